@@ -0,0 +1,375 @@
+import json
+import asyncio
+from client import Client
+from message import Message
+from connection import AsyncConnection, AsyncConnectionPool
+from codec import DEFAULT_CODEC
+from compression import DEFAULT_COMPRESSION_THRESHOLD
+from typing import Dict, List, Optional, Tuple
+
+# Cliente orientado a eventos para ser embutido em aplicações asyncio: as operações são corrotinas que devolvem os
+# valores e os timestamps em vez de exibi-los, e falham com as exceções abaixo. Muitas operações podem estar em voo
+# ao mesmo tempo, sobre um pool de conexões persistentes por servidor, cada uma com várias requisições em pipeline;
+# com `max_in_flight` operações aguardando resposta, as seguintes esperam uma vaga. O roteamento (escritas no líder
+# de cada grupo, leituras em um servidor sorteado), o anel de grupos, o cache e os timestamps por chave que garantem
+# o Read-Your-Writes são os do Client, com as mesmas factories de comandos.
+#   async with AsyncClient() as client:
+#       client.init(['127.0.0.1:7000', '127.0.0.1:7001'])
+#       await client.put('chave', 'valor')
+#       valor = await client.get('chave')
+
+# operações em voo por cliente, por padrão
+DEFAULT_MAX_IN_FLIGHT = 4096
+
+
+# Falha de uma operação do AsyncClient
+class KVStoreError(Exception):
+    pass
+
+
+# Nenhum servidor aceitou a conexão ou respondeu à requisição
+class ServerUnavailableError(KVStoreError, ConnectionError):
+    pass
+
+
+# INCR sobre um value (ou com um incremento) que não é um número inteiro
+class InvalidValueError(KVStoreError, ValueError):
+    pass
+
+
+# Operação recusada com TRY_OTHER_SERVER_OR_LATER em todas as tentativas: o servidor ainda não tem a versão que o
+# cliente já viu das chaves, ou o líder não conseguiu aplicar ou replicar a escrita
+class TryOtherServerError(KVStoreError):
+    def __init__(self, keys: List[str]) -> None:
+        KVStoreError.__init__(self, f'TRY_OTHER_SERVER_OR_LATER para {", ".join(keys)}')
+        self.keys = keys
+
+
+class AsyncClient(Client):
+    def __init__(self, codec: str = DEFAULT_CODEC, pool_size: int = 4, max_retries: int = 3,
+                 retry_backoff_ms: int = 10, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, cache_entries: int = 0,
+                 cache_bytes: int = 0, cache_ttl_ms: int = 0, compression: str = 'none',
+                 compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD) -> None:
+        Client.__init__(self, codec, pool_size, max_retries, retry_backoff_ms, cache_entries, cache_bytes,
+                        cache_ttl_ms, compression, compression_threshold)
+        self._connections = AsyncConnectionPool(codec, pool_size, compression, compression_threshold)
+        self._max_in_flight = max_in_flight
+        # vagas de operações em voo, criadas dentro do event loop na primeira requisição
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    # region getters
+    @property
+    def max_in_flight(self) -> int:
+        return self._max_in_flight
+    # endregion
+
+    # region setters
+    # respostas de operações concorrentes na mesma chave chegam em qualquer ordem: o timestamp conhecido só avança
+    def set_timestamp(self, key: str, timestamp: int) -> None:
+        if timestamp > self.get_timestamp(key):
+            self._timestamps[key] = timestamp
+    # endregion
+
+    # region funções de comunicação com o servidor
+    # obtém uma conexão do pool de um servidor (sorteado do grupo, se não informado), ou None se ele não a aceitar
+    async def open_server_connection_async(self, address: Optional[Tuple[str, int]] = None,
+                                           group: str = '') -> Optional[AsyncConnection]:
+        ip, port = address or self.get_random_server_address(group=group)
+        try:
+            return await self._connections.get(ip, port)
+        except OSError:
+            self.forget_leader((ip, port))
+            return None
+
+    # envia uma requisição a um servidor, ocupando uma vaga de operação em voo; devolve None se a comunicação falhou,
+    # descartando a conexão
+    async def send_request_async(self, address: Optional[Tuple[str, int]], msg: Message,
+                                 group: str = '') -> Optional[Message]:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._max_in_flight)
+        async with self._slots:
+            conn = await self.open_server_connection_async(address, group)
+            if conn is None:
+                return None
+            try:
+                return await conn.request(msg)
+            except OSError:
+                self._connections.discard(conn.ip, conn.port, conn)
+                self.forget_leader((conn.ip, conn.port))
+                return None
+    # endregion
+
+    # region features
+    # grava o par <key, value> no líder do grupo da key, devolvendo o timestamp da escrita
+    async def put(self, key: str, value: str, ttl_ms: int = 0) -> int:
+        timestamps = await self.write_pairs_async([(key, value)], ttl_ms, single=True)
+        return timestamps[key]
+
+    # grava vários pares em um MPUT por grupo, devolvendo o timestamp de cada key
+    async def mput(self, pairs: List[Tuple[str, str]], ttl_ms: int = 0) -> Dict[str, int]:
+        return await self.write_pairs_async(pairs, ttl_ms)
+
+    # value de uma key (None se ela não existe), lido de um servidor que já tenha a versão que o cliente conhece
+    async def get(self, key: str) -> Optional[str]:
+        if self._cache is not None:
+            value = self._cache.get(key, self.get_timestamp(key))
+            if value is not None:
+                return value
+        ring = self._ring
+        response = await self.read_with_retry_async(self.get_command_factory(key), self.group_of(key))
+        # a recusa trocou o anel: a key é lida de novo no grupo que passou a ser o dono dela
+        if response.type == 'TRY_OTHER_SERVER_OR_LATER' and self._ring is not ring:
+            return await self.get(key)
+        return self.get_response_command_handler(response)
+
+    # values de várias keys, em um MGET por grupo enviados ao mesmo tempo
+    async def mget(self, keys: List[str]) -> Dict[str, Optional[str]]:
+        values: Dict[str, Optional[str]] = dict()
+        missing = []
+        for key in keys:
+            value = self._cache.get(key, self.get_timestamp(key)) if self._cache is not None else None
+            if value is not None:
+                values[key] = value
+            else:
+                missing.append(key)
+        results = await asyncio.gather(*(self.mget_group_async(group_keys, group)
+                                         for group, group_keys in self.split_by_group(missing).items()))
+        for result in results:
+            values.update(result)
+        return values
+
+    # incrementa no líder, de forma atômica, o value inteiro de uma key (uma key inexistente vale 0), devolvendo o
+    # novo value
+    async def incr(self, key: str, delta: int = 1) -> int:
+        response = await self.write_atomic_async(self.incr_command_factory(key, delta))
+        return int(response.value)
+
+    async def decr(self, key: str, delta: int = 1) -> int:
+        return await self.incr(key, -delta)
+
+    # grava `value` na key só se ela tem o value `expected` (que pode ser vazio) ou, com `expected_timestamp`, se ela
+    # está nessa versão; sem nenhum dos dois, só se a key não existe. Devolve se gravou, o value atual da key (o novo,
+    # se gravou; None se ela não existe) e o timestamp dele
+    async def cas(self, key: str, value: str, expected: Optional[str] = None, expected_timestamp: Optional[int] = None,
+                  ttl_ms: int = 0) -> Tuple[bool, Optional[str], int]:
+        response = await self.write_atomic_async(
+            self.cas_command_factory(key, value, expected, expected_timestamp, ttl_ms))
+        current = None if response.absent else response.value
+        return response.type == 'PUT_OK', current, response.server_timestamp
+
+    # acrescenta `suffix` ao fim do value de uma key no líder, de forma atômica, devolvendo o novo value
+    async def append(self, key: str, suffix: str) -> str:
+        response = await self.write_atomic_async(self.append_command_factory(key, suffix))
+        return response.value
+
+    # lista em ordem as keys do intervalo [start, end) (end vazio: até a última), com os seus values
+    async def scan(self, start: str, end: str = '', limit: int = 100) -> List[Tuple[str, str]]:
+        start_key, end_key = start.upper(), end.upper()
+        return await self.read_groups_async(lambda group: self.read_pages_async(
+            lambda cursor, timestamp: self.scan_command_factory(start, end, cursor, limit, timestamp),
+            lambda key: key >= start_key and (not end_key or key < end_key), group))
+
+    # lista em ordem as keys que começam com `prefix`, com os seus values
+    async def prefix(self, prefix: str, limit: int = 100) -> List[Tuple[str, str]]:
+        prefix_key = prefix.upper()
+        return await self.read_groups_async(lambda group: self.read_pages_async(
+            lambda cursor, timestamp: self.prefix_command_factory(prefix, cursor, limit, timestamp),
+            lambda key: key.startswith(prefix_key), group))
+
+    # métricas de um servidor (sorteado, se não informado)
+    async def stats(self, address: Optional[str] = None) -> Dict:
+        if address is not None:
+            ip, port = address.split(':')
+            address = (ip, int(port))
+        response = await self.send_request_async(address, self.stats_command_factory())
+        if response is None:
+            raise ServerUnavailableError('Nenhum servidor respondeu ao STATS')
+        return self.stats_ok_command_handler(response)
+
+    # envia uma leitura a um servidor aleatório do grupo, repetindo-a em outro servidor após TRY_OTHER_SERVER_OR_LATER
+    # ou falha de comunicação, com espera exponencial; devolve a última resposta recebida. Como em
+    # Client.read_with_retry, uma recusa relê o anel e, se ele mudou, é devolvida para a leitura ir ao novo dono
+    async def read_with_retry_async(self, msg: Message, group: str = '') -> Message:
+        tried = []
+        response = None
+        for attempt in range(self._max_retries + 1):
+            address = self.get_random_server_address(tried, group)
+            received = await self.send_request_async(address, msg)
+            response = received or response
+            if response is not None and response.type != 'TRY_OTHER_SERVER_OR_LATER':
+                return response
+            if received is not None and self.reload_ring():
+                return received
+            tried.append(address)
+            if attempt < self._max_retries:
+                await self.backoff_async(attempt)
+        if response is None:
+            raise ServerUnavailableError(f'Nenhum servidor respondeu ao {msg.type}')
+        return response
+
+    # envia os pares ao líder do grupo de cada key, em um MPUT por grupo (ou em um PUT, com `single`), com os grupos
+    # em paralelo. As keys recusadas (líder indisponível ou intervalo do anel em migração) e as de grupos sem resposta
+    # são repetidas após a espera, com o líder esquecido e o anel relido do arquivo do cluster
+    async def write_pairs_async(self, pairs: List[Tuple[str, str]], ttl_ms: int = 0,
+                                single: bool = False) -> Dict[str, int]:
+        self.invalidate_cached([key for key, _ in pairs])
+        timestamps: Dict[str, int] = dict()
+        unavailable = False
+        for attempt in range(self._max_retries + 1):
+            groups = self.split_by_group(pairs, key=lambda pair: pair[0])
+            responses = await asyncio.gather(*(
+                self.send_request_async(self._leaders.get(group), self.put_command_factory(*group_pairs[0], ttl_ms)
+                                        if single else self.mput_command_factory(group_pairs, ttl_ms), group)
+                for group, group_pairs in groups.items()))
+            refused = []
+            for (group, group_pairs), response in zip(groups.items(), responses):
+                if response is None:
+                    unavailable = True
+                    refused.extend(group_pairs)
+                    continue
+                done = self.mput_ok_command_handler(response) if response.type == 'MPUT_OK' else \
+                    {response.key: self.put_ok_command_handler(response)} if response.type == 'PUT_OK' else dict()
+                timestamps.update(done)
+                if len(done) < len(group_pairs):
+                    refused.extend(pair for pair in group_pairs if pair[0] not in done)
+            if not refused:
+                return timestamps
+            pairs = refused
+            if attempt < self._max_retries:
+                await self.backoff_async(attempt)
+                self.reload_ring()
+        keys = [key for key, _ in pairs]
+        if unavailable:
+            raise ServerUnavailableError(f'Nenhum servidor confirmou a escrita de {", ".join(keys)}')
+        raise TryOtherServerError(keys)
+
+    # envia um INCR, CAS ou APPEND ao líder do grupo da key, devolvendo o PUT_OK ou o CAS_FAILED. Como em
+    # Client.write_atomic, uma recusa não é repetida; com o anel, ele é relido para a próxima operação
+    async def write_atomic_async(self, msg: Message) -> Message:
+        self.invalidate_cached([msg.key])
+        group = self.group_of(msg.key)
+        response = await self.send_request_async(self._leaders.get(group), msg, group)
+        if response is None:
+            raise ServerUnavailableError(f'Nenhum servidor respondeu ao {msg.type} de {msg.key}')
+        if response.type == 'PUT_OK':
+            self.put_ok_command_handler(response)
+        elif response.type == 'CAS_FAILED':
+            self.set_timestamp(response.key, response.server_timestamp)
+            self.learn_leader(response)
+        elif response.type == 'INVALID_VALUE':
+            raise InvalidValueError(response.value)
+        else:
+            self.reload_ring()
+            raise TryOtherServerError([msg.key])
+        return response
+
+    # MGET das keys de um único grupo; as keys recusadas com TRY_OTHER_SERVER_OR_LATER são repetidas juntas em outro
+    # servidor ou, se a recusa trocou o anel, repartidas entre os seus novos donos
+    async def mget_group_async(self, keys: List[str], group: str = '') -> Dict[str, Optional[str]]:
+        values: Dict[str, Optional[str]] = dict()
+        tried = []
+        for attempt in range(self._max_retries + 1):
+            address = self.get_random_server_address(tried, group)
+            response = await self.send_request_async(address, self.mget_command_factory(keys))
+            tried.append(address)
+            if response is not None:
+                refused = [item.key for item in response.items if item.type == 'TRY_OTHER_SERVER_OR_LATER']
+                response.items = [item for item in response.items if item.type != 'TRY_OTHER_SERVER_OR_LATER']
+                values.update(self.mget_ok_command_handler(response))
+                if not refused:
+                    return values
+                keys = refused
+                if self.reload_ring():
+                    values.update(await self.mget(keys))
+                    return values
+            if attempt < self._max_retries:
+                await self.backoff_async(attempt)
+        if response is None:
+            raise ServerUnavailableError(f'Nenhum servidor respondeu ao MGET de {", ".join(keys)}')
+        raise TryOtherServerError(keys)
+
+    # lê um SCAN/PREFIX de cada grupo do anel ao mesmo tempo e junta as keys em ordem, cada grupo contribuindo só com
+    # as keys de que é dono. Com um anel novo, relido após a recusa de algum grupo, a leitura recomeça em todos eles
+    async def read_groups_async(self, read) -> List[Tuple[str, str]]:
+        while True:
+            ring = self._ring
+            if ring is None:
+                return await read('')
+            groups = list(ring.groups)
+            try:
+                results = await asyncio.gather(*(read(group) for group in groups))
+            except TryOtherServerError:
+                if self._ring is ring:
+                    raise
+                continue
+            if self._ring is ring:
+                return sorted((key, value) for group, items in zip(groups, results) for key, value in items
+                              if ring.group_of(key) == group)
+
+    # busca as páginas de um SCAN/PREFIX seguindo o cursor, com os timestamps exigidos como em Client.read_pages
+    async def read_pages_async(self, factory, in_range, group: str = '') -> List[Tuple[str, str]]:
+        timestamp = max((ts for key, ts in self._timestamps.items()
+                         if in_range(key.upper()) and self.group_of(key) == group), default=0)
+        results, cursor = [], ''
+        while True:
+            response = await self.read_with_retry_async(factory(cursor, timestamp), group)
+            if response.type != 'SCAN_OK':
+                raise TryOtherServerError([response.key])
+            results.extend(self.scan_ok_command_handler(response))
+            timestamp = max(timestamp, response.server_timestamp)
+            cursor = response.cursor
+            if not cursor:
+                return results
+
+    # espera antes da tentativa seguinte sem bloquear o event loop
+    async def backoff_async(self, attempt: int) -> None:
+        await asyncio.sleep(self._retry_backoff * (2 ** attempt))
+
+    # encerra as conexões com os servidores
+    def close(self) -> None:
+        self._connections.close_all()
+
+    async def __aenter__(self) -> 'AsyncClient':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+    # endregion
+
+    # region command handlers
+    # handler responsavel por tratar a confirmação de um PUT, devolvendo o timestamp da escrita
+    def put_ok_command_handler(self, put_ok_cmd: Message) -> int:
+        self.set_timestamp(put_ok_cmd.key, put_ok_cmd.server_timestamp)
+        self.learn_leader(put_ok_cmd)
+        return put_ok_cmd.server_timestamp
+
+    # handler responsavel por tratar o resultado de um GET, devolvendo o value (None se a key não existe)
+    def get_response_command_handler(self, get_response_cmd: Message) -> Optional[str]:
+        if get_response_cmd.type != 'GET_OK':
+            raise TryOtherServerError([get_response_cmd.key])
+        key, value, timestamp = get_response_cmd.key, get_response_cmd.value, get_response_cmd.server_timestamp
+        self.set_timestamp(key, timestamp)
+        if self._cache is not None:
+            self._cache.put(key, value, timestamp, get_response_cmd.expires_at)
+        # o servidor responde a uma key inexistente com o value NULL
+        return None if value == 'NULL' else value
+
+    # handler responsavel por tratar o resultado de um MPUT, devolvendo o timestamp de cada key confirmada
+    def mput_ok_command_handler(self, mput_ok_cmd: Message) -> Dict[str, int]:
+        self.learn_leader(mput_ok_cmd)
+        return {put_ok_cmd.key: self.put_ok_command_handler(put_ok_cmd)
+                for put_ok_cmd in mput_ok_cmd.items if put_ok_cmd.type == 'PUT_OK'}
+
+    # handler responsavel por tratar o resultado de um MGET, devolvendo o value de cada key
+    def mget_ok_command_handler(self, mget_ok_cmd: Message) -> Dict[str, Optional[str]]:
+        return {get_response_cmd.key: self.get_response_command_handler(get_response_cmd)
+                for get_response_cmd in mget_ok_cmd.items}
+
+    # handler responsavel por tratar uma página de SCAN/PREFIX, devolvendo os pares <key, value> dela
+    def scan_ok_command_handler(self, scan_ok_cmd: Message) -> List[Tuple[str, str]]:
+        return [(get_ok_cmd.key, get_ok_cmd.value) for get_ok_cmd in scan_ok_cmd.items]
+
+    # handler responsavel por tratar um STATS_OK, devolvendo as métricas
+    def stats_ok_command_handler(self, stats_ok_cmd: Message) -> Dict:
+        return json.loads(stats_ok_cmd.value)
+    # endregion
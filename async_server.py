@@ -0,0 +1,271 @@
+import time
+import asyncio
+import helpers
+from server import Server, RangeFencedError, InvalidValueError, ATOMIC_COMMANDS, INLINE_COMMANDS, FORWARDED_COMMANDS
+from message import Message
+from connection import AsyncConnectionCache
+from codec import codec_from_flags
+from compression import get_compressor, compress_payload, decompress_payload
+from log import logger, sampled
+from socket import IPPROTO_TCP, TCP_NODELAY
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Set
+
+# comandos que só leem o store; os demais passam pelo lock das escritas e, com a política de fsync always, esperam
+# pelo fsync
+LOOP_COMMANDS = {'GET', 'MGET', 'SCAN', 'PREFIX', 'HELLO', 'STATS', 'WORKERS', 'SNAPSHOT_CHUNK', 'RANGE_SCAN'}
+
+# Servidor orientado a eventos: todas as conexões são atendidas por um único event loop asyncio,
+# sem uma thread por conexão. O dispatch de comandos é o mesmo do Server (server_handle); apenas
+# o PUT, que depende de rede (encaminhamento ao líder e replicação), ganha uma versão aguardável.
+# A replicação é feita pelo mesmo Replicator do Server, cujo Future é aguardado pelo event loop. Com a política de
+# fsync always, as escritas (inclusive as replicadas nos followers) esperam pelo fsync nas threads do executor, e as
+# escritas concorrentes continuam dividindo o mesmo fsync.
+class AsyncServer(Server):
+    def __init__(self, ip: str, port: int, ip_leader: str, port_leader, backlog: int = 1024, **kwargs) -> None:
+        Server.__init__(self, ip, port, ip_leader, port_leader, backlog=backlog, **kwargs)
+        self._backlog = backlog
+        # conexões assíncronas com o líder e com os followers, criadas dentro do event loop
+        self._async_peer_connections = None
+        # vagas de escritas em voo no canal com o líder, como no LeaderChannel do Server
+        self._forward_slots = None
+        # compressão das respostas de cada conexão aberta, combinada no HELLO dela
+        self._connection_compressors: Dict[asyncio.StreamWriter, object] = dict()
+        # tasks das requisições em andamento: o event loop guarda só referências fracas às tasks, e uma task que
+        # aguarda um Future sem outras referências (como a leitura do HELLO de uma conexão nova com o líder) seria
+        # coletada no meio da requisição, sem responder ao cliente
+        self._request_tasks: Set[asyncio.Task] = set()
+        # só com a política always uma escrita espera pelo disco; nas demais ela é rápida o bastante para o event loop
+        self._blocking_writes = self._persistence is not None and self._persistence.wal.fsync_policy == 'always'
+
+    # region getters
+    @property
+    def backlog(self) -> int:
+        return self._backlog
+    # endregion
+
+    # region command handlers
+    # versão aguardável do server_handle: comandos que não dependem de rede são tratados pelos handlers síncronos.
+    # No modo multiprocesso, as requisições da porta pública com chaves de outros workers são roteadas a eles
+    async def server_handle_async(self, command: Message, routed: bool = False) -> Message:
+        if routed and self.needs_routing(command):
+            self.metrics.count('requests.routed')
+            return await asyncio.wrap_future(self.route(command))
+        if command.type == 'PUT':
+            return await self.put_command_handler_async(command)
+        if command.type == 'MPUT':
+            return await self.mput_command_handler_async(command)
+        if command.type in ATOMIC_COMMANDS:
+            return await self.atomic_command_handler_async(command)
+        if command.type in LOOP_COMMANDS:
+            response_cmd = self.server_handle(command)
+        else:
+            response_cmd = await self.run_blocking(self.server_handle, command)
+        # GETs estacionados aguardando a replicação devolvem um Future
+        if isinstance(response_cmd, Future):
+            return await asyncio.wrap_future(response_cmd)
+        return response_cmd
+
+    # inclui/atualiza o valor de uma chave, aguardando a replicação sem bloquear o event loop
+    async def put_command_handler_async(self, put_cmd: Message) -> Message:
+        key, value = put_cmd.key, put_cmd.value
+        if self.is_leader:
+            client_address = put_cmd.sender_address
+            try:
+                server_timestamp, replicated = await self.run_blocking(self.write_key_value_pair, key, value,
+                                                                       put_cmd.ttl)
+            except RangeFencedError:
+                return self.leader_unavailable_command_factory(put_cmd)
+            except InvalidValueError as e:
+                return self.invalid_value_command_factory(key, str(e))
+            if sampled():
+                logger.debug('Cliente %s PUT key:%s value:%s ts:%s', client_address, key, value, server_timestamp)
+            try:
+                await asyncio.wait_for(asyncio.wrap_future(replicated), self._replication_timeout)
+            except Exception as e:
+                logger.warning('Erro ao replicar key:%s ts:%s: %s', key, server_timestamp, e)
+                return self.try_another_command_factory(key)
+
+            # a resposta informa o líder, para o cliente enviar as próximas escritas direto a ele
+            return self.put_ok_command_factory(key, value, server_timestamp).set_leader(*self.advertised_address)
+
+        if sampled():
+            logger.debug('Encaminhando PUT key:%s value:%s', key, value)
+        return await self.send_put_to_leader_async(put_cmd)
+
+    # inclui/atualiza o valor de várias chaves, aguardando a replicação do lote sem bloquear o event loop
+    async def mput_command_handler_async(self, mput_cmd: Message) -> Message:
+        if self.is_leader:
+            client_address = mput_cmd.sender_address
+            pairs = [(put_cmd.key, put_cmd.value) for put_cmd in mput_cmd.items]
+            try:
+                timestamps, replicated = await self.run_blocking(self.write_key_value_pairs, pairs,
+                                                                 [put_cmd.ttl for put_cmd in mput_cmd.items])
+            except RangeFencedError:
+                return self.leader_unavailable_command_factory(mput_cmd)
+            except InvalidValueError as e:
+                # nenhuma chave do lote é gravada
+                return self.mput_ok_command_factory([self.invalid_value_command_factory(key, str(e))
+                                                     for key, _ in pairs])
+            if sampled():
+                logger.debug('Cliente %s MPUT de %s chaves', client_address, len(pairs))
+            try:
+                await asyncio.wait_for(asyncio.wrap_future(replicated), self._replication_timeout)
+            except Exception as e:
+                logger.warning('Erro ao replicar MPUT de %s chaves: %s', len(pairs), e)
+                return self.mput_ok_command_factory([self.try_another_command_factory(key) for key, _ in pairs])
+            mput_ok_cmd = self.mput_ok_command_factory([self.put_ok_command_factory(key, value, timestamp)
+                                                        for (key, value), timestamp in zip(pairs, timestamps)])
+            return mput_ok_cmd.set_leader(*self.advertised_address)
+
+        if sampled():
+            logger.debug('Encaminhando MPUT de %s chaves', len(mput_cmd.items))
+        return await self.send_put_to_leader_async(mput_cmd)
+
+    # executa um INCR, CAS ou APPEND no líder, aguardando a replicação sem bloquear o event loop
+    async def atomic_command_handler_async(self, atomic_cmd: Message) -> Message:
+        if not self.is_leader:
+            return await self.send_put_to_leader_async(atomic_cmd)
+        response_cmd, replicated = await self.run_blocking(self.apply_atomic_command, atomic_cmd)
+        if replicated is None:
+            return response_cmd
+        try:
+            await asyncio.wait_for(asyncio.wrap_future(replicated), self._replication_timeout)
+        except Exception as e:
+            logger.warning('Erro ao replicar %s key:%s: %s', atomic_cmd.type, atomic_cmd.key, e)
+            return self.try_another_command_factory(atomic_cmd.key)
+        return response_cmd
+    # endregion
+
+    # executa uma escrita `fn` em uma thread do executor quando ela pode esperar pelo fsync, sem parar o event loop
+    async def run_blocking(self, fn: Callable, *args):
+        if not self._blocking_writes:
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    # repassa um PUT ou MPUT command recebido para o líder e retransmite ao cliente solicitante a resposta.
+    # A vaga no canal com o líder é reservada por handle_connection antes de criar a task e liberada aqui
+    async def send_put_to_leader_async(self, put_cmd: Message) -> Message:
+        try:
+            conn = await self._async_peer_connections.get(self.ip_leader, self.port_leader)
+            return await conn.request(put_cmd)
+        except OSError:
+            self._async_peer_connections.discard(self.ip_leader, self.port_leader)
+            return self.leader_unavailable_command_factory(put_cmd)
+        finally:
+            self._forward_slots.release()
+
+    # recebe as conexões pelo event loop até o processo ser interrompido
+    def listen(self) -> None:
+        try:
+            asyncio.run(self.serve())
+        except (KeyboardInterrupt, EOFError):
+            logger.info('Saindo...')
+
+    # corrotina principal: aceita conexões no socket já vinculado pelo Server e, no modo multiprocesso, também
+    # na porta pública do nó, cujas conexões passam pelo roteamento entre os workers
+    async def serve(self) -> None:
+        self._async_peer_connections = AsyncConnectionCache(self.codec, self._compression, self.compression_threshold)
+        self._forward_slots = asyncio.Semaphore(self._leader_channel.max_in_flight)
+        # o socket do Server já está em listen; o asyncio apenas passa a aceitar por ele
+        self.server_socket.setblocking(False)
+        tcp_server = await asyncio.start_server(self.handle_connection, sock=self.server_socket, backlog=self.backlog)
+        public_server = None
+        if self.public_socket is not None:
+            self.public_socket.setblocking(False)
+            public_server = await asyncio.start_server(
+                lambda reader, writer: self.handle_connection(reader, writer, routed=True), sock=self.public_socket,
+                backlog=self.backlog)
+        try:
+            async with tcp_server:
+                if public_server is not None:
+                    await public_server.start_serving()
+                await tcp_server.serve_forever()
+        finally:
+            if public_server is not None:
+                public_server.close()
+            self._async_peer_connections.close_all()
+
+    # atende uma conexão: lê frames até o cliente encerrá-la, tratando cada requisição em uma task
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                                routed: bool = False) -> None:
+        sock = writer.get_extra_info('socket')
+        sock.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+        client_address = writer.get_extra_info('peername')
+        self._connection_compressors[writer] = None
+        self.metrics.add('connections', 1)
+        try:
+            while True:
+                frame = await helpers.receive_frame_async(reader)
+                if frame is None:
+                    break
+                request_id, flags, payload = frame
+                # a resposta é codificada no mesmo codec da requisição
+                codec = codec_from_flags(flags)
+                started = time.perf_counter()
+                try:
+                    command = codec.decode(decompress_payload(flags, payload))
+                except Exception as e:
+                    logger.warning('Requisição %s de %s inválida: %s', request_id, client_address, e)
+                    command = None
+                self.metrics.observe('parse', time.perf_counter() - started)
+                if command is None:
+                    # a requisição inválida recebe uma recusa com o seu id, sem passar pelos handlers
+                    self.metrics.count('requests.invalid')
+                    await self.handle_request(writer, request_id, codec, None)
+                    continue
+                command.set_sender(ip=client_address[0], port=client_address[1])
+                # comandos internos são tratados em ordem; os demais viram tasks e podem responder fora de ordem
+                if command.type in INLINE_COMMANDS:
+                    await self.handle_request(writer, request_id, codec, command)
+                else:
+                    # as escritas roteadas a outro worker ocupam o canal com o líder daquele worker, não o deste
+                    if (command.type in FORWARDED_COMMANDS and not self.is_leader
+                            and not (routed and self.needs_routing(command))):
+                        # com o canal para o líder cheio, a leitura desta conexão fica parada até ele responder
+                        await self._forward_slots.acquire()
+                    task = asyncio.ensure_future(self.handle_request(writer, request_id, codec, command, routed))
+                    self._request_tasks.add(task)
+                    task.add_done_callback(self._request_tasks.discard)
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.metrics.add('connections', -1)
+            self._connection_compressors.pop(writer, None)
+            writer.close()
+
+    # trata uma requisição e envia a resposta com o mesmo id recebido; uma requisição inválida (None) é recusada
+    async def handle_request(self, writer: asyncio.StreamWriter, request_id: int, codec, command: Optional[Message],
+                             routed: bool = False) -> None:
+        started = time.perf_counter()
+        if command is None:
+            response_cmd = self.try_another_command_factory('')
+        else:
+            try:
+                response_cmd = await self.server_handle_async(command, routed)
+            except Exception as e:
+                # um erro no tratamento vira TRY_OTHER_SERVER_OR_LATER, para o cliente não esperar para sempre
+                logger.warning('Erro ao tratar %s key:%s: %s', command.type, command.key, e)
+                self.metrics.count('requests.failed')
+                response_cmd = self.try_another_command_factory(command.key)
+            self.metrics.observe_command(command.type, time.perf_counter() - started)
+        if response_cmd is None or writer.is_closing():
+            return
+        response_cmd.set_sender(self.ip, self.port)
+        started = time.perf_counter()
+        try:
+            encoded = codec.encode(response_cmd)
+        except Exception as e:
+            logger.warning('Erro ao codificar a resposta %s key:%s: %s', response_cmd.type, response_cmd.key, e)
+            encoded = codec.encode(self.try_another_command_factory(response_cmd.key).set_sender(self.ip, self.port))
+        payload, compression_flags = compress_payload(encoded,
+                                                      self._connection_compressors.get(writer),
+                                                      self.compression_threshold)
+        self.metrics.observe('serialize', time.perf_counter() - started)
+        if response_cmd.type == 'HELLO_OK':
+            self._connection_compressors[writer] = get_compressor(response_cmd.key)
+        writer.write(helpers.encode_frame(request_id, payload, codec.id | compression_flags))
+        try:
+            await writer.drain()
+        except OSError:
+            pass
@@ -0,0 +1,79 @@
+# Compara a vazão de GETs e PUTs do Client bloqueante (em laço e com várias threads) com a do AsyncClient com 1 a N
+# operações em voo ao mesmo tempo, contra um líder em um processo server.py próprio (assíncrono, para que as
+# requisições em pipeline de uma mesma conexão sejam atendidas em paralelo).
+# Execução: python -m benchmarks.bench_async_client [operações] [operações em voo...]
+import sys
+import time
+import asyncio
+import subprocess
+from threading import Thread
+from client import Client
+from async_client import AsyncClient
+from benchmarks.common import quiet, report
+from benchmarks.loadgen import SERVER_SCRIPT, wait_for_port
+
+BASE_PORT = 18600
+KEYS = 10000
+THREADS = 32
+
+
+# vazão do Client com `threads` threads dividindo as operações, cada uma com o seu cliente
+def sync_throughput(address: str, operation: str, operations: int, threads: int) -> float:
+    per_thread = operations // threads
+
+    def worker(idx: int):
+        client = Client()
+        client.init([address])
+        for i in range(per_thread):
+            key = f'bench:{(idx * per_thread + i) % KEYS}'
+            client.put(key, 'x' * 100) if operation == 'PUT' else client.get(key)
+
+    workers = [Thread(target=worker, args=(idx,)) for idx in range(threads)]
+    with quiet():
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+    return per_thread * threads / (time.perf_counter() - started)
+
+
+# vazão do AsyncClient com `concurrency` corrotinas dividindo as operações em um único event loop
+async def async_throughput(address: str, operation: str, operations: int, concurrency: int) -> float:
+    async with AsyncClient() as client:
+        client.init([address])
+        per_task = operations // concurrency
+
+        async def worker(idx: int):
+            for i in range(per_task):
+                key = f'bench:{(idx * per_task + i) % KEYS}'
+                await (client.put(key, 'x' * 100) if operation == 'PUT' else client.get(key))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(idx) for idx in range(concurrency)))
+        return per_task * concurrency / (time.perf_counter() - started)
+
+
+def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    levels = [int(arg) for arg in sys.argv[2:]] or [1, 16, 256, 2048]
+    process = subprocess.Popen([sys.executable, SERVER_SCRIPT, '--ip', '127.0.0.1', '--port', str(BASE_PORT),
+                                '--leader-ip', '127.0.0.1', '--leader-port', str(BASE_PORT), '--mode', 'async',
+                                '--log-level', 'warning'], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+    try:
+        wait_for_port(BASE_PORT)
+        address = f'127.0.0.1:{BASE_PORT}'
+        for operation in ('PUT', 'GET'):
+            baseline = sync_throughput(address, operation, operations // 10, 1)
+            report(f'{operation} Client em laço', baseline)
+            ops = sync_throughput(address, operation, operations, THREADS)
+            report(f'{operation} Client com {THREADS} threads', ops, f'({ops / baseline:.1f}x)')
+            for concurrency in levels:
+                ops = asyncio.run(async_throughput(address, operation, operations, concurrency))
+                report(f'{operation} AsyncClient, {concurrency} em voo', ops, f'({ops / baseline:.1f}x)')
+    finally:
+        process.terminate()
+        process.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# Compara o servidor com uma thread por conexão e o AsyncServer com muitas conexões simultâneas.
+# Execução: python -m benchmarks.bench_async_server [conexões] [requisições por conexão]
+import sys
+import time
+import asyncio
+import resource
+import subprocess
+from message import Message
+from connection import AsyncConnection
+
+BASE_PORT = 17100
+
+# eleva o limite de descritores de arquivo do processo até o máximo permitido
+def raise_fd_limit() -> int:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+# sobe um líder isolado em um processo próprio, para não disputar o GIL com o gerador de carga
+def spawn_server(mode: str, port: int, backlog: int) -> subprocess.Popen:
+    args = [sys.executable, 'server.py', '--mode', mode, '--ip', '127.0.0.1', '--port', str(port),
+            '--leader-ip', '127.0.0.1', '--leader-port', str(port), '--backlog', str(backlog)]
+    process = subprocess.Popen(args, stdout=subprocess.DEVNULL, preexec_fn=raise_fd_limit)
+    time.sleep(1)
+    return process
+
+# abre `connections` conexões e dispara `requests` GETs em cada uma, todas ao mesmo tempo
+async def drive(port: int, connections: int, requests: int) -> float:
+    conns = []
+    for _ in range(connections):
+        conns.append(await AsyncConnection.open('127.0.0.1', port))
+    get_cmd = Message('GET').set_key('bench')
+
+    async def worker(conn: AsyncConnection):
+        for _ in range(requests):
+            await conn.request(get_cmd)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(conn) for conn in conns))
+    elapsed = time.perf_counter() - start
+    for conn in conns:
+        conn.close()
+    return connections * requests / elapsed
+
+def main():
+    connections = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    limit = raise_fd_limit()
+    if connections * 2 + 64 > limit:
+        print(f'Limite de descritores ({limit}) insuficiente para {connections} conexões')
+        return
+    for i, mode in enumerate(['thread', 'async']):
+        port = BASE_PORT + i
+        process = spawn_server(mode, port, backlog=connections)
+        try:
+            ops = asyncio.run(drive(port, connections, requests))
+            print(f'{mode:<8} {connections:>6} conexões {ops:>12,.0f} ops/s')
+        except OSError as e:
+            print(f'{mode:<8} {connections:>6} conexões falhou: {e}')
+        finally:
+            process.terminate()
+            process.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# Compara um contador disputado por várias threads incrementado com GET seguido de PUT, com GET seguido de CAS
+# (repetindo o CAS com o valor atual devolvido na recusa) e com INCR, enviados ao líder ou a um follower (que
+# encaminha as escritas ao líder), contra servidores em processos server.py próprios. Além da vazão de incrementos,
+# mostra quantos foram perdidos: o valor final do contador comparado com o total de incrementos feitos.
+# Execução: python -m benchmarks.bench_atomic [incrementos] [threads]
+import sys
+import time
+from threading import Thread
+from message import Message
+from connection import Connection
+from benchmarks.common import report
+from benchmarks.loadgen import start_servers, stop_servers
+
+BASE_PORT = 18700
+KEY = 'bench:counter'
+
+
+# um incremento com GET e PUT: duas idas ao servidor e nenhuma garantia contra escritas concorrentes
+def get_put(connection: Connection) -> int:
+    current = connection.request(Message.get(KEY, 0)).value
+    connection.request(Message.put(KEY, str(int(current) + 1)))
+    return 0
+
+
+# um incremento com GET e CAS sobre o valor lido; a recusa já traz o valor atual, então só o CAS é repetido.
+# Devolve a quantidade de CAS recusados
+def get_cas(connection: Connection) -> int:
+    current = connection.request(Message.get(KEY, 0)).value
+    retries = 0
+    while True:
+        response = connection.request(Message.cas(KEY, str(int(current) + 1), 'VALUE', current))
+        if response.type == 'PUT_OK':
+            return retries
+        current = response.value
+        retries += 1
+
+
+# um incremento com INCR, aplicado pelo líder sob o lock do store
+def incr(connection: Connection) -> int:
+    connection.request(Message.incr(KEY, 1))
+    return 0
+
+
+# vazão de `increments` incrementos divididos entre `threads` threads, cada uma com a sua conexão com `port`,
+# e quantos deles se perderam, lidos no líder no fim. Devolve também a quantidade de CAS recusados
+def run(increment, port: int, increments: int, threads: int):
+    leader = Connection('127.0.0.1', BASE_PORT)
+    leader.request(Message.put(KEY, '0'))
+    per_thread = increments // threads
+    retries = [0] * threads
+
+    def worker(idx: int):
+        connection = Connection('127.0.0.1', port)
+        for _ in range(per_thread):
+            retries[idx] += increment(connection)
+        connection.close()
+
+    workers = [Thread(target=worker, args=(idx,)) for idx in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    final = int(leader.request(Message.get(KEY, 0)).value)
+    leader.close()
+    total = per_thread * threads
+    return total / elapsed, total - final, sum(retries)
+
+
+def main():
+    increments = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    processes = start_servers(BASE_PORT, 1, '')
+    try:
+        for target, port in (('líder', BASE_PORT), ('follower', BASE_PORT + 1)):
+            for name, increment in (('GET+PUT', get_put), ('GET+CAS', get_cas), ('INCR', incr)):
+                ops, lost, retries = run(increment, port, increments, threads)
+                extra = f'{lost:,} perdidos' + (f', {retries:,} CAS recusados' if increment is get_cas else '')
+                report(f'{name} no {target}, {threads} threads', ops, extra)
+    finally:
+        stop_servers(processes)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+# Compara a carga e a leitura de chaves com PUT/GET em laço contra MPUT/MGET em lotes, através do Client,
+# em um cluster com um líder e um follower (os PUTs enviados ao follower são encaminhados ao líder).
+# Execução: python -m benchmarks.bench_batch [chaves] [tamanho do lote]
+import sys
+import time
+from client import Client
+from benchmarks.common import start_cluster, stop_cluster, quiet, report
+
+BASE_PORT = 17500
+
+# executa `fn` e devolve a vazão em chaves por segundo (uma operação por chave)
+def keys_per_sec(fn, keys: int) -> float:
+    start = time.perf_counter()
+    fn()
+    return keys / (time.perf_counter() - start)
+
+def main():
+    keys = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    batch = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    servers = start_cluster(BASE_PORT, followers=1)
+    client = Client()
+    client.init([f'127.0.0.1:{BASE_PORT}', f'127.0.0.1:{BASE_PORT + 1}'])
+    names = [f'bench:{i}' for i in range(keys)]
+    batches = [names[i:i + batch] for i in range(0, keys, batch)]
+    try:
+        with quiet():
+            put_loop = keys_per_sec(lambda: [client.put(key, 'x' * 100) for key in names], keys)
+            mput = keys_per_sec(lambda: [client.mput([(key, 'x' * 100) for key in chunk]) for chunk in batches], keys)
+            get_loop = keys_per_sec(lambda: [client.get(key) for key in names], keys)
+            mget = keys_per_sec(lambda: [client.mget(chunk) for chunk in batches], keys)
+        report('PUT em laço', put_loop)
+        report(f'MPUT em lotes de {batch}', mput, f'({mput / put_loop:.1f}x)')
+        report('GET em laço', get_loop)
+        report(f'MGET em lotes de {batch}', mget, f'({mget / get_loop:.1f}x)')
+    finally:
+        stop_cluster(servers)
+
+if __name__ == '__main__':
+    main()
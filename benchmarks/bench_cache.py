@@ -0,0 +1,38 @@
+# Mede GETs por segundo e a taxa de acerto do cache de leituras do Client com chaves lidas em distribuição Zipf
+# (poucas chaves quentes concentram a maior parte das leituras), variando o número máximo de entradas do cache.
+# Execução: python -m benchmarks.bench_cache [chaves] [leituras]
+import sys
+import random
+from client import Client
+from benchmarks.common import start_cluster, stop_cluster, quiet, measure, report
+
+BASE_PORT = 17700
+CACHE_SIZES = (0, 100, 1000)
+
+def main():
+    keys = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    reads = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    servers = start_cluster(BASE_PORT, followers=1)
+    names = [f'bench:{i}' for i in range(keys)]
+    # peso 1/posição: distribuição Zipf com expoente 1
+    sample = random.Random(42).choices(names, weights=[1 / (i + 1) for i in range(keys)], k=reads)
+    try:
+        with quiet():
+            loader = Client()
+            loader.init([f'127.0.0.1:{BASE_PORT}'])
+            for i in range(0, keys, 500):
+                loader.mput([(key, 'x' * 100) for key in names[i:i + 500]])
+        for size in CACHE_SIZES:
+            client = Client(cache_entries=size)
+            client.init([f'127.0.0.1:{BASE_PORT}', f'127.0.0.1:{BASE_PORT + 1}'])
+            reader = iter(sample)
+            with quiet():
+                ops, _ = measure(lambda: client.get(next(reader)), reads)
+            stats = client.cache_stats
+            extra = f'(acertos {stats["hit_ratio"]:.0%}, {stats["bytes"] / 1024:.0f} KiB)' if size else ''
+            report(f'GET com cache de {size} entradas' if size else 'GET sem cache', ops, extra)
+    finally:
+        stop_cluster(servers)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+# Microbenchmark dos codecs: tamanho e vazão de codificação/decodificação por tipo de mensagem.
+# Execução: python -m benchmarks.bench_codec [iterações]
+import sys
+import time
+from message import Message
+from codec import CODECS
+
+# mensagens representativas de cada tipo trafegado no caminho quente
+def sample_messages():
+    sender = ('127.0.0.1', 50321)
+    replication = Message('REPLICATION').set_key('user:42').set_value('x' * 32).set_server_timestamp(1234)
+    return {
+        'PUT': Message('PUT').set_key('user:42').set_value('x' * 32).set_sender(*sender),
+        'PUT_OK': Message('PUT_OK').set_key('user:42').set_value('x' * 32).set_server_timestamp(1234).set_sender(*sender),
+        'GET': Message('GET').set_key('user:42').set_client_timestamp(1234).set_sender(*sender),
+        'GET_OK': Message('GET_OK').set_key('user:42').set_value('x' * 32).set_client_timestamp(1234)
+                                   .set_server_timestamp(1234).set_sender(*sender),
+        'REPLICATION': replication,
+        'REPLICATION_BATCH(32)': Message('REPLICATION_BATCH').set_items([replication] * 32),
+    }
+
+# executa `fn` repetidamente e devolve operações por segundo
+def throughput(fn, arg, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(arg)
+    return iterations / (time.perf_counter() - start)
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f'{"mensagem":<22} {"codec":<7} {"bytes":>6} {"encode/s":>12} {"decode/s":>12}')
+    for name, message in sample_messages().items():
+        for codec in CODECS.values():
+            payload = codec.encode(message)
+            # batches são maiores, então usam menos iterações para manter o tempo de execução parecido
+            n = iterations // 10 if message.items else iterations
+            encode_ops = throughput(codec.encode, message, n)
+            decode_ops = throughput(codec.decode, payload, n)
+            print(f'{name:<22} {codec.name:<7} {len(payload):>6} {encode_ops:>12,.0f} {decode_ops:>12,.0f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# Mede o custo da compressão contra os bytes economizados. Primeiro, sem rede, para PUTs com valores json de
+# vários tamanhos: bytes do payload no frame e microssegundos de CPU para comprimir e descomprimir cada mensagem,
+# por algoritmo. Depois, com um líder e um follower: vazão de PUT+GET com valores grandes, tempo de entrada de um
+# follower novo por snapshot e memória do store com os valores comprimidos.
+# Execução: python -m benchmarks.bench_compression [operações] [chaves do snapshot]
+import sys
+import json
+import time
+from threading import Thread
+from message import Message
+from client import Client
+from codec import get_codec
+from server import Server
+from compression import COMPRESSIONS, get_compressor, compress_payload, decompress_payload
+from benchmarks.common import start_cluster, stop_cluster, quiet, report
+
+BASE_PORT = 18200
+VALUE_SIZES = (256, 1024, 8192, 65536)
+
+
+# valor json com aproximadamente `size` bytes, no formato típico dos valores guardados por uma aplicação
+def json_value(size: int, seed: int = 0) -> str:
+    items, value = [], '[]'
+    while len(value) < size:
+        i = len(items) + seed
+        items.append({'id': i, 'name': f'produto {i}', 'price': round(i * 1.37, 2), 'tags': ['novo', 'promo']})
+        value = json.dumps(items)
+    return value[:size]
+
+
+def cpu_versus_bytes(iterations: int = 200) -> None:
+    codec = get_codec('binary')
+    print(f'{"valor":>8} {"compressão":>10} {"bytes":>10} {"redução":>8} {"comprimir":>12} {"descomprimir":>12}')
+    for size in VALUE_SIZES:
+        payload = codec.encode(Message.put('produtos:1', json_value(size)))
+        for name in COMPRESSIONS:
+            compressor = get_compressor(name)
+            start = time.perf_counter()
+            for _ in range(iterations):
+                compressed, flags = compress_payload(payload, compressor, threshold=0)
+            compress_us = (time.perf_counter() - start) / iterations * 1e6
+            start = time.perf_counter()
+            for _ in range(iterations):
+                decompress_payload(flags, compressed)
+            decompress_us = (time.perf_counter() - start) / iterations * 1e6
+            print(f'{size:>8} {name:>10} {len(compressed):>10,} {1 - len(compressed) / len(payload):>8.0%} '
+                  f'{compress_us:>9,.1f} µs {decompress_us:>9,.1f} µs')
+
+
+def end_to_end(base_port: int, compression: str, operations: int, snapshot_keys: int) -> None:
+    servers = start_cluster(base_port, followers=1, compression=compression, store_compression=compression,
+                            replication_log_size=100)
+    client = Client(compression=compression)
+    client.init([f'127.0.0.1:{base_port}', f'127.0.0.1:{base_port + 1}'])
+    value = json_value(8192)
+    late = None
+    try:
+        with quiet():
+            start = time.perf_counter()
+            for i in range(operations):
+                client.put(f'grande:{i}', value)
+                client.get(f'grande:{i}')
+            e2e = operations / (time.perf_counter() - start)
+            for i in range(0, snapshot_keys, 100):
+                client.mput([(f'snap:{j}', json_value(1024, j)) for j in range(i, i + 100)])
+        # o log de replicação guarda só 100 escritas, então o follower novo entra por snapshot
+        start = time.perf_counter()
+        late = Server('127.0.0.1', base_port + 2, '127.0.0.1', base_port, compression=compression,
+                      store_compression=compression)
+        late.setup()
+        Thread(target=late.listen, daemon=True).start()
+        join = time.perf_counter() - start
+        report(f'{compression}: PUT+GET de 8 KiB', e2e,
+               f'| snapshot de {len(late.storage):,} chaves em {join:.2f} s '
+               f'| store do líder com {servers[0].storage.size_bytes / 2 ** 20:,.1f} MiB')
+    finally:
+        stop_cluster(servers + ([late] if late is not None else []))
+
+
+def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    snapshot_keys = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    cpu_versus_bytes()
+    print()
+    for offset, compression in enumerate(COMPRESSIONS):
+        end_to_end(BASE_PORT + 10 * offset, compression, operations, snapshot_keys)
+
+if __name__ == '__main__':
+    main()
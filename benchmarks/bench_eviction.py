@@ -0,0 +1,52 @@
+# Compara as políticas de descarte no líder, sem rede, com o store usado como cache: cada operação lê uma chave
+# sorteada em distribuição Zipf e, se ela não está no store, a escreve. Com o store limitado a uma fração das
+# chaves, mede a taxa de acerto das leituras e a vazão de cada política, contra o store sem limite.
+# Execução: python -m benchmarks.bench_eviction [chaves] [operações] [% das chaves que cabem no store]
+import sys
+import time
+import random
+from bisect import bisect_left
+from itertools import accumulate
+from message import Message
+from server import Server
+from benchmarks.common import report
+
+BASE_PORT = 18100
+
+
+def run(port: int, names, cdf, operations: int, **limits) -> None:
+    server = Server('127.0.0.1', port, '127.0.0.1', port, **limits)
+    rng = random.Random(1)
+    hits = 0
+    try:
+        start = time.perf_counter()
+        for _ in range(operations):
+            key = names[bisect_left(cdf, rng.random() * cdf[-1])]
+            if server.get_command_handler(Message.get(key, 0)).value != 'NULL':
+                hits += 1
+            else:
+                server.write_key_value_pair(key, 'x' * 100)
+        elapsed = time.perf_counter() - start
+        name = limits.get('eviction_policy', 'sem limite') if limits else 'sem limite'
+        memory = server.stats()['memory']
+        report(name, operations / elapsed, f'acertos {hits / operations:.1%}, {len(server.storage):,} chaves, '
+                                           f'pico de {memory["peak_bytes"] / 1024:,.0f} KiB')
+    finally:
+        server.close()
+
+
+def main():
+    keys = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    operations = int(sys.argv[2]) if len(sys.argv) > 2 else 300000
+    fraction = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+    names = [f'chave:{i}' for i in range(keys)]
+    random.Random(0).shuffle(names)
+    cdf = list(accumulate(1 / (i + 1) ** 0.99 for i in range(keys)))
+    max_keys = int(keys * fraction / 100)
+    print(f'{keys:,} chaves em distribuição Zipf, store limitado a {max_keys:,}')
+    run(BASE_PORT, names, cdf, operations)
+    for offset, policy in enumerate(('lru', 'lfu', 'random'), 1):
+        run(BASE_PORT + offset, names, cdf, operations, max_keys=max_keys, eviction_policy=policy)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+# Compara o caminho antigo de uma conexão por requisição com as conexões persistentes do protocolo com frames.
+# Execução: python -m benchmarks.bench_framing [operações]
+import sys
+import helpers
+from message import Message
+from connection import Connection
+from benchmarks.common import start_cluster, stop_cluster, quiet, measure, report
+
+BASE_PORT = 17000
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    servers = start_cluster(BASE_PORT)
+    get_cmd = Message('GET').set_key('bench')
+    try:
+        with quiet():
+            # uma conexão TCP aberta e fechada a cada requisição, como o cliente fazia antes
+            def connect_per_request():
+                sk = helpers.open_server_connection('127.0.0.1', BASE_PORT)
+                try:
+                    helpers.send_request(sk, get_cmd)
+                finally:
+                    helpers.close_server_connection(sk)
+            per_request, _ = measure(connect_per_request, iterations)
+
+            # uma única conexão persistente, uma requisição por vez
+            conn = Connection('127.0.0.1', BASE_PORT)
+            persistent, _ = measure(lambda: conn.request(get_cmd), iterations)
+
+            # a mesma conexão com até `window` requisições em voo simultaneamente
+            window = 64
+            def pipelined():
+                futures = [conn.request_async(get_cmd) for _ in range(window)]
+                for future in futures:
+                    future.result()
+            batches = max(1, iterations // window)
+            pipelined_ops, _ = measure(pipelined, batches)
+            conn.close()
+        report('conexão por requisição', per_request)
+        report('conexão persistente', persistent, f'({persistent / per_request:.1f}x)')
+        report(f'conexão persistente, pipeline {window}', pipelined_ops * window, f'({pipelined_ops * window / per_request:.1f}x)')
+    finally:
+        stop_cluster(servers)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+# Mede a vazão agregada de PUTs com as chaves divididas pelo anel de hash consistente entre 1 a N grupos, cada um
+# com o seu líder em um processo server.py próprio, e com os PUTs disparados de vários processos de clientes que
+# enviam cada chave ao líder do seu grupo. Depois, com as chaves distribuídas entre os grupos, acrescenta mais um
+# grupo pelo rebalanceamento e informa as chaves copiadas contra o total, o tempo da migração e se todas as chaves
+# continuam legíveis com o anel novo. O ganho depende de haver núcleos livres para os líderes e para os clientes.
+# Execução: python -m benchmarks.bench_groups [segundos] [processos de clientes] [grupos...]
+import os
+import sys
+import time
+import random
+import tempfile
+import subprocess
+import contextlib
+import multiprocessing
+from typing import List
+from client import Client
+from ring import HashRing
+from rebalance import Rebalancer
+from benchmarks.common import report
+from benchmarks.loadgen import SERVER_SCRIPT, wait_for_port
+
+BASE_PORT = 18400
+KEYS = 20000
+
+
+# sobe o líder de um grupo em um processo próprio
+def start_leader(port: int) -> subprocess.Popen:
+    process = subprocess.Popen([sys.executable, SERVER_SCRIPT, '--ip', '127.0.0.1', '--port', str(port),
+                                '--leader-ip', '127.0.0.1', '--leader-port', str(port), '--log-level', 'warning'],
+                               stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+    wait_for_port(port)
+    return process
+
+
+def stop_leaders(processes: List[subprocess.Popen]) -> None:
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait()
+
+
+# grava a configuração de um cluster com um grupo de um só servidor por porta
+def write_cluster(path: str, ports: List[int]) -> HashRing:
+    ring = HashRing({f'g{i + 1}': [f'127.0.0.1:{port}'] for i, port in enumerate(ports)})
+    ring.save(path)
+    return ring
+
+
+# laço de um processo de cliente: PUTs em chaves sorteadas até o fim do prazo; devolve as operações feitas
+def client_loop(cluster: str, seed: int, duration: float, results) -> None:
+    client = Client()
+    client.init_cluster(cluster)
+    rng = random.Random(seed)
+    operations = 0
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        stop_at = time.monotonic() + duration
+        while time.monotonic() < stop_at:
+            client.put(f'bench:{rng.randrange(KEYS)}', 'x' * 100)
+            operations += 1
+    results.put(operations)
+
+
+def throughput(cluster: str, ports: List[int], clients: int, duration: float) -> float:
+    processes = [start_leader(port) for port in ports]
+    try:
+        write_cluster(cluster, ports)
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        workers = [context.Process(target=client_loop, args=(cluster, seed, duration, results))
+                   for seed in range(clients)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        operations = sum(results.get() for _ in workers)
+        elapsed = time.perf_counter() - started
+        for worker in workers:
+            worker.join()
+        return operations / elapsed
+    finally:
+        stop_leaders(processes)
+
+
+# preenche `groups` grupos, acrescenta mais um e confere as chaves depois da migração
+def rebalance(cluster: str, base_port: int, groups: int) -> None:
+    ports = [base_port + i for i in range(groups + 1)]
+    processes = [start_leader(port) for port in ports]
+    try:
+        old_ring = write_cluster(cluster, ports[:-1])
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            client = Client()
+            client.init_cluster(cluster)
+            for i in range(0, KEYS, 500):
+                client.mput([(f'bench:{j}', f'v{j}') for j in range(i, i + 500)])
+            rebalancer = Rebalancer(cluster)
+            new_ring = old_ring.with_group(f'g{groups + 1}', [f'127.0.0.1:{ports[-1]}'])
+            started = time.perf_counter()
+            moved = rebalancer.rebalance(new_ring)
+            elapsed = time.perf_counter() - started
+            rebalancer.close()
+            reader = Client()
+            reader.init_cluster(cluster)
+            values = dict(reader.prefix('bench:', limit=1000))
+        copied = sum(count for count, _ in moved.values())
+        expected = sum(1 for j in range(KEYS) if old_ring.group_of(f'bench:{j}') != new_ring.group_of(f'bench:{j}'))
+        correct = sum(1 for j in range(KEYS) if values.get(f'BENCH:{j}') == f'v{j}')
+        print(f'rebalanceamento {groups} -> {groups + 1} grupos: {copied:,} de {KEYS:,} chaves copiadas '
+              f'({copied / KEYS:.1%}; ideal {1 / (groups + 1):.1%}, esperado {expected:,}) em {elapsed:.2f} s '
+              f'({copied / elapsed:,.0f} chaves/s); {correct:,} de {KEYS:,} chaves corretas depois')
+    finally:
+        stop_leaders(processes)
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    counts = [int(arg) for arg in sys.argv[3:]] or [1, 2, 3]
+    print(f'{clients} processos de clientes, só PUTs, {os.cpu_count()} núcleos')
+    with tempfile.TemporaryDirectory() as directory:
+        cluster = os.path.join(directory, 'cluster.json')
+        baseline = None
+        for offset, groups in enumerate(counts):
+            ports = [BASE_PORT + 10 * offset + i for i in range(groups)]
+            ops = throughput(cluster, ports, clients, duration)
+            baseline = baseline or ops
+            report(f'{groups} grupo(s)', ops, f'ganho {ops / baseline:.2f}x')
+        rebalance(cluster, BASE_PORT + 10 * len(counts), 2)
+
+if __name__ == '__main__':
+    main()
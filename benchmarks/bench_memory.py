@@ -0,0 +1,50 @@
+# Relatório de memória do store: bytes por chave com 1M e 10M chaves, comparando o registro compacto (Record)
+# com o dicionário {'value', 'timestamp'} usado antes. Cada medição roda em um processo separado, que preenche
+# o engine particionado e mede o crescimento do RSS máximo; o total inclui chaves, valores e os dicionários das
+# partições, então é o número a usar no dimensionamento das máquinas.
+# Execução: python -m benchmarks.bench_memory [quantidades de chaves...]
+import gc
+import sys
+import resource
+import subprocess
+from storage import Record, ShardedStorage
+
+LAYOUTS = ('record', 'dict')
+DEFAULT_SIZES = (1_000_000, 10_000_000)
+
+# RSS máximo do processo, em bytes (ru_maxrss é informado em KB no Linux e em bytes no macOS)
+def max_rss() -> int:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+# preenche o store com `keys` chaves no formato `layout` e imprime o crescimento do RSS
+def child(layout: str, keys: int) -> None:
+    storage = ShardedStorage()
+    gc.disable()
+    before = max_rss()
+    for i in range(keys):
+        # valores distintos de 10 bytes, timestamps como os atribuídos pelo líder
+        value = f'{i:010d}'
+        record = Record(value, i + 1) if layout == 'record' else dict([('value', value), ('timestamp', i + 1)])
+        storage.put(f'KEY:{i}', record)
+    print(max_rss() - before)
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == '--child':
+        child(sys.argv[2], int(sys.argv[3]))
+        return
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    print(f'{"chaves":>12} ' + ' '.join(f'{layout + " bytes/chave":>20}' for layout in LAYOUTS))
+    for keys in sizes:
+        row = []
+        for layout in LAYOUTS:
+            result = subprocess.run([sys.executable, '-m', 'benchmarks.bench_memory', '--child', layout, str(keys)],
+                                    capture_output=True, text=True)
+            if result.returncode != 0:
+                row.append(f'{"sem memória":>20}')
+                continue
+            row.append(f'{int(result.stdout) / keys:>20,.1f}')
+        print(f'{keys:>12,} ' + ' '.join(row))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# Compara a Message com __slots__ e construtores por tipo com a implementação anterior
+# (@dataclass com __dict__, propriedades e setters encadeados), reproduzida aqui como LegacyMessage.
+# Execução: python -m benchmarks.bench_message [objetos]
+import sys
+import time
+import tracemalloc
+from message import Message
+
+# cópia da Message anterior, mantida apenas para comparação
+class LegacyMessage:
+    def __init__(self, type: str) -> None:
+        self._type = type
+        self._key = ''
+        self._value = ''
+        self._client_timestamp = 0
+        self._server_timestamp = 0
+        self._sender = ('', 0)
+        self._follower = ('', 0)
+        self._store_json = ''
+
+    @property
+    def key(self) -> str:
+        return self._key
+
+    @property
+    def value(self) -> str:
+        return self._value
+
+    @property
+    def server_timestamp(self) -> int:
+        return self._server_timestamp
+
+    def set_key(self, key: str):
+        self._key = key
+        return self
+
+    def set_value(self, value: str):
+        self._value = value
+        return self
+
+    def set_server_timestamp(self, timestamp: int):
+        self._server_timestamp = timestamp
+        return self
+
+# caminho quente de um PUT no líder com dois followers: requisição, duas replicações e a resposta
+def legacy_put_path(key: str, value: str) -> None:
+    request = LegacyMessage('PUT').set_key(key).set_value(value)
+    for _ in range(2):
+        LegacyMessage('REPLICATION').set_key(request.key).set_value(request.value).set_server_timestamp(1)
+    LegacyMessage('PUT_OK').set_key(request.key).set_value(request.value).set_server_timestamp(1)
+
+def slotted_put_path(key: str, value: str) -> None:
+    request = Message.put(key, value)
+    for _ in range(2):
+        Message.replication(request.key, request.value, 1)
+    Message.put_ok(request.key, request.value, 1)
+
+# objetos criados por segundo no caminho do PUT (4 mensagens por iteração)
+def objects_per_second(path, iterations: int) -> float:
+    start = time.perf_counter()
+    for i in range(iterations):
+        path('key', 'value')
+    return iterations * 4 / (time.perf_counter() - start)
+
+# bytes alocados por instância, medidos com tracemalloc sobre `count` mensagens vivas
+def bytes_per_instance(factory, count: int) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    alive = [factory() for _ in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # desconta a própria lista que mantém as mensagens vivas
+    return (after - before - sys.getsizeof(alive)) / count
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    legacy_ops = objects_per_second(legacy_put_path, iterations)
+    slotted_ops = objects_per_second(slotted_put_path, iterations)
+    legacy_bytes = bytes_per_instance(lambda: LegacyMessage('GET').set_key('key'), 100000)
+    slotted_bytes = bytes_per_instance(lambda: Message.get('key', 0), 100000)
+    print(f'{"implementação":<16} {"objetos/s":>12} {"bytes/instância":>16}')
+    print(f'{"anterior":<16} {legacy_ops:>12,.0f} {legacy_bytes:>16.0f}')
+    print(f'{"__slots__":<16} {slotted_ops:>12,.0f} {slotted_bytes:>16.0f}')
+
+if __name__ == '__main__':
+    main()
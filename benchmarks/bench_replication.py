@@ -0,0 +1,50 @@
+# Mede a latência do PUT no líder conforme cresce o número de followers, para cada política de confirmação.
+# Execução: python -m benchmarks.bench_replication [PUTs por cliente] [clientes]
+import sys
+import time
+from threading import Thread
+from message import Message
+from connection import Connection
+from replication import ACK_POLICIES
+from benchmarks.common import start_cluster, stop_cluster, quiet, percentile
+
+BASE_PORT = 17200
+
+# cada cliente usa sua própria conexão com o líder e registra a latência de cada PUT em milissegundos
+def run_clients(port: int, clients: int, puts: int) -> list:
+    latencies = []
+
+    def client(idx: int):
+        conn = Connection('127.0.0.1', port)
+        for i in range(puts):
+            cmd = Message('PUT').set_key(f'key{idx}:{i}').set_value('x' * 100)
+            start = time.perf_counter()
+            conn.request(cmd)
+            latencies.append((time.perf_counter() - start) * 1000)
+        conn.close()
+
+    threads = [Thread(target=client, args=(idx,)) for idx in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+def main():
+    puts = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    port = BASE_PORT
+    print(f'{"política":<8} {"followers":>9} {"p50 (ms)":>10} {"p99 (ms)":>10}')
+    for policy in ACK_POLICIES:
+        for followers in (2, 4, 6, 8, 10):
+            with quiet():
+                servers = start_cluster(port, followers, ack_policy=policy)
+                try:
+                    latencies = run_clients(port, clients, puts)
+                finally:
+                    stop_cluster(servers)
+            print(f'{policy:<8} {followers:>9} {percentile(latencies, 50):>10.2f} {percentile(latencies, 99):>10.2f}')
+            port += followers + 1
+
+if __name__ == '__main__':
+    main()
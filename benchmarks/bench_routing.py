@@ -0,0 +1,72 @@
+# Mede a latência do PUT e as conexões abertas a cada 10 mil operações em um cluster com um líder e dois followers:
+# uma conexão nova por operação em um servidor sorteado (como o cliente fazia antes), o pool de conexões com
+# servidor sorteado e o pool com as escritas enviadas direto ao líder aprendido pelas respostas.
+# Execução: python -m benchmarks.bench_routing [PUTs por thread] [threads]
+import sys
+import time
+import helpers
+from random import randint
+from threading import Thread
+from message import Message
+from client import Client
+from benchmarks.common import start_cluster, stop_cluster, quiet, percentile
+
+BASE_PORT = 17600
+FOLLOWERS = 2
+ADDRESSES = [('127.0.0.1', BASE_PORT + i) for i in range(FOLLOWERS + 1)]
+
+# cliente que ignora o líder informado nas respostas, sorteando o servidor de cada escrita
+class RandomRoutingClient(Client):
+    def learn_leader(self, response: Message) -> None:
+        pass
+
+# executa `puts` PUTs em cada uma de `threads` threads, devolvendo as latências em milissegundos
+def run(put, threads: int, puts: int) -> list:
+    latencies = []
+
+    def worker(idx: int):
+        for i in range(puts):
+            start = time.perf_counter()
+            put(f'key{idx}:{i}', 'x' * 100)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    workers = [Thread(target=worker, args=(idx,)) for idx in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return latencies
+
+# uma conexão TCP aberta e fechada por operação, em um servidor sorteado
+def connection_per_put(key: str, value: str) -> None:
+    ip, port = ADDRESSES[randint(0, len(ADDRESSES) - 1)]
+    sk = helpers.open_server_connection(ip, port)
+    try:
+        helpers.send_request(sk, Message.put(key, value))
+    finally:
+        helpers.close_server_connection(sk)
+
+def main():
+    puts = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    ops = puts * threads
+    servers = start_cluster(BASE_PORT, followers=FOLLOWERS)
+    addresses = [f'{ip}:{port}' for ip, port in ADDRESSES]
+    print(f'{"cliente":<28} {"p50 (ms)":>10} {"p99 (ms)":>10} {"conexões/10k ops":>18}')
+    try:
+        with quiet():
+            latencies = run(connection_per_put, threads, puts)
+        print(f'{"conexão por operação":<28} {percentile(latencies, 50):>10.2f} {percentile(latencies, 99):>10.2f} '
+              f'{10000:>18,.0f}')
+        for name, client_class in (('pool, servidor sorteado', RandomRoutingClient), ('pool, escrita no líder', Client)):
+            client = client_class()
+            client.init(addresses)
+            with quiet():
+                latencies = run(client.put, threads, puts)
+            opened = client.connections_opened / ops * 10000
+            print(f'{name:<28} {percentile(latencies, 50):>10.2f} {percentile(latencies, 99):>10.2f} {opened:>18,.1f}')
+    finally:
+        stop_cluster(servers)
+
+if __name__ == '__main__':
+    main()
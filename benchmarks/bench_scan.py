@@ -0,0 +1,40 @@
+# Compara a listagem das chaves de um tenant (prefixo `tenant:`) com GET chave a chave, que exige conhecer as
+# chaves de antemão, contra PREFIX paginado pelo índice ordenado, com várias outras chaves no store. A vazão é
+# em chaves por segundo.
+# Execução: python -m benchmarks.bench_scan [chaves do tenant] [chaves de outros tenants] [tamanho da página]
+import sys
+import time
+from client import Client
+from benchmarks.common import start_cluster, stop_cluster, quiet, report
+
+BASE_PORT = 17900
+
+def main():
+    keys = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    others = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    page = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+    servers = start_cluster(BASE_PORT, followers=1)
+    client = Client()
+    client.init([f'127.0.0.1:{BASE_PORT}', f'127.0.0.1:{BASE_PORT + 1}'])
+    names = [f'tenant:{i}' for i in range(keys)]
+    try:
+        with quiet():
+            filler = [f'outro{i % 100}:{i}' for i in range(others)]
+            for i in range(0, others, 1000):
+                client.mput([(key, 'x' * 100) for key in filler[i:i + 1000]])
+            for i in range(0, keys, 1000):
+                client.mput([(key, 'x' * 100) for key in names[i:i + 1000]])
+            start = time.perf_counter()
+            for key in names:
+                client.get(key)
+            get_loop = keys / (time.perf_counter() - start)
+            start = time.perf_counter()
+            listed = client.prefix('tenant:', limit=page)
+            prefix = keys / (time.perf_counter() - start)
+        report('GET chave a chave', get_loop)
+        report(f'PREFIX em páginas de {page}', prefix, f'({prefix / get_loop:.1f}x, {len(listed)} chaves)')
+    finally:
+        stop_cluster(servers)
+
+if __name__ == '__main__':
+    main()
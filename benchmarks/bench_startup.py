@@ -0,0 +1,89 @@
+# Mede o tempo até a primeira resposta de um servidor que sobe com um snapshot grande no disco, com o snapshot
+# mapeado e lido sob demanda (--snapshot-load lazy) e carregado inteiro na memória (--snapshot-load eager), além da
+# memória residente do processo e da vazão de GETs em chaves sorteadas logo depois da subida. O snapshot é gravado
+# direto pela camada de persistência, sem passar por um servidor.
+# Execução: python -m benchmarks.bench_startup [chaves] [GETs]
+import os
+import sys
+import time
+import random
+import tempfile
+import subprocess
+from message import Message
+from connection import Connection
+from persistence import Persistence
+from benchmarks.common import measure, quiet, report
+from benchmarks.loadgen import SERVER_SCRIPT
+
+BASE_PORT = 18500
+VALUE_SIZE = 100
+
+
+# grava um snapshot com `keys` chaves no diretório de dados
+def write_snapshot(data_dir: str, keys: int) -> float:
+    start = time.perf_counter()
+    persistence = Persistence(data_dir, fsync_policy='never')
+    items = ((f'BENCH:{i:09d}', 'x' * VALUE_SIZE, i + 1, 0) for i in range(keys))
+    persistence.snapshot(lambda: items, keys)
+    persistence.close()
+    return time.perf_counter() - start
+
+
+# memória residente de um processo, em MB (0 fora do Linux)
+def resident_mb(pid: int) -> float:
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+# conecta ao servidor assim que ele aceita conexões, tentando de novo enquanto ele ainda recupera o disco
+def connect(port: int, timeout: float = 300) -> Connection:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with quiet():
+                return Connection('127.0.0.1', port)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'Servidor 127.0.0.1:{port} não subiu em {timeout} s')
+            time.sleep(0.01)
+
+
+def run(data_dir: str, port: int, mode: str, keys: int, gets: int) -> None:
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, SERVER_SCRIPT, '--ip', '127.0.0.1', '--port', str(port),
+                                '--leader-ip', '127.0.0.1', '--leader-port', str(port), '--log-level', 'warning',
+                                '--data-dir', data_dir, '--snapshot-interval', '3600', '--snapshot-load', mode],
+                               stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+    try:
+        connection = connect(port)
+        response = connection.request(Message.get(f'bench:{keys // 2:09d}', 0))
+        first = time.perf_counter() - start
+        assert response is not None and response.value == 'x' * VALUE_SIZE, response
+        rng = random.Random(0)
+        ops, _ = measure(lambda: connection.request(Message.get(f'bench:{rng.randrange(keys):09d}', 0)), gets)
+        report(f'{mode}: GETs depois da subida', ops,
+               f'primeira resposta em {first * 1000:,.0f} ms, {resident_mb(process.pid):,.0f} MB residentes')
+        connection.close()
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    keys = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    gets = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    with tempfile.TemporaryDirectory() as data_dir:
+        elapsed = write_snapshot(data_dir, keys)
+        size_mb = os.path.getsize(os.path.join(data_dir, 'snapshot.dat')) / 1024 / 1024
+        print(f'snapshot com {keys:,} chaves de {VALUE_SIZE} bytes: {size_mb:,.0f} MB gravados em {elapsed:.2f} s')
+        for offset, mode in enumerate(('lazy', 'eager')):
+            run(data_dir, BASE_PORT + offset, mode, keys, gets)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# Mede a vazão de get_key_value_pair/store_key_value_pair conforme cresce a quantidade de threads de handler,
+# comparando o engine com um único lock e o engine particionado (lock por partição, leituras sem lock).
+# Execução: python -m benchmarks.bench_storage [operações por thread] [% de escritas]
+import sys
+import time
+import random
+from threading import Thread, Barrier
+from server import Server
+from storage import STORAGE_ENGINES
+from benchmarks.common import quiet
+
+BASE_PORT = 17400
+THREADS = (1, 2, 4, 8, 16, 32)
+KEYS = 10000
+
+# executa `ops` operações em cada uma de `threads` threads e devolve a vazão total
+def run(server: Server, threads: int, ops: int, write_ratio: float) -> float:
+    barrier = Barrier(threads + 1)
+
+    def handler(idx: int):
+        rng = random.Random(idx)
+        keys = [f'key{rng.randrange(KEYS)}' for _ in range(ops)]
+        writes = [rng.random() < write_ratio for _ in range(ops)]
+        barrier.wait()
+        for key, write in zip(keys, writes):
+            if write:
+                server.store_key_value_pair(key, 'x' * 100)
+            else:
+                server.get_key_value_pair(key)
+
+    workers = [Thread(target=handler, args=(idx,)) for idx in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return threads * ops / (time.perf_counter() - start)
+
+def main():
+    ops = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    write_ratio = (int(sys.argv[2]) if len(sys.argv) > 2 else 10) / 100
+    print(f'{int(write_ratio * 100)}% de escritas, {KEYS} chaves')
+    print(f'{"threads":>8} ' + ' '.join(f'{engine + " ops/s":>16}' for engine in STORAGE_ENGINES))
+    results = {engine: [] for engine in STORAGE_ENGINES}
+    for i, engine in enumerate(STORAGE_ENGINES):
+        port = BASE_PORT + i
+        with quiet():
+            server = Server('127.0.0.1', port, '127.0.0.1', port, storage=engine)
+            server.setup()
+            for key in range(KEYS):
+                server.store_key_value_pair(f'key{key}', 'x' * 100)
+            for threads in THREADS:
+                results[engine].append(run(server, threads, ops, write_ratio))
+            server.close()
+    for row, threads in enumerate(THREADS):
+        print(f'{threads:>8} ' + ' '.join(f'{results[engine][row]:>16,.0f}' for engine in STORAGE_ENGINES))
+
+if __name__ == '__main__':
+    main()
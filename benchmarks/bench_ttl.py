@@ -0,0 +1,64 @@
+# Mede o custo das chaves com TTL no líder, sem rede: a vazão de escrita com e sem TTL (a agenda de expirações
+# é um heap), a vazão das expirações com todas as chaves vencendo juntas e o custo ocioso da agenda com milhões
+# de chaves agendadas, comparado ao tempo de uma varredura completa do store, que um coletor sem agenda faria
+# a cada passada.
+# Execução: python -m benchmarks.bench_ttl [chaves]
+import sys
+import time
+from expiry import now_ms
+from benchmarks.common import start_cluster, stop_cluster, report
+
+BASE_PORT = 18000
+BATCH = 1000
+
+
+# escreve `keys` chaves em lotes de BATCH pelo mesmo caminho do MPUT e devolve as chaves por segundo
+def write_keys(server, keys: int, ttl_ms: int) -> float:
+    start = time.perf_counter()
+    for i in range(0, keys, BATCH):
+        pairs = [(f'ttl:{j}', 'x' * 16) for j in range(i, min(i + BATCH, keys))]
+        server.write_key_value_pairs(pairs, [ttl_ms] * len(pairs))
+    return keys / (time.perf_counter() - start)
+
+
+def main():
+    keys = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    server, = start_cluster(BASE_PORT)
+    try:
+        without_ttl = write_keys(server, keys, 0)
+        report(f'escrita sem TTL ({keys:,} chaves)', without_ttl)
+        server.storage.clear()
+        with_ttl = write_keys(server, keys, 3600 * 1000)
+        report('escrita com TTL', with_ttl, f'({with_ttl / without_ttl - 1:+.1%}, {len(server._reaper):,} agendadas)')
+
+        # com milhões de expirações agendadas, a thread da agenda fica parada até o vencimento mais próximo
+        cpu = time.process_time()
+        time.sleep(1)
+        print(f'{"CPU da agenda ociosa por segundo":<40} {(time.process_time() - cpu) * 1000:>12,.2f} ms')
+        start = time.perf_counter()
+        now = now_ms()
+        expired = sum(1 for _, stored in server.storage.items() if stored.expires_at and stored.expires_at <= now)
+        print(f'{"varredura completa do store":<40} {(time.perf_counter() - start) * 1000:>12,.2f} ms '
+              f'({expired} vencidas)')
+        start = time.perf_counter()
+        for j in range(100000):
+            server.get_key_value_pair(f'ttl:{j}')
+        report('leituras com verificação do TTL', 100000 / (time.perf_counter() - start))
+
+        # reescreve as chaves com um TTL que só vence depois da última escrita e mede o tempo entre o vencimento
+        # da primeira chave e a expiração de todas
+        server.storage.clear()
+        ttl_ms = int(keys / with_ttl * 1000) + 1000
+        started = time.perf_counter()
+        write_keys(server, keys, ttl_ms)
+        first_due = started + ttl_ms / 1000
+        while len(server.storage) and time.perf_counter() < first_due + 120:
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - first_due
+        expired = server.metrics.snapshot()['counters'].get('keys.expired', 0)
+        report('expirações', expired / max(elapsed, 1e-9), f'({expired:,} chaves em {elapsed:.2f} s após o vencimento)')
+    finally:
+        stop_cluster([server])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# Mede a vazão de escrita de cada política de fsync do write-ahead log e o tempo de recuperação na inicialização.
+# Execução: python -m benchmarks.bench_wal [escritas] [threads]
+import sys
+import time
+import shutil
+import tempfile
+from threading import Thread
+from server import Server
+from persistence import FSYNC_POLICIES
+from benchmarks.common import quiet
+
+BASE_PORT = 17300
+
+# escreve `writes` chaves divididas entre `threads` threads diretamente no store do servidor
+def write_throughput(server: Server, writes: int, threads: int) -> float:
+    per_thread = writes // threads
+
+    def writer(idx: int):
+        for i in range(per_thread):
+            server.store_key_value_pair(f'key{idx}:{i}', 'x' * 100)
+
+    workers = [Thread(target=writer, args=(idx,)) for idx in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return per_thread * threads / (time.perf_counter() - start)
+
+# tempo do setup (recuperação do disco) de um servidor novo apontando para `data_dir`
+def startup_time(data_dir: str, port: int) -> float:
+    start = time.perf_counter()
+    server = Server('127.0.0.1', port, '127.0.0.1', port, data_dir=data_dir, snapshot_interval_s=3600)
+    server.setup()
+    elapsed = time.perf_counter() - start
+    server.close()
+    return elapsed
+
+def main():
+    writes = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    print(f'{"fsync":<10} {"escritas/s":>12} {"início só log (s)":>18} {"início snapshot (s)":>20}')
+    for i, policy in enumerate(FSYNC_POLICIES):
+        data_dir = tempfile.mkdtemp(prefix='kv-bench-')
+        port = BASE_PORT + i
+        try:
+            with quiet():
+                server = Server('127.0.0.1', port, '127.0.0.1', port, data_dir=data_dir, fsync_policy=policy,
+                                snapshot_interval_s=3600)
+                server.setup()
+                ops = write_throughput(server, writes, threads)
+                server.close()
+                wal_only = startup_time(data_dir, port)
+                # grava um snapshot e mede de novo: a recuperação passa a ler o arquivo compacto
+                server = Server('127.0.0.1', port, '127.0.0.1', port, data_dir=data_dir, snapshot_interval_s=3600)
+                server.setup()
+                server.snapshot()
+                server.close()
+                with_snapshot = startup_time(data_dir, port)
+            print(f'{policy:<10} {ops:>12,.0f} {wal_only:>18.3f} {with_snapshot:>20.3f}')
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# Mede a vazão de um líder no modo multiprocesso (--workers) com 1 a N workers: cada execução sobe o server.py
+# em um processo próprio, preenche as chaves e dispara GETs e PUTs de vários processos de clientes, para que a
+# vazão não fique limitada pelo GIL do próprio benchmark. Informa a vazão, o ganho sobre 1 worker e a eficiência
+# (ganho dividido pelos workers); com N workers, (N-1)/N das requisições passam por um salto interno até o worker
+# dono da chave. O ganho depende de haver núcleos livres para os workers e para os clientes.
+# Execução: python -m benchmarks.bench_workers [segundos] [processos de clientes] [workers...]
+import os
+import sys
+import time
+import random
+import subprocess
+import contextlib
+import multiprocessing
+from client import Client
+from benchmarks.common import report
+from benchmarks.loadgen import SERVER_SCRIPT, wait_for_port
+
+BASE_PORT = 18300
+KEYS = 10000
+READ_RATIO = 0.9
+
+
+# laço de um processo de cliente: GETs e PUTs em chaves sorteadas até o fim do prazo; devolve as operações feitas
+def client_loop(port: int, seed: int, duration: float, results) -> None:
+    client = Client()
+    client.init([f'127.0.0.1:{port}'])
+    rng = random.Random(seed)
+    operations = 0
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        stop_at = time.monotonic() + duration
+        while time.monotonic() < stop_at:
+            key = f'bench:{rng.randrange(KEYS)}'
+            if rng.random() < READ_RATIO:
+                client.get(key)
+            else:
+                client.put(key, 'x' * 100)
+            operations += 1
+    results.put(operations)
+
+
+def run(port: int, workers: int, clients: int, duration: float) -> float:
+    process = subprocess.Popen([sys.executable, SERVER_SCRIPT, '--ip', '127.0.0.1', '--port', str(port),
+                                '--leader-ip', '127.0.0.1', '--leader-port', str(port), '--workers', str(workers),
+                                '--log-level', 'warning'], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            loader = Client()
+            loader.init([f'127.0.0.1:{port}'])
+            for i in range(0, KEYS, 500):
+                loader.mput([(f'bench:{j}', 'x' * 100) for j in range(i, i + 500)])
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        processes = [context.Process(target=client_loop, args=(port, seed, duration, results))
+                     for seed in range(clients)]
+        started = time.perf_counter()
+        for client_process in processes:
+            client_process.start()
+        operations = sum(results.get() for _ in processes)
+        elapsed = time.perf_counter() - started
+        for client_process in processes:
+            client_process.join()
+        return operations / elapsed
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    counts = [int(arg) for arg in sys.argv[3:]] or [1, 2, 4]
+    print(f'{clients} processos de clientes, {READ_RATIO:.0%} de GETs, {os.cpu_count()} núcleos')
+    baseline = None
+    for offset, workers in enumerate(counts):
+        throughput = run(BASE_PORT + 10 * offset, workers, clients, duration)
+        baseline = baseline or throughput
+        speedup = throughput / baseline
+        report(f'{workers} worker(s)', throughput, f'ganho {speedup:.2f}x, eficiência {speedup / workers * counts[0]:.0%}')
+
+if __name__ == '__main__':
+    main()
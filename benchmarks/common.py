@@ -0,0 +1,47 @@
+import io
+import time
+import contextlib
+from threading import Thread
+from typing import Callable, List, Tuple
+from server import Server
+
+# sobe um líder e `followers` seguidores na mesma máquina, cada um escutando em uma thread própria
+def start_cluster(base_port: int, followers: int = 0, **server_kwargs) -> List[Server]:
+    servers = []
+    for i in range(followers + 1):
+        server = Server('127.0.0.1', base_port + i, '127.0.0.1', base_port, **server_kwargs)
+        server.setup()
+        Thread(target=server.listen, daemon=True).start()
+        servers.append(server)
+    return servers
+
+# encerra os servidores iniciados por start_cluster
+def stop_cluster(servers: List[Server]) -> None:
+    for server in servers:
+        server.close()
+
+# silencia os prints por requisição dos servidores e clientes durante a medição
+@contextlib.contextmanager
+def quiet():
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+# executa `fn` `iterations` vezes e devolve (operações por segundo, tempo total em segundos)
+def measure(fn: Callable[[], None], iterations: int) -> Tuple[float, float]:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    return iterations / elapsed, elapsed
+
+# imprime uma linha de resultado alinhada
+def report(name: str, ops_per_sec: float, extra: str = '') -> None:
+    print(f'{name:<40} {ops_per_sec:>12,.0f} ops/s {extra}')
+
+# percentil `p` (0-100) de uma lista de amostras
+def percentile(samples: List[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[idx]
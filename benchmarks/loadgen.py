@@ -0,0 +1,219 @@
+# Gerador de carga do KV Store: sobe um líder e N followers em processos separados na máquina local, preenche as
+# chaves e dispara, pela API do Client, uma mistura de GETs e PUTs com chaves em distribuição uniforme ou Zipf,
+# valores de tamanho fixo e várias threads de clientes. O resultado (vazão e latências p50/p99/p999, no total e por
+# comando) sai em json, para ser guardado como referência e comparado com as execuções seguintes (--baseline).
+# Execução: python -m benchmarks.loadgen [opções]; python -m benchmarks.loadgen --help lista as opções
+import os
+import sys
+import json
+import time
+import random
+import shlex
+import socket
+import argparse
+import platform
+import contextlib
+import subprocess
+from bisect import bisect_left
+from itertools import accumulate
+from threading import Thread
+from typing import Dict, List
+from message import Message
+from client import Client
+from benchmarks.common import percentile
+
+BASE_PORT = 17800
+DISTRIBUTIONS = ('uniform', 'zipf')
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'server.py')
+
+
+# cliente que conta as respostas TRY_OTHER_SERVER_OR_LATER recebidas, já depois das repetições do Client
+class LoadClient(Client):
+    def __init__(self, **kwargs) -> None:
+        Client.__init__(self, **kwargs)
+        self.errors = 0
+
+    def put_ok_command_handler(self, put_ok_cmd: Message) -> None:
+        if put_ok_cmd.type == 'TRY_OTHER_SERVER_OR_LATER':
+            self.errors += 1
+        Client.put_ok_command_handler(self, put_ok_cmd)
+
+    def get_response_command_handler(self, get_response_cmd: Message) -> None:
+        if get_response_cmd.type == 'TRY_OTHER_SERVER_OR_LATER':
+            self.errors += 1
+        Client.get_response_command_handler(self, get_response_cmd)
+
+
+# sorteia chaves de uma lista: uniforme, ou Zipf com expoente `s`, em que a chave de posição i tem peso 1/(i+1)^s.
+# As posições são embaralhadas com a semente, então as chaves quentes não são as primeiras criadas
+class KeySampler:
+    def __init__(self, keys: List[str], distribution: str, s: float, seed: int) -> None:
+        self._keys = list(keys)
+        random.Random(seed).shuffle(self._keys)
+        self._cdf = None
+        if distribution == 'zipf':
+            self._cdf = list(accumulate(1 / (i + 1) ** s for i in range(len(keys))))
+
+    def sample(self, rng: random.Random) -> str:
+        if self._cdf is None:
+            return self._keys[rng.randrange(len(self._keys))]
+        idx = bisect_left(self._cdf, rng.random() * self._cdf[-1])
+        return self._keys[min(idx, len(self._keys) - 1)]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Gerador de carga do KV Store')
+    parser.add_argument('--followers', type=int, default=2, help='followers iniciados além do líder')
+    parser.add_argument('--clients', type=int, default=8, help='threads de clientes, cada uma com o seu Client')
+    parser.add_argument('--duration', type=float, default=10, help='segundos de medição')
+    parser.add_argument('--warmup', type=float, default=1, help='segundos de carga antes da medição, descartados')
+    parser.add_argument('--read-ratio', type=float, default=0.9, help='fração das operações que são GET')
+    parser.add_argument('--keys', type=int, default=10000, help='quantidade de chaves, preenchidas antes da carga')
+    parser.add_argument('--distribution', choices=DISTRIBUTIONS, default='uniform', help='distribuição das chaves')
+    parser.add_argument('--zipf-s', type=float, default=0.99, help='expoente da distribuição Zipf')
+    parser.add_argument('--value-size', type=int, default=100, help='tamanho dos valores, em bytes')
+    parser.add_argument('--seed', type=int, default=1, help='semente das chaves e da sequência de operações')
+    parser.add_argument('--base-port', type=int, default=BASE_PORT, help='porta do líder; os followers usam as seguintes')
+    parser.add_argument('--server-args', default='',
+                        help='parâmetros repassados a cada server.py, por exemplo "--mode async --ack-policy quorum"')
+    parser.add_argument('--client-args', default='{}',
+                        help='parâmetros do Client em json, por exemplo \'{"pool_size": 2, "cache_entries": 1000}\'')
+    parser.add_argument('--label', default='', help='nome da execução, registrado no resultado')
+    parser.add_argument('--output', help='arquivo do resultado em json; sem ele o json sai na saída padrão')
+    parser.add_argument('--baseline', help='resultado anterior em json, comparado com o desta execução')
+    parser.add_argument('--server-stats', action='store_true', help='inclui no resultado o STATS de cada servidor')
+    return parser.parse_args()
+
+
+# aguarda um servidor aceitar conexões
+def wait_for_port(port: int, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'Servidor 127.0.0.1:{port} não subiu em {timeout} s')
+            time.sleep(0.05)
+
+
+# sobe o líder e os followers, um processo por servidor; cada follower só sobe depois do anterior aceitar conexões
+def start_servers(base_port: int, followers: int, server_args: str) -> List[subprocess.Popen]:
+    processes = []
+    for i in range(followers + 1):
+        args = [sys.executable, SERVER_SCRIPT, '--ip', '127.0.0.1', '--port', str(base_port + i),
+                '--leader-ip', '127.0.0.1', '--leader-port', str(base_port), '--log-level', 'warning']
+        processes.append(subprocess.Popen(args + shlex.split(server_args), stdin=subprocess.DEVNULL,
+                                          stdout=subprocess.DEVNULL))
+        wait_for_port(base_port + i)
+    return processes
+
+
+def stop_servers(processes: List[subprocess.Popen]) -> None:
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait()
+
+
+# resumo de uma lista de latências em milissegundos
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    return dict(ops=len(latencies), throughput_ops=round(len(latencies) / elapsed, 1),
+                mean_ms=round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+                p50_ms=round(percentile(latencies, 50), 3), p99_ms=round(percentile(latencies, 99), 3),
+                p999_ms=round(percentile(latencies, 99.9), 3), max_ms=round(max(latencies, default=0.0), 3))
+
+
+# executa a carga: cada thread repete operações até o fim do aquecimento mais a medição e guarda só as latências
+# medidas depois do aquecimento, separadas por comando
+def run_load(args, addresses: List[str], sampler: KeySampler) -> Dict:
+    client_args = json.loads(args.client_args)
+    value = 'x' * args.value_size
+    start = time.monotonic()
+    measure_from = start + args.warmup
+    stop_at = measure_from + args.duration
+    samples = [dict(GET=[], PUT=[]) for _ in range(args.clients)]
+    clients = []
+
+    def worker(idx: int) -> None:
+        client = LoadClient(**client_args)
+        client.init(addresses)
+        clients.append(client)
+        rng = random.Random(args.seed * 1000 + idx)
+        latencies = samples[idx]
+        while True:
+            key = sampler.sample(rng)
+            is_read = rng.random() < args.read_ratio
+            began = time.perf_counter()
+            if is_read:
+                client.get(key)
+            else:
+                client.put(key, value)
+            now = time.monotonic()
+            if now >= stop_at:
+                break
+            if now >= measure_from:
+                latencies['GET' if is_read else 'PUT'].append((time.perf_counter() - began) * 1000)
+
+    workers = [Thread(target=worker, args=(idx,)) for idx in range(args.clients)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    gets = [latency for sample in samples for latency in sample['GET']]
+    puts = [latency for sample in samples for latency in sample['PUT']]
+    return dict(total=summarize(gets + puts, args.duration), get=summarize(gets, args.duration),
+                put=summarize(puts, args.duration), errors=sum(client.errors for client in clients))
+
+
+# imprime na saída de erro a variação desta execução em relação a um resultado anterior
+def compare(result: Dict, baseline: Dict) -> None:
+    print(f'{"comparação com " + (baseline["config"].get("label") or "a referência"):<36} '
+          f'{"referência":>12} {"atual":>12} {"variação":>10}', file=sys.stderr)
+    for command in ('total', 'get', 'put'):
+        for metric in ('throughput_ops', 'p50_ms', 'p99_ms', 'p999_ms'):
+            before, after = baseline['results'][command][metric], result['results'][command][metric]
+            change = f'{(after - before) / before:+.1%}' if before else '-'
+            print(f'{command + " " + metric:<36} {before:>12,.3f} {after:>12,.3f} {change:>10}', file=sys.stderr)
+
+
+def main():
+    args = parse_args()
+    names = [f'load:{i}' for i in range(args.keys)]
+    sampler = KeySampler(names, args.distribution, args.zipf_s, args.seed)
+    addresses = [f'127.0.0.1:{args.base_port + i}' for i in range(args.followers + 1)]
+    processes = start_servers(args.base_port, args.followers, args.server_args)
+    try:
+        # as mensagens por operação do Client são descartadas durante a carga
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            loader = Client()
+            loader.init(addresses[:1])
+            for i in range(0, args.keys, 500):
+                loader.mput([(key, 'x' * args.value_size) for key in names[i:i + 500]])
+            results = run_load(args, addresses, sampler)
+            stats = [loader.stats(address) for address in addresses] if args.server_stats else None
+    finally:
+        stop_servers(processes)
+
+    config = {name: value for name, value in vars(args).items() if name not in ('output', 'baseline', 'server_stats')}
+    result = dict(config=config, results=results,
+                  environment=dict(python=platform.python_version(), platform=platform.platform(),
+                                   cpus=os.cpu_count(), time=time.strftime('%Y-%m-%dT%H:%M:%S')))
+    if stats is not None:
+        result['server_stats'] = stats
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+    total = results['total']
+    print(f'{total["throughput_ops"]:,.0f} ops/s, p50 {total["p50_ms"]:.2f} ms, p99 {total["p99_ms"]:.2f} ms, '
+          f'p999 {total["p999_ms"]:.2f} ms, {results["errors"]} erros', file=sys.stderr)
+    if args.baseline:
+        with open(args.baseline) as file:
+            compare(result, json.load(file))
+
+if __name__ == '__main__':
+    main()
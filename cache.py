@@ -0,0 +1,115 @@
+import sys
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional
+
+# memória estimada de uma entrada além da chave e do valor: o objeto CacheEntry e o nó do OrderedDict
+ENTRY_OVERHEAD = 160
+
+
+# Valor lido de um servidor, com o timestamp da versão e o instante em que deixa de valer
+class CacheEntry:
+    __slots__ = ('value', 'timestamp', 'expires_at', 'size')
+
+    def __init__(self, value: str, timestamp: int, expires_at: float, size: int) -> None:
+        self.value = value
+        self.timestamp = timestamp
+        self.expires_at = expires_at
+        self.size = size
+
+
+# Cache LRU de leituras do cliente, limitado por quantidade de entradas e por memória estimada, com TTL opcional.
+# Uma entrada só atende a leitura se a versão guardada é pelo menos a última que o cliente conhece da chave,
+# então o cache nunca devolve algo mais antigo do que o cliente já viu ou escreveu.
+class ReadCache:
+    def __init__(self, max_entries: int, max_bytes: int = 0, ttl_s: float = 0) -> None:
+        self._max_entries = max_entries
+        # 0 desabilita o limite de memória e o TTL
+        self._max_bytes = max_bytes
+        self._ttl = ttl_s
+        self._entries: 'OrderedDict[str, CacheEntry]' = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    # region getters
+    @property
+    def hits(self) -> int:
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        return self._misses
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    # estatísticas de uso do cache
+    @property
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return dict(entries=len(self._entries), bytes=self._bytes, hits=self._hits, misses=self._misses,
+                        hit_ratio=self._hits / lookups if lookups else 0.0, evictions=self._evictions,
+                        expirations=self._expirations)
+    # endregion
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # devolve o valor da chave se a versão em cache é pelo menos `min_timestamp` e ainda não expirou
+    def get(self, key: str, min_timestamp: int) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                self._expirations += 1
+                entry = None
+            if entry is None or entry.timestamp < min_timestamp:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry.value
+
+    # guarda a versão `timestamp` do valor de uma chave, descartando as entradas menos usadas acima dos limites.
+    # Uma chave com TTL no servidor (`key_expires_at`, em milissegundos desde a época) não fica em cache além dele
+    def put(self, key: str, value: str, timestamp: int, key_expires_at: int = 0) -> None:
+        size = sys.getsizeof(key) + sys.getsizeof(value) + ENTRY_OVERHEAD
+        if self._max_bytes and size > self._max_bytes:
+            return
+        now = time.monotonic()
+        expires_at = now + self._ttl if self._ttl else 0
+        if key_expires_at:
+            key_deadline = now + (key_expires_at - time.time() * 1000) / 1000
+            if key_deadline <= now:
+                return
+            expires_at = min(expires_at, key_deadline) if expires_at else key_deadline
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None:
+                # uma resposta atrasada não substitui uma versão mais nova já guardada
+                if current.timestamp > timestamp:
+                    return
+                self._remove(key)
+            self._entries[key] = CacheEntry(value, timestamp, expires_at, size)
+            self._bytes += size
+            while len(self._entries) > self._max_entries or (self._max_bytes and self._bytes > self._max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._evictions += 1
+
+    # descarta a entrada de uma chave
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
@@ -1,24 +1,77 @@
 import os
+import json
+import time
 import re
-import helpers
+import argparse
 from random import randint
 from message import Message
-from typing import List, Tuple
+from connection import Connection, ConnectionPool
+from cache import ReadCache
+from codec import CODECS, DEFAULT_CODEC
+from compression import COMPRESSIONS, DEFAULT_COMPRESSION_THRESHOLD
+from ring import HashRing
+from typing import Dict, List, Optional, Tuple
 from threading import Thread
 from dataclasses import dataclass
-from socket import socket
 
 @dataclass
 class Client:
-    def __init__(self) -> None:
+    def __init__(self, codec: str = DEFAULT_CODEC, pool_size: int = 4, max_retries: int = 3,
+                 retry_backoff_ms: int = 10, cache_entries: int = 0, cache_bytes: int = 0,
+                 cache_ttl_ms: int = 0, compression: str = 'none',
+                 compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD) -> None:
         self._servers_adresses  = []
         self._timestamps = dict()
+        # pool de conexões persistentes por servidor, reaproveitadas entre as operações; cada conexão oferece a
+        # compressão dos frames grandes ao servidor, que pode recusá-la
+        self._connections = ConnectionPool(codec, pool_size, compression, compression_threshold)
+        # endereço do líder de cada grupo, aprendido pelas respostas de escrita; enquanto desconhecido, escritas vão
+        # para um servidor sorteado do grupo. Sem o anel, todos os servidores formam um único grupo, ''
+        self._leaders: Dict[str, Tuple[str, int]] = dict()
+        # anel de hash consistente que divide as chaves entre os grupos de servidores, lido do arquivo de configuração
+        # do cluster e relido quando ele muda (após um rebalanceamento); None com um único grupo
+        self._ring: Optional[HashRing] = None
+        self._cluster_file: Optional[str] = None
+        self._cluster_mtime = 0.0
+        # leituras recusadas com TRY_OTHER_SERVER_OR_LATER são repetidas em outro servidor, com espera exponencial
+        self._max_retries = max_retries
+        self._retry_backoff = retry_backoff_ms / 1000
+        # cache opcional das leituras, desabilitado com cache_entries = 0
+        self._cache = ReadCache(cache_entries, cache_bytes, cache_ttl_ms / 1000) if cache_entries > 0 else None
    
     # region getters
     @property
     def servers_adresses(self) -> List[Tuple[str, int]]:
         return self._servers_adresses
 
+    # líder aprendido quando não há anel
+    @property
+    def leader_address(self) -> Optional[Tuple[str, int]]:
+        return self._leaders.get('')
+
+    @property
+    def ring(self) -> Optional[HashRing]:
+        return self._ring
+
+    # versão do anel em uso (0 sem anel)
+    @property
+    def ring_version(self) -> int:
+        return self._ring.version if self._ring is not None else 0
+
+    # quantidade de conexões abertas com os servidores desde a criação do cliente
+    @property
+    def connections_opened(self) -> int:
+        return self._connections.opened
+
+    @property
+    def cache(self) -> Optional[ReadCache]:
+        return self._cache
+
+    # estatísticas do cache de leituras, vazias se ele está desabilitado
+    @property
+    def cache_stats(self) -> Dict[str, float]:
+        return self._cache.stats if self._cache is not None else dict()
+
     def get_timestamp(self, key: str) -> int:
         timestamp = self._timestamps.get(key)
         return timestamp if timestamp is not None else 0
@@ -27,28 +80,93 @@ class Client:
     # region setters
     def set_timestamp(self, key: str, timestamp: int) -> None:
         self._timestamps[key] = timestamp
+
+    def set_leader_address(self, leader_address: Optional[Tuple[str, int]], group: str = '') -> None:
+        if leader_address is None:
+            self._leaders.pop(group, None)
+        else:
+            self._leaders[group] = leader_address
+
+    # passa a dividir as chaves entre os grupos do anel, com os servidores de todos eles. Os timestamps são
+    # sequências do líder de cada grupo, então os das chaves que mudaram de grupo são descartados, com o cache delas
+    def set_ring(self, ring: HashRing) -> None:
+        previous = self._ring
+        self._ring = ring
+        self._servers_adresses = [address for group in ring.groups for address in ring.addresses(group)]
+        self._leaders = {group: ring.leader(group) for group in ring.groups}
+        if previous is not None:
+            moved = [key for key in self._timestamps if previous.group_of(key) != ring.group_of(key)]
+            for key in moved:
+                del self._timestamps[key]
+            self.invalidate_cached(moved)
     # endregion
 
+    # grupo dono de uma chave ('' sem anel)
+    def group_of(self, key: str) -> str:
+        return self._ring.group_of(key) if self._ring is not None else ''
+
+    # grupo de um servidor ('' sem anel), ou None se ele não está no anel
+    def group_of_address(self, address: Tuple[str, int]) -> Optional[str]:
+        if self._ring is None:
+            return ''
+        return next((group for group in self._ring.groups if address in self._ring.addresses(group)), None)
+
+    # separa itens (keys ou pares <key, value>) pelo grupo dono da key, mantendo a ordem em cada grupo
+    def split_by_group(self, items: List, key=lambda item: item) -> Dict[str, List]:
+        groups: Dict[str, List] = dict()
+        for item in items:
+            groups.setdefault(self.group_of(key(item)), []).append(item)
+        return groups
+
     # inclui um server socket na lista de sockets disponíveis
     def set_server_address(self, server_address: str) -> None:
         ip, port = server_address.split(':')
         self.servers_adresses.append((ip, int(port)))
     
-    # sorteia o endereço de um dos servidores aleatóriamente
-    def get_random_server_address(self) -> Tuple[str, int]:
-        if not any(self.servers_adresses):
+    # sorteia o endereço de um dos servidores (do grupo, com o anel) aleatóriamente, evitando os de `exclude`
+    # enquanto houver outros
+    def get_random_server_address(self, exclude: List[Tuple[str, int]] = (), group: str = '') -> Tuple[str, int]:
+        addresses = self._ring.addresses(group) if self._ring is not None and group else self.servers_adresses
+        if not any(addresses):
             raise Exception('Nenhum endereço de servidor disponível')
-        
-        idx = randint(a=0, b=len(self.servers_adresses)-1)
-        return self.servers_adresses[idx]
+        candidates = [address for address in addresses if address not in exclude] or addresses
+        idx = randint(a=0, b=len(candidates)-1)
+        return candidates[idx]
 
     # region funções de comunicação com o servidor
-    def open_server_connection(self) -> socket:
-        ip, port = self.get_random_server_address()
-        return helpers.open_server_connection(ip, port)
+    # obtém uma conexão do pool de um servidor (sorteado, se não informado), devolvendo None se ele não aceitar a conexão
+    def open_server_connection(self, address: Optional[Tuple[str, int]] = None, group: str = '') -> Connection:
+        ip, port = address or self.get_random_server_address(group=group)
+        try:
+            return self._connections.get(ip, port)
+        except OSError:
+            print(f'Servidor {ip}:{port} não aceitou a conexão')
+            self.forget_leader((ip, port))
+            return None
+
+    # obtém uma conexão com o líder do grupo para enviar uma escrita, evitando o encaminhamento por um follower
+    def open_leader_connection(self, group: str = '') -> Connection:
+        return self.open_server_connection(self._leaders.get(group), group)
+
+    # descarta a conexão persistente com um servidor após uma falha; se era o líder, ele volta a ser desconhecido
+    def close_server_connection(self, conn: Connection) -> None:
+        if conn is not None:
+            self._connections.discard(conn.ip, conn.port, conn)
+            self.forget_leader((conn.ip, conn.port))
 
-    def close_server_connection(self, socket: socket) -> None:
-        helpers.close_server_connection(socket)
+    # esquece um servidor que falhou como líder dos grupos em que ele era o líder conhecido
+    def forget_leader(self, address: Tuple[str, int]) -> None:
+        for group in [group for group, leader in self._leaders.items() if leader == address]:
+            self.set_leader_address(None, group)
+
+    # envia uma requisição por uma conexão persistente, descartando-a em caso de falha
+    def send_request(self, conn: Connection, msg: Message) -> Message:
+        try:
+            return conn.request(msg)
+        except OSError as e:
+            self.close_server_connection(conn)
+            print(f'Falha na comunicação com o servidor {conn.address}: {e}')
+            return None
     # endregion
 
     # region features
@@ -56,37 +174,267 @@ class Client:
     def init(self, addresses: List[str]) -> None:
         for address in addresses:
             self.set_server_address(address)
-    
-    # Recebe uma key e um value, envia a um servidor aleatoriamente e aguarda pela resposta
-    def put(self, key: str, value: str) -> None:
-        # abre-se uma conexão com o servidor
-        conn = self.open_server_connection()
-        try:
-            if conn is not None:
-                msg = self.put_command_factory(key, value)
-                response = helpers.send_request(conn, msg)
-                self.put_ok_command_handler(response)
-        finally:
-            self.close_server_connection(conn)
 
-    # recebe uma key e solicita pelo value para um servidor aleatório
+    # Lê a configuração do cluster com vários grupos de servidores (ver ring.py), para enviar cada key ao seu grupo
+    def init_cluster(self, path: str) -> None:
+        self._cluster_file = path
+        self._cluster_mtime = os.path.getmtime(path)
+        self.set_ring(HashRing.load(path))
+
+    # relê a configuração do cluster se o arquivo mudou desde a última leitura, indicando se o anel foi trocado
+    def reload_ring(self) -> bool:
+        if self._cluster_file is None:
+            return False
+        mtime = os.path.getmtime(self._cluster_file)
+        if mtime == self._cluster_mtime:
+            return False
+        self._cluster_mtime = mtime
+        self.set_ring(HashRing.load(self._cluster_file))
+        return True
+
+    # Recebe uma key e um value, envia ao líder do grupo dela (ou a um servidor aleatório do grupo, se ele ainda não
+    # é conhecido) e aguarda pela resposta. Com `ttl_ms`, a key expira depois desse tempo em milissegundos
+    def put(self, key: str, value: str, ttl_ms: int = 0) -> None:
+        self.write_pairs([(key, value)], ttl_ms, single=True)
+
+    # recebe uma key e solicita pelo value para um servidor aleatório; se ele ainda não tem a versão que o cliente
+    # já viu, a leitura é repetida em outro servidor após uma espera que dobra a cada tentativa.
+    # Com o cache habilitado, uma chave já lida em versão pelo menos igual à última conhecida é servida localmente
     def get(self, key: str) -> None:
-         # abre-se uma conexão com o servidor
-        conn = self.open_server_connection()
-        try:
-            if conn is not None:
-                msg = self.get_command_factory(key)
-                response = helpers.send_request(conn, msg)
-                self.get_response_command_handler(response)
-        finally:
-            self.close_server_connection(conn)
+        if self.get_cached([key]):
+            return
+        ring = self._ring
+        response = self.read_with_retry(self.get_command_factory(key), self.group_of(key))
+        if response is None:
+            return
+        # a recusa trocou o anel: a key é lida de novo no grupo que passou a ser o dono dela
+        if response.type == 'TRY_OTHER_SERVER_OR_LATER' and self._ring is not ring:
+            return self.get(key)
+        self.get_response_command_handler(response)
+
+    # envia uma leitura a um servidor aleatório (do grupo, com o anel), repetindo-a em outro servidor após
+    # TRY_OTHER_SERVER_OR_LATER, com espera exponencial; devolve a última resposta, ou None se não houve comunicação.
+    # Com o anel, a recusa pode ser de um intervalo que migrou para outro grupo: o anel é relido do arquivo do
+    # cluster e, se mudou, a recusa é devolvida para quem chamou refazer a leitura no novo dono
+    def read_with_retry(self, msg: Message, group: str = '') -> Optional[Message]:
+        tried = []
+        for attempt in range(self._max_retries + 1):
+            # obtém-se a conexão persistente com o servidor
+            conn = self.open_server_connection(self.get_random_server_address(tried, group))
+            if conn is None:
+                return None
+            response = self.send_request(conn, msg)
+            if response is None:
+                return None
+            if response.type != 'TRY_OTHER_SERVER_OR_LATER' or self.reload_ring() or attempt == self._max_retries:
+                return response
+            tried.append((conn.ip, conn.port))
+            self.backoff(attempt)
+        return None
+
+    # envia vários pares <key, value> em um único MPUT, aplicado pelo líder de uma vez, todos com o mesmo TTL opcional
+    def mput(self, pairs: List[Tuple[str, str]], ttl_ms: int = 0) -> None:
+        self.write_pairs(pairs, ttl_ms)
+
+    # envia os pares ao líder do grupo de cada key, em um MPUT por grupo (ou em um PUT, com `single`). Com o anel,
+    # uma escrita recusada pode ser de um intervalo em migração para outro grupo: as keys recusadas são repetidas
+    # após a espera, com o anel relido do arquivo do cluster
+    def write_pairs(self, pairs: List[Tuple[str, str]], ttl_ms: int = 0, single: bool = False) -> None:
+        self.invalidate_cached([key for key, _ in pairs])
+        for attempt in range(self._max_retries + 1):
+            refused = []
+            for group, group_pairs in self.split_by_group(pairs, key=lambda pair: pair[0]).items():
+                # obtém-se a conexão persistente com o líder do grupo
+                conn = self.open_leader_connection(group)
+                if conn is None:
+                    continue
+                if single:
+                    msg = self.put_command_factory(*group_pairs[0], ttl_ms)
+                else:
+                    msg = self.mput_command_factory(group_pairs, ttl_ms)
+                response = self.send_request(conn, msg)
+                if response is None:
+                    continue
+                if self._ring is not None and attempt < self._max_retries:
+                    results = response.items if response.type == 'MPUT_OK' else [response]
+                    refused_keys = {item.key for item in results if item.type == 'TRY_OTHER_SERVER_OR_LATER'}
+                    if refused_keys:
+                        refused.extend(pair for pair in group_pairs if pair[0] in refused_keys)
+                        if response.type != 'MPUT_OK':
+                            continue
+                        response.items = [item for item in results if item.type != 'TRY_OTHER_SERVER_OR_LATER']
+                if single:
+                    self.put_ok_command_handler(response)
+                else:
+                    self.mput_ok_command_handler(response)
+            if not refused:
+                return
+            pairs = refused
+            self.backoff(attempt)
+            self.reload_ring()
+
+    # incrementa no líder, de forma atômica, o value inteiro de uma key (uma key inexistente vale 0), devolvendo o
+    # novo value, ou None se o incremento foi recusado
+    def incr(self, key: str, delta: int = 1) -> Optional[int]:
+        response = self.write_atomic(self.incr_command_factory(key, delta))
+        return int(response.value) if response is not None and response.type == 'PUT_OK' else None
+
+    def decr(self, key: str, delta: int = 1) -> Optional[int]:
+        return self.incr(key, -delta)
+
+    # grava `value` na key só se ela tem o value `expected` (que pode ser vazio) ou, com `expected_timestamp`, se ela
+    # está nessa versão; sem nenhum dos dois, só se a key não existe. Devolve se gravou, o value atual da key (o novo,
+    # se gravou; None se ela não existe) e o timestamp dele, para repetir a operação sem um GET
+    def cas(self, key: str, value: str, expected: Optional[str] = None, expected_timestamp: Optional[int] = None,
+            ttl_ms: int = 0) -> Tuple[bool, Optional[str], int]:
+        response = self.write_atomic(self.cas_command_factory(key, value, expected, expected_timestamp, ttl_ms))
+        if response is None or response.type not in ('PUT_OK', 'CAS_FAILED'):
+            return False, None, 0
+        current = None if response.absent else response.value
+        return response.type == 'PUT_OK', current, response.server_timestamp
+
+    # acrescenta `suffix` ao fim do value de uma key no líder, de forma atômica, devolvendo o novo value
+    def append(self, key: str, suffix: str) -> Optional[str]:
+        response = self.write_atomic(self.append_command_factory(key, suffix))
+        return response.value if response is not None and response.type == 'PUT_OK' else None
+
+    # envia um INCR, CAS ou APPEND ao líder do grupo da key e trata a resposta. Uma recusa não é repetida: um INCR ou
+    # APPEND recusado por falha na replicação pode já ter sido aplicado pelo líder. Com o anel, a recusa pode ser de
+    # um intervalo em migração para outro grupo, e o anel é relido para a próxima operação
+    def write_atomic(self, msg: Message) -> Optional[Message]:
+        self.invalidate_cached([msg.key])
+        conn = self.open_leader_connection(self.group_of(msg.key))
+        if conn is None:
+            return None
+        response = self.send_request(conn, msg)
+        if response is None:
+            return None
+        self.atomic_response_command_handler(response)
+        if response.type == 'TRY_OTHER_SERVER_OR_LATER':
+            self.reload_ring()
+        return response
+
+    # solicita o value de várias keys em um único MGET, cada uma com o seu timestamp conhecido;
+    # as keys recusadas com TRY_OTHER_SERVER_OR_LATER são repetidas juntas em outro servidor;
+    # as keys servidas pelo cache não são enviadas
+    def mget(self, keys: List[str]) -> None:
+        cached = self.get_cached(keys)
+        for group, group_keys in self.split_by_group([key for key in keys if key not in cached]).items():
+            self.mget_group(group_keys, group)
+
+    # MGET das keys de um único grupo. Como em read_with_retry, uma recusa relê o anel, e com um anel novo as keys
+    # recusadas são repartidas entre os seus novos donos
+    def mget_group(self, keys: List[str], group: str = '') -> None:
+        tried = []
+        for attempt in range(self._max_retries + 1):
+            conn = self.open_server_connection(self.get_random_server_address(tried, group))
+            if conn is None:
+                return
+            msg = self.mget_command_factory(keys)
+            response = self.send_request(conn, msg)
+            if response is None:
+                return
+            refused = [item for item in response.items if item.type == 'TRY_OTHER_SERVER_OR_LATER']
+            if refused and attempt < self._max_retries:
+                response.items = [item for item in response.items if item.type != 'TRY_OTHER_SERVER_OR_LATER']
+                self.mget_ok_command_handler(response)
+                keys = [item.key for item in refused]
+                if self.reload_ring():
+                    self.mget(keys)
+                    return
+                tried.append((conn.ip, conn.port))
+                self.backoff(attempt)
+                continue
+            self.mget_ok_command_handler(response)
+            return
+
+    # lista em ordem as keys do intervalo [start, end) (end vazio: até a última), página a página
+    def scan(self, start: str, end: str = '', limit: int = 100) -> List[Tuple[str, str]]:
+        start_key, end_key = start.upper(), end.upper()
+        return self.read_groups(lambda group: self.read_pages(
+            lambda cursor, timestamp: self.scan_command_factory(start, end, cursor, limit, timestamp),
+            lambda key: key >= start_key and (not end_key or key < end_key), group))
+
+    # lista em ordem as keys que começam com `prefix`, página a página
+    def prefix(self, prefix: str, limit: int = 100) -> List[Tuple[str, str]]:
+        prefix_key = prefix.upper()
+        return self.read_groups(lambda group: self.read_pages(
+            lambda cursor, timestamp: self.prefix_command_factory(prefix, cursor, limit, timestamp),
+            lambda key: key.startswith(prefix_key), group))
+
+    # lê um SCAN/PREFIX de cada grupo do anel e junta as keys em ordem. Cada grupo contribui só com as keys de que
+    # é dono: durante um rebalanceamento, as keys já copiadas aparecem também no grupo de origem. Um grupo que
+    # recusa o anel do cliente faz o anel ser relido, e com um anel novo a leitura recomeça em todos os grupos
+    def read_groups(self, read) -> List[Tuple[str, str]]:
+        while True:
+            ring = self._ring
+            if ring is None:
+                return read('')
+            results = sorted((key, value) for group in ring.groups for key, value in read(group)
+                             if ring.group_of(key) == group)
+            if self._ring is ring:
+                return results
+
+    # busca as páginas de um SCAN/PREFIX seguindo o cursor. A primeira página exige o maior timestamp conhecido
+    # entre as keys do intervalo, para o servidor não omitir uma escrita que o cliente já viu; as seguintes exigem
+    # também a sequência do servidor que respondeu a anterior, para nenhuma página vir de um servidor mais atrasado
+    def read_pages(self, factory, in_range, group: str = '') -> List[Tuple[str, str]]:
+        timestamp = max((ts for key, ts in self._timestamps.items()
+                         if in_range(key.upper()) and self.group_of(key) == group), default=0)
+        results, cursor = [], ''
+        while True:
+            response = self.read_with_retry(factory(cursor, timestamp), group)
+            if response is None:
+                return results
+            if response.type != 'SCAN_OK':
+                print(f'Erro ao listar as chaves a partir de "{response.key}".\n Erro: {response.type}')
+                return results
+            results.extend(self.scan_ok_command_handler(response))
+            timestamp = max(timestamp, response.server_timestamp)
+            cursor = response.cursor
+            if not cursor:
+                return results
+
+    # solicita as métricas de um servidor (sorteado, se não informado)
+    def stats(self, address: Optional[str] = None) -> Dict:
+        if address is not None:
+            ip, port = address.split(':')
+            address = (ip, int(port))
+        conn = self.open_server_connection(address)
+        if conn is None:
+            return dict()
+        response = self.send_request(conn, self.stats_command_factory())
+        return self.stats_ok_command_handler(response) if response is not None else dict()
+
+    # espera antes da tentativa seguinte: retry_backoff, 2 * retry_backoff, 4 * retry_backoff, ...
+    def backoff(self, attempt: int) -> None:
+        time.sleep(self._retry_backoff * (2 ** attempt))
+
+    # serve do cache as keys cuja versão guardada é pelo menos o timestamp conhecido, devolvendo as servidas
+    def get_cached(self, keys: List[str]) -> Dict[str, str]:
+        cached = dict()
+        if self._cache is None:
+            return cached
+        for key in keys:
+            value = self._cache.get(key, self.get_timestamp(key))
+            if value is not None:
+                cached[key] = value
+                print(f'GET key: {key} value: {value} obtido do cache local, meu timestamp {self.get_timestamp(key)}')
+        return cached
+
+    # descarta do cache as keys escritas pelo próprio cliente
+    def invalidate_cached(self, keys: List[str]) -> None:
+        if self._cache is not None:
+            for key in keys:
+                self._cache.invalidate(key)
     # endregion
 
     # region factories
-    # monta um PUT command, carregando uma key e um value
-    def put_command_factory(self, key:str, value: str) -> Message:
-        cmd = Message('PUT').set_key(key).set_value(value)
-        return cmd
+    # monta um PUT command, carregando uma key, um value e o TTL em milissegundos (0 nunca expira)
+    def put_command_factory(self, key:str, value: str, ttl_ms: int = 0) -> Message:
+        if ttl_ms < 0:
+            raise ValueError(f'O TTL não pode ser negativo: {ttl_ms}')
+        return Message.put(key, value, ttl_ms)
 
     # monta um GET command, carregando uma key e o timestamp conhecido pelo client
     def get_command_factory(self, key: str) -> Message:
@@ -96,18 +444,93 @@ class Client:
         # Um get na chave teste:erro retornará TRY_OTHER_SERVER_OR_LATER até que um put neste valor seja realizado
         if key == 'teste:erro' and my_timestamp == 0:
             my_timestamp = 1
-        cmd = Message('GET').set_key(key).set_client_timestamp(my_timestamp)
-        return cmd
+        return Message.get(key, my_timestamp)
+
+    # monta um MPUT command, carregando um PUT para cada par <key, value>
+    def mput_command_factory(self, pairs: List[Tuple[str, str]], ttl_ms: int = 0) -> Message:
+        return Message.mput([self.put_command_factory(key, value, ttl_ms) for key, value in pairs])
+
+    # monta um MGET command, carregando um GET com o timestamp conhecido de cada key
+    def mget_command_factory(self, keys: List[str]) -> Message:
+        return Message.mget([self.get_command_factory(key) for key in keys])
+
+    # monta um INCR command, carregando a key e o incremento (negativo para decrementar)
+    def incr_command_factory(self, key: str, delta: int) -> Message:
+        return Message.incr(key, delta)
+
+    # monta um CAS command, carregando a key, o novo value e o modo de comparação: pelo value esperado, pelo
+    # timestamp esperado ou, sem nenhum dos dois, a exigência de que a key não exista
+    def cas_command_factory(self, key: str, value: str, expected: Optional[str] = None,
+                            expected_timestamp: Optional[int] = None, ttl_ms: int = 0) -> Message:
+        if expected is not None and expected_timestamp is not None:
+            raise ValueError('O CAS compara o value ou o timestamp, não os dois')
+        if ttl_ms < 0:
+            raise ValueError(f'O TTL não pode ser negativo: {ttl_ms}')
+        if expected is not None:
+            return Message.cas(key, value, 'VALUE', expected=expected, ttl=ttl_ms)
+        if expected_timestamp is not None:
+            return Message.cas(key, value, 'TIMESTAMP', expected_timestamp=expected_timestamp, ttl=ttl_ms)
+        return Message.cas(key, value, absent=True, ttl=ttl_ms)
+
+    # monta um APPEND command, carregando a key e o sufixo a acrescentar ao value
+    def append_command_factory(self, key: str, suffix: str) -> Message:
+        return Message.append(key, suffix)
+
+    # monta um SCAN command, pedindo uma página do intervalo [start, end) após o cursor; leva a versão do anel do
+    # cliente, para um grupo cercado por um rebalanceamento recusar um anel anterior
+    def scan_command_factory(self, start: str, end: str, cursor: str, limit: int, timestamp: int) -> Message:
+        return Message.scan(start, end, cursor, limit, timestamp).set_ring_version(self.ring_version)
+
+    # monta um PREFIX command, pedindo uma página das keys que começam com `prefix` após o cursor
+    def prefix_command_factory(self, prefix: str, cursor: str, limit: int, timestamp: int) -> Message:
+        return Message.prefix(prefix, cursor, limit, timestamp).set_ring_version(self.ring_version)
+
+    # monta um STATS command, pedindo as métricas do servidor
+    def stats_command_factory(self) -> Message:
+        return Message('STATS')
     # endregion
     
     # region command handlers
     # handler responsavel por tratar confirmações de PUT
     def put_ok_command_handler(self, put_ok_cmd: Message) -> None:
+        if put_ok_cmd.type == 'TRY_OTHER_SERVER_OR_LATER':
+            print(f'Erro ao registrar o valor da chave "{put_ok_cmd.key}".\n Erro: TRY_OTHER_SERVER_OR_LATER')
+            return
         key, value, timestamp, server_address = put_ok_cmd.key, put_ok_cmd.value, put_ok_cmd.server_timestamp, put_ok_cmd.sender_address
         self.set_timestamp(key, timestamp)
+        self.learn_leader(put_ok_cmd)
         print(f'PUT_OK key: {key} value {value} timestamp {timestamp} realizada no servidor {server_address}')
         
 
+    # registra o líder informado em uma resposta de escrita
+    def learn_leader(self, response: Message) -> None:
+        ip, port = response.leader
+        if not ip:
+            return
+        group = self.group_of_address((ip, port))
+        if group is not None:
+            self.set_leader_address((ip, port), group)
+
+    # handler responsavel por tratar o resultado de um INCR, CAS ou APPEND: PUT_OK com o value resultante,
+    # CAS_FAILED com o value e o timestamp atuais da key ou uma recusa
+    def atomic_response_command_handler(self, response_cmd: Message) -> None:
+        key, value, timestamp = response_cmd.key, response_cmd.value, response_cmd.server_timestamp
+        if response_cmd.type == 'PUT_OK':
+            self.put_ok_command_handler(response_cmd)
+        elif response_cmd.type == 'CAS_FAILED':
+            # o líder informou a versão atual: as próximas leituras não podem devolver uma anterior
+            if timestamp > self.get_timestamp(key):
+                self.set_timestamp(key, timestamp)
+            self.learn_leader(response_cmd)
+            if response_cmd.absent:
+                print(f'CAS recusado: a chave "{key}" não existe')
+            else:
+                print(f'CAS recusado: a chave "{key}" tem o valor {value} (timestamp {timestamp})')
+        elif response_cmd.type == 'INVALID_VALUE':
+            print(f'Erro ao atualizar o valor da chave "{key}".\n Erro: {value}')
+        else:
+            print(f'Erro ao atualizar o valor da chave "{key}".\n Erro: {response_cmd.type}')
+
     # handler responsavel por tratar resultados de um GET
     def get_response_command_handler(self, get_response_cmd: Message) -> None:
         response_type = get_response_cmd.type
@@ -115,10 +538,40 @@ class Client:
             key, value, client_timestamp = get_response_cmd.key, get_response_cmd.value, get_response_cmd.client_timestamp
             server_timestamp, server_address = get_response_cmd.server_timestamp, get_response_cmd.sender_address
             self.set_timestamp(key, server_timestamp)
+            if self._cache is not None:
+                self._cache.put(key, value, server_timestamp, get_response_cmd.expires_at)
             print(f'GET key: {key} value: {value} obtido do servidor {server_address}, meu timestamp {client_timestamp} e do servidor {server_timestamp}')
         elif response_type == 'TRY_OTHER_SERVER_OR_LATER':
             print(f'Erro ao resgatar o valor correspondente a chave "{get_response_cmd.key}".\n Erro: TRY_OTHER_SERVER_OR_LATER')
 
+    # handler responsavel por tratar o resultado de um MPUT, chave a chave
+    def mput_ok_command_handler(self, mput_ok_cmd: Message) -> None:
+        if mput_ok_cmd.type == 'TRY_OTHER_SERVER_OR_LATER':
+            print('Erro ao registrar os valores do MPUT.\n Erro: TRY_OTHER_SERVER_OR_LATER')
+            return
+        self.learn_leader(mput_ok_cmd)
+        for put_ok_cmd in mput_ok_cmd.items:
+            put_ok_cmd.sender = mput_ok_cmd.sender
+            self.put_ok_command_handler(put_ok_cmd)
+
+    # handler responsavel por tratar o resultado de um MGET, chave a chave
+    def mget_ok_command_handler(self, mget_ok_cmd: Message) -> None:
+        for get_response_cmd in mget_ok_cmd.items:
+            get_response_cmd.sender = mget_ok_cmd.sender
+            self.get_response_command_handler(get_response_cmd)
+
+    # handler responsavel por tratar uma página de SCAN/PREFIX, devolvendo os pares <key, value> dela
+    def scan_ok_command_handler(self, scan_ok_cmd: Message) -> List[Tuple[str, str]]:
+        for get_ok_cmd in scan_ok_cmd.items:
+            print(f'{get_ok_cmd.key}: {get_ok_cmd.value} (timestamp {get_ok_cmd.server_timestamp})')
+        return [(get_ok_cmd.key, get_ok_cmd.value) for get_ok_cmd in scan_ok_cmd.items]
+
+    # handler responsavel por exibir as métricas recebidas em um STATS_OK
+    def stats_ok_command_handler(self, stats_ok_cmd: Message) -> Dict:
+        stats = json.loads(stats_ok_cmd.value)
+        print(json.dumps(stats, indent=2))
+        return stats
+
     # endregion
     
     # Sobe a thread que executa a cli de forma contínua
@@ -157,21 +610,78 @@ class Client:
                                 raise Exception(f'{address} não é um endereço válido.\n')
                         self.client.init(addresses=args)
                     elif main_cmd == 'PUT':
-                        if len(args) != 2:
-                            raise Exception('PUT espera pelos parâmetros `key` e `value`.\n')
+                        if len(args) not in (2, 3) or (len(args) == 3 and not args[2].isdigit()):
+                            raise Exception('PUT espera pelos parâmetros `key`, `value` e, opcionalmente, `ttl_ms`.\n')
                         key, value = args[0], args[1]
-                        self.client.put(key, value)
+                        self.client.put(key, value, int(args[2]) if len(args) == 3 else 0)
                     elif main_cmd == 'GET':
                         if len(args) != 1:
                             raise Exception('GET espera pelo parâmetro `key`.\n')
                         self.client.get(key=args[0])
+                    elif main_cmd == 'MPUT':
+                        if len(args) < 2 or len(args) % 2 != 0:
+                            raise Exception('MPUT espera por pares de parâmetros `key value`.\n')
+                        self.client.mput(list(zip(args[0::2], args[1::2])))
+                    elif main_cmd == 'MGET':
+                        if len(args) < 1:
+                            raise Exception('MGET espera por pelo menos um parâmetro `key`.\n')
+                        self.client.mget(keys=args)
+                    elif main_cmd in ('INCR', 'DECR'):
+                        if len(args) not in (1, 2) or (len(args) == 2 and not re.match(r'^-?\d+$', args[1])):
+                            raise Exception(f'{main_cmd} espera pelos parâmetros `key` e, opcionalmente, `delta`.\n')
+                        delta = int(args[1]) if len(args) == 2 else 1
+                        self.client.incr(args[0], delta if main_cmd == 'INCR' else -delta)
+                    elif main_cmd == 'CAS':
+                        if len(args) != 3:
+                            raise Exception('CAS espera pelos parâmetros `key`, `esperado` e `value`.\n')
+                        self.client.cas(args[0], args[2], expected=args[1])
+                    elif main_cmd == 'CAS_TS':
+                        if len(args) != 3 or not args[1].isdigit():
+                            raise Exception('CAS_TS espera pelos parâmetros `key`, `timestamp` e `value`.\n')
+                        self.client.cas(args[0], args[2], expected_timestamp=int(args[1]))
+                    elif main_cmd == 'CAS_NEW':
+                        if len(args) != 2:
+                            raise Exception('CAS_NEW espera pelos parâmetros `key` e `value`.\n')
+                        self.client.cas(args[0], args[1])
+                    elif main_cmd == 'APPEND':
+                        if len(args) != 2:
+                            raise Exception('APPEND espera pelos parâmetros `key` e `sufixo`.\n')
+                        self.client.append(args[0], args[1])
+                    elif main_cmd == 'SCAN':
+                        if len(args) not in (1, 2):
+                            raise Exception('SCAN espera pelos parâmetros `início` e, opcionalmente, `fim`.\n')
+                        self.client.scan(*args)
+                    elif main_cmd == 'PREFIX':
+                        if len(args) != 1:
+                            raise Exception('PREFIX espera pelo parâmetro `prefixo`.\n')
+                        self.client.prefix(args[0])
+                    elif main_cmd == 'STATS':
+                        if len(args) > 1:
+                            raise Exception('STATS espera por no máximo um parâmetro `ip:porta`.\n')
+                        self.client.stats(args[0] if args else None)
+                    elif main_cmd == 'CACHE':
+                        if self.client.cache is None:
+                            raise Exception('O cache de leituras está desabilitado; use --cache-entries.\n')
+                        for name, value in self.client.cache_stats.items():
+                            print(f'{name}: {value:.3f}' if isinstance(value, float) else f'{name}: {value}')
                     elif main_cmd == 'EXIT':
                         raise KeyboardInterrupt()
                     elif main_cmd == 'HELP':
                         print('Os comandos disponíveis são:\n')
                         print('INIT ip:porta [, ip:porta]*: Configura os endereços dos servidores.\n')
-                        print('PUT key value: Envia o par <key,value> para o servidor.\n')
+                        print('PUT key value [ttl_ms]: Envia o par <key,value> para o servidor; com ttl_ms, a key expira após esse tempo.\n')
                         print('GET key: Solicita ao servidor pelo valor correspondente a chave `key`.\n')
+                        print('MPUT key value [key value]*: Envia vários pares <key,value> em uma única requisição.\n')
+                        print('MGET key [key]*: Solicita em uma única requisição os valores de várias chaves.\n')
+                        print('INCR key [delta] / DECR key [delta]: Soma (ou subtrai) `delta` (padrão 1) ao valor inteiro da chave, de forma atômica no líder.\n')
+                        print('CAS key esperado value: Grava `value` só se a chave existe e tem o valor `esperado`.\n')
+                        print('CAS_TS key timestamp value: Grava `value` só se a chave existe e está na versão `timestamp`.\n')
+                        print('CAS_NEW key value: Grava `value` só se a chave não existe.\n')
+                        print('APPEND key sufixo: Acrescenta `sufixo` ao fim do valor da chave, de forma atômica no líder.\n')
+                        print('SCAN início [fim]: Lista em ordem as chaves a partir de `início` e antes de `fim`.\n')
+                        print('PREFIX prefixo: Lista em ordem as chaves que começam com `prefixo`.\n')
+                        print('STATS [ip:porta]: Exibe as métricas de um servidor (sorteado, se não informado).\n')
+                        print('CACHE: Exibe as estatísticas do cache de leituras.\n')
                         print('EXIT: Encerra a execução.\n')
                     else:
                         pass
@@ -185,9 +695,32 @@ class Client:
             os._exit(os.EX_OK) 
 
 def main():
+    parser = argparse.ArgumentParser(description='Cliente do KV Store')
+    parser.add_argument('--codec', choices=list(CODECS), default=DEFAULT_CODEC,
+                        help='codec das mensagens; json facilita a depuração do tráfego')
+    parser.add_argument('--pool-size', type=int, default=4, help='máximo de conexões persistentes por servidor')
+    parser.add_argument('--retries', type=int, default=3,
+                        help='tentativas extras de uma leitura recusada com TRY_OTHER_SERVER_OR_LATER')
+    parser.add_argument('--retry-backoff-ms', type=int, default=10, help='espera antes da primeira repetição; dobra a cada tentativa')
+    parser.add_argument('--cache-entries', type=int, default=0,
+                        help='máximo de chaves no cache de leituras; 0 desabilita o cache')
+    parser.add_argument('--cache-bytes', type=int, default=0, help='memória máxima estimada do cache; 0 sem limite')
+    parser.add_argument('--cache-ttl-ms', type=int, default=0, help='validade de uma entrada do cache; 0 sem expiração')
+    parser.add_argument('--compression', choices=COMPRESSIONS, default='none',
+                        help='compressão dos frames grandes, oferecida aos servidores ao abrir cada conexão')
+    parser.add_argument('--compression-threshold', type=int, default=DEFAULT_COMPRESSION_THRESHOLD,
+                        help='tamanho mínimo, em bytes, de um frame para ser comprimido')
+    parser.add_argument('--cluster', default=None,
+                        help='arquivo json com os grupos de servidores do anel de hash consistente (ver ring.py)')
+    args = parser.parse_args()
     try:
         # instancio o client
-        client = Client()
+        client = Client(codec=args.codec, pool_size=args.pool_size, max_retries=args.retries,
+                        retry_backoff_ms=args.retry_backoff_ms, cache_entries=args.cache_entries,
+                        cache_bytes=args.cache_bytes, cache_ttl_ms=args.cache_ttl_ms, compression=args.compression,
+                        compression_threshold=args.compression_threshold)
+        if args.cluster:
+            client.init_cluster(args.cluster)
         # coloco a command line interface do client para rodar
         client.run_iteractive_menu()
     except ValueError as error:
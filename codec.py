@@ -0,0 +1,253 @@
+import json
+from message import Message, EMPTY_ADDRESS, EMPTY_ITEMS
+from typing import Dict, List, Tuple
+
+# Camada de codecs da serialização das mensagens. O codec usado em cada frame é identificado pelos
+# 4 bits menos significativos das flags do cabeçalho, então o receptor sempre sabe decodificar o payload
+# e responde no mesmo codec da requisição. Os pares negociam o codec com um HELLO ao abrir a conexão.
+
+# máscara das flags do frame que identifica o codec
+CODEC_MASK = 0x0F
+
+
+# Codec textual, legível para depuração: o mesmo JSON produzido por helpers.msg_serialize
+class JsonCodec:
+    name = 'json'
+    id = 0
+
+    def encode(self, message: Message) -> bytes:
+        return json.dumps(message, default=Message.to_json).encode()
+
+    def decode(self, payload: bytes) -> Message:
+        if not payload:
+            return None
+        return json.loads(payload, object_hook=Message.from_json)
+
+
+# region primitivas do formato binário
+# codifica um inteiro não negativo em varint (LEB128): 7 bits por byte, bit mais significativo indica continuação
+def encode_varint(value: int) -> bytes:
+    if value < 0:
+        raise ValueError(f'Varint não representa valores negativos: {value}')
+    if value < 0x80:
+        return bytes((value,))
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+# decodifica um varint a partir de `offset`, devolvendo (valor, próximo offset)
+def decode_varint(data: bytes, offset: int) -> Tuple[int, int]:
+    byte = data[offset]
+    if byte < 0x80:
+        return byte, offset + 1
+    result = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, offset
+        shift += 7
+
+# codifica uma string como varint do tamanho seguido dos bytes em utf-8
+def encode_str(value: str) -> bytes:
+    raw = value.encode()
+    return encode_varint(len(raw)) + raw
+
+def decode_str(data: bytes, offset: int) -> Tuple[str, int]:
+    size, offset = decode_varint(data, offset)
+    end = offset + size
+    return data[offset:end].decode(), end
+# endregion
+
+
+# Codec binário compacto. Layout de uma mensagem:
+#   tag do tipo (1 byte; 0 indica que o nome do tipo vem em seguida como string)
+#   máscara de presença (varint): um bit por campo diferente do valor padrão
+#   campos presentes, na ordem dos bits da máscara: strings com tamanho prefixado, timestamps em varint,
+#   endereços como string + varint e itens como contagem + mensagens aninhadas com tamanho prefixado; os campos
+#   booleanos só ocupam o seu bit na máscara
+class BinaryCodec:
+    name = 'binary'
+    id = 1
+
+    # tags dos tipos de mensagem conhecidos
+    TYPE_TAGS: Dict[str, int] = {
+        'PUT': 1, 'PUT_OK': 2, 'GET': 3, 'GET_OK': 4, 'TRY_OTHER_SERVER_OR_LATER': 5,
+        'FOLLOW': 6, 'FOLLOW_OK': 7, 'REPLICATION': 8, 'REPLICATION_OK': 9, 'REPLICATION_BATCH': 10,
+        'HELLO': 11, 'HELLO_OK': 12, 'SNAPSHOT_CHUNK': 13, 'SNAPSHOT_CHUNK_OK': 14,
+        'MPUT': 15, 'MPUT_OK': 16, 'MGET': 17, 'MGET_OK': 18, 'STATS': 19, 'STATS_OK': 20,
+        'SCAN': 21, 'SCAN_OK': 22, 'PREFIX': 23, 'EXPIRE': 24, 'WORKERS': 25, 'WORKERS_OK': 26,
+        'RANGE_SCAN': 27, 'FENCE': 28, 'DROP_RANGES': 29, 'RANGES_OK': 30,
+        'INCR': 31, 'CAS': 32, 'APPEND': 33, 'CAS_FAILED': 34, 'INVALID_VALUE': 35,
+    }
+    TAG_TYPES: Dict[int, str] = {tag: type for type, tag in TYPE_TAGS.items()}
+
+    # bits da máscara de presença
+    (KEY, VALUE, CLIENT_TS, SERVER_TS, SENDER, FOLLOWER, STORE_JSON, ITEMS, LEADER, CURSOR, LIMIT,
+     TTL, EXPIRES_AT, EXPECTED, COMPARE, ABSENT, RING_VERSION) = (1 << i for i in range(17))
+
+    def encode(self, message: Message) -> bytes:
+        parts: List[bytes] = []
+        mask = 0
+        if message.key:
+            mask |= self.KEY
+            parts.append(encode_str(message.key))
+        if message.value:
+            mask |= self.VALUE
+            parts.append(encode_str(message.value))
+        if message.client_timestamp:
+            mask |= self.CLIENT_TS
+            parts.append(encode_varint(message.client_timestamp))
+        if message.server_timestamp:
+            mask |= self.SERVER_TS
+            parts.append(encode_varint(message.server_timestamp))
+        ip, port = message.sender
+        if ip:
+            mask |= self.SENDER
+            parts.append(encode_str(ip) + encode_varint(port))
+        ip, port = message.follower_address
+        if ip:
+            mask |= self.FOLLOWER
+            parts.append(encode_str(ip) + encode_varint(port))
+        if message.store_json:
+            mask |= self.STORE_JSON
+            parts.append(encode_str(message.store_json))
+        items = message.items
+        if items:
+            mask |= self.ITEMS
+            parts.append(encode_varint(len(items)))
+            for item in items:
+                encoded = self.encode(item)
+                parts.append(encode_varint(len(encoded)))
+                parts.append(encoded)
+        ip, port = message.leader
+        if ip:
+            mask |= self.LEADER
+            parts.append(encode_str(ip) + encode_varint(port))
+        if message.cursor:
+            mask |= self.CURSOR
+            parts.append(encode_str(message.cursor))
+        if message.limit:
+            mask |= self.LIMIT
+            parts.append(encode_varint(message.limit))
+        if message.ttl:
+            mask |= self.TTL
+            parts.append(encode_varint(message.ttl))
+        if message.expires_at:
+            mask |= self.EXPIRES_AT
+            parts.append(encode_varint(message.expires_at))
+        if message.expected:
+            mask |= self.EXPECTED
+            parts.append(encode_str(message.expected))
+        if message.compare:
+            mask |= self.COMPARE
+            parts.append(encode_str(message.compare))
+        if message.absent:
+            mask |= self.ABSENT
+        if message.ring_version:
+            mask |= self.RING_VERSION
+            parts.append(encode_varint(message.ring_version))
+
+        tag = self.TYPE_TAGS.get(message.type, 0)
+        header = bytes((tag,)) if tag else b'\x00' + encode_str(message.type)
+        return header + encode_varint(mask) + b''.join(parts)
+
+    def decode(self, payload: bytes) -> Message:
+        if not payload:
+            return None
+        message, _ = self.decode_from(payload, 0)
+        return message
+
+    # decodifica uma mensagem a partir de `offset`, devolvendo (mensagem, próximo offset)
+    def decode_from(self, data: bytes, offset: int) -> Tuple[Message, int]:
+        tag = data[offset]
+        offset += 1
+        if tag:
+            type = self.TAG_TYPES[tag]
+        else:
+            type, offset = decode_str(data, offset)
+        mask, offset = decode_varint(data, offset)
+        key = value = store_json = cursor = expected = compare = ''
+        client_timestamp = server_timestamp = limit = ttl = expires_at = ring_version = 0
+        sender = follower = leader = EMPTY_ADDRESS
+        items = EMPTY_ITEMS
+        if mask & self.KEY:
+            key, offset = decode_str(data, offset)
+        if mask & self.VALUE:
+            value, offset = decode_str(data, offset)
+        if mask & self.CLIENT_TS:
+            client_timestamp, offset = decode_varint(data, offset)
+        if mask & self.SERVER_TS:
+            server_timestamp, offset = decode_varint(data, offset)
+        if mask & self.SENDER:
+            ip, offset = decode_str(data, offset)
+            port, offset = decode_varint(data, offset)
+            sender = (ip, port)
+        if mask & self.FOLLOWER:
+            ip, offset = decode_str(data, offset)
+            port, offset = decode_varint(data, offset)
+            follower = (ip, port)
+        if mask & self.STORE_JSON:
+            store_json, offset = decode_str(data, offset)
+        if mask & self.ITEMS:
+            count, offset = decode_varint(data, offset)
+            items = []
+            for _ in range(count):
+                size, offset = decode_varint(data, offset)
+                item, _ = self.decode_from(data, offset)
+                items.append(item)
+                offset += size
+        if mask & self.LEADER:
+            ip, offset = decode_str(data, offset)
+            port, offset = decode_varint(data, offset)
+            leader = (ip, port)
+        if mask & self.CURSOR:
+            cursor, offset = decode_str(data, offset)
+        if mask & self.LIMIT:
+            limit, offset = decode_varint(data, offset)
+        if mask & self.TTL:
+            ttl, offset = decode_varint(data, offset)
+        if mask & self.EXPIRES_AT:
+            expires_at, offset = decode_varint(data, offset)
+        if mask & self.EXPECTED:
+            expected, offset = decode_str(data, offset)
+        if mask & self.COMPARE:
+            compare, offset = decode_str(data, offset)
+        if mask & self.RING_VERSION:
+            ring_version, offset = decode_varint(data, offset)
+        message = Message(type, key, value, client_timestamp, server_timestamp, sender, follower, store_json, items, leader,
+                          cursor, limit, ttl, expires_at, expected, compare, bool(mask & self.ABSENT), ring_version)
+        return message, offset
+
+
+# codecs disponíveis, indexados pelo nome e pelo id transportado nas flags do frame
+CODECS: Dict[str, object] = {codec.name: codec for codec in (JsonCodec(), BinaryCodec())}
+CODECS_BY_ID: Dict[int, object] = {codec.id: codec for codec in CODECS.values()}
+# codec usado pelas conexões quando nenhum outro é informado
+DEFAULT_CODEC = 'binary'
+
+# obtém um codec pelo nome
+def get_codec(name: str):
+    codec = CODECS.get(name)
+    if codec is None:
+        raise ValueError(f'Codec desconhecido: {name}')
+    return codec
+
+# obtém o codec identificado pelas flags de um frame
+def codec_from_flags(flags: int):
+    codec = CODECS_BY_ID.get(flags & CODEC_MASK)
+    if codec is None:
+        raise ValueError(f'Codec desconhecido no frame: {flags & CODEC_MASK}')
+    return codec
+
+# escolhe, entre os codecs oferecidos por um par (em ordem de preferência), o primeiro suportado localmente
+def negotiate(offered: List[str]) -> str:
+    for name in offered:
+        if name in CODECS:
+            return name
+    return JsonCodec.name
@@ -0,0 +1,115 @@
+import lzma
+import zlib
+from typing import Dict, List, Tuple, Union
+
+# Compressão opcional dos payloads dos frames e dos valores grandes do store, com os codecs da biblioteca padrão.
+# O algoritmo usado em cada frame vai nos bits 4 e 5 das flags do cabeçalho (os 4 bits menos significativos
+# identificam o codec), então o receptor sempre sabe descomprimir. Os pares combinam o algoritmo no HELLO e só
+# comprimem os frames de pelo menos `threshold` bytes, e só quando a versão comprimida é menor.
+
+# máscara e deslocamento das flags do frame que identificam a compressão do payload
+COMPRESSION_MASK = 0x30
+COMPRESSION_SHIFT = 4
+# tamanho mínimo, em bytes, de um payload ou valor para que a compressão seja tentada
+DEFAULT_COMPRESSION_THRESHOLD = 1024
+
+
+# zlib em nível 1: a maior parte da redução das mensagens com pouco custo de CPU
+class ZlibCompressor:
+    name = 'zlib'
+    id = 1
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, 1)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+# lzma no preset 1: comprime mais que o zlib, ao custo de bem mais CPU
+class LzmaCompressor:
+    name = 'lzma'
+    id = 2
+
+    def compress(self, data: bytes) -> bytes:
+        return lzma.compress(data, preset=1)
+
+    def decompress(self, data: bytes) -> bytes:
+        return lzma.decompress(data)
+
+
+# algoritmos disponíveis, indexados pelo nome e pelo id transportado nas flags do frame; `none` desabilita
+COMPRESSORS: Dict[str, object] = {compressor.name: compressor for compressor in (ZlibCompressor(), LzmaCompressor())}
+COMPRESSORS_BY_ID: Dict[int, object] = {compressor.id: compressor for compressor in COMPRESSORS.values()}
+COMPRESSIONS = ('none',) + tuple(COMPRESSORS)
+
+
+# obtém um algoritmo pelo nome, ou None para `none` e vazio
+def get_compressor(name: str):
+    if not name or name == 'none':
+        return None
+    compressor = COMPRESSORS.get(name)
+    if compressor is None:
+        raise ValueError(f'Compressão desconhecida: {name}')
+    return compressor
+
+
+# escolhe, entre os algoritmos oferecidos por um par (em ordem de preferência), o primeiro suportado localmente
+def negotiate_compression(offered: List[str]) -> str:
+    for name in offered:
+        if name in COMPRESSORS:
+            return name
+    return ''
+
+
+# comprime um payload com pelo menos `threshold` bytes, devolvendo o payload a enviar e as flags de compressão
+def compress_payload(payload: bytes, compressor, threshold: int = DEFAULT_COMPRESSION_THRESHOLD) -> Tuple[bytes, int]:
+    if compressor is None or len(payload) < threshold:
+        return payload, 0
+    compressed = compressor.compress(payload)
+    if len(compressed) >= len(payload):
+        return payload, 0
+    return compressed, compressor.id << COMPRESSION_SHIFT
+
+
+# devolve o payload de um frame já descomprimido, conforme as flags do cabeçalho
+def decompress_payload(flags: int, payload: bytes) -> bytes:
+    compression_id = (flags & COMPRESSION_MASK) >> COMPRESSION_SHIFT
+    if not compression_id:
+        return payload
+    compressor = COMPRESSORS_BY_ID.get(compression_id)
+    if compressor is None:
+        raise ValueError(f'Compressão desconhecida no frame: {compression_id}')
+    return compressor.decompress(payload)
+
+
+# Compressão dos valores grandes no store: um valor com pelo menos `threshold` caracteres é guardado como bytes,
+# com o id do algoritmo no primeiro byte seguido do texto comprimido; os demais continuam como texto. O tipo do
+# valor armazenado indica se ele precisa ser descomprimido na leitura.
+class ValueCompressor:
+    def __init__(self, compression: str = 'none', threshold: int = DEFAULT_COMPRESSION_THRESHOLD) -> None:
+        self._compressor = get_compressor(compression)
+        self._threshold = threshold
+
+    # region getters
+    @property
+    def enabled(self) -> bool:
+        return self._compressor is not None
+    # endregion
+
+    # valor a armazenar: comprimido, se ele é grande e a compressão reduz o seu tamanho
+    def pack(self, value: str) -> Union[str, bytes]:
+        if self._compressor is None or len(value) < self._threshold:
+            return value
+        data = value.encode()
+        compressed = self._compressor.compress(data)
+        if len(compressed) + 1 >= len(data):
+            return value
+        return bytes((self._compressor.id,)) + compressed
+
+    # texto de um valor armazenado
+    @staticmethod
+    def unpack(value: Union[str, bytes]) -> str:
+        if not isinstance(value, bytes):
+            return value
+        return COMPRESSORS_BY_ID[value[0]].decompress(value[1:]).decode()
@@ -0,0 +1,508 @@
+import asyncio
+import helpers
+from message import Message
+from codec import DEFAULT_CODEC, JsonCodec, codec_from_flags, get_codec
+from compression import DEFAULT_COMPRESSION_THRESHOLD, get_compressor, compress_payload, decompress_payload
+from itertools import count
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from threading import Thread, Lock
+from typing import Dict, List, Optional
+from socket import SHUT_RDWR, IPPROTO_TCP, TCP_NODELAY
+
+# segundos que uma requisição síncrona aguarda pela resposta antes de falhar
+DEFAULT_REQUEST_TIMEOUT = 30.0
+
+# Monta um HELLO command, oferecendo o codec desejado com fallback para JSON e, na chave, a compressão desejada
+def hello_command_factory(codec: str, compression: str = 'none') -> Message:
+    offered = [codec] if codec == JsonCodec.name else [codec, JsonCodec.name]
+    return Message('HELLO').set_value(','.join(offered)).set_key(compression if compression != 'none' else '')
+
+
+# Conexão persistente com um servidor, capaz de transportar várias requisições em pipeline.
+# Cada requisição recebe um id que volta no frame de resposta, então as respostas podem chegar fora de ordem.
+class Connection:
+    def __init__(self, ip: str, port: int, codec: str = DEFAULT_CODEC, compression: str = 'none',
+                 compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD) -> None:
+        self._ip = ip
+        self._port = port
+        self._socket = helpers.open_server_connection(ip, port)
+        if self._socket is None:
+            raise ConnectionRefusedError(f'Não foi possível conectar em {ip}:{port}')
+        # codec e compressão combinados com o servidor antes de qualquer requisição; as requisições com pelo menos
+        # `compression_threshold` bytes são comprimidas se o servidor aceitou a compressão
+        self._compressor = None
+        self._compression_threshold = compression_threshold
+        self._codec = self.negotiate_codec(codec, compression)
+        # ids das requisições enviadas por esta conexão
+        self._request_ids = count(1)
+        # requisições que aguardam resposta, indexadas pelo id
+        self._pending: Dict[int, Future] = dict()
+        # lock que protege a escrita no socket e o registro das requisições pendentes
+        self._lock = Lock()
+        self._closed = False
+        # thread dedicada a ler as respostas e entregá-las para quem as aguarda
+        self._reader_thread = Thread(target=self._read_responses, daemon=True)
+        self._reader_thread.start()
+
+    # region getters
+    @property
+    def ip(self) -> str:
+        return self._ip
+
+    @property
+    def port(self) -> int:
+        return self._port
+
+    @property
+    def address(self) -> str:
+        return f'{self.ip}:{self.port}'
+
+    @property
+    def is_open(self) -> bool:
+        return not self._closed
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    @property
+    def codec(self) -> str:
+        return self._codec.name
+
+    @property
+    def compression(self) -> str:
+        return self._compressor.name if self._compressor is not None else 'none'
+    # endregion
+
+    # oferece ao servidor o codec e a compressão desejados por um HELLO em JSON e adota os escolhidos por ele
+    def negotiate_codec(self, codec: str, compression: str = 'none'):
+        if codec == JsonCodec.name and compression == 'none':
+            return get_codec(codec)
+        hello_cmd = hello_command_factory(codec, compression)
+        # o HELLO espera no máximo o tempo de uma requisição: um servidor que aceita a conexão e não responde
+        # não prende quem abre a conexão
+        self._socket.settimeout(DEFAULT_REQUEST_TIMEOUT)
+        try:
+            response = helpers.send_request(self._socket, hello_cmd)
+        except OSError:
+            self._socket.close()
+            raise
+        self._socket.settimeout(None)
+        if response is None or response.type != 'HELLO_OK':
+            return get_codec(JsonCodec.name)
+        self._compressor = get_compressor(response.key)
+        return get_codec(response.value)
+
+    # envia uma requisição sem bloquear, devolvendo um Future que será resolvido com a resposta
+    def request_async(self, message: Message) -> Future:
+        future = Future()
+        payload, compression_flags = compress_payload(self._codec.encode(message), self._compressor,
+                                                      self._compression_threshold)
+        with self._lock:
+            if self._closed:
+                raise ConnectionError(f'Conexão com {self.address} encerrada')
+            request_id = next(self._request_ids)
+            self._pending[request_id] = future
+            try:
+                helpers.send_frame(self._socket, request_id, payload, self._codec.id | compression_flags)
+            except OSError:
+                self._pending.pop(request_id, None)
+                self._close_socket()
+                raise
+        return future
+
+    # envia uma requisição e aguarda pela resposta por até `timeout` segundos (None sem limite); o prazo esgotado
+    # falha como um erro de comunicação
+    def request(self, message: Message, timeout: Optional[float] = DEFAULT_REQUEST_TIMEOUT) -> Message:
+        try:
+            return self.request_async(message).result(timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f'{message.type} sem resposta de {self.address} em {timeout}s')
+
+    # encerra a conexão, falhando as requisições que ainda aguardam resposta
+    def close(self) -> None:
+        with self._lock:
+            self._close_socket()
+        self._fail_pending(ConnectionError(f'Conexão com {self.address} encerrada'))
+
+    def _close_socket(self) -> None:
+        if not self._closed:
+            self._closed = True
+            # o shutdown desbloqueia a thread leitora que estiver parada no recv
+            try:
+                self._socket.shutdown(SHUT_RDWR)
+            except OSError:
+                pass
+            helpers.close_server_connection(self._socket)
+
+    def _fail_pending(self, error: Exception) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, dict()
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    # laço da thread leitora: cada frame recebido resolve o Future da requisição de mesmo id
+    def _read_responses(self) -> None:
+        error = ConnectionError(f'Conexão com {self.address} encerrada pelo servidor')
+        try:
+            while True:
+                frame = helpers.receive_frame(self._socket)
+                if frame is None:
+                    break
+                request_id, flags, payload = frame
+                with self._lock:
+                    future = self._pending.pop(request_id, None)
+                if future is None:
+                    continue
+                # o Future já saiu das pendentes: uma resposta que não decodifica falha só ele, e o laço segue
+                try:
+                    response = codec_from_flags(flags).decode(decompress_payload(flags, payload))
+                except Exception as e:
+                    future.set_exception(ConnectionError(f'Resposta inválida de {self.address}: {e}'))
+                    continue
+                future.set_result(response)
+        except OSError as e:
+            error = e
+        finally:
+            with self._lock:
+                self._close_socket()
+            self._fail_pending(error)
+
+
+# Cache de conexões persistentes indexadas pelo endereço ip:porta, reabrindo as que tiverem sido encerradas
+class ConnectionCache:
+    def __init__(self, codec: str = DEFAULT_CODEC, compression: str = 'none',
+                 compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD) -> None:
+        self._codec = codec
+        self._compression = compression
+        self._compression_threshold = compression_threshold
+        self._connections: Dict[tuple, Connection] = dict()
+        self._lock = Lock()
+        # locks por endereço: a conexão e o HELLO acontecem fora do lock do cache, então um servidor lento ou
+        # inacessível não atrasa quem usa os demais endereços
+        self._address_locks: Dict[tuple, Lock] = dict()
+
+    # conexão aberta com o endereço, ou None se for preciso abrir outra
+    def pick(self, address: tuple) -> Optional[Connection]:
+        with self._lock:
+            conn = self._connections.get(address)
+            return conn if conn is not None and conn.is_open else None
+
+    # devolve uma conexão aberta com o endereço solicitado, abrindo uma nova se necessário
+    def get(self, ip: str, port: int) -> Connection:
+        address = (ip, port)
+        conn = self.pick(address)
+        if conn is not None:
+            return conn
+        with self._lock:
+            address_lock = self._address_locks.setdefault(address, Lock())
+        with address_lock:
+            conn = self.pick(address)
+            if conn is None:
+                conn = Connection(ip, port, self._codec, self._compression, self._compression_threshold)
+                with self._lock:
+                    self._connections[address] = conn
+            return conn
+
+    # descarta a conexão de um endereço, encerrando-a
+    def discard(self, ip: str, port: int) -> None:
+        with self._lock:
+            conn = self._connections.pop((ip, port), None)
+        if conn is not None:
+            conn.close()
+
+    # encerra todas as conexões abertas
+    def close_all(self) -> None:
+        with self._lock:
+            connections, self._connections = list(self._connections.values()), dict()
+        for conn in connections:
+            conn.close()
+
+
+# Pool de conexões persistentes por servidor: mantém até `size` conexões por endereço e entrega a menos ocupada,
+# abrindo uma nova apenas quando todas as existentes têm requisições em voo
+class ConnectionPool:
+    def __init__(self, codec: str = DEFAULT_CODEC, size: int = 4, compression: str = 'none',
+                 compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD) -> None:
+        self._codec = codec
+        self._compression = compression
+        self._compression_threshold = compression_threshold
+        self._size = size
+        self._pools: Dict[tuple, List[Connection]] = dict()
+        self._opened = 0
+        self._lock = Lock()
+        # locks por endereço evitam que várias threads abram conexões além do tamanho do pool ao mesmo tempo; a
+        # conexão e o HELLO acontecem fora do lock do pool, então um servidor lento não atrasa os demais endereços
+        self._address_locks: Dict[tuple, Lock] = dict()
+
+    # region getters
+    @property
+    def size(self) -> int:
+        return self._size
+
+    # quantidade de conexões abertas desde a criação do pool
+    @property
+    def opened(self) -> int:
+        return self._opened
+    # endregion
+
+    # conexão aberta do pool de um endereço preferida para a próxima requisição, ou None se for preciso abrir outra
+    def pick(self, address: tuple) -> Optional[Connection]:
+        with self._lock:
+            pool = [conn for conn in self._pools.get(address, []) if conn.is_open]
+            self._pools[address] = pool
+            conn = min(pool, key=lambda c: c.in_flight, default=None)
+            if conn is None or (conn.in_flight > 0 and len(pool) < self._size):
+                return None
+            return conn
+
+    # devolve uma conexão aberta com o endereço solicitado, preferindo a que tem menos requisições em voo
+    def get(self, ip: str, port: int) -> Connection:
+        address = (ip, port)
+        conn = self.pick(address)
+        if conn is not None:
+            return conn
+        with self._lock:
+            address_lock = self._address_locks.setdefault(address, Lock())
+        with address_lock:
+            conn = self.pick(address)
+            if conn is None:
+                conn = Connection(ip, port, self._codec, self._compression, self._compression_threshold)
+                with self._lock:
+                    self._opened += 1
+                    self._pools.setdefault(address, []).append(conn)
+            return conn
+
+    # descarta uma conexão do pool de um endereço, ou todas elas quando `conn` não é informada
+    def discard(self, ip: str, port: int, conn: Optional[Connection] = None) -> None:
+        with self._lock:
+            pool = self._pools.get((ip, port), [])
+            discarded = [c for c in pool if conn is None or c is conn]
+            self._pools[(ip, port)] = [c for c in pool if c not in discarded]
+        for c in discarded:
+            c.close()
+
+    # encerra todas as conexões abertas
+    def close_all(self) -> None:
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), dict()
+        for pool in pools:
+            for conn in pool:
+                conn.close()
+
+
+# Versão asyncio da Connection: as requisições são corrotinas e as respostas são entregues por uma task leitora
+class AsyncConnection:
+    def __init__(self, ip: str, port: int, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, codec,
+                 compressor=None, compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD) -> None:
+        self._ip = ip
+        self._port = port
+        self._reader = reader
+        self._writer = writer
+        self._codec = codec
+        self._compressor = compressor
+        self._compression_threshold = compression_threshold
+        self._request_ids = count(1)
+        self._pending: Dict[int, asyncio.Future] = dict()
+        self._closed = False
+        self._reader_task = asyncio.ensure_future(self._read_responses())
+
+    # abre uma conexão assíncrona com o servidor ip:port, negociando o codec e a compressão antes de devolvê-la
+    @staticmethod
+    async def open(ip: str, port: int, codec: str = DEFAULT_CODEC, compression: str = 'none',
+                   compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD) -> 'AsyncConnection':
+        reader, writer = await asyncio.open_connection(ip, port)
+        writer.get_extra_info('socket').setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+        negotiated = get_codec(JsonCodec.name)
+        compressor = None
+        if codec != JsonCodec.name or compression != 'none':
+            writer.write(helpers.encode_frame(0, negotiated.encode(hello_command_factory(codec, compression))))
+            frame = await helpers.receive_frame_async(reader)
+            response = negotiated.decode(frame[2]) if frame is not None else None
+            if response is not None and response.type == 'HELLO_OK':
+                negotiated = get_codec(response.value)
+                compressor = get_compressor(response.key)
+        return AsyncConnection(ip, port, reader, writer, negotiated, compressor, compression_threshold)
+
+    # region getters
+    @property
+    def ip(self) -> str:
+        return self._ip
+
+    @property
+    def port(self) -> int:
+        return self._port
+
+    @property
+    def address(self) -> str:
+        return f'{self.ip}:{self.port}'
+
+    @property
+    def is_open(self) -> bool:
+        return not self._closed
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    @property
+    def codec(self) -> str:
+        return self._codec.name
+    # endregion
+
+    # envia uma requisição e aguarda pela resposta sem bloquear o event loop
+    async def request(self, message: Message) -> Message:
+        if self._closed:
+            raise ConnectionError(f'Conexão com {self.address} encerrada')
+        request_id = next(self._request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        payload, compression_flags = compress_payload(self._codec.encode(message), self._compressor,
+                                                      self._compression_threshold)
+        self._writer.write(helpers.encode_frame(request_id, payload, self._codec.id | compression_flags))
+        await self._writer.drain()
+        return await future
+
+    # encerra a conexão, falhando as requisições que ainda aguardam resposta
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._writer.close()
+            self._reader_task.cancel()
+        self._fail_pending(ConnectionError(f'Conexão com {self.address} encerrada'))
+
+    def _fail_pending(self, error: Exception) -> None:
+        pending, self._pending = self._pending, dict()
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    # laço da task leitora: cada frame recebido resolve o Future da requisição de mesmo id
+    async def _read_responses(self) -> None:
+        error = ConnectionError(f'Conexão com {self.address} encerrada pelo servidor')
+        try:
+            while True:
+                frame = await helpers.receive_frame_async(self._reader)
+                if frame is None:
+                    break
+                request_id, flags, payload = frame
+                future = self._pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                # como na Connection, uma resposta que não decodifica falha só a sua requisição
+                try:
+                    response = codec_from_flags(flags).decode(decompress_payload(flags, payload))
+                except Exception as e:
+                    future.set_exception(ConnectionError(f'Resposta inválida de {self.address}: {e}'))
+                    continue
+                future.set_result(response)
+        except OSError as e:
+            error = e
+        finally:
+            if not self._closed:
+                self._closed = True
+                self._writer.close()
+            self._fail_pending(error)
+
+
+# Cache de conexões assíncronas indexadas pelo endereço ip:porta
+class AsyncConnectionCache:
+    def __init__(self, codec: str = DEFAULT_CODEC, compression: str = 'none',
+                 compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD) -> None:
+        self._codec = codec
+        self._compression = compression
+        self._compression_threshold = compression_threshold
+        self._connections: Dict[tuple, AsyncConnection] = dict()
+        # locks por endereço evitam que duas corrotinas abram conexões duplicadas
+        self._locks: Dict[tuple, asyncio.Lock] = dict()
+
+    # devolve uma conexão aberta com o endereço solicitado, abrindo uma nova se necessário
+    async def get(self, ip: str, port: int) -> AsyncConnection:
+        address = (ip, port)
+        conn = self._connections.get(address)
+        if conn is not None and conn.is_open:
+            return conn
+        lock = self._locks.setdefault(address, asyncio.Lock())
+        async with lock:
+            conn = self._connections.get(address)
+            if conn is None or not conn.is_open:
+                conn = await AsyncConnection.open(ip, port, self._codec, self._compression, self._compression_threshold)
+                self._connections[address] = conn
+            return conn
+
+    # descarta a conexão de um endereço, encerrando-a
+    def discard(self, ip: str, port: int) -> None:
+        conn = self._connections.pop((ip, port), None)
+        if conn is not None:
+            conn.close()
+
+    # encerra todas as conexões abertas
+    def close_all(self) -> None:
+        connections, self._connections = list(self._connections.values()), dict()
+        for conn in connections:
+            conn.close()
+
+
+# Versão asyncio do ConnectionPool: mantém até `size` conexões por endereço e entrega a menos ocupada, abrindo uma
+# nova apenas quando todas as existentes têm requisições em voo
+class AsyncConnectionPool:
+    def __init__(self, codec: str = DEFAULT_CODEC, size: int = 4, compression: str = 'none',
+                 compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD) -> None:
+        self._codec = codec
+        self._compression = compression
+        self._compression_threshold = compression_threshold
+        self._size = size
+        self._pools: Dict[tuple, List[AsyncConnection]] = dict()
+        self._opened = 0
+        # locks por endereço evitam que várias corrotinas abram conexões além do tamanho do pool ao mesmo tempo
+        self._locks: Dict[tuple, asyncio.Lock] = dict()
+
+    # region getters
+    @property
+    def size(self) -> int:
+        return self._size
+
+    # quantidade de conexões abertas desde a criação do pool
+    @property
+    def opened(self) -> int:
+        return self._opened
+    # endregion
+
+    # conexão aberta do pool de um endereço preferida para a próxima requisição, ou None se for preciso abrir outra
+    def pick(self, address: tuple) -> Optional[AsyncConnection]:
+        pool = [conn for conn in self._pools.get(address, []) if conn.is_open]
+        self._pools[address] = pool
+        conn = min(pool, key=lambda c: c.in_flight, default=None)
+        if conn is None or (conn.in_flight > 0 and len(pool) < self._size):
+            return None
+        return conn
+
+    # devolve uma conexão aberta com o endereço solicitado, preferindo a que tem menos requisições em voo
+    async def get(self, ip: str, port: int) -> AsyncConnection:
+        address = (ip, port)
+        conn = self.pick(address)
+        if conn is not None:
+            return conn
+        async with self._locks.setdefault(address, asyncio.Lock()):
+            conn = self.pick(address)
+            if conn is None:
+                conn = await AsyncConnection.open(ip, port, self._codec, self._compression, self._compression_threshold)
+                self._opened += 1
+                self._pools[address].append(conn)
+            return conn
+
+    # descarta uma conexão do pool de um endereço, ou todas elas quando `conn` não é informada
+    def discard(self, ip: str, port: int, conn: Optional[AsyncConnection] = None) -> None:
+        pool = self._pools.get((ip, port), [])
+        discarded = [c for c in pool if conn is None or c is conn]
+        self._pools[(ip, port)] = [c for c in pool if c not in discarded]
+        for c in discarded:
+            c.close()
+
+    # encerra todas as conexões abertas
+    def close_all(self) -> None:
+        pools, self._pools = list(self._pools.values()), dict()
+        for pool in pools:
+            for conn in pool:
+                conn.close()
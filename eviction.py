@@ -0,0 +1,186 @@
+import random
+from threading import Lock
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+# políticas de descarte disponíveis quando o store atinge o limite de memória ou de chaves
+EVICTION_POLICIES = ('lru', 'lfu', 'random')
+# chaves sorteadas a cada descarte na política LFU; a menos acessada entre elas é descartada
+LFU_SAMPLES = 5
+# valor máximo do contador de acessos de uma chave na política LFU
+LFU_MAX_COUNT = 255
+
+
+# Interface das políticas de descarte, usadas só pelo líder, que decide quais chaves saem do store.
+# O líder informa as chaves escritas e removidas com o lock das escritas; os acessos das leituras chegam
+# sem lock, de várias threads, e só afetam a ordem de descarte, então podem ser aproximados.
+class EvictionPolicy:
+    # registra uma escrita na chave, nova ou não
+    def add(self, key: str) -> None:
+        raise NotImplementedError
+
+    # esquece uma chave removida do store
+    def remove(self, key: str) -> None:
+        raise NotImplementedError
+
+    # registra uma leitura da chave
+    def touch(self, key: str) -> None:
+        pass
+
+    # próxima chave a descartar, ou None se não há chaves
+    def victim(self) -> Optional[str]:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+# Descarta a chave acessada há mais tempo: as chaves ficam em um OrderedDict na ordem do último acesso. Como as
+# leituras reordenam o dicionário sem o lock das escritas, e reordená-lo durante a busca da vítima interrompe a
+# iteração, todas as operações passam por um lock próprio da política
+class LRUPolicy(EvictionPolicy):
+    def __init__(self) -> None:
+        self._order: 'OrderedDict[str, None]' = OrderedDict()
+        self._lock = Lock()
+
+    def add(self, key: str) -> None:
+        with self._lock:
+            self._order[key] = None
+            self._order.move_to_end(key)
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            self._order.pop(key, None)
+
+    def touch(self, key: str) -> None:
+        with self._lock:
+            try:
+                self._order.move_to_end(key)
+            except KeyError:
+                pass
+
+    def victim(self) -> Optional[str]:
+        with self._lock:
+            return next(iter(self._order), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._order.clear()
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+
+# Conjunto de chaves com sorteio em O(1): uma lista com a posição de cada chave em um dicionário;
+# a remoção troca a chave com a última da lista
+class KeySample:
+    def __init__(self) -> None:
+        self._keys: List[str] = []
+        self._positions: Dict[str, int] = dict()
+
+    def add(self, key: str) -> bool:
+        if key in self._positions:
+            return False
+        self._positions[key] = len(self._keys)
+        self._keys.append(key)
+        return True
+
+    def remove(self, key: str) -> bool:
+        pos = self._positions.pop(key, None)
+        if pos is None:
+            return False
+        last = self._keys.pop()
+        if pos < len(self._keys):
+            self._keys[pos] = last
+            self._positions[last] = pos
+        return True
+
+    def sample(self, rng: random.Random) -> Optional[str]:
+        return self._keys[rng.randrange(len(self._keys))] if self._keys else None
+
+    def clear(self) -> None:
+        self._keys, self._positions = [], dict()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+# Descarta uma chave sorteada
+class RandomPolicy(EvictionPolicy):
+    def __init__(self, seed: Optional[int] = None) -> None:
+        self._keys = KeySample()
+        self._rng = random.Random(seed)
+
+    def add(self, key: str) -> None:
+        self._keys.add(key)
+
+    def remove(self, key: str) -> None:
+        self._keys.remove(key)
+
+    def victim(self) -> Optional[str]:
+        return self._keys.sample(self._rng)
+
+    def clear(self) -> None:
+        self._keys.clear()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+# Descarta, entre LFU_SAMPLES chaves sorteadas, a de menos acessos. O contador de cada chave satura em
+# LFU_MAX_COUNT e cai pela metade quando a chave é sorteada e sobrevive a um descarte, para que chaves que
+# deixaram de ser acessadas percam a vantagem com o tempo. Sortear, em vez de manter as chaves ordenadas por
+# contagem, deixa a leitura com um único incremento no dicionário.
+class LFUPolicy(EvictionPolicy):
+    def __init__(self, samples: int = LFU_SAMPLES, seed: Optional[int] = None) -> None:
+        self._keys = KeySample()
+        self._counts: Dict[str, int] = dict()
+        self._samples = samples
+        self._rng = random.Random(seed)
+
+    def add(self, key: str) -> None:
+        if self._keys.add(key):
+            self._counts[key] = 1
+        else:
+            self.touch(key)
+
+    def remove(self, key: str) -> None:
+        if self._keys.remove(key):
+            self._counts.pop(key, None)
+
+    # o incremento sem lock pode perder acessos simultâneos à mesma chave, o que só torna a contagem aproximada
+    def touch(self, key: str) -> None:
+        count = self._counts.get(key)
+        if count is not None and count < LFU_MAX_COUNT:
+            self._counts[key] = count + 1
+
+    def victim(self) -> Optional[str]:
+        if not len(self._keys):
+            return None
+        candidates = [self._keys.sample(self._rng) for _ in range(self._samples)]
+        victim = min(candidates, key=lambda key: self._counts.get(key, 0))
+        for key in candidates:
+            if key != victim and key in self._counts:
+                self._counts[key] = max(1, self._counts[key] // 2)
+        return victim
+
+    def clear(self) -> None:
+        self._keys.clear()
+        self._counts.clear()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+# cria a política de descarte pelo nome
+def create_eviction_policy(policy: str = 'lru') -> EvictionPolicy:
+    if policy == 'lru':
+        return LRUPolicy()
+    if policy == 'lfu':
+        return LFUPolicy()
+    if policy == 'random':
+        return RandomPolicy()
+    raise ValueError(f'Política de descarte desconhecida: {policy}')
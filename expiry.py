@@ -0,0 +1,75 @@
+import time
+import heapq
+from threading import Thread, Condition
+from typing import Callable, List, Tuple
+from log import logger
+
+# quantidade máxima de chaves entregues de uma vez ao callback de expiração
+REAP_BATCH = 1024
+
+
+# instante atual em milissegundos desde a época, a unidade dos instantes de expiração
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+# Agenda das expirações do líder: um heap de (instante de expiração, chave, timestamp) atendido por uma única
+# thread, que dorme até o vencimento mais próximo e nunca percorre o store. Uma chave reescrita não sai do heap:
+# a entrada antiga vence e é descartada por quem expira as chaves, que confere se o timestamp ainda é o agendado.
+# As chaves vencidas são entregues ao callback `expire` em lotes de até `batch`, fora do lock da agenda.
+class ExpiryReaper:
+    def __init__(self, expire: Callable[[List[Tuple[str, int]]], None], batch: int = REAP_BATCH) -> None:
+        self._expire = expire
+        self._batch = batch
+        self._heap: List[Tuple[int, str, int]] = []
+        self._condition = Condition()
+        self._thread = None
+        self._running = True
+
+    # quantidade de expirações agendadas, incluindo as de chaves já reescritas
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    # agenda a expiração da versão `timestamp` de uma chave para o instante `expires_at`
+    def schedule(self, key: str, timestamp: int, expires_at: int) -> None:
+        self.schedule_many([(key, timestamp, expires_at)])
+
+    # agenda várias expirações com uma única passagem pelo lock
+    def schedule_many(self, entries: List[Tuple[str, int, int]]) -> None:
+        if not entries:
+            return
+        with self._condition:
+            earliest = self._heap[0][0] if self._heap else None
+            for key, timestamp, expires_at in entries:
+                heapq.heappush(self._heap, (expires_at, key, timestamp))
+            if self._thread is None:
+                self._thread = Thread(target=self._reap_loop, daemon=True)
+                self._thread.start()
+            # a thread só precisa acordar se o vencimento mais próximo mudou
+            if earliest is None or self._heap[0][0] < earliest:
+                self._condition.notify()
+
+    def close(self) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+    # laço da thread: aguarda o vencimento mais próximo e entrega as chaves vencidas ao callback
+    def _reap_loop(self) -> None:
+        while True:
+            with self._condition:
+                while self._running:
+                    now = now_ms()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    self._condition.wait((self._heap[0][0] - now) / 1000 if self._heap else None)
+                if not self._running:
+                    return
+                due = []
+                while self._heap and self._heap[0][0] <= now and len(due) < self._batch:
+                    _, key, timestamp = heapq.heappop(self._heap)
+                    due.append((key, timestamp))
+            try:
+                self._expire(due)
+            except Exception as e:
+                logger.warning('Erro ao expirar %s chaves: %s', len(due), e)
@@ -0,0 +1,60 @@
+from message import Message
+from connection import ConnectionCache
+from codec import DEFAULT_CODEC
+from compression import DEFAULT_COMPRESSION_THRESHOLD
+from concurrent.futures import Future
+from threading import BoundedSemaphore, Lock
+from typing import Tuple
+
+# Canal de encaminhamento de um follower para o líder: uma única conexão persistente que transporta várias
+# escritas em voo ao mesmo tempo, cada uma identificada pelo id do frame. O número de escritas em voo é limitado
+# por `max_in_flight`; com o canal cheio, forward bloqueia quem encaminha até o líder responder alguma delas,
+# o que segura a leitura da conexão do cliente (backpressure) em vez de acumular requisições no follower.
+class LeaderChannel:
+    def __init__(self, ip: str, port: int, codec: str = DEFAULT_CODEC, max_in_flight: int = 1024,
+                 compression: str = 'none', compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD) -> None:
+        self._ip = ip
+        self._port = port
+        self._max_in_flight = max_in_flight
+        self._slots = BoundedSemaphore(max_in_flight)
+        self._in_flight = 0
+        self._lock = Lock()
+        # a conexão é reaberta no próximo encaminhamento se o líder a encerrar
+        self._connections = ConnectionCache(codec, compression, compression_threshold)
+
+    # region getters
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._ip, self._port
+
+    @property
+    def max_in_flight(self) -> int:
+        return self._max_in_flight
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+    # endregion
+
+    # envia uma requisição ao líder, devolvendo um Future resolvido com a resposta dele
+    def forward(self, message: Message) -> Future:
+        self._slots.acquire()
+        with self._lock:
+            self._in_flight += 1
+        try:
+            conn = self._connections.get(self._ip, self._port)
+            future = conn.request_async(message)
+        except OSError:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    # libera a vaga de uma requisição respondida (ou que falhou)
+    def _release(self, _: Future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def close(self) -> None:
+        self._connections.close_all()
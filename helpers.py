@@ -1,7 +1,17 @@
 import json
-from socket import socket, AF_INET, SOCK_STREAM
+import asyncio
+import struct
+from itertools import count
+from socket import socket, AF_INET, SOCK_STREAM, IPPROTO_TCP, TCP_NODELAY
 from message import Message
-from typing import Dict
+from typing import Dict, Optional, Tuple
+
+# cabeçalho de cada frame do protocolo: tamanho do payload (4 bytes), id da requisição (8 bytes) e flags (1 byte)
+FRAME_HEADER = struct.Struct('!IQB')
+# tamanho máximo aceito para o payload de um frame
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+# gerador de ids para requisições enviadas fora de uma conexão persistente
+_request_ids = count(1)
 
 # serializa um dicionário qualquer em json
 def json_serialize(obj: Dict) -> str:
@@ -17,26 +27,73 @@ def msg_serialize(message: Message) -> str:
 
 # deserializa um json em um objeto da classe Message
 def msg_deserialize(json_str: str) -> Message:
-    if str == '':
-        return {}
+    if json_str == '':
+        return None
     return json.loads(json_str, object_hook=Message.from_json)
 
-# Recebe e agrupa todos os pacotes de uma determinada requisição
-def socket_receive_all(socket) -> bytes:
-    buffer_size = 1024
-    content = b""
-    while True:
-        temp = socket.recv(buffer_size)
-        content += temp
-        if len(temp) < buffer_size:
-            break
-    return content
+# Recebe exatamente `size` bytes do socket, retornando None caso a conexão seja encerrada antes do primeiro byte
+def socket_receive_exactly(socket, size: int) -> Optional[bytes]:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        read = socket.recv_into(view[received:], size - received)
+        if read == 0:
+            if received == 0:
+                return None
+            raise ConnectionError('Conexão encerrada no meio de um frame')
+        received += read
+    return bytes(buffer)
+
+# Recebe um frame completo, devolvendo a tupla (id da requisição, flags, payload) ou None se a conexão foi encerrada
+def receive_frame(socket) -> Optional[Tuple[int, int, bytes]]:
+    header = socket_receive_exactly(socket, FRAME_HEADER.size)
+    if header is None:
+        return None
+    size, request_id, flags = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ConnectionError(f'Frame de {size} bytes excede o limite de {MAX_FRAME_SIZE} bytes')
+    payload = socket_receive_exactly(socket, size) if size > 0 else b''
+    if payload is None:
+        raise ConnectionError('Conexão encerrada no meio de um frame')
+    return request_id, flags, payload
+
+# versão assíncrona de receive_frame, lendo de um asyncio.StreamReader
+async def receive_frame_async(reader) -> Optional[Tuple[int, int, bytes]]:
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if len(e.partial) == 0:
+            return None
+        raise ConnectionError('Conexão encerrada no meio de um frame')
+    size, request_id, flags = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ConnectionError(f'Frame de {size} bytes excede o limite de {MAX_FRAME_SIZE} bytes')
+    try:
+        payload = await reader.readexactly(size) if size > 0 else b''
+    except asyncio.IncompleteReadError:
+        raise ConnectionError('Conexão encerrada no meio de um frame')
+    return request_id, flags, payload
+
+# monta o fluxo de bytes de um frame: cabeçalho seguido do payload
+def encode_frame(request_id: int, payload: bytes, flags: int = 0) -> bytes:
+    return FRAME_HEADER.pack(len(payload), request_id, flags) + payload
+
+# envia um frame completo pelo socket
+def send_frame(socket, request_id: int, payload: bytes, flags: int = 0) -> None:
+    socket.sendall(encode_frame(request_id, payload, flags))
+
+# gera um novo id de requisição
+def next_request_id() -> int:
+    return next(_request_ids)
 
 # abre um socket com um dado ip e porta
 def open_server_connection(ip, port) -> socket:
     try:
         sk = socket(AF_INET, SOCK_STREAM)
         sk.connect((ip, port))
+        # desabilita o algoritmo de Nagle, já que requisições pequenas são enviadas em sequência
+        sk.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
         return sk
     except ConnectionRefusedError:
         print('Servidor não aceitou a conexão')
@@ -47,12 +104,19 @@ def close_server_connection(socket: socket) -> None:
         socket.close()
 
 # envia um comando sem esperar pela resposta
-def send_and_forget(socket: socket, message: Message) -> None:
+def send_and_forget(socket: socket, message: Message, request_id: int = 0) -> None:
     cmd_str = msg_serialize(message)
-    socket.sendall(cmd_str.encode())
+    send_frame(socket, request_id, cmd_str.encode())
 
-# envia um comando e aguarda a resposta
+# envia um comando e aguarda a resposta correspondente ao id da requisição
 def send_request(socket: socket, message: Message) -> Message:
-    send_and_forget(socket, message)
-    response = socket_receive_all(socket)
-    return msg_deserialize(response)
+    request_id = next_request_id()
+    send_and_forget(socket, message, request_id)
+    while True:
+        frame = receive_frame(socket)
+        if frame is None:
+            return None
+        response_id, _, payload = frame
+        # respostas de outras requisições (pipeline) são descartadas por este envio síncrono
+        if response_id == request_id:
+            return msg_deserialize(payload.decode())
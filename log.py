@@ -0,0 +1,26 @@
+import random
+import logging
+
+# níveis aceitos em --log-level
+LOG_LEVELS = ('debug', 'info', 'warning', 'error')
+
+# logger dos servidores. Os eventos do ciclo de vida (follower entrando, snapshot aplicado, recuperação do disco)
+# ficam em INFO e as falhas em WARNING; as mensagens por requisição ficam em DEBUG e passam por `sampled`
+logger = logging.getLogger('kvstore')
+
+# fração das requisições registradas em DEBUG
+_sample_rate = 1.0
+
+
+# configura a saída e o nível do logger e a amostragem das mensagens por requisição
+def configure(level: str = 'info', sample_rate: float = 1.0) -> None:
+    global _sample_rate
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(threadName)s %(message)s')
+    logger.setLevel(level.upper())
+    _sample_rate = sample_rate
+
+
+# indica se uma mensagem por requisição deve ser registrada. Com o nível desabilitado custa uma consulta ao logger,
+# sem montar a mensagem; habilitado, registra só a fração configurada das requisições
+def sampled(level: int = logging.DEBUG) -> bool:
+    return logger.isEnabledFor(level) and (_sample_rate >= 1 or random.random() < _sample_rate)
@@ -0,0 +1,164 @@
+import os
+import mmap
+import sys
+import struct
+from array import array
+from storage import Record
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# Snapshot em disco com as chaves em ordem e um índice de posições, aberto com mmap: o servidor passa a atender
+# logo depois de mapear o arquivo, sem ler os registros, e cada leitura é uma busca binária no índice.
+# Layout do arquivo:
+#   cabeçalho: assinatura, último segmento de log coberto, sequência, quantidade de chaves, posição do índice e
+#              quantidade de chaves com TTL
+#   registros, em ordem de chave: timestamp, expiração, tamanho da chave, tamanho do valor, chave e valor em utf-8
+#   índice: a posição de cada registro, em ordem de chave (8 bytes, little-endian)
+#   índice das chaves com TTL: a posição de cada registro com expiração, para a agenda do líder sem ler o arquivo todo
+# A ordem dos bytes em utf-8 é a mesma das strings, então a busca compara os bytes das chaves direto no mapa.
+
+SNAPSHOT_MAGIC = b'KVSNAP02'
+SNAPSHOT_HEADER = struct.Struct('!8sQQQQQ')
+RECORD_HEADER = struct.Struct('!QQII')
+OFFSET = struct.Struct('<Q')
+
+# Registro de um snapshot: chave, valor, timestamp e instante de expiração (0 nunca expira)
+Entry = Tuple[str, str, int, int]
+
+
+# indica se o arquivo está no formato mapeável (os snapshots antigos são uma sequência de registros do log)
+def is_mapped_snapshot(path: str) -> bool:
+    with open(path, 'rb') as f:
+        return f.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC
+
+
+# posições como bytes little-endian, qualquer que seja a ordem da máquina
+def offsets_bytes(offsets: array) -> bytes:
+    if sys.byteorder == 'big':
+        offsets = array('Q', offsets)
+        offsets.byteswap()
+    return offsets.tobytes()
+
+
+# grava um snapshot mapeável com as chaves de `items`, que precisam vir em ordem crescente de chave
+def write_snapshot(f, items: Iterable[Entry], covered: int, seq: int) -> None:
+    f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, covered, seq, 0, 0, 0))
+    position = SNAPSHOT_HEADER.size
+    offsets, expiring = array('Q'), array('Q')
+    batch = []
+    for key, value, timestamp, expires_at in items:
+        raw_key, raw_value = key.encode(), value.encode()
+        offsets.append(position)
+        if expires_at:
+            expiring.append(position)
+        record = RECORD_HEADER.pack(timestamp, expires_at, len(raw_key), len(raw_value)) + raw_key + raw_value
+        batch.append(record)
+        position += len(record)
+        if len(batch) >= 4096:
+            f.write(b''.join(batch))
+            batch = []
+    f.write(b''.join(batch))
+    f.write(offsets_bytes(offsets))
+    f.write(offsets_bytes(expiring))
+    f.seek(0)
+    f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, covered, seq, len(offsets), position, len(expiring)))
+    f.seek(0, os.SEEK_END)
+
+
+# Leitura de um snapshot mapeável. O arquivo fica mapeado enquanto houver referências ao objeto, mesmo depois de
+# substituído no disco por um snapshot mais novo; as páginas só são lidas do disco quando acessadas
+class MappedSnapshot:
+    def __init__(self, path: str) -> None:
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._covered, self._seq, self._count, self._index_offset, self._expiring_count = \
+            SNAPSHOT_HEADER.unpack_from(self._map, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f'{path} não é um snapshot mapeável')
+
+    # region getters
+    # último segmento do write-ahead log coberto pelo snapshot
+    @property
+    def covered(self) -> int:
+        return self._covered
+
+    # sequência das escritas refletidas no snapshot
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    # tamanho do arquivo mapeado, em bytes
+    @property
+    def size_bytes(self) -> int:
+        return len(self._map)
+    # endregion
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    # posição do registro de índice `i`
+    def offset(self, i: int) -> int:
+        return OFFSET.unpack_from(self._map, self._index_offset + 8 * i)[0]
+
+    # chave do registro em uma posição, em bytes
+    def raw_key(self, offset: int) -> bytes:
+        key_size = RECORD_HEADER.unpack_from(self._map, offset)[2]
+        start = offset + RECORD_HEADER.size
+        return self._map[start:start + key_size]
+
+    # chave e registro em uma posição
+    def record(self, offset: int) -> Tuple[str, Record]:
+        timestamp, expires_at, key_size, value_size = RECORD_HEADER.unpack_from(self._map, offset)
+        start = offset + RECORD_HEADER.size
+        key = self._map[start:start + key_size].decode()
+        value = self._map[start + key_size:start + key_size + value_size].decode()
+        return key, Record(value, timestamp, expires_at)
+
+    # índice da primeira chave maior ou igual (ou maior, com `after`) a `key`
+    def bisect(self, key: str, after: bool = False) -> int:
+        raw = key.encode()
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            current = self.raw_key(self.offset(mid))
+            if current < raw or (after and current == raw):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    # registro de uma chave, ou None se ela não está no snapshot
+    def get(self, key: str) -> Optional[Record]:
+        i = self.bisect(key)
+        if i == self._count:
+            return None
+        found, record = self.record(self.offset(i))
+        return record if found == key else None
+
+    # até `limit` chaves em ordem a partir de `start` (ou depois dela, com `after`) e antes de `stop`, se informado
+    def range(self, start: str, stop: Optional[str], limit: int, after: bool = False) -> List[str]:
+        keys = []
+        raw_stop = stop.encode() if stop is not None else None
+        first = self.bisect(start, after)
+        for i in range(first, min(self._count, first + limit)):
+            raw = self.raw_key(self.offset(i))
+            if raw_stop is not None and raw >= raw_stop:
+                break
+            keys.append(raw.decode())
+        return keys
+
+    # pares <chave, registro> em ordem de chave, lidos sob demanda
+    def items(self) -> Iterator[Tuple[str, Record]]:
+        return (self.record(self.offset(i)) for i in range(self._count))
+
+    def keys(self) -> Iterator[str]:
+        return (self.raw_key(self.offset(i)).decode() for i in range(self._count))
+
+    # chaves com TTL, com o timestamp e o instante de expiração de cada uma
+    def expiring(self) -> Iterator[Tuple[str, int, int]]:
+        base = self._index_offset + 8 * self._count
+        for i in range(self._expiring_count):
+            key, record = self.record(OFFSET.unpack_from(self._map, base + 8 * i)[0])
+            yield key, record.timestamp, record.expires_at
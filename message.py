@@ -1,103 +1,236 @@
-from typing import Dict, Tuple
-from dataclasses import dataclass
+from typing import Dict, List, Tuple
 
-@dataclass
-class Message:
-    def __init__(self, type: str) -> None:
-        self._type  = type
-        self._key   = ''
-        self._value = ''
-        self._client_timestamp = 0
-        self._server_timestamp = 0
-        self._sender = ('', 0)
-        self._follower = ('', 0)
-        self._store_json = ''
-    # region getters
-    @property
-    def type(self) -> str:
-        return self._type
-    
-    @property
-    def key(self) -> str:
-        return self._key
-    
-    @property
-    def value(self) -> str:
-        return self._value
+# endereço vazio compartilhado pelas mensagens que não carregam remetente/follower
+EMPTY_ADDRESS = ('', 0)
+# lista de itens vazia compartilhada; set_items substitui a referência, nunca a modifica
+EMPTY_ITEMS = ()
+# modos de comparação do CAS: pelo valor atual da chave ou pelo timestamp da sua última escrita
+CAS_COMPARES = ('VALUE', 'TIMESTAMP')
+# valor de um RANGE_SCAN que pede só as chaves, sem os values
+RANGE_SCAN_KEYS_ONLY = 'KEYS'
 
-    @property
-    def client_timestamp(self) -> int:
-        return self._client_timestamp
+# Mensagem trocada entre clientes e servidores.
+# Os campos ficam em __slots__ (sem __dict__ por instância) e são lidos diretamente como atributos;
+# os setters encadeáveis continuam disponíveis, mas o caminho quente usa o construtor completo
+# ou os construtores por tipo (Message.put, Message.get_ok, ...), que criam a mensagem em uma única chamada.
+class Message:
+    __slots__ = ('type', 'key', 'value', 'client_timestamp', 'server_timestamp', 'sender', 'follower_address',
+                 'store_json', 'items', 'leader', 'cursor', 'limit', 'ttl', 'expires_at', 'expected', 'compare',
+                 'absent', 'ring_version')
 
-    @property
-    def server_timestamp(self) -> int:
-        return self._server_timestamp
+    def __init__(self, type: str, key: str = '', value: str = '', client_timestamp: int = 0, server_timestamp: int = 0,
+                 sender: Tuple[str, int] = EMPTY_ADDRESS, follower_address: Tuple[str, int] = EMPTY_ADDRESS,
+                 store_json: str = '', items: List['Message'] = EMPTY_ITEMS,
+                 leader: Tuple[str, int] = EMPTY_ADDRESS, cursor: str = '', limit: int = 0, ttl: int = 0,
+                 expires_at: int = 0, expected: str = '', compare: str = '', absent: bool = False,
+                 ring_version: int = 0) -> None:
+        self.type = type
+        self.key = key
+        self.value = value
+        self.client_timestamp = client_timestamp
+        self.server_timestamp = server_timestamp
+        self.sender = sender
+        self.follower_address = follower_address
+        self.store_json = store_json
+        self.items = items
+        # endereço do líder, informado nas respostas de escrita para o cliente enviar as próximas direto a ele
+        self.leader = leader
+        # paginação de SCAN/PREFIX: a última chave já entregue e a quantidade máxima de chaves por página
+        self.cursor = cursor
+        self.limit = limit
+        # validade de uma chave: relativa em milissegundos no PUT do cliente (`ttl`) e absoluta, em milissegundos
+        # desde a época no relógio do líder, na replicação e nas leituras (`expires_at`); 0 nunca expira
+        self.ttl = ttl
+        self.expires_at = expires_at
+        # CAS: o modo de comparação (um de CAS_COMPARES) e o valor esperado na chave, que pode ser vazio; no modo
+        # TIMESTAMP, o timestamp esperado vai no timestamp do cliente
+        self.expected = expected
+        self.compare = compare
+        # no CAS, exige que a chave não exista, sem comparação; no CAS_FAILED, indica que a chave não existe
+        self.absent = absent
+        # versão do anel de grupos: a usada pelo cliente em um SCAN/PREFIX e a do novo anel em um FENCE
+        self.ring_version = ring_version
 
+    # region getters
     @property
     def sender_address(self) -> str:
-        ip, port = self._sender
+        ip, port = self.sender
         return f'{ip}:{port}'
-    
-    @property
-    def follower_address(self) -> Tuple[str, int]:
-        return self._follower
-    
-    @property
-    def store_json(self) -> Dict:
-        return self._store_json
     # endregion
 
     # region setters
     def set_key(self, key: str):
-        self._key = key
+        self.key = key
         return self
-        
+
     def set_value(self, value: str):
-        self._value = value
+        self.value = value
         return self
-    
+
     def set_client_timestamp(self, timestamp: int):
-        self._client_timestamp = timestamp
+        self.client_timestamp = timestamp
         return self
-    
+
     def set_server_timestamp(self, timestamp: int):
-        self._server_timestamp = timestamp
+        self.server_timestamp = timestamp
         return self
 
     def set_sender(self, ip: str, port: int):
-        self._sender = (ip, port)
+        self.sender = (ip, port)
         return self
 
     def set_follower_address(self, ip: str, port: int):
-        self._follower = (ip, port)
+        self.follower_address = (ip, port)
         return self
 
     def set_store_json(self, store_json: str):
-        self._store_json = store_json
+        self.store_json = store_json
+        return self
+
+    def set_items(self, items: List['Message']):
+        self.items = items
+        return self
+
+    def set_leader(self, ip: str, port: int):
+        self.leader = (ip, port)
+        return self
+
+    def set_cursor(self, cursor: str):
+        self.cursor = cursor
+        return self
+
+    def set_limit(self, limit: int):
+        self.limit = limit
+        return self
+
+    def set_ttl(self, ttl: int):
+        self.ttl = ttl
+        return self
+
+    def set_expires_at(self, expires_at: int):
+        self.expires_at = expires_at
+        return self
+
+    def set_expected(self, expected: str):
+        self.expected = expected
+        return self
+
+    def set_compare(self, compare: str):
+        self.compare = compare
+        return self
+
+    def set_absent(self, absent: bool):
+        self.absent = absent
+        return self
+
+    def set_ring_version(self, ring_version: int):
+        self.ring_version = ring_version
         return self
     # endregion
 
+    # region construtores por tipo
+    @classmethod
+    def put(cls, key: str, value: str, ttl: int = 0) -> 'Message':
+        return cls('PUT', key, value, ttl=ttl)
+
+    @classmethod
+    def put_ok(cls, key: str, value: str, server_timestamp: int) -> 'Message':
+        return cls('PUT_OK', key, value, 0, server_timestamp)
+
+    @classmethod
+    def get(cls, key: str, client_timestamp: int) -> 'Message':
+        return cls('GET', key, '', client_timestamp)
+
+    @classmethod
+    def get_ok(cls, key: str, value: str, client_timestamp: int, server_timestamp: int, expires_at: int = 0) -> 'Message':
+        return cls('GET_OK', key, value, client_timestamp, server_timestamp, expires_at=expires_at)
+
+    @classmethod
+    def try_other(cls, key: str) -> 'Message':
+        return cls('TRY_OTHER_SERVER_OR_LATER', key)
+
+    @classmethod
+    def mput(cls, items: List['Message']) -> 'Message':
+        return cls('MPUT', items=items)
+
+    @classmethod
+    def mput_ok(cls, items: List['Message']) -> 'Message':
+        return cls('MPUT_OK', items=items)
+
+    @classmethod
+    def mget(cls, items: List['Message']) -> 'Message':
+        return cls('MGET', items=items)
+
+    @classmethod
+    def mget_ok(cls, items: List['Message']) -> 'Message':
+        return cls('MGET_OK', items=items)
+
+    @classmethod
+    def scan(cls, start: str, end: str, cursor: str, limit: int, client_timestamp: int) -> 'Message':
+        return cls('SCAN', start, end, client_timestamp, cursor=cursor, limit=limit)
+
+    @classmethod
+    def prefix(cls, prefix: str, cursor: str, limit: int, client_timestamp: int) -> 'Message':
+        return cls('PREFIX', prefix, '', client_timestamp, cursor=cursor, limit=limit)
+
+    @classmethod
+    def scan_ok(cls, items: List['Message'], cursor: str, server_timestamp: int) -> 'Message':
+        return cls('SCAN_OK', server_timestamp=server_timestamp, items=items, cursor=cursor)
+
+    @classmethod
+    def replication(cls, key: str, value: str, server_timestamp: int, expires_at: int = 0) -> 'Message':
+        return cls('REPLICATION', key, value, 0, server_timestamp, expires_at=expires_at)
+
+    @classmethod
+    def expire(cls, key: str, server_timestamp: int) -> 'Message':
+        return cls('EXPIRE', key, '', 0, server_timestamp)
+
+    @classmethod
+    def replication_batch(cls, items: List['Message']) -> 'Message':
+        return cls('REPLICATION_BATCH', items=items)
+
+    @classmethod
+    def incr(cls, key: str, delta: int) -> 'Message':
+        return cls('INCR', key, str(delta))
+
+    @classmethod
+    def cas(cls, key: str, value: str, compare: str = '', expected: str = '', expected_timestamp: int = 0,
+            absent: bool = False, ttl: int = 0) -> 'Message':
+        return cls('CAS', key, value, expected_timestamp, ttl=ttl, expected=expected, compare=compare, absent=absent)
+
+    @classmethod
+    def append(cls, key: str, suffix: str) -> 'Message':
+        return cls('APPEND', key, suffix)
+
+    @classmethod
+    def cas_failed(cls, key: str, value: str, server_timestamp: int, absent: bool = False) -> 'Message':
+        return cls('CAS_FAILED', key, value, 0, server_timestamp, absent=absent)
+    # endregion
+
     # region métodos estáticos para serialização/deserialização
     @staticmethod
     def to_json(msg) -> Dict:
         if isinstance(msg, Message):
-            # usando list comprehension, mapeio propriedades e valores do dicionario em uma lista de tuplas
-            decode_array = [(key, msg.__dict__[key]) for key in msg.__dict__]
-            # incluo uma informação no json para validar a deserialização
-            decode_array.append(('__class__', Message.__name__))
-            # monto um dicionario generico
-            return dict(decode_array)
+            # mantém os nomes de campo do formato JSON original, usado para depuração
+            return {
+                '_type': msg.type, '_key': msg.key, '_value': msg.value,
+                '_client_timestamp': msg.client_timestamp, '_server_timestamp': msg.server_timestamp,
+                '_sender': msg.sender, '_follower': msg.follower_address, '_store_json': msg.store_json,
+                '_items': list(msg.items), '_leader': msg.leader, '_cursor': msg.cursor, '_limit': msg.limit,
+                '_ttl': msg.ttl, '_expires_at': msg.expires_at, '_expected': msg.expected,
+                '_compare': msg.compare, '_absent': msg.absent, '_ring_version': msg.ring_version,
+                # incluo uma informação no json para validar a deserialização
+                '__class__': Message.__name__,
+            }
         raise TypeError(f"Objeto do tipo '{msg.__class__.__name__}' não JSON-serializável")
 
     @staticmethod
     def from_json(d: Dict):
-        if d['__class__'] == Message.__name__:
-            msg = Message(d['_type'])
-            msg.set_key(d['_key']).set_value(d['_value'])
-            msg.set_client_timestamp(d['_client_timestamp']).set_server_timestamp(d['_server_timestamp'])
-            msg.set_sender(d['_sender'][0],d['_sender'][1]).set_follower_address(d['_follower'][0],d['_follower'][1])
-            msg.set_store_json(d['_store_json'])
-        else:
-            msg = d
-        return msg
-    # endregion
\ No newline at end of file
+        if d.get('__class__') == Message.__name__:
+            return Message(d['_type'], d['_key'], d['_value'], d['_client_timestamp'], d['_server_timestamp'],
+                           tuple(d['_sender']), tuple(d['_follower']), d['_store_json'], d.get('_items', EMPTY_ITEMS),
+                           tuple(d.get('_leader', EMPTY_ADDRESS)), d.get('_cursor', ''), d.get('_limit', 0),
+                           d.get('_ttl', 0), d.get('_expires_at', 0), d.get('_expected', ''),
+                           d.get('_compare', ''), d.get('_absent', False), d.get('_ring_version', 0))
+        return d
+    # endregion
@@ -0,0 +1,107 @@
+from threading import Lock
+from typing import Dict, List
+
+# quantidade de buckets dos histogramas: o bucket i conta as amostras de até 2^i microssegundos (o último, ~67 s, acumula o resto)
+HISTOGRAM_BUCKETS = 27
+
+
+# Histograma de latências em buckets de potências de 2 microssegundos: registrar uma amostra custa uma conta
+# inteira e um incremento, e os percentis saem com erro de no máximo 2x, suficiente para acompanhar caudas
+class Histogram:
+    __slots__ = ('_counts', '_count', '_sum', '_max', '_lock')
+
+    def __init__(self) -> None:
+        self._counts = [0] * HISTOGRAM_BUCKETS
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = Lock()
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    # registra uma amostra, em segundos
+    def observe(self, seconds: float) -> None:
+        idx = min(int(seconds * 1000000).bit_length(), HISTOGRAM_BUCKETS - 1)
+        with self._lock:
+            self._counts[idx] += 1
+            self._count += 1
+            self._sum += seconds
+            if seconds > self._max:
+                self._max = seconds
+
+    # limite superior, em segundos, do bucket que contém o percentil `p` (0-100)
+    def percentile(self, p: float) -> float:
+        with self._lock:
+            counts, total, maximum = list(self._counts), self._count, self._max
+        return self._percentile(counts, total, maximum, p)
+
+    # resumo do histograma em milissegundos
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            counts, total, total_sum, maximum = list(self._counts), self._count, self._sum, self._max
+        summary = dict(count=total, mean_ms=round(total_sum / total * 1000, 3) if total else 0.0,
+                       max_ms=round(maximum * 1000, 3))
+        for name, p in (('p50_ms', 50), ('p99_ms', 99), ('p999_ms', 99.9)):
+            summary[name] = round(self._percentile(counts, total, maximum, p) * 1000, 3)
+        return summary
+
+    @staticmethod
+    def _percentile(counts: List[int], total: int, maximum: float, p: float) -> float:
+        if not total:
+            return 0.0
+        rank = p / 100 * total
+        seen = 0
+        for idx, bucket in enumerate(counts):
+            seen += bucket
+            if seen >= rank:
+                # o limite do bucket nunca passa da maior amostra observada
+                return min((1 << idx) / 1000000, maximum)
+        return maximum
+
+
+# Métricas de um servidor: contadores, valores que sobem e descem (gauges) e histogramas de latência por nome.
+# Os histogramas são criados no primeiro uso, então cada comando ganha o seu sem registro prévio
+class Metrics:
+    def __init__(self) -> None:
+        self._counters: Dict[str, int] = dict()
+        self._gauges: Dict[str, int] = dict()
+        self._histograms: Dict[str, Histogram] = dict()
+        self._lock = Lock()
+
+    # soma `n` a um contador
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    # soma `delta` (positivo ou negativo) a um gauge, como o número de conexões abertas
+    def add(self, name: str, delta: int) -> None:
+        with self._lock:
+            self._gauges[name] = self._gauges.get(name, 0) + delta
+
+    def gauge(self, name: str) -> int:
+        return self._gauges.get(name, 0)
+
+    def histogram(self, name: str) -> Histogram:
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram())
+        return histogram
+
+    # registra uma latência, em segundos
+    def observe(self, name: str, seconds: float) -> None:
+        self.histogram(name).observe(seconds)
+
+    # conta um comando atendido e registra o tempo de tratamento dele
+    def observe_command(self, command: str, seconds: float) -> None:
+        self.count(f'commands.{command}')
+        self.observe(f'handle.{command}', seconds)
+
+    # cópia de todas as métricas, com os histogramas resumidos em percentis
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            counters, gauges, histograms = dict(self._counters), dict(self._gauges), dict(self._histograms)
+        return dict(counters=counters, gauges=gauges,
+                    latencies={name: histogram.snapshot() for name, histogram in sorted(histograms.items())})
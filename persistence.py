@@ -0,0 +1,328 @@
+import os
+import time
+import struct
+import zlib
+from codec import encode_varint, decode_varint, encode_str, decode_str
+from mapped_snapshot import MappedSnapshot, is_mapped_snapshot, write_snapshot
+from threading import Thread, Condition, Lock
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# políticas de fsync do write-ahead log:
+#   always: cada escrita só é confirmada depois do fsync do lote em que foi gravada (group commit)
+#   interval: o log é gravado continuamente e sincronizado com o disco a cada `fsync_interval_ms`
+#   never: o log é entregue ao sistema operacional, que decide quando gravar no disco
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+# cabeçalho de cada registro no disco: tamanho do payload e crc32 do payload
+RECORD_HEADER = struct.Struct('!II')
+# operações registradas no log: escrita de um valor e remoção de uma chave expirada
+OP_SET = 1
+OP_DELETE = 2
+# assinatura do formato anterior do snapshot (uma sequência de registros do log), seguida do número do último
+# segmento de log coberto por ele e da última sequência de escrita aplicada quando o snapshot foi iniciado.
+# Os snapshots novos são gravados no formato mapeável (ver mapped_snapshot.py); os antigos continuam legíveis
+SNAPSHOT_MAGIC = b'KVSNAP01'
+SNAPSHOT_HEADER = struct.Struct('!8sQQ')
+
+# Registro de uma escrita: chave, valor, timestamp resultante e instante de expiração (0 nunca expira).
+# Nas remoções o valor é None
+Entry = Tuple[str, Optional[str], int, int]
+
+
+# region formato dos registros
+# codifica uma escrita como registro com tamanho e crc32, para detectar registros incompletos ou corrompidos.
+# O instante de expiração só é gravado nas chaves com TTL; registros sem ele são lidos com expiração 0
+def encode_record(key: str, value: str, timestamp: int, expires_at: int = 0) -> bytes:
+    payload = bytes((OP_SET,)) + encode_str(key) + encode_str(value) + encode_varint(timestamp)
+    if expires_at:
+        payload += encode_varint(expires_at)
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+# codifica a remoção de uma chave expirada, com o número de sequência atribuído à remoção
+def encode_delete(key: str, timestamp: int) -> bytes:
+    payload = bytes((OP_DELETE,)) + encode_str(key) + encode_varint(timestamp)
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+# lê os registros de um arquivo, parando no primeiro registro incompleto ou corrompido (escrita interrompida por crash)
+def read_records(path: str) -> Iterator[Entry]:
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset = 0
+    if data.startswith(SNAPSHOT_MAGIC):
+        offset = SNAPSHOT_HEADER.size
+    while offset + RECORD_HEADER.size <= len(data):
+        size, crc = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        payload = data[start:start + size]
+        if len(payload) < size or zlib.crc32(payload) != crc:
+            break
+        if payload[0] == OP_SET:
+            key, pos = decode_str(payload, 1)
+            value, pos = decode_str(payload, pos)
+            timestamp, pos = decode_varint(payload, pos)
+            expires_at = decode_varint(payload, pos)[0] if pos < len(payload) else 0
+            yield key, value, timestamp, expires_at
+        elif payload[0] == OP_DELETE:
+            key, pos = decode_str(payload, 1)
+            timestamp, _ = decode_varint(payload, pos)
+            yield key, None, timestamp, 0
+        offset = start + size
+# endregion
+
+
+# Log de escritas com append em segmentos numerados (wal-000001.log, ...). Uma thread escritora drena a fila
+# de registros pendentes e grava todos de uma vez, de forma que várias escritas concorrentes compartilham
+# o mesmo write e o mesmo fsync (group commit).
+class WriteAheadLog:
+    def __init__(self, directory: str, fsync_policy: str = 'interval', fsync_interval_ms: int = 10) -> None:
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f'Política de fsync inválida: {fsync_policy}')
+        self._directory = directory
+        self._fsync_policy = fsync_policy
+        self._fsync_interval = fsync_interval_ms / 1000
+        # fila de registros pendentes; None marca a troca de segmento
+        self._queue: List[Optional[bytes]] = []
+        self._condition = Condition()
+        # número de sequência do último registro enfileirado e do último registro durável
+        self._enqueued_lsn = 0
+        self._durable_lsn = 0
+        self._segment = max(self.segments(), default=0) + 1
+        self._file = open(self.segment_path(self._segment), 'ab')
+        self._last_fsync = time.monotonic()
+        self._running = True
+        self._writer_thread = Thread(target=self._write_loop, daemon=True)
+        self._writer_thread.start()
+
+    # region getters
+    @property
+    def segment(self) -> int:
+        return self._segment
+
+    @property
+    def fsync_policy(self) -> str:
+        return self._fsync_policy
+    # endregion
+
+    # caminho do arquivo de um segmento
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self._directory, f'wal-{segment:06d}.log')
+
+    # números dos segmentos existentes no diretório, em ordem
+    def segments(self) -> List[int]:
+        numbers = []
+        for name in os.listdir(self._directory):
+            if name.startswith('wal-') and name.endswith('.log'):
+                numbers.append(int(name[4:-4]))
+        return sorted(numbers)
+
+    # enfileira uma escrita, devolvendo seu número de sequência no log
+    def append(self, key: str, value: str, timestamp: int, expires_at: int = 0) -> int:
+        return self.append_record(encode_record(key, value, timestamp, expires_at))
+
+    # enfileira a remoção de uma chave expirada, devolvendo seu número de sequência no log
+    def append_delete(self, key: str, timestamp: int) -> int:
+        return self.append_record(encode_delete(key, timestamp))
+
+    # enfileira um registro já codificado
+    def append_record(self, record: bytes) -> int:
+        with self._condition:
+            self._queue.append(record)
+            self._enqueued_lsn += 1
+            self._condition.notify_all()
+            return self._enqueued_lsn
+
+    # bloqueia até o registro `lsn` estar no disco; só espera de fato na política `always`
+    def wait_durable(self, lsn: int) -> None:
+        if self._fsync_policy != 'always':
+            return
+        with self._condition:
+            while self._durable_lsn < lsn and self._running:
+                self._condition.wait()
+
+    # fecha o segmento atual e passa a gravar no próximo, devolvendo o número do segmento fechado
+    def rotate(self) -> int:
+        with self._condition:
+            self._queue.append(None)
+            self._condition.notify_all()
+            closed = self._segment
+            # o segmento só é trocado pela thread escritora, depois de gravar o que estava na fila antes da marca
+            while self._segment == closed and self._running:
+                self._condition.wait()
+            return closed
+
+    # remove os segmentos já cobertos por um snapshot
+    def discard_until(self, segment: int) -> None:
+        for number in self.segments():
+            if number <= segment:
+                os.remove(self.segment_path(number))
+
+    def close(self) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._writer_thread.join()
+        self._file.close()
+
+    # laço da thread escritora
+    def _write_loop(self) -> None:
+        timeout = self._fsync_interval if self._fsync_policy == 'interval' else None
+        while True:
+            with self._condition:
+                if self._running and not self._queue:
+                    self._condition.wait(timeout)
+                pending, self._queue = self._queue, []
+                lsn = self._enqueued_lsn
+                running = self._running
+            if pending:
+                self._write(pending)
+            elif self._fsync_policy == 'interval':
+                self._sync_if_due()
+            with self._condition:
+                self._durable_lsn = lsn
+                self._condition.notify_all()
+            if not running:
+                self._sync()
+                return
+
+    # grava um lote de registros, trocando de segmento ao encontrar a marca de rotação
+    def _write(self, pending: List[Optional[bytes]]) -> None:
+        batch = []
+        for record in pending:
+            if record is not None:
+                batch.append(record)
+                continue
+            self._file.write(b''.join(batch))
+            batch = []
+            self._sync()
+            self._file.close()
+            with self._condition:
+                self._segment += 1
+                self._file = open(self.segment_path(self._segment), 'ab')
+                self._condition.notify_all()
+        if batch:
+            self._file.write(b''.join(batch))
+        if self._fsync_policy == 'always':
+            self._sync()
+        else:
+            # o lote sempre chega ao sistema operacional, para não se perder se o processo for encerrado; só o
+            # fsync é adiado pela política
+            self._file.flush()
+            if self._fsync_policy == 'interval':
+                self._sync_if_due()
+
+    def _sync(self) -> None:
+        self._file.flush()
+        if self._fsync_policy != 'never':
+            os.fsync(self._file.fileno())
+        self._last_fsync = time.monotonic()
+
+    def _sync_if_due(self) -> None:
+        if time.monotonic() - self._last_fsync >= self._fsync_interval:
+            self._sync()
+
+
+# Persistência do store de um servidor: write-ahead log + snapshots periódicos compactos.
+# O snapshot registra o último segmento de log que ele cobre; a recuperação carrega (ou só mapeia) o snapshot
+# e reaplica os segmentos posteriores. Como cada registro carrega o timestamp resultante da escrita,
+# reaplicar um registro já refletido no snapshot é inofensivo.
+class Persistence:
+    def __init__(self, directory: str, fsync_policy: str = 'interval', fsync_interval_ms: int = 10,
+                 snapshot_interval_s: float = 60) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._wal = WriteAheadLog(directory, fsync_policy, fsync_interval_ms)
+        self._snapshot_interval = snapshot_interval_s
+        self._snapshot_lock = Lock()
+        self._snapshot_thread = None
+        self._running = True
+        self._writes_since_snapshot = 0
+
+    # region getters
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self._directory, 'snapshot.dat')
+
+    @property
+    def wal(self) -> WriteAheadLog:
+        return self._wal
+    # endregion
+
+    # reconstrói o estado a partir do snapshot e dos segmentos de log posteriores a ele, devolvendo também a última
+    # sequência de escrita aplicada. O estado de cada chave é (valor, timestamp, expiração), ou None se ela foi
+    # removida. Com `lazy`, um snapshot mapeável não é lido: ele é devolvido aberto, e o estado traz só as escritas
+    # e remoções do log posteriores a ele; caso contrário, o snapshot devolvido é None e o estado traz tudo
+    def recover(self, lazy: bool = False) -> Tuple[Optional[MappedSnapshot], Dict[str, Optional[Tuple[str, int, int]]],
+                                                    int]:
+        state: Dict[str, Optional[Tuple[str, int, int]]] = dict()
+        snapshot = None
+        covered = seq = 0
+        if os.path.exists(self.snapshot_path) and is_mapped_snapshot(self.snapshot_path):
+            snapshot = MappedSnapshot(self.snapshot_path)
+            covered, seq = snapshot.covered, snapshot.seq
+            if not lazy:
+                for key, record in snapshot.items():
+                    state[key] = (record.value, record.timestamp, record.expires_at)
+                snapshot = None
+        elif os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'rb') as f:
+                _, covered, seq = SNAPSHOT_HEADER.unpack(f.read(SNAPSHOT_HEADER.size))
+            for key, value, timestamp, expires_at in read_records(self.snapshot_path):
+                state[key] = (value, timestamp, expires_at)
+        # os segmentos posteriores ao snapshot contêm as escritas na ordem em que foram aplicadas
+        for segment in self._wal.segments():
+            if segment <= covered or segment == self._wal.segment:
+                continue
+            for key, value, timestamp, expires_at in read_records(self._wal.segment_path(segment)):
+                if key in state:
+                    current = state[key]
+                    current_timestamp = current[1] if current is not None else 0
+                else:
+                    current = snapshot.get(key) if snapshot is not None else None
+                    current_timestamp = current.timestamp if current is not None else 0
+                if timestamp >= current_timestamp:
+                    state[key] = (value, timestamp, expires_at) if value is not None else None
+                seq = max(seq, timestamp)
+        return snapshot, state, seq
+
+    # registra uma escrita no log, devolvendo o número de sequência para aguardar a durabilidade
+    def log_put(self, key: str, value: str, timestamp: int, expires_at: int = 0) -> int:
+        self._writes_since_snapshot += 1
+        return self._wal.append(key, value, timestamp, expires_at)
+
+    # registra no log a remoção de uma chave expirada
+    def log_delete(self, key: str, timestamp: int) -> int:
+        self._writes_since_snapshot += 1
+        return self._wal.append_delete(key, timestamp)
+
+    def wait_durable(self, lsn: int) -> None:
+        self._wal.wait_durable(lsn)
+
+    # grava um snapshot mapeável do store e descarta os segmentos de log cobertos por ele. `items` deve devolver as
+    # chaves em ordem. `seq` deve ser lido antes da chamada e `items` é chamado só depois da rotação do log, então
+    # toda escrita posterior a `seq` ausente do snapshot está em um segmento mantido.
+    def snapshot(self, items: Callable[[], Iterable[Entry]], seq: int) -> None:
+        with self._snapshot_lock:
+            self._writes_since_snapshot = 0
+            covered = self._wal.rotate()
+            tmp_path = self.snapshot_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                write_snapshot(f, items(), covered, seq)
+                f.flush()
+                os.fsync(f.fileno())
+            # a troca atômica garante que sempre existe um snapshot completo no disco
+            os.replace(tmp_path, self.snapshot_path)
+            self._wal.discard_until(covered)
+
+    # inicia a thread que aciona `snapshot` periodicamente enquanto houver escritas novas
+    def start_snapshots(self, snapshot: Callable[[], None]) -> None:
+        def loop():
+            while self._running:
+                time.sleep(self._snapshot_interval)
+                if self._running and self._writes_since_snapshot > 0:
+                    snapshot()
+        self._snapshot_thread = Thread(target=loop, daemon=True)
+        self._snapshot_thread.start()
+
+    def close(self) -> None:
+        self._running = False
+        self._wal.close()
@@ -0,0 +1,223 @@
+import argparse
+from message import Message, RANGE_SCAN_KEYS_ONLY
+from connection import ConnectionCache
+from codec import CODECS, DEFAULT_CODEC
+from compression import COMPRESSIONS
+from expiry import now_ms
+from ring import HashRing, HashRange, encode_ranges, moved_ranges, ring_fraction
+from typing import Dict, List, Optional, Set, Tuple
+
+# Rebalanceamento do anel de hash consistente ao acrescentar ou retirar um grupo de servidores: só as chaves dos
+# intervalos que mudam de dono são copiadas, do líder do grupo de origem para o líder do grupo de destino.
+#   1. os servidores dos destinos deixam de recusar escritas e leituras de cercos antigos (FENCE vazio);
+#   2. cópia: páginas de RANGE_SCAN da origem viram MPUTs no destino, com o TTL restante de cada chave; a
+#      sequência da origem no início da cópia marca o que a cópia já viu;
+#   3. cerco: os servidores da origem passam a recusar as escritas e as leituras nos intervalos, e os SCAN/PREFIX
+#      de clientes com um anel anterior ao novo (FENCE), e as escritas feitas desde o início da cópia são copiadas
+#      de novo (delta). As chaves que a origem removeu desde então (expiradas ou descartadas) não aparecem no delta:
+#      as chaves dos intervalos no destino são comparadas com as da origem, e as que faltam nela são removidas;
+#   4. o novo anel é gravado no arquivo do cluster: os clientes com uma escrita ou leitura recusada releem o arquivo
+#      e a enviam ao novo dono;
+#   5. a origem remove as chaves copiadas (DROP_RANGES). O cerco continua até o próximo rebalanceamento, para os
+#      clientes que ainda usam o anel antigo.
+# As operações nos intervalos movidos ficam recusadas apenas entre o cerco e a gravação do anel. O cerco dos
+# followers é feito na medida do possível: um follower inacessível é só avisado, e segue respondendo pelo anel
+# antigo. Se a cópia falha, o cerco é desfeito, as cópias parciais são removidas do destino e o anel antigo continua
+# valendo.
+# Execução: python rebalance.py --cluster cluster.json --add-group g3 127.0.0.1:7020 127.0.0.1:7021
+
+# chaves por página de RANGE_SCAN (o máximo aceito pelo servidor)
+PAGE_SIZE = 1000
+
+
+class Rebalancer:
+    def __init__(self, cluster_file: str, codec: str = DEFAULT_CODEC, compression: str = 'none',
+                 page_size: int = PAGE_SIZE) -> None:
+        self._cluster_file = cluster_file
+        self._ring = HashRing.load(cluster_file)
+        self._page_size = page_size
+        # conexões persistentes com os líderes dos grupos
+        self._connections = ConnectionCache(codec, compression)
+
+    # region getters
+    @property
+    def ring(self) -> HashRing:
+        return self._ring
+    # endregion
+
+    # region factories
+    # Monta um RANGE_SCAN command, pedindo uma página das chaves dos intervalos, após o cursor, escritas depois de `since`
+    # (só as chaves, com `keys_only`)
+    def range_scan_command_factory(self, ranges: List[HashRange], cursor: str, since: int,
+                                   keys_only: bool = False) -> Message:
+        return Message('RANGE_SCAN', key=encode_ranges(ranges), value=RANGE_SCAN_KEYS_ONLY if keys_only else '',
+                       cursor=cursor, limit=self._page_size, client_timestamp=since)
+
+    # Monta um MPUT command com as chaves de uma página de RANGE_SCAN, cada uma com o TTL que ainda lhe resta
+    # (ao menos 1 ms: uma chave que vence agora não pode virar um TTL 0, sem expiração, nem negativo)
+    def copy_command_factory(self, items: List[Message], now: int) -> Message:
+        return Message.mput([Message.put(item.key, item.value, max(item.expires_at - now, 1) if item.expires_at else 0)
+                             for item in items])
+
+    # Monta um FENCE command, cercando os intervalos (nenhum, para desfazer o cerco) para os clientes com anel
+    # anterior à versão informada
+    def fence_command_factory(self, ranges: List[HashRange], version: int = 0) -> Message:
+        return Message('FENCE', key=encode_ranges(ranges), ring_version=version)
+
+    # Monta um DROP_RANGES command, removendo as chaves dos intervalos (só as informadas, com `keys`)
+    def drop_ranges_command_factory(self, ranges: List[HashRange], keys: Optional[List[str]] = None) -> Message:
+        return Message('DROP_RANGES', key=encode_ranges(ranges), items=[Message('EXPIRE', key) for key in keys or []])
+    # endregion
+
+    # envia uma requisição ao líder de um grupo, falhando se ele não responde ou a recusa
+    def request(self, address: Tuple[str, int], msg: Message) -> Message:
+        response = self._connections.get(*address).request(msg)
+        if response is None or response.type == 'TRY_OTHER_SERVER_OR_LATER':
+            raise ConnectionError(f'{msg.type} recusado por {address[0]}:{address[1]}')
+        if response.type == 'MPUT_OK' and any(item.type != 'PUT_OK' for item in response.items):
+            raise ConnectionError(f'Cópia recusada por {address[0]}:{address[1]}')
+        return response
+
+    # copia do líder `source` para o líder `target` as chaves dos intervalos escritas depois de `since`.
+    # Devolve as chaves copiadas e a sequência da origem no início da cópia
+    def copy_ranges(self, source: Tuple[str, int], target: Tuple[str, int], ranges: List[HashRange],
+                    since: int = 0) -> Tuple[int, int]:
+        copied, seq, cursor = 0, None, ''
+        while True:
+            page = self.request(source, self.range_scan_command_factory(ranges, cursor, since))
+            if seq is None:
+                seq = page.server_timestamp
+            # chaves que vencem antes de chegar ao destino não são copiadas
+            now = now_ms()
+            items = [item for item in page.items if not item.expires_at or item.expires_at > now]
+            if items:
+                self.request(target, self.copy_command_factory(items, now))
+                copied += len(items)
+            cursor = page.cursor
+            if not cursor:
+                return copied, seq
+
+    # chaves dos intervalos no líder de um grupo
+    def list_keys(self, address: Tuple[str, int], ranges: List[HashRange]) -> Set[str]:
+        keys, cursor = set(), ''
+        while True:
+            page = self.request(address, self.range_scan_command_factory(ranges, cursor, 0, keys_only=True))
+            keys.update(item.key for item in page.items)
+            cursor = page.cursor
+            if not cursor:
+                return keys
+
+    # remove do líder `target` as chaves dos intervalos que não existem mais no líder `source`, devolvendo quantas
+    # foram removidas. Feito com a origem cercada, quando só as expirações e os descartes ainda a alteram
+    def remove_missing(self, source: Tuple[str, int], target: Tuple[str, int], ranges: List[HashRange]) -> int:
+        missing = sorted(self.list_keys(target, ranges) - self.list_keys(source, ranges))
+        return sum(self.drop(target, ranges, missing[i:i + self._page_size])
+                   for i in range(0, len(missing), self._page_size))
+
+    # cerca os intervalos em um servidor (nenhum, para desfazer o cerco)
+    def fence(self, address: Tuple[str, int], ranges: List[HashRange], version: int = 0) -> None:
+        self.request(address, self.fence_command_factory(ranges, version))
+
+    # cerca os intervalos em todos os servidores de um grupo do anel. O cerco do líder é obrigatório, porque é ele
+    # que protege as escritas; o dos followers só evita leituras desatualizadas, e a falha é apenas avisada
+    def fence_group(self, ring: HashRing, group: str, ranges: List[HashRange], version: int = 0) -> None:
+        leader, *followers = ring.addresses(group)
+        self.fence(leader, ranges, version)
+        for address in followers:
+            try:
+                self.fence(address, ranges, version)
+            except OSError as e:
+                print(f'Falha ao cercar o follower {address[0]}:{address[1]} de {group}: {e}')
+
+    # remove do líder de um grupo as chaves dos intervalos (só as informadas, com `keys`), devolvendo quantas foram
+    # removidas
+    def drop(self, address: Tuple[str, int], ranges: List[HashRange], keys: Optional[List[str]] = None) -> int:
+        return int(self.request(address, self.drop_ranges_command_factory(ranges, keys)).value)
+
+    # troca o anel atual pelo novo, migrando as chaves dos intervalos que mudam de dono. Devolve as chaves copiadas
+    # e removidas por (origem, destino)
+    def rebalance(self, new_ring: HashRing) -> Dict[Tuple[str, str], Tuple[int, int]]:
+        old_ring = self._ring
+        if new_ring.version <= old_ring.version:
+            raise ValueError(f'O novo anel precisa de uma versão acima de {old_ring.version}')
+        moves = moved_ranges(old_ring, new_ring)
+        outgoing: Dict[str, List[HashRange]] = dict()
+        for (source, _), ranges in moves.items():
+            outgoing.setdefault(source, []).extend(ranges)
+        targets = {target for _, target in moves}
+        copied: Dict[Tuple[str, str], int] = dict()
+        try:
+            for target in targets:
+                self.fence_group(new_ring, target, [])
+            seqs = dict()
+            for (source, target), ranges in moves.items():
+                copied[(source, target)], seqs[(source, target)] = self.copy_ranges(
+                    old_ring.leader(source), new_ring.leader(target), ranges)
+            for source, ranges in outgoing.items():
+                self.fence_group(old_ring, source, ranges, new_ring.version)
+            for (source, target), ranges in moves.items():
+                delta, _ = self.copy_ranges(old_ring.leader(source), new_ring.leader(target), ranges,
+                                            seqs[(source, target)])
+                copied[(source, target)] += delta
+                self.remove_missing(old_ring.leader(source), new_ring.leader(target), ranges)
+        except Exception:
+            self.abort(old_ring, new_ring, moves)
+            raise
+        new_ring.save(self._cluster_file)
+        self._ring = new_ring
+        dropped = {source: self.drop(old_ring.leader(source), ranges) for source, ranges in outgoing.items()}
+        return {(source, target): (count, dropped[source]) for (source, target), count in copied.items()}
+
+    # desfaz uma migração interrompida: tira o cerco dos servidores das origens e remove dos destinos o que já foi
+    # copiado
+    def abort(self, old_ring: HashRing, new_ring: HashRing,
+              moves: Dict[Tuple[str, str], List[HashRange]]) -> None:
+        for (source, target), ranges in moves.items():
+            for action in (lambda: self.fence_group(old_ring, source, []),
+                           lambda: self.drop(new_ring.leader(target), ranges)):
+                try:
+                    action()
+                except Exception as e:
+                    print(f'Falha ao desfazer a migração de {source} para {target}: {e}')
+
+    def close(self) -> None:
+        self._connections.close_all()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Rebalanceamento do anel de grupos do KV Store')
+    parser.add_argument('--cluster', required=True, help='arquivo json com os grupos do anel (ver ring.py)')
+    change = parser.add_mutually_exclusive_group(required=True)
+    change.add_argument('--add-group', nargs='+', metavar=('NOME', 'IP:PORTA'),
+                        help='grupo a acrescentar, seguido dos endereços dos seus servidores (o primeiro é o líder)')
+    change.add_argument('--remove-group', metavar='NOME', help='grupo a retirar; as chaves dele vão para os demais')
+    parser.add_argument('--dry-run', action='store_true', help='só mostra os intervalos que mudariam de dono')
+    parser.add_argument('--codec', choices=list(CODECS), default=DEFAULT_CODEC, help='codec das mensagens')
+    parser.add_argument('--compression', choices=COMPRESSIONS, default='none',
+                        help='compressão dos frames grandes da cópia, se o servidor a aceitar')
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE, help='chaves por página da cópia')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    rebalancer = Rebalancer(args.cluster, args.codec, args.compression, args.page_size)
+    try:
+        if args.add_group:
+            if len(args.add_group) < 2:
+                raise SystemExit('--add-group espera pelo nome do grupo e pelo menos um endereço `ip:porta`')
+            new_ring = rebalancer.ring.with_group(args.add_group[0], args.add_group[1:])
+        else:
+            new_ring = rebalancer.ring.without_group(args.remove_group)
+        for (source, target), ranges in moved_ranges(rebalancer.ring, new_ring).items():
+            print(f'{source} -> {target}: {len(ranges)} intervalos, {ring_fraction(ranges):.1%} do anel')
+        if args.dry_run:
+            return
+        for (source, target), (copied, dropped) in rebalancer.rebalance(new_ring).items():
+            print(f'{source} -> {target}: {copied} chaves copiadas; {dropped} removidas de {source}')
+        print(f'Anel gravado em {args.cluster}')
+    finally:
+        rebalancer.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,368 @@
+import time
+from message import Message
+from connection import ConnectionCache
+from codec import DEFAULT_CODEC
+from compression import DEFAULT_COMPRESSION_THRESHOLD
+from log import logger
+from concurrent.futures import Future
+from threading import Thread, Condition, Lock
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+# políticas de confirmação aceitas pelo líder antes de responder PUT_OK; `all` exige todos os followers saudáveis
+# no momento da escrita
+ACK_POLICIES = ('all', 'quorum', 'async')
+
+# Agrega as confirmações dos followers de uma escrita e resolve o Future quando a política é satisfeita. Só contam
+# os followers que participavam da escrita, cada um uma única vez; um follower que sai do cluster deixa de contar,
+# e a política é recalculada sobre os que restam
+class AckWaiter:
+    def __init__(self, members: Set[Tuple[str, int]], required_acks: Callable[[int], int]) -> None:
+        self._members = set(members)
+        self._required_acks = required_acks
+        self._acked: Set[Tuple[str, int]] = set()
+        self._failed: Set[Tuple[str, int]] = set()
+        self._lock = Lock()
+        self._future = Future()
+        self.evaluate()
+
+    @property
+    def future(self) -> Future:
+        return self._future
+
+    # registra o resultado da replicação em um follower
+    def ack(self, address: Tuple[str, int], success: bool) -> None:
+        with self._lock:
+            if self._future.done() or address not in self._members:
+                return
+            (self._acked if success else self._failed).add(address)
+            self.evaluate()
+
+    # retira um follower descartado pelo líder das confirmações esperadas
+    def leave(self, address: Tuple[str, int]) -> None:
+        with self._lock:
+            if self._future.done():
+                return
+            self._members.discard(address)
+            self._acked.discard(address)
+            self._failed.discard(address)
+            self.evaluate()
+
+    # resolve o Future se a política foi atendida ou ficou impossível; chamado com o lock (ou na criação)
+    def evaluate(self) -> None:
+        required = self._required_acks(len(self._members))
+        if len(self._acked) >= required:
+            self._future.set_result(True)
+        elif len(self._members) - len(self._failed) < required:
+            # followers que falharam tornaram a política impossível de ser atendida
+            self._future.set_exception(Exception('Erro ao replicar.'))
+
+
+# escrita registrada no log de replicação: chave, valor e instante de expiração; valor None remove a chave expirada
+LogEntry = Tuple[str, Optional[str], int]
+
+
+# Log de replicação do líder: as últimas `max_entries` escritas, indexadas pelo número de sequência.
+# Os números de sequência são consecutivos, então a posição de uma escrita na lista é seq - first_seq.
+class ReplicationLog:
+    def __init__(self, max_entries: int, last_seq: int = 0) -> None:
+        self._max_entries = max_entries
+        self._entries: List[LogEntry] = []
+        self._first_seq = last_seq + 1
+
+    # region getters
+    @property
+    def first_seq(self) -> int:
+        return self._first_seq
+
+    @property
+    def last_seq(self) -> int:
+        return self._first_seq + len(self._entries) - 1
+    # endregion
+
+    # registra as escritas numeradas a partir de `first_seq`, que deve ser a próxima da sequência
+    def append(self, first_seq: int, entries: List[LogEntry]) -> None:
+        if first_seq != self.last_seq + 1:
+            raise ValueError(f'Sequência fora de ordem: esperado {self.last_seq + 1}, recebido {first_seq}')
+        self._entries.extend(entries)
+        # o descarte é feito em blocos para não mover a lista a cada escrita
+        if len(self._entries) >= 2 * self._max_entries:
+            drop = len(self._entries) - self._max_entries
+            del self._entries[:drop]
+            self._first_seq += drop
+
+    # verifica se todas as escritas a partir de `seq` ainda estão no log
+    def contains_from(self, seq: int) -> bool:
+        return self._first_seq <= seq <= self.last_seq + 1
+
+    # devolve até `limit` escritas a partir de `seq` como REPLICATION (ou EXPIRE, nas remoções) commands,
+    # ou None se já foram descartadas
+    def entries_from(self, seq: int, limit: int) -> Optional[List[Message]]:
+        if seq < self._first_seq:
+            return None
+        start = seq - self._first_seq
+        return [Message.replication(key, value, start_seq, expires_at) if value is not None
+                else Message.expire(key, start_seq)
+                for start_seq, (key, value, expires_at) in enumerate(self._entries[start:start + limit], seq)]
+
+
+# Thread dedicada a um follower: lê o log de replicação a partir do cursor do follower, agrupa as escritas
+# pendentes em lotes e mantém até `window` lotes em voo pela mesma conexão persistente.
+class FollowerReplicator(Thread):
+    def __init__(self, replicator: 'Replicator', ip: str, port: int, next_seq: int, paused: bool) -> None:
+        Thread.__init__(self, daemon=True)
+        self._replicator = replicator
+        self._ip = ip
+        self._port = port
+        # próxima escrita a ser enviada e última escrita confirmada pelo follower
+        self._send_seq = next_seq
+        self._acked_seq = next_seq - 1
+        # última escrita cuja falha já foi informada às confirmações pendentes
+        self._failed_seq = next_seq - 1
+        self._in_flight = 0
+        # instante a partir do qual as escritas não confirmadas são reenviadas depois de uma falha (0 sem falha)
+        self._retry_at = 0.0
+        # um follower recebendo snapshot fica pausado até terminar, acumulando as escritas novas no log
+        self._paused = paused
+        self._healthy = True
+        self._running = True
+
+    # region getters
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._ip, self._port
+
+    @property
+    def acked_seq(self) -> int:
+        return self._acked_seq
+
+    @property
+    def is_paused(self) -> bool:
+        return self._paused
+
+    @property
+    def is_healthy(self) -> bool:
+        return self._healthy
+    # endregion
+
+    # libera o envio das escritas a partir do cursor do follower
+    def resume(self) -> None:
+        with self._replicator.condition:
+            self._paused = False
+            self._replicator.condition.notify_all()
+
+    def stop(self) -> None:
+        with self._replicator.condition:
+            self._running = False
+            self._replicator.condition.notify_all()
+
+    # laço de envio: escritas que chegam enquanto a janela está cheia são coalescidas no próximo lote
+    def run(self) -> None:
+        condition = self._replicator.condition
+        while True:
+            with condition:
+                while self._running and not self.can_send():
+                    condition.wait(self.retry_wait())
+                if not self._running:
+                    return
+                batch = self._replicator.log.entries_from(self._send_seq, self._replicator.max_batch)
+                if batch is None:
+                    # o follower ficou para trás do que o log ainda guarda; precisa seguir o líder novamente
+                    logger.warning('Follower %s:%s ficou para trás do log de replicação e foi descartado', self._ip, self._port)
+                    self._replicator.remove_follower(self._ip, self._port)
+                    return
+                first_seq = self._send_seq
+                self._send_seq += len(batch)
+                self._in_flight += 1
+            self.send_batch(first_seq, batch)
+
+    # há escritas ainda não enviadas e espaço na janela de lotes em voo. Depois de uma falha, o envio recomeça da
+    # última escrita confirmada, só depois da pausa e do retorno dos lotes que ainda estavam em voo
+    def can_send(self) -> bool:
+        if self._retry_at:
+            if self._in_flight or time.monotonic() < self._retry_at:
+                return False
+            self._retry_at = 0.0
+            self._send_seq = self._acked_seq + 1
+        return (not self._paused and self._send_seq <= self._replicator.log.last_seq
+                and self._in_flight < self._replicator.window)
+
+    # tempo máximo de espera da thread: até o fim da pausa de uma falha, se nenhum lote em voo vai acordá-la antes
+    def retry_wait(self) -> Optional[float]:
+        if not self._retry_at or self._in_flight:
+            return None
+        return max(0.0, self._retry_at - time.monotonic())
+
+    # envia um lote como REPLICATION (uma escrita) ou REPLICATION_BATCH (várias escritas)
+    def send_batch(self, first_seq: int, batch: List[Message]) -> None:
+        message = batch[0] if len(batch) == 1 else Message.replication_batch(batch)
+        last_seq = first_seq + len(batch) - 1
+        try:
+            conn = self._replicator.connections.get(self._ip, self._port)
+            future = conn.request_async(message)
+        except OSError:
+            self.on_failure(first_seq, last_seq)
+            return
+        future.add_done_callback(lambda f: self.on_response(first_seq, last_seq, f))
+
+    def on_response(self, first_seq: int, last_seq: int, future: Future) -> None:
+        if future.exception() is not None or future.result() is None:
+            self.on_failure(first_seq, last_seq)
+            return
+        with self._replicator.condition:
+            # um lote reenviado pode ser confirmado duas vezes (o envio original atrasado e o reenvio); cada escrita
+            # conta uma única confirmação deste follower
+            first_new = max(first_seq, self._acked_seq + 1)
+            self._acked_seq = max(self._acked_seq, last_seq)
+            self._healthy = True
+            self._in_flight -= 1
+            self._replicator.condition.notify_all()
+        if first_new <= last_seq:
+            self._replicator.acknowledge(first_new, last_seq, self.address, True)
+
+    # falha no envio: as escritas não confirmadas voltam a ser enviadas pela thread do follower após uma pausa, sem
+    # prender a thread da conexão que entregou a falha
+    def on_failure(self, first_seq: int, last_seq: int) -> None:
+        self._replicator.connections.discard(self._ip, self._port)
+        with self._replicator.condition:
+            first_new = max(first_seq, self._acked_seq + 1, self._failed_seq + 1)
+            self._failed_seq = max(self._failed_seq, last_seq)
+            self._healthy = False
+            self._in_flight -= 1
+            self._retry_at = time.monotonic() + self._replicator.retry_interval
+            self._replicator.condition.notify_all()
+        if first_new <= last_seq:
+            self._replicator.acknowledge(first_new, last_seq, self.address, False)
+
+
+# Distribui as escritas do líder para todos os followers em paralelo, respeitando a política de confirmação.
+# Toda escrita entra no log de replicação na ordem dos números de sequência; cada follower é um cursor nesse log,
+# o que permite retomar a replicação de quem volta à rede a partir da última escrita que recebeu.
+class Replicator:
+    def __init__(self, ack_policy: str = 'all', max_batch: int = 256, window: int = 4, codec: str = DEFAULT_CODEC,
+                 log_size: int = 100000, retry_interval: float = 0.5, compression: str = 'none',
+                 compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD) -> None:
+        if ack_policy not in ACK_POLICIES:
+            raise ValueError(f'Política de confirmação inválida: {ack_policy}')
+        self._ack_policy = ack_policy
+        self._max_batch = max_batch
+        self._window = window
+        self._retry_interval = retry_interval
+        self._log_size = log_size
+        self._log = ReplicationLog(log_size)
+        self._connections = ConnectionCache(codec, compression, compression_threshold)
+        self._followers: Dict[Tuple[str, int], FollowerReplicator] = dict()
+        # confirmações aguardadas, indexadas pelo número de sequência da escrita
+        self._waiters: Dict[int, AckWaiter] = dict()
+        # protege o log, os cursores dos followers e as confirmações pendentes
+        self._condition = Condition()
+
+    # region getters
+    @property
+    def ack_policy(self) -> str:
+        return self._ack_policy
+
+    @property
+    def followers(self) -> List[FollowerReplicator]:
+        return list(self._followers.values())
+
+    @property
+    def log(self) -> ReplicationLog:
+        return self._log
+
+    @property
+    def condition(self) -> Condition:
+        return self._condition
+
+    @property
+    def connections(self) -> ConnectionCache:
+        return self._connections
+
+    @property
+    def max_batch(self) -> int:
+        return self._max_batch
+
+    @property
+    def window(self) -> int:
+        return self._window
+
+    @property
+    def retry_interval(self) -> float:
+        return self._retry_interval
+    # endregion
+
+    # reinicia o log a partir da última sequência conhecida (estado recuperado do disco)
+    def reset(self, last_seq: int) -> None:
+        with self._condition:
+            self._log = ReplicationLog(self._log_size, last_seq)
+
+    # registra um follower cujo próximo envio é a escrita `next_seq`; pausado, só recebe escritas após resume
+    def add_follower(self, ip: str, port: int, next_seq: int, paused: bool = False) -> FollowerReplicator:
+        with self._condition:
+            previous = self._followers.get((ip, port))
+            if previous is not None:
+                previous.stop()
+            follower = FollowerReplicator(self, ip, port, next_seq, paused)
+            self._followers[(ip, port)] = follower
+        follower.start()
+        return follower
+
+    def get_follower(self, ip: str, port: int) -> Optional[FollowerReplicator]:
+        return self._followers.get((ip, port))
+
+    # descarta um follower; as escritas que aguardavam a confirmação dele passam a ser avaliadas sem ele
+    def remove_follower(self, ip: str, port: int) -> None:
+        with self._condition:
+            follower = self._followers.pop((ip, port), None)
+            for seq, waiter in list(self._waiters.items()):
+                waiter.leave((ip, port))
+                if waiter.future.done():
+                    del self._waiters[seq]
+        if follower is not None:
+            follower.stop()
+
+    # quantidade de confirmações de followers necessárias para uma escrita ser considerada replicada
+    def required_acks(self, total: int) -> int:
+        if self._ack_policy == 'all':
+            return total
+        if self._ack_policy == 'quorum':
+            # maioria do cluster (followers + líder), descontando o próprio líder
+            return (total + 1) // 2
+        return 0
+
+    # registra a escrita `seq` no log e devolve um Future resolvido conforme a política de confirmação.
+    # Deve ser chamado na ordem das sequências, com o lock que atribui os números de sequência.
+    def replicate(self, seq: int, key: str, value: str, expires_at: int = 0) -> Future:
+        return self.replicate_many(seq, [(key, value, expires_at)])
+
+    # registra de uma vez as escritas numeradas a partir de `first_seq` (um MPUT): os followers as recebem
+    # no mesmo lote, e o Future é resolvido quando o lote que contém a última delas é confirmado
+    def replicate_many(self, first_seq: int, entries: List[LogEntry]) -> Future:
+        seq = first_seq + len(entries) - 1
+        with self._condition:
+            self._log.append(first_seq, entries)
+            # followers pausados (recebendo snapshot) e com a conexão em falha não contam para a política: um
+            # follower fora do ar não recusa as escritas que o líder já aplicou
+            waiter = AckWaiter({address for address, follower in self._followers.items()
+                                if not follower.is_paused and follower.is_healthy}, self.required_acks)
+            if not waiter.future.done():
+                self._waiters[seq] = waiter
+            self._condition.notify_all()
+        return waiter.future
+
+    # repassa o resultado de um lote para as escritas aguardando confirmação
+    def acknowledge(self, first_seq: int, last_seq: int, address: Tuple[str, int], success: bool) -> None:
+        with self._condition:
+            for seq in range(first_seq, last_seq + 1):
+                waiter = self._waiters.get(seq)
+                if waiter is None:
+                    continue
+                waiter.ack(address, success)
+                # confirmações que chegam depois da política atendida são ignoradas
+                if waiter.future.done():
+                    del self._waiters[seq]
+
+    # encerra as threads de replicação e as conexões com os followers
+    def close(self) -> None:
+        for follower in self.followers:
+            follower.stop()
+        self._connections.close_all()
@@ -0,0 +1,165 @@
+import json
+import hashlib
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+# Anel de hash consistente que divide as chaves entre vários grupos de servidores, cada um com o seu líder e os
+# seus followers. Cada grupo ocupa `vnodes` pontos do anel (nós virtuais), na posição do hash de "grupo#i", e é dono
+# das posições entre o ponto anterior (exclusive) e o seu (inclusive); uma chave pertence ao dono da posição do seu
+# hash. Com vários pontos por grupo, a carga fica equilibrada e a entrada de um grupo novo toma um pouco de cada
+# grupo existente, em vez de dividir um só.
+# A configuração do cluster fica em um arquivo json, compartilhado por clientes e pela ferramenta de rebalanceamento:
+#   {"version": 1, "vnodes": 64, "groups": {"g1": ["127.0.0.1:7000", "127.0.0.1:7001"], "g2": ["127.0.0.1:7010"]}}
+# O primeiro endereço de cada grupo é o do seu líder. A versão cresce a cada anel derivado de outro, e os servidores
+# cercados por um rebalanceamento a comparam com a dos clientes para recusar quem ainda usa um anel anterior.
+
+# nós virtuais de cada grupo no anel
+DEFAULT_VNODES = 64
+# maior posição do anel: os hashes têm 64 bits
+RING_MAX = (1 << 64) - 1
+
+# intervalo (início, fim] de posições do anel, com início < fim; início -1 inclui a posição 0
+HashRange = Tuple[int, int]
+
+
+# posição de uma chave (ou de um nó virtual) no anel: os primeiros 64 bits do md5, estáveis entre processos e máquinas
+def ring_hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+
+# posição de uma chave no anel; a chave é comparada em maiúsculas, como no store
+def key_position(key: str) -> int:
+    return ring_hash(key.upper())
+
+
+# serializa uma lista de intervalos como "início:fim,início:fim"
+def encode_ranges(ranges: List[HashRange]) -> str:
+    return ','.join(f'{start}:{end}' for start, end in ranges)
+
+
+def decode_ranges(encoded: str) -> List[HashRange]:
+    if not encoded:
+        return []
+    return [(int(start), int(end)) for start, end in (item.split(':') for item in encoded.split(','))]
+
+
+# Conjunto de intervalos do anel com busca binária: indica se uma posição está em algum deles
+class RangeSet:
+    def __init__(self, ranges: List[HashRange]) -> None:
+        self._ranges = sorted(ranges)
+        self._starts = [start for start, _ in self._ranges]
+
+    def __contains__(self, position: int) -> bool:
+        idx = bisect_left(self._starts, position) - 1
+        return idx >= 0 and position <= self._ranges[idx][1]
+
+    def __len__(self) -> int:
+        return len(self._ranges)
+
+    def __bool__(self) -> bool:
+        return bool(self._ranges)
+
+    # indica se a chave está em algum dos intervalos
+    def contains_key(self, key: str) -> bool:
+        return key_position(key) in self
+
+
+class HashRing:
+    def __init__(self, groups: Dict[str, List[str]], vnodes: int = DEFAULT_VNODES, version: int = 0) -> None:
+        if not groups:
+            raise ValueError('O anel precisa de pelo menos um grupo')
+        self._groups = {name: list(addresses) for name, addresses in groups.items()}
+        self._vnodes = vnodes
+        self._version = version
+        points = sorted((ring_hash(f'{name}#{i}'), name) for name in self._groups for i in range(vnodes))
+        self._positions = [position for position, _ in points]
+        self._owners = [name for _, name in points]
+
+    # region getters
+    @property
+    def groups(self) -> Dict[str, List[str]]:
+        return self._groups
+
+    @property
+    def vnodes(self) -> int:
+        return self._vnodes
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def positions(self) -> List[int]:
+        return self._positions
+
+    # endereços (ip, porta) dos servidores de um grupo; o primeiro é o líder
+    def addresses(self, group: str) -> List[Tuple[str, int]]:
+        return [(ip, int(port)) for ip, port in (address.split(':') for address in self._groups[group])]
+
+    def leader(self, group: str) -> Tuple[str, int]:
+        return self.addresses(group)[0]
+    # endregion
+
+    # grupo dono de uma posição do anel: o do primeiro ponto na posição ou depois dela, dando a volta no anel
+    def owner(self, position: int) -> str:
+        idx = bisect_left(self._positions, position)
+        return self._owners[idx if idx < len(self._positions) else 0]
+
+    # grupo dono de uma chave
+    def group_of(self, key: str) -> str:
+        return self.owner(key_position(key))
+
+    # novo anel com um grupo a mais, ou com os endereços de um grupo existente substituídos
+    def with_group(self, name: str, addresses: List[str]) -> 'HashRing':
+        return HashRing({**self._groups, name: list(addresses)}, self._vnodes, self._version + 1)
+
+    # novo anel sem um grupo
+    def without_group(self, name: str) -> 'HashRing':
+        return HashRing({group: addresses for group, addresses in self._groups.items() if group != name},
+                        self._vnodes, self._version + 1)
+
+    # region serialização
+    def to_json(self) -> str:
+        return json.dumps(dict(version=self._version, vnodes=self._vnodes, groups=self._groups), indent=2)
+
+    @staticmethod
+    def from_json(data: str) -> 'HashRing':
+        config = json.loads(data)
+        return HashRing(config['groups'], config.get('vnodes', DEFAULT_VNODES), config.get('version', 0))
+
+    @staticmethod
+    def load(path: str) -> 'HashRing':
+        with open(path) as file:
+            return HashRing.from_json(file.read())
+
+    def save(self, path: str) -> None:
+        with open(path, 'w') as file:
+            file.write(self.to_json() + '\n')
+    # endregion
+
+
+# Intervalos do anel que mudam de dono de um anel para outro, agrupados por (grupo de origem, grupo de destino).
+# Os pontos dos dois anéis dividem o anel em arcos com um único dono em cada um; os arcos consecutivos com a mesma
+# origem e o mesmo destino são unidos. Ao acrescentar um grupo, só os arcos que ele toma dos demais aparecem
+def moved_ranges(old: HashRing, new: HashRing) -> Dict[Tuple[str, str], List[HashRange]]:
+    boundaries = sorted(set(old.positions) | set(new.positions))
+    arcs = [(boundaries[i - 1] if i else -1, boundaries[i]) for i in range(len(boundaries))]
+    # o arco depois do último ponto dá a volta no anel e pertence ao dono do primeiro
+    if boundaries[-1] < RING_MAX:
+        arcs.append((boundaries[-1], RING_MAX))
+    moves: Dict[Tuple[str, str], List[HashRange]] = dict()
+    for start, end in arcs:
+        source, target = old.owner(end), new.owner(end)
+        if source == target:
+            continue
+        ranges = moves.setdefault((source, target), [])
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return moves
+
+
+# fração do anel coberta por uma lista de intervalos
+def ring_fraction(ranges: List[HashRange]) -> float:
+    return sum(end - start for start, end in ranges) / (RING_MAX + 1)
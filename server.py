@@ -1,28 +1,176 @@
+import time
+import json
+import argparse
 import helpers
-from message import Message
-from socket import socket, AF_INET, SOCK_STREAM
+import log
+from message import Message, RANGE_SCAN_KEYS_ONLY
+from connection import Connection, ConnectionCache
+from replication import Replicator, LogEntry, ACK_POLICIES
+from codec import CODECS, DEFAULT_CODEC, codec_from_flags, negotiate
+from compression import (COMPRESSIONS, DEFAULT_COMPRESSION_THRESHOLD, ValueCompressor, get_compressor,
+                         negotiate_compression, compress_payload, decompress_payload)
+from persistence import Persistence, FSYNC_POLICIES
+from forwarding import LeaderChannel
+from waiters import TimestampWaiters
+from expiry import ExpiryReaper, now_ms
+from storage import StorageEngine, OverlayStorage, Record, MISSING, STORAGE_ENGINES, create_storage
+from eviction import EVICTION_POLICIES, create_eviction_policy
+from workers import PartitionRouter, run_workers
+from ring import RangeSet, decode_ranges, key_position
+from metrics import Metrics
+from log import logger, sampled, LOG_LEVELS
+from socket import socket, AF_INET, SOCK_STREAM, SOL_SOCKET, SO_REUSEADDR, IPPROTO_TCP, TCP_NODELAY
 from dataclasses import dataclass
 from threading import Thread, Lock
-from typing import Dict, List
+from itertools import count
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# comandos tratados na própria thread leitora da conexão, preservando a ordem de chegada
+INLINE_COMMANDS = {'REPLICATION', 'REPLICATION_BATCH', 'EXPIRE'}
+# quantidade de chaves enviadas em cada bloco do snapshot transferido para um follower novo
+SNAPSHOT_CHUNK_SIZE = 1024
+# segundos sem pedidos de bloco após os quais uma sessão de snapshot é descartada (o follower morreu ou desistiu)
+SNAPSHOT_SESSION_IDLE_S = 60
+# modos de carga do snapshot em disco ao subir: mapeado e lido sob demanda, ou carregado inteiro na memória
+SNAPSHOT_LOADS = ('lazy', 'eager')
+# escritas atômicas executadas pelo líder sobre o valor atual da chave e replicadas como o valor resultante
+ATOMIC_COMMANDS = {'INCR', 'CAS', 'APPEND'}
+# escritas que um follower encaminha ao líder sem ocupar uma thread do pool
+FORWARDED_COMMANDS = {'PUT', 'MPUT'} | ATOMIC_COMMANDS
+# chaves por página de SCAN/PREFIX quando o cliente não informa o limite, e o máximo aceito
+SCAN_DEFAULT_LIMIT = 100
+SCAN_MAX_LIMIT = 1000
+# chaves examinadas por página de RANGE_SCAN, em múltiplos do limite: uma página pode voltar com menos chaves que
+# o limite (até vazia) quando poucas chaves do índice caem nos intervalos pedidos
+RANGE_SCAN_EXAMINE_FACTOR = 64
+# chaves removidas por passagem pelo lock das escritas ao descartar os intervalos migrados para outro grupo
+DROP_RANGES_BATCH = 1024
+
+
+# Escrita recusada porque a chave está em um intervalo do anel cercado para migração a outro grupo
+class RangeFencedError(Exception):
+    pass
+
+
+# Snapshot interrompido: o líder não conhece mais a sessão (reiniciou ou já a encerrou) e o follower precisa
+# recomeçar o FOLLOW
+class SnapshotSessionLostError(Exception):
+    pass
+
+
+# CAS recusado: o valor ou o timestamp atual da chave não é o esperado. Carrega o registro atual, com o valor em texto
+# (None se a chave não existe)
+class CompareFailedError(Exception):
+    def __init__(self, current: Optional[Record]) -> None:
+        Exception.__init__(self, 'Valor atual diferente do esperado')
+        self.current = current
+
+
+# INCR sobre um valor (ou com um incremento) que não é um número inteiro, ou escrita com TTL negativo
+class InvalidValueError(ValueError):
+    pass
+
 
 @dataclass
 class Server:
     # construtor da classe server que recebe a parametrizacao do endereço ip:porta vinculado a instancia em execução
-    def __init__(self, ip: str, port: int, ip_leader: str, port_leader) -> None:
+    def __init__(self, ip: str, port: int, ip_leader: str, port_leader, max_workers: int = 32, backlog: int = 128,
+                 ack_policy: str = 'all', codec: str = DEFAULT_CODEC, data_dir: str = None, fsync_policy: str = 'interval',
+                 fsync_interval_ms: int = 10, snapshot_interval_s: float = 60, replication_log_size: int = 100000,
+                 storage: str = 'sharded', stripes: int = 16, max_forwards: int = 1024,
+                 read_wait_ms: int = 0, max_memory: int = 0, max_keys: int = 0, eviction_policy: str = 'lru',
+                 compression: str = 'none', store_compression: str = 'none',
+                 compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD,
+                 server_socket: Optional[socket] = None, snapshot_load: str = 'lazy',
+                 snapshot_hot_reads: int = 2, replication_timeout_ms: int = 5000) -> None:
         self._ip = ip
         self._port = port
         self.ip_leader = ip_leader
         self.port_leader = port_leader
-        # criação do server socket e bind no ip:porta parametrizado
-        self._server_socket = socket(AF_INET, SOCK_STREAM)
-        self._server_socket.bind((self.ip, self.port))
-        self._server_socket.listen(5)
-        # estrutura de dados para armazenamento dos pares chave-valor registrados
-        self._store = dict()
-        # lock para gerenciar alterações concorrentes
+        # criação do server socket e bind no ip:porta parametrizado, a menos que ele já venha aberto (workers)
+        self._server_socket = server_socket
+        if server_socket is None:
+            self._server_socket = socket(AF_INET, SOCK_STREAM)
+            # permite reabrir a porta logo após um restart, com conexões antigas ainda em TIME_WAIT
+            self._server_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+            self._server_socket.bind((self.ip, self.port))
+            self._server_socket.listen(backlog)
+        # no modo multiprocesso, a porta pública compartilhada com os demais workers do nó e o roteador das
+        # requisições dela para o worker dono de cada chave; sem workers, o servidor só escuta no seu ip:porta
+        self._public_socket: Optional[socket] = None
+        self._router: Optional[PartitionRouter] = None
+        # engine de armazenamento dos pares chave-valor registrados
+        self._storage = create_storage(storage, stripes)
+        # lock que ordena as escritas: número de sequência, write-ahead log e log de replicação.
+        # As leituras não passam por ele; a concorrência no store é tratada pelo engine de armazenamento
         self._lock = Lock()
+        # número de sequência da última escrita: atribuído pelo líder e usado como timestamp da chave;
+        # nos followers, é a última escrita do líder aplicada em ordem
+        self._seq = 0
+        # GETs com timestamp à frente do store aguardam a replicação por até `read_wait_ms` (0 responde na hora)
+        self._read_wait = read_wait_ms / 1000
+        # prazo das escritas do líder à espera das confirmações dos followers, depois do qual o cliente recebe
+        # TRY_OTHER_SERVER_OR_LATER em vez de ficar preso
+        self._replication_timeout = replication_timeout_ms / 1000
+        self._read_waiters = TimestampWaiters()
+        # agenda das chaves com TTL; só o líder expira chaves, os followers aplicam as expirações replicadas
+        self._reaper = ExpiryReaper(self.expire_keys)
+        # sequência até a qual o estado local reflete as remoções (expirações e descartes): uma chave ausente pode ter
+        # sido removida (ou nunca ter existido) até ela, e a leitura devolve esse timestamp em vez de 0, para o cliente
+        # que conhecia a chave
+        self._removed_seq = 0
+        # limites do store em bytes estimados e em chaves (0 sem limite). Acima deles o líder descarta chaves pela
+        # política escolhida e replica os descartes; os followers só aplicam as remoções recebidas
+        self._max_memory = max_memory
+        self._max_keys = max_keys
+        self._eviction_policy = eviction_policy
+        self._eviction = None
+        if (max_memory or max_keys) and self.is_leader:
+            self._eviction = create_eviction_policy(eviction_policy)
+        # maior memória estimada ocupada pelo store desde o início, em bytes
+        self._memory_peak = 0
+        # com persistência, o snapshot em disco é mapeado em memória ao subir e lido sob demanda: só as escritas e as
+        # chaves lidas `snapshot_hot_reads` vezes são materializadas no engine. Com limites de memória o snapshot é
+        # carregado inteiro, pois a política de descarte precisa conhecer todas as chaves
+        self._lazy_snapshot = data_dir is not None and snapshot_load == 'lazy' and not (max_memory or max_keys)
+        if self._lazy_snapshot:
+            self._storage = OverlayStorage(self._storage, snapshot_hot_reads)
+        # snapshots em transferência para followers novos, indexados pelo id da sessão: chaves, follower e o instante
+        # (monotônico) do último pedido de bloco
+        self._snapshot_sessions: Dict[str, Tuple[List[str], Tuple[str, int], float]] = dict()
+        self._session_ids = count(1)
+        # write-ahead log e snapshots em disco, habilitados quando um diretório de dados é informado
+        self._persistence = None
+        if data_dir is not None:
+            self._persistence = Persistence(data_dir, fsync_policy, fsync_interval_ms, snapshot_interval_s)
         # lista que registra os followers
         self._followers = []
+        # codec preferido nas conexões abertas por este servidor
+        self._codec = codec
+        # compressão dos frames com pelo menos `compression_threshold` bytes: oferecida nas conexões abertas por este
+        # servidor e aceita nas recebidas ('none' recusa); os valores grandes do store têm a sua própria compressão
+        self._compression = compression
+        self._compression_threshold = compression_threshold
+        self._values = ValueCompressor(store_compression, compression_threshold)
+        # conexões persistentes com o líder
+        self._peer_connections = ConnectionCache(codec, compression, compression_threshold)
+        # canal multiplexado pelo qual o follower encaminha as escritas ao líder, com até `max_forwards` em voo
+        self._leader_channel = LeaderChannel(ip_leader, port_leader, codec, max_forwards, compression,
+                                             compression_threshold)
+        # replicação paralela e em lotes para os followers, com política de confirmação configurável
+        self._replicator = Replicator(ack_policy, codec=codec, log_size=replication_log_size, compression=compression,
+                                      compression_threshold=compression_threshold)
+        # pool de threads que processa as requisições recebidas, permitindo respostas fora de ordem
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # contadores e latências por etapa do atendimento, expostos pelo comando STATS
+        self._metrics = Metrics()
+        # intervalos do anel cujas escritas (no líder) e leituras o servidor recusa, cercados pela ferramenta de
+        # rebalanceamento enquanto as chaves deles migram para outro grupo (e depois, até o próximo rebalanceamento,
+        # para os clientes com o anel antigo buscarem o novo), e a versão do novo anel, abaixo da qual os SCAN/PREFIX
+        # são recusados; só em memória
+        self._fenced = RangeSet([])
+        self._fence_version = 0
 
     #region getters
     @property
@@ -37,73 +185,177 @@ class Server:
     def server_socket(self) -> socket:
         return self._server_socket
 
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        return self._executor
+
+    @property
+    def codec(self) -> str:
+        return self._codec
+
+    @property
+    def compression_threshold(self) -> int:
+        return self._compression_threshold
+
     @property
     def is_leader(self) -> bool:
         return self.ip == self.ip_leader and self.port == self.port_leader
+
+    # endereço informado aos clientes nas respostas de escrita: a porta pública do nó, no modo multiprocesso
+    @property
+    def advertised_address(self) -> Tuple[str, int]:
+        if self._public_socket is not None:
+            return self._public_socket.getsockname()
+        return self.ip, self.port
+
+    @property
+    def public_socket(self) -> Optional[socket]:
+        return self._public_socket
+
+    @property
+    def router(self) -> Optional[PartitionRouter]:
+        return self._router
+
+    @property
+    def seq(self) -> int:
+        return self._seq
     
+    @property
+    def storage(self) -> StorageEngine:
+        return self._storage
+
+    # cópia do store como dicionário <chave, registro>
     @property
     def store(self) -> Dict:
-        return self._store
+        return dict(self._storage.items())
     
     @property
     def followers(self) -> List:
         return self._followers
+
+    @property
+    def metrics(self) -> Metrics:
+        return self._metrics
+
+    # quantidade de conexões abertas com o servidor
+    @property
+    def connections_count(self) -> int:
+        return self._metrics.gauge('connections')
     #endregion
 
     # region setters
-    def add_follower(self, ip: str, port: int) -> None:
-        self._followers.append((ip, port))
+    def add_follower(self, ip: str, port: int, next_seq: int, paused: bool = False) -> None:
+        if (ip, port) not in self._followers:
+            self._followers.append((ip, port))
+        self._replicator.add_follower(ip, port, next_seq, paused)
     
     def set_store(self, store: Dict) -> None:
-        self._store = store
-    # endregion
+        self._storage.clear()
+        for key, stored in store.items():
+            self._storage.put(key, stored)
 
-    # abre conexão com um servidor follower para fins de replicação
-    def open_follower_conection(self, ip: str, port: int) -> socket:
-        return helpers.open_server_connection(ip, port)
+    # torna o servidor o worker `index` de um nó no modo multiprocesso: ele passa a escutar também na porta pública
+    # e a rotear as requisições dela entre os workers, cujos endereços internos vêm em `addresses`
+    def set_workers(self, index: int, addresses: List[Tuple[str, int]], public_socket: socket) -> None:
+        self._public_socket = public_socket
+        self._router = PartitionRouter(index, addresses, self.server_handle, self._executor, self._codec)
+    # endregion
 
-    # abre conexão com o servidor líder para encaminhar uma requisição PUT
-    def open_leader_connection(self) -> socket:
-        return helpers.open_server_connection(self.ip_leader, self.port_leader)
+    # obtém a conexão persistente com o servidor líder para encaminhar uma requisição PUT
+    def open_leader_connection(self) -> Connection:
+        return self._peer_connections.get(self.ip_leader, self.port_leader)
 
-    # fecha a conexão com um servidor
-    def close_server_connection(self, socket: socket) -> None:
-        helpers.close_server_connection(socket)
+    # descarta a conexão persistente com um servidor, que será reaberta no próximo uso
+    def close_server_connection(self, ip: str, port: int) -> None:
+        self._peer_connections.discard(ip, port)
 
     # region factories
     # Monta um PUT_OK command, carregando a chave, valor e o timestamp incrementado pelo servidor
     def put_ok_command_factory(self, key:str, value: str, server_timestamp: int) -> Message:
-        put_ok_cmd = Message('PUT_OK').set_key(key).set_value(value).set_server_timestamp(server_timestamp)
-        return put_ok_cmd
+        return Message.put_ok(key, value, server_timestamp)
 
     # Monta um GET_OK Command, carregando chave, valor e os timestamps do cliente e o do servidor
-    def get_ok_command_factory(self, key:str, value: str, client_timestamp: int, server_timestamp: int) -> Message:
-        get_ok_cmd = Message('GET_OK').set_key(key).set_value(value)
-        get_ok_cmd.set_client_timestamp(client_timestamp).set_server_timestamp(server_timestamp)
-        return get_ok_cmd
+    # e, para chaves com TTL, o instante em que ela expira
+    def get_ok_command_factory(self, key:str, value: str, client_timestamp: int, server_timestamp: int,
+                               expires_at: int = 0) -> Message:
+        return Message.get_ok(key, value, client_timestamp, server_timestamp, expires_at)
     
     # Monta um erro TRY_OTHER_SERVER_OR_LATER carregando a chave responsável pelo erro
     def try_another_command_factory(self, key:str) -> Message:
-        return Message('TRY_OTHER_SERVER_OR_LATER').set_key(key)
+        return Message.try_other(key)
 
-    # Monta um FOLLOW command carregando o endereço do servidor que deseja se juntar a rede
-    def follow_command_factory(self, ip: str, port: int) -> Message:
-        follow_cmd = Message('FOLLOW').set_follower_address(ip, port)
-        return follow_cmd
+    # Monta a resposta de um PUT ou MPUT que não pôde ser encaminhado ao líder: TRY_OTHER_SERVER_OR_LATER para cada chave
+    def leader_unavailable_command_factory(self, put_cmd: Message) -> Message:
+        if put_cmd.type == 'MPUT':
+            return self.mput_ok_command_factory([self.try_another_command_factory(item.key) for item in put_cmd.items])
+        return self.try_another_command_factory(put_cmd.key)
 
-    # Monta um FOLLOW_OK command, carregando uma cópia do estado atual do servidor líder para manter a consistência
-    def follow_ok_command_factory(self) -> Message:
-        follow_ok_cmd = Message('FOLLOW_OK').set_store_json(helpers.json_serialize(self.store))
-        return follow_ok_cmd
-    
-    # Monta um REPLICATION command, carregando chave, valor e o timestamp incrementado pelo líder
-    def replication_commmand_factory(self, key:str, value: str, leader_timestamp: int) -> Message:
-        replication_cmd = Message('REPLICATION').set_key(key).set_value(value).set_server_timestamp(leader_timestamp)
-        return replication_cmd
+    # Monta um CAS_FAILED command, carregando o valor atual da chave e o timestamp dele (ou a marca `absent`, se ela
+    # não existe), para o cliente tentar de novo sem um GET
+    def cas_failed_command_factory(self, key: str, current: Optional[Record]) -> Message:
+        if current is None:
+            return Message.cas_failed(key, '', 0, absent=True)
+        return Message.cas_failed(key, current.value, current.timestamp)
+
+    # Monta um INVALID_VALUE command, carregando no valor o motivo da recusa de um INCR ou de um TTL negativo
+    def invalid_value_command_factory(self, key: str, reason: str) -> Message:
+        return Message('INVALID_VALUE', key, reason)
+
+    # Monta um MPUT_OK command, carregando o resultado de cada chave: PUT_OK ou TRY_OTHER_SERVER_OR_LATER
+    def mput_ok_command_factory(self, results: List[Message]) -> Message:
+        return Message.mput_ok(results)
+
+    # Monta um MGET_OK command, carregando o resultado de cada chave: GET_OK ou TRY_OTHER_SERVER_OR_LATER
+    def mget_ok_command_factory(self, results: List[Message]) -> Message:
+        return Message.mget_ok(results)
+
+    # Monta um SCAN_OK command, carregando um GET_OK por chave da página e o cursor da próxima (vazio na última)
+    def scan_ok_command_factory(self, items: List[Tuple[str, Record]], client_timestamp: int, cursor: str) -> Message:
+        return Message.scan_ok([self.get_ok_command_factory(key, self._values.unpack(stored.value), client_timestamp,
+                                                            stored.timestamp, stored.expires_at)
+                                for key, stored in items], cursor, self._seq)
+
+    # Monta o SCAN_OK de um RANGE_SCAN só de chaves, com a sequência do líder no início da página
+    def scan_keys_ok_command_factory(self, keys: List[str], cursor: str, seq: int) -> Message:
+        return Message.scan_ok([Message('GET_OK', key) for key in keys], cursor, seq)
+
+    # Monta um FOLLOW command carregando o endereço do servidor que deseja se juntar a rede e a última sequência aplicada por ele
+    def follow_command_factory(self, ip: str, port: int, last_seq: int) -> Message:
+        return Message('FOLLOW', client_timestamp=last_seq, follower_address=(ip, port))
+
+    # Monta um FOLLOW_OK command, informando como o follower alcança o líder: pelo log de replicação (LOG)
+    # ou por um snapshot transferido em blocos (SNAPSHOT), além da sequência atual do líder
+    def follow_ok_command_factory(self, mode: str, leader_seq: int, session_id: str = '') -> Message:
+        return Message('FOLLOW_OK', key=session_id, value=mode, server_timestamp=leader_seq)
+
+    # Monta um SNAPSHOT_CHUNK command, pedindo o bloco do snapshot de uma sessão a partir da posição `cursor`
+    def snapshot_chunk_command_factory(self, session_id: str, cursor: int) -> Message:
+        return Message('SNAPSHOT_CHUNK', key=session_id, client_timestamp=cursor)
+
+    # Monta um SNAPSHOT_CHUNK_OK command, carregando as chaves do bloco como REPLICATION commands e a próxima posição
+    def snapshot_chunk_ok_command_factory(self, items: List[Message], next_cursor: int, done: bool) -> Message:
+        return Message('SNAPSHOT_CHUNK_OK', value='DONE' if done else '', client_timestamp=next_cursor, items=items)
     
     # Monta um REPLICATION_OK command, para informar o servidor do sucesso da replicação
     def replication_ok_command_factory(self) -> Message:
         return Message('REPLICATION_OK')
+
+    # Monta um HELLO_OK command, carregando o codec e, na chave, a compressão escolhidos para a conexão
+    def hello_ok_command_factory(self, codec: str, compression: str = '') -> Message:
+        return Message('HELLO_OK').set_value(codec).set_key(compression)
+
+    # Monta um WORKERS_OK command, carregando no valor os endereços internos dos workers, na ordem das partições
+    # (vazio fora do modo multiprocesso)
+    def workers_ok_command_factory(self, addresses: List[Tuple[str, int]]) -> Message:
+        return Message('WORKERS_OK').set_value(','.join(f'{ip}:{port}' for ip, port in addresses))
+
+    # Monta um RANGES_OK command, carregando no valor a quantidade de chaves afetadas por um FENCE ou DROP_RANGES
+    def ranges_ok_command_factory(self, count: int = 0) -> Message:
+        return Message('RANGES_OK').set_value(str(count))
+
+    # Monta um STATS_OK command, carregando as métricas do servidor em json
+    def stats_ok_command_factory(self, stats: Dict[str, Any]) -> Message:
+        return Message('STATS_OK').set_value(json.dumps(stats))
     # endregion
 
     # region command handlers
@@ -113,148 +365,851 @@ class Server:
             return self.put_command_handler(command)
         if cmd_name == 'GET':
             return self.get_command_handler(command)
+        if cmd_name == 'MPUT':
+            return self.mput_command_handler(command)
+        if cmd_name == 'MGET':
+            return self.mget_command_handler(command)
+        if cmd_name in ATOMIC_COMMANDS:
+            return self.atomic_command_handler(command)
+        if cmd_name in ('SCAN', 'PREFIX'):
+            return self.scan_command_handler(command)
         if cmd_name == 'FOLLOW':
             return self.follow_command_handler(command)
         if cmd_name == 'FOLLOW_OK':
             return self.follow_ok_command_handler(command)
         if cmd_name == 'REPLICATION':
             return self.replication_command_handler(command)
-        return None
+        if cmd_name == 'REPLICATION_BATCH':
+            return self.replication_batch_command_handler(command)
+        if cmd_name == 'EXPIRE':
+            return self.expire_command_handler(command)
+        if cmd_name == 'HELLO':
+            return self.hello_command_handler(command)
+        if cmd_name == 'SNAPSHOT_CHUNK':
+            return self.snapshot_chunk_command_handler(command)
+        if cmd_name == 'STATS':
+            return self.stats_command_handler(command)
+        if cmd_name == 'WORKERS':
+            return self.workers_command_handler(command)
+        if cmd_name == 'RANGE_SCAN':
+            return self.range_scan_command_handler(command)
+        if cmd_name == 'FENCE':
+            return self.fence_command_handler(command)
+        if cmd_name == 'DROP_RANGES':
+            return self.drop_ranges_command_handler(command)
+        # comando desconhecido: a requisição não fica sem resposta
+        return self.try_another_command_factory(command.key)
+
+    # indica se uma requisição recebida pela porta pública envolve chaves de outros workers
+    def needs_routing(self, command: Message) -> bool:
+        return self._router is not None and not self._router.is_local(command)
 
-    # inclui/atualiza o valor de uma chave
+    # encaminha uma requisição aos workers donos das suas chaves, devolvendo um Future resolvido com a resposta.
+    # O limite das páginas de SCAN/PREFIX é fixado antes, para todas as partições usarem o mesmo
+    def route(self, command: Message) -> Future:
+        if command.type in ('SCAN', 'PREFIX'):
+            command.limit = min(command.limit or SCAN_DEFAULT_LIMIT, SCAN_MAX_LIMIT)
+        return self._router.route(command)
+
+    # inclui/atualiza o valor de uma chave, com TTL opcional em milissegundos
     def put_command_handler(self, put_cmd: Message) -> Message:
         key, value = put_cmd.key, put_cmd.value
         if self.is_leader:
-            client_timestamp, client_address = put_cmd.client_timestamp, put_cmd.sender_address
-            server_timestamp = self.store_key_value_pair(key, value, client_timestamp)
-            print(f'Cliente {client_address} PUT key:{key} value:{value}')
-            for (ip, port) in self.followers:
-                replication_cmd = self.replication_commmand_factory(key, value, server_timestamp)
-                self.replicate(replication_cmd, ip, port)
-            
-            print(f'Enviando PUT_OK ao Cliente {client_address} da key:{key} ts:{server_timestamp}.')
-            return self.put_ok_command_factory(key, value, server_timestamp)
+            client_address = put_cmd.sender_address
+            try:
+                server_timestamp, replicated = self.write_key_value_pair(key, value, put_cmd.ttl)
+            except RangeFencedError:
+                return self.leader_unavailable_command_factory(put_cmd)
+            except InvalidValueError as e:
+                return self.invalid_value_command_factory(key, str(e))
+            if sampled():
+                logger.debug('Cliente %s PUT key:%s value:%s ts:%s', client_address, key, value, server_timestamp)
+            try:
+                # a escrita segue para todos os followers em paralelo; aguardamos conforme a política de confirmação
+                replicated.result(self._replication_timeout)
+            except Exception as e:
+                logger.warning('Erro ao replicar key:%s ts:%s: %s', key, server_timestamp, e)
+                return self.try_another_command_factory(key)
+
+            # a resposta informa o líder, para o cliente enviar as próximas escritas direto a ele
+            return self.put_ok_command_factory(key, value, server_timestamp).set_leader(*self.advertised_address)
         
-        print(f'Encaminhando PUT key:{key} value:{value}')
         return self.send_put_to_leader(put_cmd)
 
     # devolve o conteudo de uma chave
-    def get_command_handler(self, get_cmd: Message) -> Message:
+    # Se o timestamp do cliente está à frente e a espera está habilitada, o GET fica estacionado sem ocupar uma thread
+    # e o handler devolve um Future, resolvido com a resposta quando a replicação alcançar o timestamp ou o prazo esgotar
+    def get_command_handler(self, get_cmd: Message, wait: bool = True) -> Message:
         key, client_timestamp, client_address = get_cmd.key, get_cmd.client_timestamp, get_cmd.sender_address
+        # uma chave de intervalo cercado já é (ou logo será) de outro grupo, e pode até ter sido removida daqui
+        if self._fenced and key_position(key) in self._fenced:
+            self._metrics.count('reads.fenced')
+            return self.try_another_command_factory(key)
         stored = self.get_key_value_pair(key)
-        value, server_timestamp = stored['value'], stored['timestamp']
+        # o líder só conhece os acessos das leituras que ele mesmo atende
+        if self._eviction is not None:
+            self._eviction.touch(key.upper())
+        value, server_timestamp = stored.value, stored.timestamp
 
+        if client_timestamp > server_timestamp and wait and self._read_wait > 0:
+            if sampled():
+                logger.debug('Cliente %s GET key:%s ts:%s. Meu ts é %s, aguardando a replicação',
+                             client_address, key, client_timestamp, server_timestamp)
+            self._metrics.count('reads.parked')
+            return self.park_get(get_cmd)
         if client_timestamp > server_timestamp:
-            print(f'Cliente {client_address} GET key:{key} ts:{client_timestamp}. Meu ts é {server_timestamp}, portanto devolvendo TRY_OTHER_SERVER_OR_LATER')
+            if sampled():
+                logger.debug('Cliente %s GET key:%s ts:%s. Meu ts é %s, portanto devolvendo TRY_OTHER_SERVER_OR_LATER',
+                             client_address, key, client_timestamp, server_timestamp)
+            self._metrics.count('reads.refused')
             return self.try_another_command_factory(key)
             
-        value = 'NULL' if value is None else value
-        print(f'Cliente {client_address} GET key:{key} ts:{client_timestamp}. Meu ts é {server_timestamp}, portanto devolvendo {value}')
-        return self.get_ok_command_factory(key, value, client_timestamp, server_timestamp)
+        value = 'NULL' if value is None else self._values.unpack(value)
+        if sampled():
+            logger.debug('Cliente %s GET key:%s ts:%s. Meu ts é %s, portanto devolvendo %s',
+                         client_address, key, client_timestamp, server_timestamp, value)
+        return self.get_ok_command_factory(key, value, client_timestamp, server_timestamp, stored.expires_at)
+
+    # inclui/atualiza o valor de várias chaves: o líder aplica todas de uma vez e as replica em um único lote
+    def mput_command_handler(self, mput_cmd: Message) -> Message:
+        if self.is_leader:
+            client_address = mput_cmd.sender_address
+            pairs = [(put_cmd.key, put_cmd.value) for put_cmd in mput_cmd.items]
+            try:
+                timestamps, replicated = self.write_key_value_pairs(pairs, [put_cmd.ttl for put_cmd in mput_cmd.items])
+            except RangeFencedError:
+                return self.leader_unavailable_command_factory(mput_cmd)
+            except InvalidValueError as e:
+                # nenhuma chave do lote é gravada
+                return self.mput_ok_command_factory([self.invalid_value_command_factory(key, str(e))
+                                                     for key, _ in pairs])
+            if sampled():
+                logger.debug('Cliente %s MPUT de %s chaves', client_address, len(pairs))
+            try:
+                replicated.result(self._replication_timeout)
+            except Exception as e:
+                logger.warning('Erro ao replicar MPUT de %s chaves: %s', len(pairs), e)
+                return self.mput_ok_command_factory([self.try_another_command_factory(key) for key, _ in pairs])
+            mput_ok_cmd = self.mput_ok_command_factory([self.put_ok_command_factory(key, value, timestamp)
+                                                        for (key, value), timestamp in zip(pairs, timestamps)])
+            return mput_ok_cmd.set_leader(*self.advertised_address)
+
+        return self.send_put_to_leader(mput_cmd)
+
+    # inclui/atualiza o valor de uma chave a partir do valor atual, de forma atômica, com INCR, CAS ou APPEND
+    def atomic_command_handler(self, atomic_cmd: Message) -> Message:
+        if not self.is_leader:
+            return self.send_put_to_leader(atomic_cmd)
+        response_cmd, replicated = self.apply_atomic_command(atomic_cmd)
+        if replicated is None:
+            return response_cmd
+        try:
+            replicated.result(self._replication_timeout)
+        except Exception as e:
+            logger.warning('Erro ao replicar %s key:%s: %s', atomic_cmd.type, atomic_cmd.key, e)
+            return self.try_another_command_factory(atomic_cmd.key)
+        return response_cmd
+
+    # executa no líder um INCR, CAS ou APPEND, devolvendo a resposta ao cliente (PUT_OK com o valor resultante) e o
+    # Future da replicação, ou None se a operação foi recusada sem escrever
+    def apply_atomic_command(self, atomic_cmd: Message) -> Tuple[Message, Optional[Future]]:
+        key = atomic_cmd.key
+        try:
+            server_timestamp, value, replicated = self.update_key_value_pair(key, self.atomic_update(atomic_cmd))
+        except RangeFencedError:
+            return self.leader_unavailable_command_factory(atomic_cmd), None
+        except CompareFailedError as e:
+            self._metrics.count('writes.cas_failed')
+            return self.cas_failed_command_factory(key, e.current).set_leader(*self.advertised_address), None
+        except InvalidValueError as e:
+            return self.invalid_value_command_factory(key, str(e)), None
+        if sampled():
+            logger.debug('Cliente %s %s key:%s value:%s ts:%s', atomic_cmd.sender_address, atomic_cmd.type, key, value,
+                         server_timestamp)
+        # a resposta informa o líder, para o cliente enviar as próximas escritas direto a ele
+        return self.put_ok_command_factory(key, value, server_timestamp).set_leader(*self.advertised_address), replicated
+
+    # função que calcula o novo valor e a expiração de uma chave a partir do registro atual (None se ela não existe)
+    # para um INCR (o valor atual somado ao incremento; a chave inexistente vale 0), um APPEND (o valor atual seguido
+    # do sufixo) ou um CAS (o novo valor, se a chave existe e tem o valor ou o timestamp esperado, conforme o modo de
+    # comparação, ou, com `absent`, se ela não existe). INCR e APPEND mantêm a expiração da chave; o CAS usa o TTL
+    # informado, como o PUT
+    def atomic_update(self, atomic_cmd: Message) -> Callable[[Optional[Record]], Tuple[str, int]]:
+        def update(current: Optional[Record]) -> Tuple[str, int]:
+            expires_at = current.expires_at if current is not None else 0
+            if atomic_cmd.type == 'INCR':
+                counter = parse_integer(current.value) if current is not None else 0
+                return str(counter + parse_integer(atomic_cmd.value)), expires_at
+            if atomic_cmd.type == 'APPEND':
+                return (current.value if current is not None else '') + atomic_cmd.value, expires_at
+            if atomic_cmd.absent:
+                matches = current is None
+            elif atomic_cmd.compare == 'VALUE':
+                matches = current is not None and current.value == atomic_cmd.expected
+            elif atomic_cmd.compare == 'TIMESTAMP':
+                matches = current is not None and current.timestamp == atomic_cmd.client_timestamp
+            else:
+                raise InvalidValueError(f'Modo de comparação do CAS inválido: "{atomic_cmd.compare}"')
+            if not matches:
+                raise CompareFailedError(current)
+            check_ttl(atomic_cmd.ttl)
+            return atomic_cmd.value, now_ms() + atomic_cmd.ttl if atomic_cmd.ttl > 0 else 0
+
+        return update
+
+    # devolve o conteudo de várias chaves, comparando o timestamp informado pelo cliente para cada uma
+    # devolve um Future quando alguma das chaves ficou estacionada aguardando a replicação
+    def mget_command_handler(self, mget_cmd: Message) -> Message:
+        results = []
+        for get_cmd in mget_cmd.items:
+            get_cmd.sender = mget_cmd.sender
+            results.append(self.get_command_handler(get_cmd))
+        parked = [result for result in results if isinstance(result, Future)]
+        if not parked:
+            return self.mget_ok_command_factory(results)
+        response = Future()
+        remaining = [len(parked)]
+        lock = Lock()
+
+        def on_result(_: Future) -> None:
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] > 0:
+                    return
+            response.set_result(self.mget_ok_command_factory(
+                [result.result() if isinstance(result, Future) else result for result in results]))
+
+        for future in parked:
+            future.add_done_callback(on_result)
+        return response
+
+    # devolve uma página das chaves de um intervalo [key, value) (SCAN) ou que começam com key (PREFIX), em ordem.
+    # O cliente informa o maior timestamp que conhece entre as chaves do intervalo: como as escritas são aplicadas
+    # em ordem, um servidor cuja sequência já o alcançou tem todas elas, e um que não alcançou devolve
+    # TRY_OTHER_SERVER_OR_LATER, como no GET. O cursor é a última chave entregue; a página seguinte começa depois dela.
+    # Com intervalos cercados, um cliente com um anel anterior ao do rebalanceamento também é recusado: ele
+    # atribuiria a este grupo as chaves que migraram, e elas faltariam no resultado
+    def scan_command_handler(self, scan_cmd: Message) -> Message:
+        start, client_timestamp = scan_cmd.key.upper(), scan_cmd.client_timestamp
+        if self._fenced and scan_cmd.ring_version < self._fence_version:
+            self._metrics.count('reads.fenced')
+            return self.try_another_command_factory(scan_cmd.key)
+        if client_timestamp > self._seq:
+            if sampled():
+                logger.debug('Cliente %s %s key:%s ts:%s. Meu ts é %s, portanto devolvendo TRY_OTHER_SERVER_OR_LATER',
+                             scan_cmd.sender_address, scan_cmd.type, start, client_timestamp, self._seq)
+            self._metrics.count('reads.refused')
+            return self.try_another_command_factory(scan_cmd.key)
+        stop = prefix_end(start) if scan_cmd.type == 'PREFIX' else scan_cmd.value.upper() or None
+        limit = min(scan_cmd.limit or SCAN_DEFAULT_LIMIT, SCAN_MAX_LIMIT)
+        cursor = scan_cmd.cursor.upper()
+        # uma chave a mais indica se há outra página
+        if cursor and cursor >= start:
+            items = self._storage.scan(cursor, stop, limit + 1, after=True)
+        else:
+            items = self._storage.scan(start, stop, limit + 1)
+        next_cursor = items[limit - 1][0] if len(items) > limit else ''
+        # chaves vencidas que o líder ainda não expirou ficam de fora, como no GET
+        now = now_ms()
+        items = [(key, stored) for key, stored in items[:limit] if not stored.expires_at or stored.expires_at > now]
+        return self.scan_ok_command_factory(items, client_timestamp, next_cursor)
+
+    # estaciona um GET até a chave alcançar o timestamp do cliente. Quando a espera termina, a resposta é montada
+    # por uma thread do pool, para não ocupar a thread que aplicou a escrita (a leitora da replicação)
+    def park_get(self, get_cmd: Message) -> Future:
+        formatted_key = get_cmd.key.upper()
+        response = Future()
+        woken = self._read_waiters.park(formatted_key, get_cmd.client_timestamp, self._read_wait)
+        woken.add_done_callback(lambda _: self.executor.submit(
+            lambda: response.set_result(self.get_command_handler(get_cmd, wait=False))))
+        # a escrita pode ter sido aplicada entre a leitura do store e o registro da espera
+        self._read_waiters.notify(formatted_key, self.get_key_value_pair(formatted_key).timestamp)
+        return response
     
-    # inclui um servidor follower na lista
-    def follow_command_handler(self, follow_cmd) -> None:
+    # inclui um servidor follower na lista. Se o log de replicação ainda guarda tudo o que o follower não recebeu,
+    # ele passa a receber as escritas a partir da última que aplicou; caso contrário recebe um snapshot em blocos.
+    # O follower é registrado com o lock das escritas, então nenhuma escrita concorrente fica de fora.
+    def follow_command_handler(self, follow_cmd: Message) -> Message:
         ip, port = follow_cmd.follower_address
-        self.add_follower(ip, port)
-        return self.follow_ok_command_factory()
+        last_seq = follow_cmd.client_timestamp
+        with self._lock:
+            # um FOLLOW novo do mesmo follower (reiniciou ou recomeçou) abandona a sessão de snapshot anterior dele;
+            # as sessões ociosas dos demais também são descartadas
+            now = time.monotonic()
+            self.drop_snapshot_sessions(lambda follower, last_access: follower == (ip, port)
+                                        or now - last_access > SNAPSHOT_SESSION_IDLE_S)
+            leader_seq = self._seq
+            if last_seq <= leader_seq and self._replicator.log.contains_from(last_seq + 1):
+                self.add_follower(ip, port, last_seq + 1)
+                logger.info('Follower %s:%s retomando a partir da sequência %s', ip, port, last_seq + 1)
+                return self.follow_ok_command_factory('LOG', leader_seq)
+            # o snapshot percorre as chaves existentes agora; as escritas seguintes ficam no log até o follower terminar
+            session_id = str(next(self._session_ids))
+            keys = self._storage.keys()
+            self._snapshot_sessions[session_id] = (keys, (ip, port), time.monotonic())
+            self.add_follower(ip, port, leader_seq + 1, paused=True)
+        logger.info('Follower %s:%s recebendo snapshot de %s chaves', ip, port, len(keys))
+        return self.follow_ok_command_factory('SNAPSHOT', leader_seq, session_id)
 
-    # prepara a store do servidor que entrou na rede
+    # prepara a store do servidor que entrou na rede: no modo SNAPSHOT, busca e aplica o snapshot do líder bloco a bloco
     def follow_ok_command_handler(self, follow_ok_cmd: Message) -> None:
-        store = helpers.json_deserialize(follow_ok_cmd.store_json)
-        self.set_store(store)
+        if follow_ok_cmd.value != 'SNAPSHOT':
+            logger.info('Retomando a replicação a partir da sequência %s', self._seq + 1)
+            return
+        session_id, leader_seq = follow_ok_cmd.key, follow_ok_cmd.server_timestamp
+        self._storage.clear()
+        conn = self.open_leader_connection()
+        cursor, applied = 0, 0
+        while True:
+            chunk = conn.request(self.snapshot_chunk_command_factory(session_id, cursor))
+            if chunk.type == 'TRY_OTHER_SERVER_OR_LATER':
+                # o store já foi limpo, então o próximo FOLLOW parte do zero
+                with self._lock:
+                    self._seq = self._removed_seq = 0
+                raise SnapshotSessionLostError(session_id)
+            for replication_cmd in chunk.items:
+                self.apply_key_value_pair(replication_cmd.key, replication_cmd.value, replication_cmd.server_timestamp,
+                                          from_snapshot=True, expires_at=replication_cmd.expires_at)
+            applied += len(chunk.items)
+            cursor = chunk.client_timestamp
+            if chunk.value == 'DONE':
+                break
+        with self._lock:
+            self._seq = leader_seq
+            # as chaves ausentes do snapshot podem ter expirado até a sequência do líder
+            self._removed_seq = leader_seq
+        logger.info('Snapshot do líder aplicado: %s chaves até a sequência %s', applied, leader_seq)
+        # a cópia recebida do líder substitui o estado local, então vira o novo snapshot em disco
+        self.snapshot()
+
+    # devolve um bloco do snapshot de uma sessão; ao entregar o último, libera a replicação para o follower.
+    # Uma sessão desconhecida é recusada com TRY_OTHER_SERVER_OR_LATER, e o follower recomeça o FOLLOW
+    def snapshot_chunk_command_handler(self, snapshot_chunk_cmd: Message) -> Message:
+        session_id, cursor = snapshot_chunk_cmd.key, snapshot_chunk_cmd.client_timestamp
+        now = time.monotonic()
+        with self._lock:
+            self.drop_snapshot_sessions(lambda follower, last_access: now - last_access > SNAPSHOT_SESSION_IDLE_S)
+            session = self._snapshot_sessions.get(session_id)
+            if session is None:
+                logger.warning('Sessão de snapshot desconhecida: %s', session_id)
+                return self.try_another_command_factory(session_id)
+            keys, (ip, port), _ = session
+            self._snapshot_sessions[session_id] = (keys, (ip, port), now)
+        items = []
+        for key in keys[cursor:cursor + SNAPSHOT_CHUNK_SIZE]:
+            # chaves expiradas depois do início da sessão ficam de fora; as vencidas seguem com o instante de expiração
+            stored = self._storage.get(key)
+            if stored is not None:
+                items.append(Message.replication(key, self._values.unpack(stored.value), stored.timestamp,
+                                                 stored.expires_at))
+        next_cursor = cursor + SNAPSHOT_CHUNK_SIZE
+        done = next_cursor >= len(keys)
+        if done:
+            self._snapshot_sessions.pop(session_id, None)
+            follower = self._replicator.get_follower(ip, port)
+            if follower is not None:
+                follower.resume()
+        return self.snapshot_chunk_ok_command_factory(items, next_cursor, done)
+
+    # descarta as sessões de snapshot que satisfazem `predicate(follower, last_access)`, junto com o follower
+    # pausado delas, que não recebe mais nada até um novo FOLLOW. Chamado com o lock das escritas
+    def drop_snapshot_sessions(self, predicate: Callable[[Tuple[str, int], float], bool]) -> None:
+        for session_id, (keys, follower, last_access) in list(self._snapshot_sessions.items()):
+            if not predicate(follower, last_access):
+                continue
+            del self._snapshot_sessions[session_id]
+            logger.info('Sessão de snapshot %s do follower %s:%s descartada', session_id, *follower)
+            replicator = self._replicator.get_follower(*follower)
+            if replicator is not None and replicator.is_paused:
+                self._replicator.remove_follower(*follower)
 
     # replica uma chave
     def replication_command_handler(self, replication_cmd: Message) -> Message:
         key, value, timestamp = replication_cmd.key, replication_cmd.value, replication_cmd.server_timestamp
-        self.store_key_value_pair(key, value, timestamp)
-        print(f'REPLICATION key:{key} value:{value} ts:{timestamp}')
+        self.apply_key_value_pair(key, value, timestamp, expires_at=replication_cmd.expires_at)
+        if sampled():
+            logger.debug('REPLICATION key:%s value:%s ts:%s', key, value, timestamp)
+        return self.replication_ok_command_factory()
+
+    # escolhe o codec da conexão entre os oferecidos pelo par, em ordem de preferência, e a compressão, se este
+    # servidor aceita compressão e o par ofereceu alguma
+    def hello_command_handler(self, hello_cmd: Message) -> Message:
+        compression = ''
+        if self._compression != 'none' and hello_cmd.key:
+            compression = negotiate_compression(hello_cmd.key.split(','))
+        return self.hello_ok_command_factory(negotiate(hello_cmd.value.split(',')), compression)
+
+    # aplica a remoção de uma chave decidida pelo líder, por expiração ou descarte
+    def expire_command_handler(self, expire_cmd: Message) -> Message:
+        self.apply_expiration(expire_cmd.key, expire_cmd.server_timestamp)
+        if sampled():
+            logger.debug('EXPIRE key:%s ts:%s', expire_cmd.key, expire_cmd.server_timestamp)
+        return self.replication_ok_command_factory()
+
+    # replica um lote de escritas e expirações, na ordem em que aconteceram no líder
+    def replication_batch_command_handler(self, replication_batch_cmd: Message) -> Message:
+        for replication_cmd in replication_batch_cmd.items:
+            if replication_cmd.type == 'EXPIRE':
+                self.expire_command_handler(replication_cmd)
+            else:
+                self.replication_command_handler(replication_cmd)
         return self.replication_ok_command_factory()
+
+    # devolve as métricas do servidor
+    def stats_command_handler(self, stats_cmd: Message) -> Message:
+        return self.stats_ok_command_factory(self.stats())
+
+    # devolve os endereços internos dos workers deste nó, pedidos pelos workers de um follower ao subir
+    def workers_command_handler(self, workers_cmd: Message) -> Message:
+        return self.workers_ok_command_factory(self._router.addresses if self._router is not None else [])
+
+    # Comandos do rebalanceamento entre grupos, atendidos só pelo líder (um follower devolve
+    # TRY_OTHER_SERVER_OR_LATER), exceto o FENCE
+    # devolve, ao rebalanceamento, uma página das chaves do líder cuja posição no anel está nos intervalos pedidos
+    # (na chave) e cujo timestamp é maior que o informado pelo cliente, em ordem de chave a partir do cursor; com o
+    # valor RANGE_SCAN_KEYS_ONLY, a página traz só as chaves.
+    # Cada página examina no máximo RANGE_SCAN_EXAMINE_FACTOR vezes o limite de chaves do índice, e o cursor
+    # devolvido é a última chave examinada (vazio quando o índice acabou). O timestamp do servidor é a sequência do
+    # início da página: as escritas depois dela são as que uma cópia feita a partir desta página ainda não viu
+    def range_scan_command_handler(self, range_scan_cmd: Message) -> Message:
+        if not self.is_leader:
+            return self.try_another_command_factory(range_scan_cmd.key)
+        ranges = RangeSet(decode_ranges(range_scan_cmd.key))
+        since, cursor = range_scan_cmd.client_timestamp, range_scan_cmd.cursor.upper()
+        limit = min(range_scan_cmd.limit or SCAN_DEFAULT_LIMIT, SCAN_MAX_LIMIT)
+        # lida com o lock: as escritas avançam a sequência antes de gravar a chave, e a página não pode contar uma
+        # escrita que o store ainda não tem
+        with self._lock:
+            seq = self._seq
+        items = []
+        examined = 0
+        now = now_ms()
+        while len(items) < limit and examined < limit * RANGE_SCAN_EXAMINE_FACTOR:
+            batch = self._storage.scan(cursor, None, limit, after=bool(cursor))
+            examined += len(batch)
+            items.extend((key, stored) for key, stored in batch
+                         if stored.timestamp > since and (not stored.expires_at or stored.expires_at > now)
+                         and key_position(key) in ranges)
+            cursor = batch[-1][0] if len(batch) == limit else ''
+            if not cursor:
+                break
+        if range_scan_cmd.value == RANGE_SCAN_KEYS_ONLY:
+            return self.scan_keys_ok_command_factory([key for key, _ in items], cursor, seq)
+        return self.scan_ok_command_factory(items, since, cursor).set_server_timestamp(seq)
+
+    # cerca os intervalos do anel informados na chave: o servidor passa a recusar com TRY_OTHER_SERVER_OR_LATER as
+    # escritas (no líder) e as leituras neles, e os SCAN/PREFIX de clientes com anel anterior à versão informada.
+    # Substitui o cerco anterior; uma chave vazia o remove. Único destes comandos aceito também pelos followers,
+    # que recebem leituras
+    def fence_command_handler(self, fence_cmd: Message) -> Message:
+        ranges = decode_ranges(fence_cmd.key)
+        with self._lock:
+            self._fenced = RangeSet(ranges)
+            self._fence_version = fence_cmd.ring_version
+        logger.info('Intervalos cercados: %s (anel %s)', len(ranges), fence_cmd.ring_version)
+        return self.ranges_ok_command_factory(len(ranges))
+
+    # remove as chaves dos intervalos do anel informados na chave, já copiadas para o grupo que passou a ser o dono
+    # delas, ou, com itens, só as chaves deles que estão nos intervalos (as que o grupo de origem removeu durante a
+    # cópia). As remoções são replicadas como expirações, em blocos de DROP_RANGES_BATCH chaves
+    def drop_ranges_command_handler(self, drop_ranges_cmd: Message) -> Message:
+        if not self.is_leader:
+            return self.try_another_command_factory(drop_ranges_cmd.key)
+        ranges = RangeSet(decode_ranges(drop_ranges_cmd.key))
+        if drop_ranges_cmd.items:
+            stored_keys = ((item.key.upper(), self._storage.get(item.key.upper())) for item in drop_ranges_cmd.items)
+            due = [(key, stored.timestamp) for key, stored in stored_keys
+                   if stored is not None and key_position(key) in ranges]
+        else:
+            due = [(key, stored.timestamp) for key, stored in self._storage.items() if key_position(key) in ranges]
+        removed = sum(self.remove_keys(due[i:i + DROP_RANGES_BATCH]) for i in range(0, len(due), DROP_RANGES_BATCH))
+        self._metrics.count('keys.dropped', removed)
+        logger.info('%s chaves removidas dos intervalos migrados', removed)
+        return self.ranges_ok_command_factory(removed)
     # endregion
 
     # fecha uma conexão
     def close(self) -> None:
         self.server_socket.close()
+        if self._public_socket is not None:
+            self._public_socket.close()
+            self._router.close()
+        self._peer_connections.close_all()
+        self._leader_channel.close()
+        self._read_waiters.close()
+        self._reaper.close()
+        self._replicator.close()
+        self._executor.shutdown(wait=False)
+        if self._persistence is not None:
+            self._persistence.close()
 
-    # Realiza o setup inicial do servidor, seguindo o líder caso seja um follower
-    def setup(self) -> None:    
+    # Realiza o setup inicial do servidor: recupera o estado em disco e segue o líder caso seja um follower
+    def setup(self) -> None:
+        if self._persistence is not None:
+            self.recover()
         if not self.is_leader:
             self.follow_leader()
+        if self._persistence is not None:
+            self._persistence.start_snapshots(self.snapshot)
+
+    # reconstrói o store a partir do último snapshot e do write-ahead log gravado depois dele
+    def recover(self) -> None:
+        snapshot, state, seq = self._persistence.recover(self._lazy_snapshot)
+        with self._lock:
+            self._storage.clear()
+            if snapshot is not None:
+                self._storage.set_base(snapshot)
+            for key, entry in state.items():
+                if entry is None:
+                    self._storage.remove(key, seq)
+                    continue
+                value, timestamp, expires_at = entry
+                self._storage.put(key, Record(self._values.pack(value), timestamp, expires_at))
+            self._seq = seq
+            self._removed_seq = seq
+            self._replicator.reset(seq)
+            self._memory_peak = self._storage.size_bytes
+            # as chaves recuperadas entram na política de descarte; se os limites diminuíram, o excesso sai agora
+            if self._eviction is not None:
+                for key, entry in state.items():
+                    if entry is not None:
+                        self._eviction.add(key)
+                removals, _ = self.evict_keys()
+                if removals:
+                    self._replicator.replicate_many(self._seq - len(removals) + 1, removals)
+        # as chaves com TTL voltam à agenda do líder; as já vencidas expiram logo em seguida. As do snapshot mapeado
+        # vêm do índice de chaves com TTL dele, sem ler os demais registros
+        if self.is_leader:
+            expiring = [(key, entry[1], entry[2]) for key, entry in state.items() if entry is not None and entry[2]]
+            if snapshot is not None:
+                expiring.extend(item for item in snapshot.expiring() if item[0] not in state)
+            self._reaper.schedule_many(expiring)
+        logger.info('%s chaves recuperadas do disco até a sequência %s (%s no snapshot mapeado)', len(self._storage),
+                    seq, len(snapshot) if snapshot is not None else 0)
+
+    # grava imediatamente um snapshot do store, descartando o log coberto por ele
+    def snapshot(self) -> None:
+        if self._persistence is not None:
+            with self._lock:
+                seq = self._seq
+            self._persistence.snapshot(self.snapshot_items, seq)
+
+    # métricas do servidor: contadores por comando, latências por etapa (parse, handle, replicate, serialize e espera
+    # pelo lock das escritas), conexões abertas, memória estimada do store e, no líder, o atraso de replicação de cada
+    # follower em escritas
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(address=f'{self.ip}:{self.port}', role='leader' if self.is_leader else 'follower', seq=self._seq,
+                     keys=len(self._storage), expiring_keys=len(self._reaper), parked_reads=len(self._read_waiters),
+                     forwards_in_flight=self._leader_channel.in_flight, fenced_ranges=len(self._fenced))
+        # no modo multiprocesso, as métricas são as do worker que atendeu o STATS, dono de uma das partições
+        if self._router is not None:
+            stats['worker'] = dict(index=self._router.index, workers=self._router.partitions,
+                                   public_address='%s:%s' % self.advertised_address)
+        stats['memory'] = dict(bytes=self._storage.size_bytes, peak_bytes=self._memory_peak,
+                               max_bytes=self._max_memory, max_keys=self._max_keys,
+                               policy=self._eviction_policy if self._max_memory or self._max_keys else '')
+        if isinstance(self._storage, OverlayStorage):
+            stats['memory']['mapped_keys'] = self._storage.mapped_keys
+        stats.update(self._metrics.snapshot())
+        stats['followers'] = {
+            '%s:%s' % follower.address: dict(acked_seq=follower.acked_seq, lag=self._seq - follower.acked_seq,
+                                             healthy=follower.is_healthy, paused=follower.is_paused)
+            for follower in self._replicator.followers}
+        return stats
+
+    # tuplas <chave, valor, timestamp, expiração> em ordem de chave para gravação de um snapshot, lidas do store em
+    # páginas pelo índice ordenado, sem copiar o store inteiro de uma vez
+    def snapshot_items(self) -> Iterator[Tuple[str, str, int, int]]:
+        cursor = None
+        while True:
+            page = self._storage.scan(cursor or '', None, SNAPSHOT_CHUNK_SIZE, after=cursor is not None)
+            if not page:
+                return
+            for key, stored in page:
+                yield key, self._values.unpack(stored.value), stored.timestamp, stored.expires_at
+            cursor = page[-1][0]
     
-    # repassa um PUT command recebido para o líder e retransmite ao cliente solicitante a resposta
+    # repassa um PUT ou MPUT command recebido para o líder e retransmite ao cliente solicitante a resposta
     def send_put_to_leader(self, put_cmd: Message) -> Message:
-        # abre-se uma conexão com o servidor
-        conn = self.open_leader_connection()
-        try:
-            if conn is not None:
-                return helpers.send_request(conn, put_cmd)
-        finally:
-            self.close_server_connection(conn)
+        return self.forward_to_leader(put_cmd).result()
+
+    # envia um PUT ou MPUT command pelo canal com o líder sem aguardar a resposta. O Future é resolvido com a
+    # resposta do líder ou, se ele não puder ser alcançado, com TRY_OTHER_SERVER_OR_LATER para o cliente tentar novamente
+    def forward_to_leader(self, put_cmd: Message) -> Future:
+        response = Future()
+
+        def on_response(future: Future) -> None:
+            error = future.exception()
+            if error is None and future.result() is not None:
+                response.set_result(future.result())
+            else:
+                logger.warning('Falha ao encaminhar %s ao líder: %s', put_cmd.type, error)
+                response.set_result(self.leader_unavailable_command_factory(put_cmd))
 
-    # Envia o replication_cmd para um servidor endereçado em ip:port
-    def replicate(self, replication_cmd: Message, ip: str, port: int) -> None:
-        conn = self.open_follower_conection(ip, port)
         try:
-            if conn is not None:
-                if helpers.send_request(conn, replication_cmd) is None:
-                    raise Exception('Erro ao replicar.')
-        finally:
-            self.close_server_connection(conn)
-    
-    # recebe uma requisição e dispacha para uma thread dedicada ao tratamento
+            self._leader_channel.forward(put_cmd).add_done_callback(on_response)
+        except OSError as e:
+            logger.warning('Falha ao encaminhar %s ao líder: %s', put_cmd.type, e)
+            response.set_result(self.leader_unavailable_command_factory(put_cmd))
+        return response
+
+    # recebe as conexões; no modo multiprocesso, as da porta pública são aceitas por uma thread à parte
     def listen(self) -> None:
+        if self._public_socket is not None:
+            Thread(target=self.accept_connections, args=(self._public_socket, True), daemon=True).start()
+        self.accept_connections(self.server_socket)
+
+    # recebe uma requisição e dispacha para uma thread dedicada ao tratamento. As requisições das conexões com
+    # `routed` passam pelo roteamento entre os workers
+    def accept_connections(self, server_socket: socket, routed: bool = False) -> None:
         while True:
             try:
                 # aguardo um client se conectar
-                client_socket, client_address = self.server_socket.accept()
+                client_socket, client_address = server_socket.accept()
+                client_socket.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
                 # despacho para um thread tratar sua requisição
-                handler_thread = self.RequestHandlerThread(self, client_socket, client_address)
+                handler_thread = self.RequestHandlerThread(self, client_socket, client_address, routed)
                 handler_thread.start()
             except (KeyboardInterrupt, EOFError):
-                print('\nSaindo...')
+                logger.info('Saindo...')
                 break
             except:
                 break
                     
     # envia uma notificação para o líder avisando que se juntou a rede e recebe como resposta os dados que o servidor possui
     def follow_leader(self) -> None:
-         # abre-se uma conexão com o servidor
+        # obtém-se a conexão persistente com o líder, reaproveitada depois para encaminhar PUTs
         conn = self.open_leader_connection()
-        try:
-            if conn is not None:
-                msg = self.follow_command_factory(self.ip, self.port)
-                response = helpers.send_request(conn, msg)
+        while True:
+            msg = self.follow_command_factory(self.ip, self.port, self._seq)
+            response = conn.request(msg)
+            try:
                 self.follow_ok_command_handler(response)
-        finally:
-            self.close_server_connection(conn)
+                return
+            except SnapshotSessionLostError as e:
+                logger.warning('O líder não conhece a sessão de snapshot %s; recomeçando o FOLLOW', e)
     
-    # obtem um par <chave, valor> a partir da chave
-    def get_key_value_pair(self, key: str) -> Dict:
+    # obtem um par <chave, valor> a partir da chave, sem passar pelo lock das escritas.
+    # Uma chave vencida é lida como inexistente desde já, mesmo antes de o líder expirá-la, com o timestamp da
+    # última escrita; uma chave ausente leva o timestamp até o qual as expirações foram aplicadas
+    def get_key_value_pair(self, key: str) -> Record:
+        value = self._storage.get(key.upper())
+        if value is None:
+            return Record('NULL', self._removed_seq) if self._removed_seq else MISSING
+        if value.expires_at and value.expires_at <= now_ms():
+            return Record('NULL', value.timestamp)
+        return value
+
+
+    # registra um par <chave, valor>
+    def store_key_value_pair(self, key: str, value: str) -> int:
+        new_timestamp, _ = self.write_key_value_pair(key, value)
+        return new_timestamp
+
+    # registra um par <chave, valor> no líder: a escrita recebe o próximo número de sequência como timestamp
+    # e entra no store, no write-ahead log e no log de replicação na mesma ordem. Devolve o timestamp e o
+    # Future da replicação, resolvido conforme a política de confirmação.
+    def write_key_value_pair(self, key: str, value: str, ttl_ms: int = 0) -> Tuple[int, Future]:
+        timestamps, replicated = self.write_key_value_pairs([(key, value)], [ttl_ms])
+        return timestamps[0], replicated
+
+    # registra vários pares <chave, valor> no líder com uma única passagem pelo lock das escritas: cada chave
+    # recebe o seu número de sequência e o conjunto entra no log de replicação de uma vez.
+    # `ttls` traz o TTL de cada par em milissegundos (0 nunca expira); o líder o converte em um instante absoluto
+    # no seu relógio, que é o replicado, para que todos os servidores expirem a chave no mesmo instante.
+    # Um TTL negativo recusa o lote inteiro com InvalidValueError
+    def write_key_value_pairs(self, pairs: List[Tuple[str, str]],
+                              ttls: Optional[List[int]] = None) -> Tuple[List[int], Future]:
+        for ttl in ttls or []:
+            check_ttl(ttl)
+        now = now_ms() if ttls and any(ttls) else 0
+        entries = [(key.upper(), value, now + ttl if ttl > 0 else 0)
+                   for (key, value), ttl in zip(pairs, ttls or [0] * len(pairs))]
+        return self.write_entries(lambda: entries)
+
+    # aplica no líder uma escrita calculada a partir do valor atual da chave: `update` recebe o registro atual, com o
+    # valor em texto (None se a chave não existe ou venceu), e devolve o novo valor e a expiração, ou levanta uma
+    # exceção para recusar a escrita. A leitura e a escrita acontecem com o lock das escritas, então nenhuma outra
+    # escrita na chave se intercala entre elas. Devolve o timestamp, o novo valor e o Future da replicação
+    def update_key_value_pair(self, key: str,
+                              update: Callable[[Optional[Record]], Tuple[str, int]]) -> Tuple[int, str, Future]:
         formatted_key = key.upper()
+        values = []
+
+        def prepare() -> List[Tuple[str, str, int]]:
+            stored = self._storage.get(formatted_key)
+            current = None
+            if stored is not None and not (stored.expires_at and stored.expires_at <= now_ms()):
+                current = Record(self._values.unpack(stored.value), stored.timestamp, stored.expires_at)
+            value, expires_at = update(current)
+            values.append(value)
+            return [(formatted_key, value, expires_at)]
+
+        timestamps, replicated = self.write_entries(prepare)
+        return timestamps[0], values[0], replicated
+
+    # grava no líder as entradas <chave em maiúsculas, valor, expiração> devolvidas por `prepare`, chamada já com o
+    # lock das escritas (e que pode levantar uma exceção para recusar a escrita). Devolve os timestamps e o Future da
+    # replicação
+    def write_entries(self, prepare: Callable[[], List[Tuple[str, str, int]]]) -> Tuple[List[int], Future]:
+        timestamps = []
+        lsn = 0
+        waiting = time.perf_counter()
         with self._lock:
-            value = self._store.get(formatted_key)
-            if value is not None:
-                return value
-            return dict([('value', 'NULL'),('timestamp', 0)])
-            
+            self._metrics.observe('lock_wait', time.perf_counter() - waiting)
+            entries = prepare()
+            # o cerco é conferido com o lock, então nenhuma escrita nos intervalos escapa da cópia do rebalanceamento
+            if self._fenced and any(key_position(formatted_key) in self._fenced for formatted_key, _, _ in entries):
+                self._metrics.count('writes.fenced')
+                raise RangeFencedError()
+            first_seq = self._seq + 1
+            for formatted_key, value, expires_at in entries:
+                self._seq += 1
+                self._storage.put(formatted_key, Record(self._values.pack(value), self._seq, expires_at))
+                if self._persistence is not None:
+                    lsn = self._persistence.log_put(formatted_key, value, self._seq, expires_at)
+                if self._eviction is not None:
+                    self._eviction.add(formatted_key)
+                timestamps.append(self._seq)
+            self._memory_peak = max(self._memory_peak, self._storage.size_bytes)
+            # os descartes provocados pelas escritas entram no log de replicação logo depois delas
+            removals, evict_lsn = self.evict_keys() if self._eviction is not None else ([], 0)
+            lsn = max(lsn, evict_lsn)
+            replicated = self._replicator.replicate_many(first_seq, entries + removals)
+        if self._replicator.followers:
+            started = time.perf_counter()
+            replicated.add_done_callback(lambda _: self._metrics.observe('replicate', time.perf_counter() - started))
+        # as chaves com TTL entram na agenda com o novo timestamp: a agenda ignora os agendamentos de versões antigas
+        expiring = [(formatted_key, timestamp, expires_at)
+                    for (formatted_key, _, expires_at), timestamp in zip(entries, timestamps) if expires_at]
+        if expiring:
+            self._reaper.schedule_many(expiring)
+        for (formatted_key, _, _), timestamp in zip(entries, timestamps):
+            self._read_waiters.notify(formatted_key, timestamp)
+        # a espera pelo fsync fica fora do lock, para que escritas concorrentes entrem no mesmo lote
+        if lsn:
+            self._persistence.wait_durable(lsn)
+        return timestamps, replicated
 
-    # registra um par <chave, valor>
-    def store_key_value_pair(self, key: str, value: str, timestamp: int) -> int:
+    # aplica uma escrita recebida do líder, mantendo o timestamp atribuído por ele. Escritas repetidas ou mais
+    # antigas que o valor atual são ignoradas, então reaplicar um lote (reenvio após falha) é inofensivo.
+    # Blocos de snapshot não entram no write-ahead log nem avançam a sequência: o snapshot só vale quando completo.
+    def apply_key_value_pair(self, key: str, value: str, timestamp: int, from_snapshot: bool = False,
+                             expires_at: int = 0) -> bool:
         formatted_key = key.upper()
+        lsn = 0
+        # a comparação com o timestamp atual usa só o lock da partição da chave no engine
+        applied = self._storage.put_if_newer(formatted_key, Record(self._values.pack(value), timestamp, expires_at))
+        # acorda os GETs estacionados que aguardavam esta escrita
+        if applied:
+            self._read_waiters.notify(formatted_key, timestamp)
+            self._memory_peak = max(self._memory_peak, self._storage.size_bytes)
+        if from_snapshot:
+            return applied
+        waiting = time.perf_counter()
+        with self._lock:
+            self._metrics.observe('lock_wait', time.perf_counter() - waiting)
+            self._seq = max(self._seq, timestamp)
+            if applied and self._persistence is not None:
+                lsn = self._persistence.log_put(formatted_key, value, timestamp, expires_at)
+        if lsn:
+            self._persistence.wait_durable(lsn)
+        return applied
+
+    # expira, no líder, as chaves vencidas entregues pela agenda. Cada expiração é uma escrita: recebe o próximo
+    # número de sequência e entra no write-ahead log e no log de replicação como EXPIRE, então os followers removem
+    # as mesmas chaves na mesma ordem das escritas. Chaves reescritas depois do agendamento são ignoradas.
+    # A replicação não é aguardada: até o EXPIRE chegar, os followers já leem a chave vencida como inexistente
+    def expire_keys(self, due: List[Tuple[str, int]]) -> None:
+        started = time.perf_counter()
+        expired = self.remove_keys(due)
+        self._metrics.count('keys.expired', expired)
+        self._metrics.observe('expire', time.perf_counter() - started)
+
+    # remove, no líder, as chaves informadas com o timestamp que tinham ao serem escolhidas, como uma escrita cada,
+    # replicadas como EXPIRE. Devolve quantas foram removidas
+    def remove_keys(self, due: List[Tuple[str, int]]) -> int:
+        entries = []
+        lsn = 0
+        with self._lock:
+            first_seq = self._seq + 1
+            for key, timestamp in due:
+                stored = self._storage.get(key)
+                if stored is None or stored.timestamp != timestamp:
+                    continue
+                self._seq += 1
+                self._storage.remove(key, timestamp)
+                if self._persistence is not None:
+                    lsn = self._persistence.log_delete(key, self._seq)
+                if self._eviction is not None:
+                    self._eviction.remove(key)
+                entries.append((key, None, 0))
+            if entries:
+                self._removed_seq = self._seq
+                self._replicator.replicate_many(first_seq, entries)
+        if lsn:
+            self._persistence.wait_durable(lsn)
+        return len(entries)
+
+    # descarta, no líder, chaves escolhidas pela política até o store voltar aos limites de memória e de chaves.
+    # Chamado com o lock das escritas: cada descarte recebe o próximo número de sequência e entra no write-ahead log
+    # como uma remoção. Devolve as remoções, a replicar como EXPIRE, e a posição do último registro no write-ahead log
+    def evict_keys(self) -> Tuple[List[LogEntry], int]:
+        removals = []
+        lsn = 0
+        while self.over_limits():
+            key = self._eviction.victim()
+            if key is None:
+                break
+            self._eviction.remove(key)
+            stored = self._storage.get(key)
+            if stored is None:
+                continue
+            self._seq += 1
+            self._storage.remove(key, stored.timestamp)
+            if self._persistence is not None:
+                lsn = self._persistence.log_delete(key, self._seq)
+            removals.append((key, None, 0))
+        if removals:
+            self._removed_seq = self._seq
+            self._metrics.count('keys.evicted', len(removals))
+        return removals, lsn
+
+    # indica se o store passou do limite de chaves ou de memória
+    def over_limits(self) -> bool:
+        return bool((self._max_keys and len(self._storage) > self._max_keys)
+                    or (self._max_memory and self._storage.size_bytes > self._max_memory))
+
+    # aplica uma remoção recebida do líder (expiração ou descarte): a chave só é removida se não há escrita mais
+    # nova que a remoção
+    def apply_expiration(self, key: str, timestamp: int) -> bool:
+        lsn = 0
+        removed = self._storage.remove(key, timestamp)
+        # GETs estacionados à espera de uma versão anterior da chave já podem ler a expiração
+        if removed:
+            self._read_waiters.notify(key, timestamp)
         with self._lock:
-            if formatted_key not in self._store:
-                self._store[formatted_key] = dict([('value', 'NULL'),('timestamp', 0)])
-            new_timestamp = self._store.get(formatted_key)['timestamp'] + 1
-            self._store[formatted_key]['value'] = value
-            self._store[formatted_key]['timestamp'] = new_timestamp
-            return new_timestamp
+            self._seq = max(self._seq, timestamp)
+            self._removed_seq = max(self._removed_seq, timestamp)
+            if removed and self._persistence is not None:
+                lsn = self._persistence.log_delete(key, timestamp)
+        if lsn:
+            self._persistence.wait_durable(lsn)
+        return removed
 
     # classe aninhada para fazermos o dispatch da requisição para outras threads
     class RequestHandlerThread(Thread):
-        def __init__(self, server, client_socket, client_address) -> None:
+        def __init__(self, server, client_socket, client_address, routed: bool = False) -> None:
             Thread.__init__(self)
             self._server = server
             self._client_socket = client_socket
             self._client_address = client_address
+            # conexão recebida pela porta pública de um worker, cujas requisições podem ser de outras partições
+            self._routed = routed
+            # lock que serializa a escrita das respostas, produzidas por várias threads do pool
+            self._write_lock = Lock()
+            # compressão das respostas, combinada no HELLO da conexão
+            self._compressor = None
       
         # region getters
         @property
@@ -270,43 +1225,248 @@ class Server:
             return self._client_address
         # endregion
 
-        # sobrescrevendo a função run
+        # sobrescrevendo a função run: a conexão permanece aberta e recebe frames até o cliente encerrá-la
         def run(self):
-            request = helpers.socket_receive_all(self.client_socket)
-            response_cmd = self.process_request(request)
-            if response_cmd is not None:
-                self.client_socket.sendall(self.prepare_response(response_cmd))
-            self.client_socket.close()
+            metrics = self.server.metrics
+            metrics.add('connections', 1)
+            try:
+                while True:
+                    frame = helpers.receive_frame(self.client_socket)
+                    if frame is None:
+                        break
+                    request_id, flags, payload = frame
+                    # a resposta é codificada no mesmo codec da requisição
+                    codec = codec_from_flags(flags)
+                    started = time.perf_counter()
+                    try:
+                        command = codec.decode(decompress_payload(flags, payload))
+                    except Exception as e:
+                        logger.warning('Requisição %s de %s inválida: %s', request_id, self.client_address, e)
+                        command = None
+                    metrics.observe('parse', time.perf_counter() - started)
+                    if command is None:
+                        metrics.count('requests.invalid')
+                        self.send_response(request_id, codec, self.server.try_another_command_factory(''))
+                        continue
+                    # comandos internos são tratados em ordem; os demais vão para o pool e podem responder fora de ordem
+                    if command.type in INLINE_COMMANDS:
+                        self.handle_request(request_id, codec, command)
+                    elif self._routed and self.server.needs_routing(command):
+                        self.route_request(request_id, codec, command)
+                    elif command.type in FORWARDED_COMMANDS and not self.server.is_leader:
+                        # com o canal para o líder cheio, a leitura desta conexão fica parada até ele responder
+                        self.forward_request(request_id, codec, command)
+                    else:
+                        self.server.executor.submit(self.handle_request, request_id, codec, command)
+            except (OSError, ValueError):
+                pass
+            finally:
+                metrics.add('connections', -1)
+                self.client_socket.close()
+
+        # trata uma requisição e envia a resposta com o mesmo id recebido; respostas adiadas (GETs estacionados)
+        # chegam como Future e são enviadas quando ele for resolvido
+        def handle_request(self, request_id: int, codec, command: Message) -> None:
+            started = time.perf_counter()
+            try:
+                response_cmd = self.process_request(command)
+            except Exception as e:
+                response_cmd = self.failed_request_response(command, e)
+            if isinstance(response_cmd, Future):
+                response_cmd.add_done_callback(
+                    lambda f: self.complete_request(request_id, codec, command.type, started,
+                                                    self.future_response(command, f)))
+                return
+            self.complete_request(request_id, codec, command.type, started, response_cmd)
+
+        # resposta de uma requisição adiada, encaminhada ou roteada, ou a recusa se ela terminou em erro
+        def future_response(self, command: Message, future: Future) -> Message:
+            try:
+                return future.result()
+            except Exception as e:
+                return self.failed_request_response(command, e)
+
+        # um erro no tratamento vira TRY_OTHER_SERVER_OR_LATER, para o cliente não esperar por uma resposta que
+        # não virá
+        def failed_request_response(self, command: Message, error: Exception) -> Message:
+            logger.warning('Erro ao tratar %s key:%s: %s', command.type, command.key, error)
+            self.server.metrics.count('requests.failed')
+            return self.server.try_another_command_factory(command.key)
+
+        # encaminha uma escrita ao líder; a resposta é enviada ao cliente quando o líder responder
+        def forward_request(self, request_id: int, codec, command: Message) -> None:
+            started = time.perf_counter()
+            command.set_sender(ip=self.client_address[0], port=self.client_address[1])
+            if sampled():
+                logger.debug('Encaminhando %s do Cliente %s ao líder', command.type, command.sender_address)
+            future = self.server.forward_to_leader(command)
+            future.add_done_callback(
+                lambda f: self.complete_request(request_id, codec, command.type, started,
+                                                self.future_response(command, f)))
+
+        # encaminha uma requisição aos workers donos das suas chaves; a resposta é enviada quando todos responderem
+        def route_request(self, request_id: int, codec, command: Message) -> None:
+            started = time.perf_counter()
+            command.set_sender(ip=self.client_address[0], port=self.client_address[1])
+            self.server.metrics.count('requests.routed')
+            future = self.server.route(command)
+            future.add_done_callback(
+                lambda f: self.complete_request(request_id, codec, command.type, started,
+                                                self.future_response(command, f)))
+
+        # registra o tempo de tratamento de uma requisição e envia a resposta
+        def complete_request(self, request_id: int, codec, command_type: str, started: float,
+                             response_cmd: Message) -> None:
+            self.server.metrics.observe_command(command_type, time.perf_counter() - started)
+            self.send_response(request_id, codec, response_cmd)
+
+        # envia a resposta de uma requisição com o mesmo id recebido
+        def send_response(self, request_id: int, codec, response_cmd: Message) -> None:
+            if response_cmd is None:
+                return
+            started = time.perf_counter()
+            try:
+                encoded = self.prepare_response(response_cmd, codec)
+            except Exception as e:
+                logger.warning('Erro ao codificar a resposta %s key:%s: %s', response_cmd.type, response_cmd.key, e)
+                encoded = self.prepare_response(self.server.try_another_command_factory(response_cmd.key), codec)
+            payload, compression_flags = compress_payload(encoded, self._compressor, self.server.compression_threshold)
+            self.server.metrics.observe('serialize', time.perf_counter() - started)
+            # as respostas seguintes ao HELLO_OK usam a compressão combinada nele
+            if response_cmd.type == 'HELLO_OK':
+                self._compressor = get_compressor(response_cmd.key)
+            try:
+                with self._write_lock:
+                    helpers.send_frame(self.client_socket, request_id, payload, codec.id | compression_flags)
+            except OSError:
+                pass
 
         # aciona o command handler para dar o tratamento adequado de acordo com o comando recebido
-        def process_request(self, request: bytes) -> Message:
-            command = helpers.msg_deserialize(request.decode())
+        def process_request(self, command: Message) -> Message:
             # incluo os dados do remetente na mensagem
-            if command is not None:
-                command.set_sender(ip=self.client_address[0], port=self.client_address[1])
+            command.set_sender(ip=self.client_address[0], port=self.client_address[1])
             # chamo o service locator que encaminhará a mensagem para ser tratada pelo handler adequado
             return self.server.server_handle(command)
         
         # monta o fluxo de bytes que será encaminhado como response à request recebida
-        def prepare_response(self, response_cmd: Message) -> bytes:
+        def prepare_response(self, response_cmd: Message, codec) -> bytes:
             # incluo na resposta os dados do remetente
             response_cmd.set_sender(self.server.ip, self.server.port)
-            return helpers.msg_serialize(response_cmd).encode()     
+            return codec.encode(response_cmd)     
+
+# menor chave maior que todas as que começam com `prefix`, ou None se ela não existe
+def prefix_end(prefix: str) -> Optional[str]:
+    prefix = prefix.rstrip(chr(0x10FFFF))
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+# converte o valor de um contador (ou o incremento de um INCR) em inteiro
+def parse_integer(value: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        raise InvalidValueError(f'{value!r} não é um número inteiro')
+
+# recusa o TTL negativo de uma escrita (0 é sem expiração)
+def check_ttl(ttl_ms: int) -> None:
+    if ttl_ms < 0:
+        raise InvalidValueError(f'TTL negativo: {ttl_ms}')
+
+# converte um tamanho como 65536, 64kb, 512mb ou 2gb em bytes
+def parse_size(size: str) -> int:
+    size = size.strip().lower()
+    for suffix, multiplier in (('kb', 1 << 10), ('mb', 1 << 20), ('gb', 1 << 30), ('b', 1)):
+        if size.endswith(suffix):
+            return int(float(size[:-len(suffix)]) * multiplier)
+    return int(size)
+
+# lê os parâmetros da linha de comando; os endereços não informados são perguntados interativamente
+def parse_args():
+    parser = argparse.ArgumentParser(description='Servidor do KV Store')
+    parser.add_argument('--ip', help='IP do servidor')
+    parser.add_argument('--port', type=int, help='porta do servidor')
+    parser.add_argument('--leader-ip', help='IP do líder')
+    parser.add_argument('--leader-port', type=int, help='porta do líder')
+    parser.add_argument('--mode', choices=['thread', 'async'], default='thread',
+                        help='thread: uma thread por conexão; async: event loop asyncio')
+    parser.add_argument('--backlog', type=int, default=128, help='tamanho da fila de conexões pendentes')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processos do servidor neste nó, na mesma porta, cada um dono de uma partição das chaves')
+    parser.add_argument('--worker-base-port', type=int, default=0,
+                        help='porta interna do primeiro worker (as seguintes para os demais); 0 escolhe portas livres')
+    parser.add_argument('--ack-policy', choices=ACK_POLICIES, default='all',
+                        help='confirmações exigidas dos followers antes do PUT_OK: todos, maioria ou nenhuma')
+    parser.add_argument('--codec', choices=list(CODECS), default=DEFAULT_CODEC,
+                        help='codec preferido nas conexões com o líder e com os followers')
+    parser.add_argument('--data-dir', help='diretório do write-ahead log e dos snapshots; sem ele os dados ficam só em memória')
+    parser.add_argument('--fsync', choices=FSYNC_POLICIES, default='interval', help='política de fsync do write-ahead log')
+    parser.add_argument('--fsync-interval-ms', type=int, default=10, help='intervalo entre fsyncs na política interval')
+    parser.add_argument('--snapshot-interval', type=float, default=60, help='segundos entre snapshots do store')
+    parser.add_argument('--snapshot-load', choices=SNAPSHOT_LOADS, default='lazy',
+                        help='ao subir, mapeia o snapshot e lê as chaves sob demanda (lazy) ou carrega todas (eager)')
+    parser.add_argument('--snapshot-hot-reads', type=int, default=2,
+                        help='leituras de uma chave do snapshot mapeado até ela ser copiada para a memória; 0 nunca')
+    parser.add_argument('--replication-log-size', type=int, default=100000,
+                        help='escritas mantidas no log de replicação para followers que voltam à rede')
+    parser.add_argument('--max-forwards', type=int, default=1024,
+                        help='escritas que um follower mantém em voo no canal com o líder antes de parar de ler novas')
+    parser.add_argument('--read-wait-ms', type=int, default=0,
+                        help='tempo que um GET com timestamp à frente aguarda a replicação antes do TRY_OTHER_SERVER_OR_LATER')
+    parser.add_argument('--replication-timeout-ms', type=int, default=5000,
+                        help='tempo que uma escrita do líder aguarda as confirmações dos followers antes do TRY_OTHER_SERVER_OR_LATER')
+    parser.add_argument('--storage', choices=STORAGE_ENGINES, default='sharded',
+                        help='sharded: store particionado com um lock por partição; locked: um único lock')
+    parser.add_argument('--stripes', type=int, default=16, help='quantidade de partições do store sharded')
+    parser.add_argument('--max-memory', type=parse_size, default=0,
+                        help='memória estimada máxima do store, como 512mb ou 2gb; acima dela o líder descarta chaves')
+    parser.add_argument('--max-keys', type=int, default=0, help='quantidade máxima de chaves no store')
+    parser.add_argument('--eviction-policy', choices=EVICTION_POLICIES, default='lru',
+                        help='chave descartada ao atingir um limite: menos recente (lru), menos acessada (lfu) ou sorteada')
+    parser.add_argument('--compression', choices=COMPRESSIONS, default='none',
+                        help='compressão dos frames grandes, oferecida nas conexões com o líder e os followers e aceita nas recebidas')
+    parser.add_argument('--store-compression', choices=COMPRESSIONS, default='none',
+                        help='compressão dos valores grandes guardados no store')
+    parser.add_argument('--compression-threshold', type=parse_size, default=DEFAULT_COMPRESSION_THRESHOLD,
+                        help='tamanho mínimo, em bytes, de um frame ou valor para ser comprimido')
+    parser.add_argument('--log-level', choices=LOG_LEVELS, default='info',
+                        help='debug registra cada requisição; info só os eventos do cluster; warning só as falhas')
+    parser.add_argument('--log-sample', type=float, default=1.0,
+                        help='fração das requisições registradas no nível debug')
+    return parser.parse_args()
 
 def main():
     try:
-        ip = input('IP: ') or '127.0.0.1'
-        port = int(input('Port: '))
-        ip_leader = input('Leader IP: ') or '127.0.0.1'
-        port_leader = int(input('Leader Port: '))
-        server = Server(ip, port, ip_leader, port_leader)
+        args = parse_args()
+        log.configure(args.log_level, args.log_sample)
+        ip = args.ip or input('IP: ') or '127.0.0.1'
+        port = args.port or int(input('Port: '))
+        ip_leader = args.leader_ip or input('Leader IP: ') or '127.0.0.1'
+        port_leader = args.leader_port or int(input('Leader Port: '))
+        options = dict(backlog=args.backlog, ack_policy=args.ack_policy, codec=args.codec, data_dir=args.data_dir,
+                       fsync_policy=args.fsync, fsync_interval_ms=args.fsync_interval_ms,
+                       snapshot_interval_s=args.snapshot_interval, replication_log_size=args.replication_log_size,
+                       storage=args.storage, stripes=args.stripes, max_forwards=args.max_forwards,
+                       read_wait_ms=args.read_wait_ms, max_memory=args.max_memory, max_keys=args.max_keys,
+                       eviction_policy=args.eviction_policy, compression=args.compression,
+                       store_compression=args.store_compression, compression_threshold=args.compression_threshold,
+                       snapshot_load=args.snapshot_load, snapshot_hot_reads=args.snapshot_hot_reads,
+                       replication_timeout_ms=args.replication_timeout_ms)
+        server_class = Server
+        if args.mode == 'async':
+            from async_server import AsyncServer
+            server_class = AsyncServer
+        if args.workers > 1:
+            run_workers(server_class, ip, port, ip_leader, port_leader, args.workers, args.worker_base_port, **options)
+            return
+        server = server_class(ip, port, ip_leader, port_leader, **options)
         try:
             server.setup()
             server.listen()
         finally:
             server.close()
     except Exception as e:
-        print('Erro durante a execução: ', e)
+        logger.error('Erro durante a execução: %s', e)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,474 @@
+import sys
+from bisect import bisect_left, bisect_right
+from threading import Lock
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# engines de armazenamento disponíveis para o store do servidor
+STORAGE_ENGINES = ('sharded', 'locked')
+# quantidade de chaves a partir da qual um bloco do índice ordenado é dividido ao meio
+INDEX_BLOCK_SIZE = 1024
+# bytes estimados de cada chave além dos textos da chave e do valor: o Record, a entrada no dicionário do engine
+# e a referência no índice ordenado
+ENTRY_OVERHEAD = 112
+# chaves do snapshot mapeado cujas leituras são contadas para decidir a materialização; acima disso a contagem recomeça
+HOT_READS_TRACKED = 65536
+
+# Registro armazenado para cada chave: valor, timestamp da escrita e, para chaves com TTL, o instante em que
+# expira (milissegundos desde a época, no relógio do líder; 0 nunca expira).
+# Os campos ficam em __slots__, sem o dicionário por instância: 56 bytes por registro, contra 184 do
+# dict {'value', 'timestamp'}. Os registros nunca são alterados depois de armazenados; uma escrita
+# substitui o registro inteiro.
+class Record:
+    __slots__ = ('value', 'timestamp', 'expires_at')
+
+    def __init__(self, value: str, timestamp: int, expires_at: int = 0) -> None:
+        self.value = value
+        self.timestamp = timestamp
+        self.expires_at = expires_at
+
+    def __eq__(self, other) -> bool:
+        return (isinstance(other, Record) and self.value == other.value and self.timestamp == other.timestamp
+                and self.expires_at == other.expires_at)
+
+    def __repr__(self) -> str:
+        expires = f', expires_at={self.expires_at}' if self.expires_at else ''
+        return f'Record(value={self.value!r}, timestamp={self.timestamp}{expires})'
+
+
+# registro compartilhado devolvido nas leituras de chaves inexistentes
+MISSING = Record('NULL', 0)
+
+
+# tamanho aproximado em bytes de uma chave armazenada, usado na contabilidade de memória do store
+def entry_size(key: str, record: Record) -> int:
+    return sys.getsizeof(key) + sys.getsizeof(record.value) + ENTRY_OVERHEAD
+
+
+# Índice ordenado das chaves, mantido ao lado do dicionário do engine para as consultas por intervalo.
+# As chaves ficam em blocos ordenados de até INDEX_BLOCK_SIZE chaves, com a maior chave de cada bloco em
+# `_maxes`: inserir custa duas buscas binárias e o deslocamento de um único bloco, não da lista inteira.
+class KeyIndex:
+    def __init__(self) -> None:
+        self._blocks: List[List[str]] = []
+        self._maxes: List[str] = []
+        self._len = 0
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return self._len
+
+    # inclui uma chave, se ela ainda não está no índice
+    def add(self, key: str) -> None:
+        with self._lock:
+            if not self._blocks:
+                self._blocks.append([key])
+                self._maxes.append(key)
+                self._len = 1
+                return
+            # chaves maiores que todas entram no último bloco
+            idx = min(bisect_left(self._maxes, key), len(self._blocks) - 1)
+            block = self._blocks[idx]
+            pos = bisect_left(block, key)
+            if pos < len(block) and block[pos] == key:
+                return
+            block.insert(pos, key)
+            self._maxes[idx] = block[-1]
+            self._len += 1
+            if len(block) > INDEX_BLOCK_SIZE:
+                half = len(block) // 2
+                self._blocks[idx:idx + 1] = [block[:half], block[half:]]
+                self._maxes[idx:idx + 1] = [block[half - 1], block[-1]]
+
+    # retira uma chave do índice, se ela está nele
+    def remove(self, key: str) -> None:
+        with self._lock:
+            idx = bisect_left(self._maxes, key)
+            if idx == len(self._blocks):
+                return
+            block = self._blocks[idx]
+            pos = bisect_left(block, key)
+            if pos == len(block) or block[pos] != key:
+                return
+            del block[pos]
+            self._len -= 1
+            if block:
+                self._maxes[idx] = block[-1]
+            else:
+                del self._blocks[idx]
+                del self._maxes[idx]
+
+    # até `limit` chaves em ordem a partir de `start` (ou depois dela, com `after`) e antes de `stop`, se informado
+    def range(self, start: str, stop: Optional[str], limit: int, after: bool = False) -> List[str]:
+        keys: List[str] = []
+        with self._lock:
+            idx = (bisect_right if after else bisect_left)(self._maxes, start)
+            for block in self._blocks[idx:]:
+                pos = (bisect_right if after else bisect_left)(block, start) if not keys else 0
+                for key in block[pos:pos + limit - len(keys)]:
+                    if stop is not None and key >= stop:
+                        return keys
+                    keys.append(key)
+                if len(keys) >= limit:
+                    break
+        return keys
+
+    def clear(self) -> None:
+        with self._lock:
+            self._blocks, self._maxes, self._len = [], [], 0
+
+
+# Interface dos engines de armazenamento em memória usados pelo servidor.
+# As chaves chegam já normalizadas (em maiúsculas) pelo servidor.
+class StorageEngine:
+    # obtém o registro de uma chave, ou None se ela não existe
+    def get(self, key: str) -> Optional[Record]:
+        raise NotImplementedError
+
+    # armazena o registro de uma chave, substituindo o anterior
+    def put(self, key: str, record: Record) -> None:
+        raise NotImplementedError
+
+    # armazena o registro apenas se ele for mais novo que o atual, devolvendo se foi armazenado
+    def put_if_newer(self, key: str, record: Record) -> bool:
+        raise NotImplementedError
+
+    # remove a chave se o registro atual não é mais novo que `timestamp`, devolvendo se ela foi removida
+    def remove(self, key: str, timestamp: int) -> bool:
+        raise NotImplementedError
+
+    # cópia das chaves armazenadas
+    def keys(self) -> List[str]:
+        return [key for key, _ in self.items()]
+
+    # cópia dos pares <chave, registro> armazenados
+    def items(self) -> List[Tuple[str, Record]]:
+        raise NotImplementedError
+
+    # até `limit` pares <chave, registro> em ordem de chave, a partir de `start` (ou depois dela, com `after`)
+    # e antes de `stop`, se informado. As chaves vêm do índice ordenado e os registros de leituras comuns
+    def scan(self, start: str, stop: Optional[str], limit: int, after: bool = False) -> List[Tuple[str, Record]]:
+        items = []
+        for key in self._index.range(start, stop, limit, after):
+            record = self.get(key)
+            if record is not None:
+                items.append((key, record))
+        return items
+
+    # remove todas as chaves
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    # memória aproximada ocupada pelas chaves armazenadas, em bytes (ver entry_size)
+    @property
+    def size_bytes(self) -> int:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+
+# Engine com um único dicionário protegido por um único lock, inclusive nas leituras
+class LockedStorage(StorageEngine):
+    def __init__(self) -> None:
+        self._data: Dict[str, Record] = dict()
+        self._lock = Lock()
+        self._index = KeyIndex()
+        self._bytes = 0
+
+    def get(self, key: str) -> Optional[Record]:
+        with self._lock:
+            return self._data.get(key)
+
+    def put(self, key: str, record: Record) -> None:
+        with self._lock:
+            current = self._data.get(key)
+            if current is None:
+                self._index.add(key)
+            else:
+                self._bytes -= entry_size(key, current)
+            self._data[key] = record
+            self._bytes += entry_size(key, record)
+
+    def put_if_newer(self, key: str, record: Record) -> bool:
+        with self._lock:
+            current = self._data.get(key)
+            if current is not None and record.timestamp <= current.timestamp:
+                return False
+            if current is None:
+                self._index.add(key)
+            else:
+                self._bytes -= entry_size(key, current)
+            self._data[key] = record
+            self._bytes += entry_size(key, record)
+            return True
+
+    def remove(self, key: str, timestamp: int) -> bool:
+        with self._lock:
+            current = self._data.get(key)
+            if current is None or current.timestamp > timestamp:
+                return False
+            del self._data[key]
+            self._index.remove(key)
+            self._bytes -= entry_size(key, current)
+            return True
+
+    def items(self) -> List[Tuple[str, Record]]:
+        with self._lock:
+            return list(self._data.items())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._index.clear()
+            self._bytes = 0
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# Engine particionado em `stripes` dicionários, escolhidos pelo hash da chave, cada um com seu próprio lock.
+# Escritas em chaves de partições diferentes não disputam o mesmo lock. As leituras não usam lock: a busca
+# em um dicionário é atômica no CPython e os registros são substituídos inteiros, nunca alterados no lugar,
+# então uma leitura sempre vê o registro anterior ou o novo por completo.
+class ShardedStorage(StorageEngine):
+    def __init__(self, stripes: int = 16) -> None:
+        if stripes < 1:
+            raise ValueError(f'Quantidade de partições inválida: {stripes}')
+        self._stripes = stripes
+        self._shards: List[Dict[str, Record]] = [dict() for _ in range(stripes)]
+        self._locks = [Lock() for _ in range(stripes)]
+        # índice ordenado de todas as partições; recebe só as chaves novas, não cada escrita
+        self._index = KeyIndex()
+        # memória aproximada de cada partição, atualizada com o lock dela
+        self._bytes = [0] * stripes
+
+    # region getters
+    @property
+    def stripes(self) -> int:
+        return self._stripes
+    # endregion
+
+    # partição responsável por uma chave
+    def stripe(self, key: str) -> int:
+        return hash(key) % self._stripes
+
+    def get(self, key: str) -> Optional[Record]:
+        return self._shards[hash(key) % self._stripes].get(key)
+
+    def put(self, key: str, record: Record) -> None:
+        index = hash(key) % self._stripes
+        shard = self._shards[index]
+        with self._locks[index]:
+            current = shard.get(key)
+            if current is None:
+                self._index.add(key)
+            else:
+                self._bytes[index] -= entry_size(key, current)
+            shard[key] = record
+            self._bytes[index] += entry_size(key, record)
+
+    def put_if_newer(self, key: str, record: Record) -> bool:
+        index = hash(key) % self._stripes
+        shard = self._shards[index]
+        with self._locks[index]:
+            current = shard.get(key)
+            if current is not None and record.timestamp <= current.timestamp:
+                return False
+            if current is None:
+                self._index.add(key)
+            else:
+                self._bytes[index] -= entry_size(key, current)
+            shard[key] = record
+            self._bytes[index] += entry_size(key, record)
+            return True
+
+    def remove(self, key: str, timestamp: int) -> bool:
+        index = hash(key) % self._stripes
+        shard = self._shards[index]
+        with self._locks[index]:
+            current = shard.get(key)
+            if current is None or current.timestamp > timestamp:
+                return False
+            del shard[key]
+            self._index.remove(key)
+            self._bytes[index] -= entry_size(key, current)
+            return True
+
+    # cada partição é copiada com o seu lock; o resultado é consistente por partição
+    def items(self) -> List[Tuple[str, Record]]:
+        items = []
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                items.extend(shard.items())
+        return items
+
+    def clear(self) -> None:
+        for index, (shard, lock) in enumerate(zip(self._shards, self._locks)):
+            with lock:
+                shard.clear()
+                self._bytes[index] = 0
+        self._index.clear()
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(self._bytes)
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+
+# Engine em camadas sobre um snapshot mapeado em memória (ver mapped_snapshot.py): as chaves do snapshot são lidas
+# dele sob demanda, e só as escritas e as chaves quentes (lidas `hot_reads` vezes) são materializadas no engine em
+# memória, que tem precedência. As chaves do snapshot escritas, materializadas ou removidas ficam em `_taken`, e a
+# leitura delas deixa de consultar o snapshot. A memória contabilizada é só a do engine em memória.
+class OverlayStorage(StorageEngine):
+    def __init__(self, memory: StorageEngine, hot_reads: int = 2) -> None:
+        self._memory = memory
+        self._base = None
+        self._taken = set()
+        self._hot_reads = hot_reads
+        # leituras de cada chave do snapshot ainda não materializada
+        self._reads: Dict[str, int] = dict()
+        # ordena a materialização e a remoção de uma chave do snapshot
+        self._lock = Lock()
+
+    # region getters
+    @property
+    def memory(self) -> StorageEngine:
+        return self._memory
+
+    # chaves do snapshot ainda servidas por ele, sem cópia em memória
+    @property
+    def mapped_keys(self) -> int:
+        return len(self._base) - len(self._taken) if self._base is not None else 0
+    # endregion
+
+    # passa a ler as chaves ausentes da memória do snapshot mapeado `base`
+    def set_base(self, base) -> None:
+        self._base = base
+        self._taken = set()
+        self._reads = dict()
+
+    def get(self, key: str) -> Optional[Record]:
+        record = self._memory.get(key)
+        base = self._base
+        if record is not None or base is None:
+            return record
+        # uma escrita ou materialização entre as duas consultas grava a memória antes de marcar a chave, então uma
+        # chave já marcada é relida da memória
+        if key in self._taken:
+            return self._memory.get(key)
+        record = base.get(key)
+        if record is not None and self._hot_reads:
+            reads = self._reads.get(key, 0) + 1
+            if reads >= self._hot_reads:
+                self.promote(key, record)
+            else:
+                if len(self._reads) >= HOT_READS_TRACKED:
+                    self._reads.clear()
+                self._reads[key] = reads
+        return record
+
+    # materializa em memória uma chave quente do snapshot, a menos que ela tenha sido escrita ou removida antes
+    def promote(self, key: str, record: Record) -> None:
+        self._reads.pop(key, None)
+        with self._lock:
+            if key not in self._taken and self._memory.put_if_newer(key, record):
+                self._taken.add(key)
+
+    # marca uma chave do snapshot como substituída pela versão em memória
+    def take(self, key: str) -> None:
+        base = self._base
+        if base is not None and key not in self._taken and key in base:
+            self._taken.add(key)
+
+    def put(self, key: str, record: Record) -> None:
+        self._memory.put(key, record)
+        self.take(key)
+
+    def put_if_newer(self, key: str, record: Record) -> bool:
+        base = self._base
+        if base is not None and key not in self._taken and self._memory.get(key) is None:
+            current = base.get(key)
+            if current is not None and record.timestamp <= current.timestamp:
+                return False
+        applied = self._memory.put_if_newer(key, record)
+        if applied:
+            self.take(key)
+        return applied
+
+    def remove(self, key: str, timestamp: int) -> bool:
+        removed = self._memory.remove(key, timestamp)
+        base = self._base
+        if base is None or key in self._taken:
+            return removed
+        with self._lock:
+            current = base.get(key) if key not in self._taken else None
+            if current is not None and current.timestamp <= timestamp:
+                self._taken.add(key)
+                removed = True
+        return removed
+
+    def keys(self) -> List[str]:
+        keys = self._memory.keys()
+        base, taken = self._base, self._taken
+        if base is not None:
+            keys.extend(key for key in base.keys() if key not in taken)
+        return keys
+
+    def items(self) -> List[Tuple[str, Record]]:
+        items = self._memory.items()
+        base, taken = self._base, self._taken
+        if base is not None:
+            items.extend((key, record) for key, record in base.items() if key not in taken)
+        return items
+
+    # intercala as páginas do engine em memória e do snapshot: as primeiras chaves de cada um cobrem as primeiras
+    # da união, e as chaves do snapshot removidas fazem a busca continuar depois da última examinada
+    def scan(self, start: str, stop: Optional[str], limit: int, after: bool = False) -> List[Tuple[str, Record]]:
+        base = self._base
+        if base is None:
+            return self._memory.scan(start, stop, limit, after)
+        items = []
+        while len(items) < limit:
+            wanted = limit - len(items)
+            memory_items = dict(self._memory.scan(start, stop, wanted, after))
+            base_keys = base.range(start, stop, wanted, after)
+            keys = sorted(set(memory_items) | set(base_keys))[:wanted]
+            for key in keys:
+                record = memory_items.get(key)
+                if record is None:
+                    record = self._memory.get(key) if key in self._taken else base.get(key)
+                if record is not None:
+                    items.append((key, record))
+            if len(memory_items) < wanted and len(base_keys) < wanted:
+                break
+            start, after = keys[-1], True
+        return items
+
+    def clear(self) -> None:
+        self._memory.clear()
+        self.set_base(None)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._memory.size_bytes
+
+    def __len__(self) -> int:
+        return len(self._memory) + self.mapped_keys
+
+
+# cria o engine de armazenamento pelo nome
+def create_storage(engine: str = 'sharded', stripes: int = 16) -> StorageEngine:
+    if engine == 'sharded':
+        return ShardedStorage(stripes)
+    if engine == 'locked':
+        return LockedStorage()
+    raise ValueError(f'Engine de armazenamento desconhecido: {engine}')
@@ -0,0 +1,18 @@
+import socket
+from threading import Thread
+from server import Server
+
+
+# porta livre na interface local
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# sobe um servidor escutando em uma thread; sem `leader_port`, ele é o líder
+def start_server(port: int, leader_port: int = 0, **server_kwargs) -> Server:
+    server = Server('127.0.0.1', port, '127.0.0.1', leader_port or port, **server_kwargs)
+    server.setup()
+    Thread(target=server.listen, daemon=True).start()
+    return server
@@ -0,0 +1,36 @@
+import time
+from threading import Thread
+from async_server import AsyncServer
+from connection import Connection
+from message import Message
+from tests.helpers import free_port
+from benchmarks.loadgen import wait_for_port
+
+
+def test_slow_fsync_does_not_stop_the_event_loop(tmp_path):
+    port = free_port()
+    server = AsyncServer('127.0.0.1', port, '127.0.0.1', port, data_dir=str(tmp_path), fsync_policy='always')
+    server.setup()
+    wait_durable = server._persistence.wait_durable
+
+    # o fsync de cada escrita leva meio segundo
+    def slow_wait_durable(lsn: int) -> None:
+        time.sleep(0.5)
+        wait_durable(lsn)
+
+    server._persistence.wait_durable = slow_wait_durable
+    Thread(target=server.listen, daemon=True).start()
+    wait_for_port(port)
+    writer, reader = Connection('127.0.0.1', port), Connection('127.0.0.1', port)
+    try:
+        put = writer.request_async(Message.put('slow', 'v'))
+        time.sleep(0.1)
+        started = time.monotonic()
+        response = reader.request(Message.get('other', 0), timeout=5)
+        assert response.type == 'GET_OK'
+        assert time.monotonic() - started < 0.3
+        assert put.result(5).type == 'PUT_OK'
+    finally:
+        writer.close()
+        reader.close()
+        server.close()
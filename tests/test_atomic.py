@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+from client import Client
+from async_client import AsyncClient, InvalidValueError
+from codec import get_codec
+from message import Message
+from tests.helpers import free_port, start_server
+
+
+@pytest.fixture
+def leader():
+    server = start_server(free_port())
+    yield server
+    server.close()
+
+
+def client_for(server) -> Client:
+    client = Client()
+    client.init([f'127.0.0.1:{server.port}'])
+    return client
+
+
+@pytest.mark.parametrize('codec', ['binary', 'json'])
+def test_cas_fields_survive_the_codec(codec):
+    encoder = get_codec(codec)
+    for message in (Message.cas('k', 'v', 'VALUE', expected=''), Message.cas('k', 'v', absent=True),
+                    Message.cas('k', 'v', 'TIMESTAMP', expected_timestamp=7), Message.cas_failed('k', '', 0, absent=True)):
+        decoded = encoder.decode(encoder.encode(message))
+        assert (decoded.type, decoded.compare, decoded.expected, decoded.client_timestamp, decoded.absent) == \
+               (message.type, message.compare, message.expected, message.client_timestamp, message.absent)
+
+
+def test_incr_on_non_integer_is_invalid_value(leader):
+    leader.store_key_value_pair('word', 'abc')
+    response = leader.atomic_command_handler(Message.incr('word', 1))
+    assert response.type == 'INVALID_VALUE'
+    assert leader.get_key_value_pair('word').value == 'abc'
+    assert client_for(leader).incr('word') is None
+
+    async def incr_async():
+        async with AsyncClient() as client:
+            client.init([f'127.0.0.1:{leader.port}'])
+            await client.incr('word')
+
+    with pytest.raises(InvalidValueError):
+        asyncio.run(incr_async())
+
+
+def test_cas_against_empty_value(leader):
+    leader.store_key_value_pair('k', '')
+    assert client_for(leader).cas('k', 'filled', expected='')[:2] == (True, 'filled')
+
+
+def test_cas_value_null_is_a_literal(leader):
+    client = client_for(leader)
+    # a chave inexistente não tem o valor "NULL"
+    assert client.cas('k', 'v', expected='NULL') == (False, None, 0)
+    leader.store_key_value_pair('k', 'NULL')
+    assert client.cas('k', 'v', expected='NULL')[:2] == (True, 'v')
+
+
+def test_cas_must_not_exist(leader):
+    client = client_for(leader)
+    applied, current, timestamp = client.cas('k', 'first')
+    assert (applied, current) == (True, 'first')
+    assert client.cas('k', 'second') == (False, 'first', timestamp)
+    # o timestamp 0 não significa mais "a chave não existe"
+    assert client.cas('other', 'v', expected_timestamp=0) == (False, None, 0)
+    assert client.cas('k', 'second', expected_timestamp=timestamp)[:2] == (True, 'second')
+
+
+def test_cas_without_compare_mode_is_invalid(leader):
+    assert leader.atomic_command_handler(Message.cas('k', 'v')).type == 'INVALID_VALUE'
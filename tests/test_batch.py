@@ -0,0 +1,46 @@
+import asyncio
+from async_client import AsyncClient
+from connection import Connection
+from message import Message
+from tests.helpers import free_port, start_server
+from benchmarks.loadgen import wait_for_port
+
+
+def test_mput_is_replicated_and_mget_answers_key_by_key():
+    leader_port, follower_port = free_port(), free_port()
+    leader = start_server(leader_port)
+    wait_for_port(leader_port)
+    follower = start_server(follower_port, leader_port)
+    wait_for_port(follower_port)
+    conn = Connection('127.0.0.1', follower_port)
+    try:
+        # o follower encaminha o MPUT ao líder, que confirma cada chave com o seu timestamp
+        mput = conn.request(Message.mput([Message.put(f'K{i}', str(i)) for i in range(5)]))
+        assert mput.type == 'MPUT_OK'
+        assert [(item.type, item.key) for item in mput.items] == [('PUT_OK', f'K{i}') for i in range(5)]
+        timestamps = [item.server_timestamp for item in mput.items]
+        assert timestamps == sorted(set(timestamps))
+        # cada GET do MGET compara o seu timestamp: a chave à frente do follower é recusada, as demais respondidas
+        mget = conn.request(Message.mget([Message.get('K3', timestamps[3]), Message.get('K4', timestamps[4] + 1),
+                                          Message.get('MISSING', 0)]))
+        assert [(item.type, item.value) for item in mget.items] == \
+               [('GET_OK', '3'), ('TRY_OTHER_SERVER_OR_LATER', ''), ('GET_OK', 'NULL')]
+    finally:
+        conn.close()
+        follower.close()
+        leader.close()
+
+
+def test_async_client_mput_then_mget():
+    leader = start_server(free_port())
+    wait_for_port(leader.port)
+    client = AsyncClient()
+    client.init([f'127.0.0.1:{leader.port}'])
+    pairs = [(f'key{i}', f'v{i}') for i in range(20)]
+    try:
+        timestamps = asyncio.run(client.mput(pairs))
+        assert set(timestamps) == {key for key, _ in pairs}
+        assert asyncio.run(client.mget([key for key, _ in pairs] + ['missing'])) == dict(pairs, missing=None)
+    finally:
+        client.close()
+        leader.close()
@@ -0,0 +1,36 @@
+import socket
+import pytest
+from threading import Thread
+from connection import ConnectionCache, ConnectionPool
+from message import Message
+from tests.helpers import free_port, start_server
+from benchmarks.loadgen import wait_for_port
+
+
+@pytest.mark.parametrize('connections', [ConnectionPool, ConnectionCache])
+def test_slow_server_does_not_stall_other_addresses(connections):
+    server = start_server(free_port())
+    wait_for_port(server.port)
+    # servidor que aceita a conexão no backlog e nunca responde ao HELLO
+    silent = socket.socket()
+    silent.bind(('127.0.0.1', 0))
+    silent.listen()
+    pool = connections()
+
+    # a conexão com o servidor mudo falha quando ele fecha o socket, no fim do teste
+    def open_silent():
+        with pytest.raises(OSError):
+            pool.get(*silent.getsockname())
+
+    opening = Thread(target=open_silent, daemon=True)
+    try:
+        opening.start()
+        opening.join(0.2)
+        assert opening.is_alive()
+        conn = pool.get('127.0.0.1', server.port)
+        assert conn.request(Message.put('K', 'v'), timeout=1).type == 'PUT_OK'
+    finally:
+        silent.close()
+        opening.join(5)
+        pool.close_all()
+        server.close()
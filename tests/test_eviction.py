@@ -0,0 +1,52 @@
+from connection import Connection
+from eviction import LFUPolicy, LRUPolicy
+from message import Message
+from tests.helpers import free_port, start_server
+from benchmarks.loadgen import wait_for_port
+
+
+def test_lru_evicts_the_least_recently_used_key():
+    policy = LRUPolicy()
+    for key in ('A', 'B', 'C'):
+        policy.add(key)
+    policy.touch('A')
+    policy.add('B')
+    assert policy.victim() == 'C'
+    policy.remove('C')
+    assert policy.victim() == 'A'
+
+
+def test_lfu_evicts_the_least_frequently_used_key():
+    # com mais sorteios que chaves, todas entram entre os candidatos
+    policy = LFUPolicy(samples=50, seed=1)
+    for key in ('A', 'B', 'C'):
+        policy.add(key)
+    for _ in range(3):
+        policy.touch('A')
+        policy.touch('C')
+    policy.touch('B')
+    assert policy.victim() == 'B'
+
+
+def test_leader_evicts_in_lru_order_and_replicates_it():
+    leader_port, follower_port = free_port(), free_port()
+    leader = start_server(leader_port, max_keys=3, eviction_policy='lru')
+    wait_for_port(leader_port)
+    follower = start_server(follower_port, leader_port)
+    wait_for_port(follower_port)
+    conn = Connection('127.0.0.1', leader_port)
+    try:
+        for key in ('A', 'B', 'C'):
+            assert conn.request(Message.put(key, 'v')).type == 'PUT_OK'
+        # a leitura no líder renova A, então B é a chave descartada ao passar do limite
+        assert conn.request(Message.get('A', 0)).value == 'v'
+        assert conn.request(Message.put('D', 'v')).type == 'PUT_OK'
+        assert [leader.get_key_value_pair(key).value for key in 'ABCD'] == ['v', 'NULL', 'v', 'v']
+        assert conn.request(Message.put('E', 'v')).type == 'PUT_OK'
+        assert leader.get_key_value_pair('C').value == 'NULL'
+        # o descarte segue para o follower como uma remoção
+        assert [follower.get_key_value_pair(key).value for key in 'ABCDE'] == ['v', 'NULL', 'NULL', 'v', 'v']
+    finally:
+        conn.close()
+        follower.close()
+        leader.close()
@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+from async_client import AsyncClient
+from client import Client
+from connection import Connection
+from message import Message
+from rebalance import Rebalancer
+from ring import HashRing
+from tests.helpers import free_port, start_server
+from benchmarks.loadgen import wait_for_port
+
+KEYS = [f'key{i}' for i in range(40)]
+
+
+# g1 (líder e follower) com as chaves, e g2 vazio: o rebalanceamento para o anel com g2 move parte delas
+@pytest.fixture
+def cluster(tmp_path):
+    g1, follower_port, g2 = free_port(), free_port(), free_port()
+    servers = [start_server(g1), start_server(follower_port, g1), start_server(g2)]
+    for port in (g1, follower_port, g2):
+        wait_for_port(port)
+    path = str(tmp_path / 'cluster.json')
+    ring = HashRing({'g1': [f'127.0.0.1:{g1}', f'127.0.0.1:{follower_port}']})
+    ring.save(path)
+    for i, key in enumerate(KEYS):
+        servers[0].write_key_value_pair(key, f'v{i}', 0)[1].result(5)
+    new_ring = ring.with_group('g2', [f'127.0.0.1:{g2}'])
+    moved = [key for key in KEYS if new_ring.group_of(key) == 'g2']
+    assert moved
+    # os clientes leem o anel antigo antes do rebalanceamento
+    client, async_client = Client(cache_entries=100), AsyncClient()
+    for stale in (client, async_client):
+        stale.init_cluster(path)
+    rebalancer = Rebalancer(path)
+    rebalancer.rebalance(new_ring)
+    rebalancer.close()
+    yield client, servers, moved, new_ring, async_client
+    client._connections.close_all()
+    async_client.close()
+    for server in servers:
+        server.close()
+
+
+def test_fenced_servers_refuse_reads_of_moved_keys(cluster):
+    _, servers, moved, new_ring, _ = cluster
+    for server in servers[:2]:
+        conn = Connection('127.0.0.1', server.port)
+        try:
+            assert conn.request(Message.get(moved[0], 0)).type == 'TRY_OTHER_SERVER_OR_LATER'
+            assert conn.request(Message.scan('', '', '', 100, 0)).type == 'TRY_OTHER_SERVER_OR_LATER'
+            scan = Message.scan('', '', '', 100, 0).set_ring_version(new_ring.version)
+            assert conn.request(scan).type == 'SCAN_OK'
+        finally:
+            conn.close()
+
+
+def test_stale_client_get_reloads_the_ring(cluster):
+    client, _, moved, new_ring, _ = cluster
+    client.get(moved[0])
+    assert client.ring.version == new_ring.version
+    assert client.get_cached([moved[0]]) == {moved[0]: f'v{KEYS.index(moved[0])}'}
+
+
+def test_stale_client_mget_reloads_the_ring(cluster):
+    client, _, moved, _, _ = cluster
+    client.mget(KEYS)
+    assert client.get_cached(KEYS) == {key: f'v{i}' for i, key in enumerate(KEYS)}
+
+
+def test_stale_client_scan_reloads_the_ring(cluster):
+    client, _, _, _, _ = cluster
+    assert client.prefix('key') == sorted((key.upper(), f'v{i}') for i, key in enumerate(KEYS))
+
+
+def test_stale_async_client_get_reloads_the_ring(cluster):
+    _, _, moved, new_ring, client = cluster
+    assert asyncio.run(client.get(moved[0])) == f'v{KEYS.index(moved[0])}'
+    assert client.ring.version == new_ring.version
+
+
+def test_stale_async_client_mget_reloads_the_ring(cluster):
+    _, _, _, _, client = cluster
+    assert asyncio.run(client.mget(KEYS)) == {key: f'v{i}' for i, key in enumerate(KEYS)}
+
+
+def test_stale_async_client_scan_reloads_the_ring(cluster):
+    _, _, _, _, client = cluster
+    assert asyncio.run(client.prefix('key')) == sorted((key.upper(), f'v{i}') for i, key in enumerate(KEYS))
@@ -0,0 +1,36 @@
+import time
+from connection import Connection
+from message import Message
+from tests.helpers import free_port, start_server
+
+
+def test_pipelined_requests_are_matched_by_id():
+    leader = start_server(free_port())
+    conn = Connection('127.0.0.1', leader.port)
+    try:
+        futures = [conn.request_async(Message.put(f'KEY{i}', str(i))) for i in range(50)]
+        responses = [future.result(5) for future in futures]
+        assert [(response.type, response.key, response.value) for response in responses] == \
+               [('PUT_OK', f'KEY{i}', str(i)) for i in range(50)]
+    finally:
+        conn.close()
+        leader.close()
+
+
+def test_responses_arrive_out_of_order():
+    leader = start_server(free_port(), read_wait_ms=5000)
+    conn = Connection('127.0.0.1', leader.port)
+    try:
+        # o GET à frente do servidor fica estacionado; o PUT enviado depois na mesma conexão responde antes dele
+        get = conn.request_async(Message.get('K', 1))
+        deadline = time.monotonic() + 5
+        while not leader.metrics.snapshot()['counters'].get('reads.parked') and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert not get.done()
+        put = conn.request(Message.put('K', 'v'), timeout=5)
+        assert put.type == 'PUT_OK'
+        response = get.result(5)
+        assert (response.type, response.value, response.server_timestamp) == ('GET_OK', 'v', put.server_timestamp)
+    finally:
+        conn.close()
+        leader.close()
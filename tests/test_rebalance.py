@@ -0,0 +1,80 @@
+from threading import Event, Thread
+from rebalance import Rebalancer
+from ring import HashRing
+from tests.helpers import free_port, start_server
+from benchmarks.loadgen import wait_for_port
+
+
+def test_keys_removed_during_the_copy_do_not_reach_the_target(tmp_path):
+    source, target = start_server(free_port()), start_server(free_port())
+    for server in (source, target):
+        wait_for_port(server.port)
+    try:
+        path = str(tmp_path / 'cluster.json')
+        ring = HashRing({'g1': [f'127.0.0.1:{source.port}']})
+        ring.save(path)
+        keys = [f'KEY{i}' for i in range(40)]
+        for key in keys:
+            source.write_key_value_pair(key, 'v', 0)[1].result(5)
+        new_ring = ring.with_group('g2', [f'127.0.0.1:{target.port}'])
+        moved = [key for key in keys if new_ring.group_of(key) == 'g2']
+        rebalancer = Rebalancer(path)
+        fence_group = rebalancer.fence_group
+
+        # uma das chaves é descartada na origem depois da primeira cópia, pouco antes do cerco
+        def remove_then_fence(ring, group, ranges, version=0):
+            if ranges:
+                source.remove_keys([(moved[0], source.get_key_value_pair(moved[0]).timestamp)])
+            fence_group(ring, group, ranges, version)
+
+        rebalancer.fence_group = remove_then_fence
+        rebalancer.rebalance(new_ring)
+        rebalancer.close()
+        assert target.get_key_value_pair(moved[0]).value == 'NULL'
+        assert all(target.get_key_value_pair(key).value != 'NULL' for key in moved[1:])
+    finally:
+        source.close()
+        target.close()
+
+
+def test_write_in_flight_during_the_copy_is_not_lost(tmp_path):
+    source, target = start_server(free_port()), start_server(free_port())
+    for server in (source, target):
+        wait_for_port(server.port)
+    path = str(tmp_path / 'cluster.json')
+    ring = HashRing({'g1': [f'127.0.0.1:{source.port}']})
+    ring.save(path)
+    new_ring = ring.with_group('g2', [f'127.0.0.1:{target.port}'])
+    for i in range(20):
+        source.write_key_value_pair(f'KEY{i}', 'v', 0)[1].result(5)
+    key = next(f'NEW{i}' for i in range(100) if new_ring.group_of(f'NEW{i}') == 'g2')
+    # a escrita da chave nova para entre o avanço da sequência e a gravação no store até a primeira página da
+    # cópia ser lida (ou, se a página espera pela escrita, por meio segundo)
+    in_put, scanned = Event(), Event()
+    put, range_scan = source._storage.put, source.range_scan_command_handler
+
+    def paused_put(formatted_key, record):
+        if formatted_key == key:
+            in_put.set()
+            scanned.wait(0.5)
+        put(formatted_key, record)
+
+    def range_scan_then_resume(cmd):
+        response = range_scan(cmd)
+        scanned.set()
+        return response
+
+    source._storage.put = paused_put
+    source.range_scan_command_handler = range_scan_then_resume
+    writer = Thread(target=lambda: source.write_key_value_pair(key, 'v', 0)[1].result(5), daemon=True)
+    try:
+        writer.start()
+        assert in_put.wait(5)
+        rebalancer = Rebalancer(path)
+        rebalancer.rebalance(new_ring)
+        rebalancer.close()
+        writer.join(5)
+        assert target.get_key_value_pair(key).value == 'v'
+    finally:
+        source.close()
+        target.close()
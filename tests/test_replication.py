@@ -0,0 +1,86 @@
+import socket
+import time
+from concurrent.futures import Future
+from message import Message
+from replication import FollowerReplicator, Replicator
+from tests.helpers import free_port, start_server
+
+
+# follower registrado sem a thread de envio, para entregar as respostas dos lotes à mão
+def idle_follower(replicator: Replicator, port: int) -> FollowerReplicator:
+    follower = FollowerReplicator(replicator, '127.0.0.1', port, 1, False)
+    replicator._followers[follower.address] = follower
+    return follower
+
+
+def answered() -> Future:
+    future = Future()
+    future.set_result(Message('REPLICATION_OK'))
+    return future
+
+
+def test_late_and_resent_batch_count_as_one_ack():
+    replicator = Replicator('all', retry_interval=60)
+    first, second = idle_follower(replicator, 1), idle_follower(replicator, 2)
+    replicated = replicator.replicate_many(1, [('K', 'v', 0)])
+    # o lote chega atrasado depois do reenvio: duas respostas do mesmo follower para a mesma escrita
+    first._in_flight = 2
+    first.on_response(1, 1, answered())
+    first.on_response(1, 1, answered())
+    assert not replicated.done()
+    second._in_flight = 1
+    second.on_response(1, 1, answered())
+    assert replicated.result(0) is True
+
+
+def test_failure_does_not_block_the_calling_thread():
+    replicator = Replicator('all', retry_interval=60)
+    follower = idle_follower(replicator, 1)
+    replicated = replicator.replicate_many(1, [('K', 'v', 0)])
+    follower._in_flight = 1
+    started = time.monotonic()
+    follower.on_failure(1, 1)
+    assert time.monotonic() - started < 1
+    assert replicated.exception(0) is not None
+    # o reenvio espera a pausa na thread do follower
+    assert not follower.can_send()
+    assert 0 < follower.retry_wait() <= 60
+
+
+def test_unhealthy_follower_does_not_fail_writes():
+    replicator = Replicator('all', retry_interval=60)
+    healthy, down = idle_follower(replicator, 1), idle_follower(replicator, 2)
+    down._healthy = False
+    replicated = replicator.replicate_many(1, [('K', 'v', 0)])
+    healthy._in_flight = 1
+    healthy.on_response(1, 1, answered())
+    assert replicated.result(0) is True
+
+
+def test_removed_follower_releases_pending_writes():
+    replicator = Replicator('all', retry_interval=60)
+    first, second = idle_follower(replicator, 1), idle_follower(replicator, 2)
+    replicated = replicator.replicate_many(1, [('K', 'v', 0)])
+    first._in_flight = 1
+    first.on_response(1, 1, answered())
+    assert not replicated.done()
+    # o segundo ficou para trás do log e foi descartado: a escrita não espera mais por ele
+    replicator.remove_follower(*second.address)
+    assert replicated.result(0) is True
+
+
+def test_put_gives_up_on_a_silent_follower():
+    # o follower aceita a conexão e nunca responde
+    silent = socket.socket()
+    silent.bind(('127.0.0.1', 0))
+    silent.listen()
+    leader = start_server(free_port(), replication_timeout_ms=200)
+    try:
+        leader._replicator.add_follower('127.0.0.1', silent.getsockname()[1], 1)
+        started = time.monotonic()
+        response = leader.put_command_handler(Message.put('K', 'v'))
+        assert response.type == 'TRY_OTHER_SERVER_OR_LATER'
+        assert time.monotonic() - started < 2
+    finally:
+        silent.close()
+        leader.close()
@@ -0,0 +1,72 @@
+import socket
+import pytest
+from threading import Thread
+import helpers
+from async_server import AsyncServer
+from codec import BinaryCodec
+from connection import Connection
+from message import Message
+from tests.helpers import free_port, start_server
+from benchmarks.loadgen import wait_for_port
+
+
+def start_async_server(port: int) -> AsyncServer:
+    server = AsyncServer('127.0.0.1', port, '127.0.0.1', port)
+    server.setup()
+    Thread(target=server.listen, daemon=True).start()
+    return server
+
+
+@pytest.fixture(params=[start_server, start_async_server], ids=['thread', 'async'])
+def server(request):
+    server = request.param(free_port())
+    wait_for_port(server.port)
+    yield server
+    server.close()
+
+
+def test_handler_error_is_answered(server):
+    def fail(*args, **kwargs):
+        raise RuntimeError('falha no handler')
+
+    server.get_command_handler = fail
+    conn = Connection('127.0.0.1', server.port)
+    try:
+        assert conn.request(Message.get('K', 0), timeout=5).type == 'TRY_OTHER_SERVER_OR_LATER'
+        # a conexão continua atendendo as requisições seguintes
+        assert conn.request(Message.put('K', 'v'), timeout=5).type == 'PUT_OK'
+    finally:
+        conn.close()
+
+
+def test_undecodable_request_is_answered(server):
+    with socket.create_connection(('127.0.0.1', server.port), timeout=5) as sock:
+        helpers.send_frame(sock, 7, b'\xff\xff', BinaryCodec.id)
+        request_id, flags, payload = helpers.receive_frame(sock)
+        assert request_id == 7
+        assert BinaryCodec().decode(payload).type == 'TRY_OTHER_SERVER_OR_LATER'
+
+
+def test_undecodable_response_fails_the_request():
+    # servidor falso que responde a cada requisição com um payload inválido no mesmo id
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen()
+
+    def serve():
+        sock, _ = listener.accept()
+        with sock:
+            while True:
+                frame = helpers.receive_frame(sock)
+                if frame is None:
+                    return
+                helpers.send_frame(sock, frame[0], b'\xff\xff', BinaryCodec.id)
+
+    Thread(target=serve, daemon=True).start()
+    conn = Connection('127.0.0.1', listener.getsockname()[1], codec='json')
+    try:
+        with pytest.raises(ConnectionError):
+            conn.request(Message.get('K', 0), timeout=5)
+    finally:
+        conn.close()
+        listener.close()
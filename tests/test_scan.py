@@ -0,0 +1,47 @@
+from client import Client
+from connection import Connection
+from message import Message
+from tests.helpers import free_port, start_server
+from benchmarks.loadgen import wait_for_port
+
+
+def test_scan_cursor_walks_all_pages():
+    leader = start_server(free_port())
+    wait_for_port(leader.port)
+    keys = [f'KEY{i:02}' for i in range(25)]
+    for key in reversed(keys):
+        leader.write_key_value_pair(key, key.lower(), 0)[1].result(5)
+    leader.write_key_value_pair('OTHER', 'x', 0)[1].result(5)
+    conn = Connection('127.0.0.1', leader.port)
+    try:
+        pages, cursor = [], ''
+        while True:
+            page = conn.request(Message.scan('KEY', 'KEZ', cursor, 10, 0))
+            assert page.type == 'SCAN_OK'
+            pages.append([item.key for item in page.items])
+            # uma chave escrita depois do cursor aparece nas próximas páginas
+            if len(pages) == 1:
+                leader.write_key_value_pair('KEY99', 'new', 0)[1].result(5)
+            cursor = page.cursor
+            if not cursor:
+                break
+        assert [len(page) for page in pages] == [10, 10, 6]
+        assert [key for page in pages for key in page] == keys + ['KEY99']
+    finally:
+        conn.close()
+        leader.close()
+
+
+def test_client_prefix_follows_the_cursor():
+    leader = start_server(free_port())
+    wait_for_port(leader.port)
+    for i in range(9):
+        leader.write_key_value_pair(f'user:{i}', str(i), 0)[1].result(5)
+    leader.write_key_value_pair('users', 'x', 0)[1].result(5)
+    client = Client()
+    client.init([f'127.0.0.1:{leader.port}'])
+    try:
+        assert client.prefix('user:', limit=4) == [(f'USER:{i}', str(i)) for i in range(9)]
+    finally:
+        client._connections.close_all()
+        leader.close()
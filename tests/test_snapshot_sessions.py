@@ -0,0 +1,88 @@
+import pytest
+from threading import Thread
+import server
+from message import Message
+from server import Server, SnapshotSessionLostError
+from tests.helpers import free_port, start_server
+
+
+def test_unknown_session_is_refused():
+    leader = start_server(free_port())
+    try:
+        response = leader.snapshot_chunk_command_handler(Message('SNAPSHOT_CHUNK', key='404', client_timestamp=0))
+        assert response.type == 'TRY_OTHER_SERVER_OR_LATER'
+    finally:
+        leader.close()
+
+
+def test_follower_restarts_follow_when_session_is_lost():
+    # com o log de replicação de uma escrita, um follower novo recebe o snapshot em blocos
+    leader = start_server(free_port(), replication_log_size=1)
+    for i in range(10):
+        leader.store_key_value_pair(f'key{i}', str(i))
+    handler = leader.snapshot_chunk_command_handler
+    lost = []
+
+    # a primeira sessão some antes do primeiro bloco, como se o líder tivesse reiniciado
+    def forget_first_session(cmd: Message) -> Message:
+        if not lost:
+            lost.append(leader._snapshot_sessions.pop(cmd.key))
+        return handler(cmd)
+
+    leader.snapshot_chunk_command_handler = forget_first_session
+    port = free_port()
+    follower = Server('127.0.0.1', port, '127.0.0.1', leader.port)
+    setup = Thread(target=follower.setup, daemon=True)
+    setup.start()
+    setup.join(10)
+    try:
+        assert not setup.is_alive(), 'o follower ficou preso no snapshot'
+        assert lost
+        assert [follower.get_key_value_pair(f'key{i}').value for i in range(10)] == [str(i) for i in range(10)]
+    finally:
+        follower.close()
+        leader.close()
+
+
+def test_lost_session_resets_follower_sequence():
+    leader = start_server(free_port())
+    follower = Server('127.0.0.1', free_port(), '127.0.0.1', leader.port)
+    follower._seq = 5
+    try:
+        with pytest.raises(SnapshotSessionLostError):
+            follower.follow_ok_command_handler(Message('FOLLOW_OK', key='404', value='SNAPSHOT', server_timestamp=7))
+        assert follower._seq == 0
+    finally:
+        follower.close()
+        leader.close()
+
+
+def test_follow_again_drops_the_previous_session():
+    leader = start_server(free_port(), replication_log_size=1)
+    for i in range(10):
+        leader.store_key_value_pair(f'key{i}', str(i))
+    try:
+        # o follower reinicia durante a transferência e pede o FOLLOW de novo
+        first = leader.follow_command_handler(leader.follow_command_factory('127.0.0.1', 1, 0))
+        second = leader.follow_command_handler(leader.follow_command_factory('127.0.0.1', 1, 0))
+        assert list(leader._snapshot_sessions) == [second.key]
+        assert first.key != second.key
+    finally:
+        leader.close()
+
+
+def test_idle_sessions_expire(monkeypatch):
+    leader = start_server(free_port(), replication_log_size=1)
+    for i in range(10):
+        leader.store_key_value_pair(f'key{i}', str(i))
+    try:
+        idle = leader.follow_command_handler(leader.follow_command_factory('127.0.0.1', 1, 0)).key
+        monkeypatch.setattr(server, 'SNAPSHOT_SESSION_IDLE_S', 0)
+        # o FOLLOW de outro follower descarta a sessão que ficou sem pedidos de bloco, e o follower pausado dela
+        leader.follow_command_handler(leader.follow_command_factory('127.0.0.1', 2, 0))
+        assert idle not in leader._snapshot_sessions
+        assert leader._replicator.get_follower('127.0.0.1', 1) is None
+        response = leader.snapshot_chunk_command_handler(Message('SNAPSHOT_CHUNK', key=idle, client_timestamp=0))
+        assert response.type == 'TRY_OTHER_SERVER_OR_LATER'
+    finally:
+        leader.close()
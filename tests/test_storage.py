@@ -0,0 +1,36 @@
+import pytest
+from threading import Thread
+from storage import STORAGE_ENGINES, Record, create_storage, entry_size
+
+
+@pytest.fixture(params=STORAGE_ENGINES)
+def storage(request):
+    return create_storage(request.param, stripes=4)
+
+
+def test_put_if_newer_keeps_the_newest_record(storage):
+    assert storage.put_if_newer('K', Record('v2', 2))
+    assert not storage.put_if_newer('K', Record('v1', 1))
+    assert storage.get('K') == Record('v2', 2)
+
+
+def test_remove_skips_newer_records(storage):
+    storage.put('K', Record('v', 5))
+    assert not storage.remove('K', 4)
+    assert storage.remove('K', 5)
+    assert storage.get('K') is None and len(storage) == 0 and storage.size_bytes == 0
+
+
+def test_concurrent_writes_across_stripes(storage):
+    def write(thread: int) -> None:
+        for i in range(500):
+            storage.put(f'K{thread}-{i}', Record(str(i), i + 1))
+
+    threads = [Thread(target=write, args=(thread,)) for thread in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(storage) == 4000
+    assert storage.size_bytes == sum(entry_size(key, record) for key, record in storage.items())
+    assert [key for key, _ in storage.scan('K0-', 'K0-~', 3)] == ['K0-0', 'K0-1', 'K0-10']
@@ -0,0 +1,85 @@
+import time
+import pytest
+from client import Client
+from codec import encode_varint
+from connection import Connection
+from message import Message
+from rebalance import Rebalancer
+from ring import HashRing
+from tests.helpers import free_port, start_server
+from benchmarks.loadgen import wait_for_port
+
+
+@pytest.fixture
+def leader():
+    server = start_server(free_port())
+    yield server
+    server.close()
+
+
+def test_negative_ttl_is_refused(leader):
+    # em JSON o TTL negativo chega ao servidor, que o recusa sem gravar nada
+    conn = Connection('127.0.0.1', leader.port, codec='json')
+    try:
+        assert conn.request(Message.put('K', 'v', -5)).type == 'INVALID_VALUE'
+        mput = conn.request(Message.mput([Message.put('A', 'v'), Message.put('B', 'v', -1)]))
+        assert [item.type for item in mput.items] == ['INVALID_VALUE', 'INVALID_VALUE']
+        assert conn.request(Message.cas('K', 'v', absent=True, ttl=-1)).type == 'INVALID_VALUE'
+    finally:
+        conn.close()
+    assert all(leader.get_key_value_pair(key).value == 'NULL' for key in ('K', 'A', 'B'))
+
+
+def test_negative_ttl_is_refused_before_encoding():
+    with pytest.raises(ValueError):
+        encode_varint(-1)
+    with pytest.raises(ValueError):
+        Client().put_command_factory('K', 'v', -1)
+
+
+def test_copy_keeps_keys_expiring_now_with_a_ttl(tmp_path):
+    path = str(tmp_path / 'cluster.json')
+    HashRing({'g1': ['127.0.0.1:1']}).save(path)
+    rebalancer = Rebalancer(path)
+    copy = rebalancer.copy_command_factory([Message.replication('K', 'v', 1, 1000)], 1000)
+    rebalancer.close()
+    assert copy.items[0].ttl == 1
+
+
+# espera até `condition` valer, por no máximo `timeout` segundos
+def eventually(condition, timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_expiry_is_replicated_to_followers():
+    leader_port, follower_port = free_port(), free_port()
+    leader = start_server(leader_port)
+    wait_for_port(leader_port)
+    follower = start_server(follower_port, leader_port)
+    wait_for_port(follower_port)
+    try:
+        conn = Connection('127.0.0.1', leader_port)
+        put = conn.request(Message.put('K', 'v', 300))
+        conn.close()
+        # o follower recebe o instante absoluto de expiração calculado pelo líder
+        stored = follower.get_key_value_pair('K')
+        assert stored.value == 'v' and stored.expires_at == leader.get_key_value_pair('K').expires_at
+        # o líder remove a chave no vencimento e replica a remoção como EXPIRE
+        assert eventually(lambda: follower._storage.get('K') is None)
+        assert leader._storage.get('K') is None
+        assert follower.get_key_value_pair('K').timestamp > put.server_timestamp
+    finally:
+        follower.close()
+        leader.close()
+
+
+def test_rewritten_key_is_not_expired_by_its_old_ttl(leader):
+    leader.write_key_value_pair('K', 'old', 50)[1].result(5)
+    leader.write_key_value_pair('K', 'new', 0)[1].result(5)
+    time.sleep(0.2)
+    assert leader.get_key_value_pair('K').value == 'new'
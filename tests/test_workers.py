@@ -0,0 +1,32 @@
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from message import Message
+from workers import PartitionRouter
+
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(2)
+    yield executor
+    executor.shutdown()
+
+
+@pytest.mark.parametrize('command', [Message('FENCE', key='0:10'), Message('RANGE_SCAN', key='0:10', limit=10),
+                                     Message('DROP_RANGES', key='0:10')])
+def test_public_port_refuses_rebalancing_commands(executor, command):
+    handled = []
+    router = PartitionRouter(0, [('127.0.0.1', 1), ('127.0.0.1', 2)], handled.append, executor)
+    try:
+        assert not router.is_local(command)
+        assert router.route(command).result(5).type == 'TRY_OTHER_SERVER_OR_LATER'
+        assert not handled
+    finally:
+        router.close()
+
+
+def test_single_worker_handles_rebalancing_commands(executor):
+    router = PartitionRouter(0, [('127.0.0.1', 1)], lambda command: None, executor)
+    try:
+        assert router.is_local(Message('FENCE', key='0:10'))
+    finally:
+        router.close()
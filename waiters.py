@@ -0,0 +1,102 @@
+import time
+import heapq
+from itertools import count
+from concurrent.futures import Future
+from threading import Thread, Condition
+from typing import Dict, List, Tuple
+
+# Leitura estacionada à espera de que uma chave alcance um timestamp
+class Waiter:
+    __slots__ = ('key', 'timestamp', 'future', 'resolved')
+
+    def __init__(self, key: str, timestamp: int) -> None:
+        self.key = key
+        self.timestamp = timestamp
+        self.future = Future()
+        self.resolved = False
+
+
+# Leituras estacionadas por chave. Quem aplica uma escrita chama notify, que acorda só as leituras daquela chave
+# cujo timestamp foi alcançado; não há polling. Os prazos ficam em um heap atendido por uma única thread, que dorme
+# até o prazo mais próximo. O Future de cada leitura é resolvido com True (timestamp alcançado) ou False (prazo
+# esgotado), sempre fora do lock, já que os callbacks podem responder ao cliente.
+class TimestampWaiters:
+    def __init__(self) -> None:
+        self._waiters: Dict[str, List[Waiter]] = dict()
+        self._deadlines: List[Tuple[float, int, Waiter]] = []
+        self._ids = count()
+        self._condition = Condition()
+        self._timer_thread = None
+        self._running = True
+
+    # quantidade de leituras estacionadas
+    def __len__(self) -> int:
+        with self._condition:
+            return sum(len(waiters) for waiters in self._waiters.values())
+
+    # estaciona uma leitura da chave até ela alcançar `timestamp` ou até `timeout` segundos se passarem
+    def park(self, key: str, timestamp: int, timeout: float) -> Future:
+        waiter = Waiter(key, timestamp)
+        with self._condition:
+            self._waiters.setdefault(key, []).append(waiter)
+            heapq.heappush(self._deadlines, (time.monotonic() + timeout, next(self._ids), waiter))
+            if self._timer_thread is None:
+                self._timer_thread = Thread(target=self._expire_loop, daemon=True)
+                self._timer_thread.start()
+            self._condition.notify()
+        return waiter.future
+
+    # acorda as leituras da chave que aguardam um timestamp menor ou igual a `timestamp`
+    def notify(self, key: str, timestamp: int) -> None:
+        # leitura sem lock: o caso comum, sem leituras estacionadas, não paga nada
+        if key not in self._waiters:
+            return
+        with self._condition:
+            waiters = self._waiters.get(key)
+            if not waiters:
+                return
+            ready = [waiter for waiter in waiters if waiter.timestamp <= timestamp]
+            if not ready:
+                return
+            pending = [waiter for waiter in waiters if waiter.timestamp > timestamp]
+            if pending:
+                self._waiters[key] = pending
+            else:
+                del self._waiters[key]
+            for waiter in ready:
+                waiter.resolved = True
+        for waiter in ready:
+            waiter.future.set_result(True)
+
+    def close(self) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+    # laço da thread dos prazos: esgota as leituras vencidas e dorme até o próximo prazo
+    def _expire_loop(self) -> None:
+        while True:
+            expired = []
+            with self._condition:
+                while self._running:
+                    now = time.monotonic()
+                    while self._deadlines and (self._deadlines[0][2].resolved or self._deadlines[0][0] <= now):
+                        _, _, waiter = heapq.heappop(self._deadlines)
+                        if not waiter.resolved:
+                            waiter.resolved = True
+                            self._remove(waiter)
+                            expired.append(waiter)
+                    if expired:
+                        break
+                    self._condition.wait(self._deadlines[0][0] - now if self._deadlines else None)
+                if not self._running:
+                    return
+            for waiter in expired:
+                waiter.future.set_result(False)
+
+    def _remove(self, waiter: Waiter) -> None:
+        waiters = self._waiters.get(waiter.key, [])
+        if waiter in waiters:
+            waiters.remove(waiter)
+        if not waiters:
+            self._waiters.pop(waiter.key, None)
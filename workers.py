@@ -0,0 +1,326 @@
+import os
+import sys
+import zlib
+import signal
+import helpers
+import multiprocessing
+from message import Message, EMPTY_ADDRESS
+from connection import ConnectionCache
+from codec import DEFAULT_CODEC
+from log import logger
+from socket import socket, AF_INET, SOCK_STREAM, SOL_SOCKET, SO_REUSEADDR, SO_REUSEPORT
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Modo multiprocesso: o servidor de um nó roda em N processos (workers) que escutam na mesma porta pública com
+# SO_REUSEPORT, e o kernel distribui as conexões dos clientes entre eles. Cada worker é dono de uma partição das
+# chaves, escolhida por um hash estável da chave, e é um Server completo, com o seu store, a sua sequência e a sua
+# porta interna. A partição i de todos os nós forma um cluster à parte: o worker i de um follower segue o worker i
+# do líder, então a replicação, o log de replicação e os timestamps valem por partição.
+# Uma requisição recebida pela porta pública por um worker que não é dono da chave é encaminhada ao dono pela porta
+# interna dele; as conexões internas só transportam requisições da partição do worker e nunca são roteadas.
+
+# comandos de cliente que podem envolver chaves de outras partições
+ROUTED_COMMANDS = {'PUT', 'GET', 'MPUT', 'MGET', 'SCAN', 'PREFIX', 'INCR', 'CAS', 'APPEND'}
+# comandos de uma única chave, enviados à partição dona dela
+SINGLE_KEY_COMMANDS = {'PUT', 'GET', 'INCR', 'CAS', 'APPEND'}
+# comandos do rebalanceamento entre grupos, que valem para todas as chaves do nó: um worker só enxerga a sua partição
+# e as sequências das partições não são comparáveis, então eles são recusados na porta pública com vários workers
+PARTITION_COMMANDS = {'FENCE', 'RANGE_SCAN', 'DROP_RANGES'}
+
+
+# partição dona de uma chave: crc32 em vez do hash() do Python, que muda a cada processo, para que todos os workers
+# de todos os nós concordem
+def partition_of(key: str, partitions: int) -> int:
+    return zlib.crc32(key.upper().encode()) % partitions
+
+
+# Monta um WORKERS command, pedindo a um nó os endereços internos dos seus workers
+def workers_command_factory() -> Message:
+    return Message('WORKERS')
+
+
+# encadeia um Future: `target` é resolvido com o resultado de `source` transformado por `transform`
+def chain(source: Future, target: Future, transform: Callable = None) -> None:
+    def on_done(future: Future) -> None:
+        result = future.result()
+        target.set_result(transform(result) if transform is not None else result)
+    source.add_done_callback(on_done)
+
+
+# Future resolvido com a lista dos resultados de `futures`, na mesma ordem, quando todos terminarem
+def gather(futures: List[Future]) -> Future:
+    result = Future()
+    remaining = [len(futures)]
+    lock = Lock()
+
+    def on_done(_: Future) -> None:
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] > 0:
+                return
+        result.set_result([future.result() for future in futures])
+
+    for future in futures:
+        future.add_done_callback(on_done)
+    return result
+
+
+# Roteador das requisições recebidas pela porta pública de um worker. PUT e GET vão inteiros para o dono da chave;
+# MPUT e MGET são divididos por partição e as respostas são remontadas na ordem das chaves; SCAN e PREFIX são
+# enviados a todas as partições e as páginas são intercaladas em ordem. A parte local é tratada pelo próprio worker,
+# em uma thread do pool; as demais seguem pelas conexões persistentes com os outros workers.
+class PartitionRouter:
+    def __init__(self, index: int, addresses: List[Tuple[str, int]], handle_local: Callable[[Message], object],
+                 executor: ThreadPoolExecutor, codec: str = DEFAULT_CODEC) -> None:
+        self._index = index
+        self._addresses = addresses
+        self._handle_local = handle_local
+        self._executor = executor
+        # os workers estão na mesma máquina: as conexões entre eles não usam compressão
+        self._connections = ConnectionCache(codec)
+
+    # region getters
+    @property
+    def index(self) -> int:
+        return self._index
+
+    @property
+    def partitions(self) -> int:
+        return len(self._addresses)
+
+    @property
+    def addresses(self) -> List[Tuple[str, int]]:
+        return self._addresses
+    # endregion
+
+    # partição dona de uma chave
+    def owner(self, key: str) -> int:
+        return partition_of(key, len(self._addresses))
+
+    # indica se uma requisição envolve só chaves deste worker e pode ser tratada sem roteamento
+    def is_local(self, command: Message) -> bool:
+        if command.type in PARTITION_COMMANDS:
+            return len(self._addresses) == 1
+        if command.type not in ROUTED_COMMANDS or len(self._addresses) == 1:
+            return True
+        if command.type in SINGLE_KEY_COMMANDS:
+            return self.owner(command.key) == self._index
+        if command.type in ('MPUT', 'MGET'):
+            return all(self.owner(item.key) == self._index for item in command.items)
+        return False
+
+    # encaminha uma requisição às partições envolvidas, devolvendo um Future resolvido com a resposta ao cliente.
+    # Os comandos do rebalanceamento são recusados com TRY_OTHER_SERVER_OR_LATER
+    def route(self, command: Message) -> Future:
+        if command.type in PARTITION_COMMANDS:
+            logger.warning('%s recusado na porta pública de um nó com %s workers', command.type, self.partitions)
+            response = Future()
+            response.set_result(unavailable(command))
+            return response
+        if command.type in SINGLE_KEY_COMMANDS:
+            return self.send(self.owner(command.key), command)
+        if command.type in ('MPUT', 'MGET'):
+            return self.route_batch(command)
+        return self.route_scan(command)
+
+    # divide um MPUT/MGET por partição e remonta os resultados na ordem das chaves da requisição
+    def route_batch(self, command: Message) -> Future:
+        groups: Dict[int, List[int]] = dict()
+        for pos, item in enumerate(command.items):
+            groups.setdefault(self.owner(item.key), []).append(pos)
+        parts = [(positions, self.send(index, Message(command.type, sender=command.sender,
+                                                      items=[command.items[pos] for pos in positions])))
+                 for index, positions in groups.items()]
+
+        def merge(responses: List[Message]) -> Message:
+            results: List[Optional[Message]] = [None] * len(command.items)
+            leader = EMPTY_ADDRESS
+            for (positions, _), response in zip(parts, responses):
+                for pos, item in zip(positions, response.items):
+                    results[pos] = item
+                if response.leader[0]:
+                    leader = response.leader
+            return Message(command.type + '_OK', items=results, leader=leader)
+
+        response = Future()
+        chain(gather([future for _, future in parts]), response, merge)
+        return response
+
+    # Envia um SCAN/PREFIX a todas as partições, com o mesmo cursor e limite, e intercala as páginas em ordem.
+    # As sequências das partições não são comparáveis entre si: o timestamp do cliente não é repassado e a resposta
+    # não leva sequência
+    def route_scan(self, command: Message) -> Future:
+        limit = command.limit
+        futures = [self.send(index, Message(command.type, command.key, command.value, sender=command.sender,
+                                            cursor=command.cursor, limit=limit, ring_version=command.ring_version))
+                   for index in range(len(self._addresses))]
+
+        def merge(responses: List[Message]) -> Message:
+            refused = next((response for response in responses if response.type != 'SCAN_OK'), None)
+            if refused is not None:
+                return refused
+            items = sorted((item for response in responses for item in response.items), key=lambda item: item.key)
+            # o cursor é o menor entre os das partições e a última chave que cabe na página; as chaves depois
+            # dele voltam na próxima página
+            cursors = [response.cursor for response in responses if response.cursor]
+            if len(items) > limit:
+                cursors.append(items[limit - 1].key)
+            cursor = min(cursors, default='')
+            if cursor:
+                items = [item for item in items if item.key <= cursor]
+            return Message.scan_ok(items, cursor, 0)
+
+        response = Future()
+        chain(gather(futures), response, merge)
+        return response
+
+    # envia uma requisição a uma partição: a local é tratada por uma thread do pool, as outras pela porta interna
+    # do worker dono. Uma falha resolve o Future com TRY_OTHER_SERVER_OR_LATER para as chaves, como no encaminhamento
+    # ao líder
+    def send(self, index: int, command: Message) -> Future:
+        if index == self._index:
+            return self.handle(command)
+        response = Future()
+        ip, port = self._addresses[index]
+
+        def on_response(future: Future) -> None:
+            error = future.exception()
+            if error is None and future.result() is not None:
+                response.set_result(future.result())
+            else:
+                logger.warning('Falha ao encaminhar %s ao worker %s: %s', command.type, index, error)
+                self._connections.discard(ip, port)
+                response.set_result(unavailable(command))
+
+        try:
+            self._connections.get(ip, port).request_async(command).add_done_callback(on_response)
+        except OSError as e:
+            logger.warning('Falha ao encaminhar %s ao worker %s: %s', command.type, index, e)
+            self._connections.discard(ip, port)
+            response.set_result(unavailable(command))
+        return response
+
+    # trata a parte local de uma requisição em uma thread do pool; o handler pode devolver um Future (GETs
+    # estacionados), encadeado na resposta
+    def handle(self, command: Message) -> Future:
+        response = Future()
+
+        def run() -> None:
+            try:
+                result = self._handle_local(command)
+            except Exception as e:
+                logger.warning('Erro ao tratar %s na partição %s: %s', command.type, self._index, e)
+                response.set_result(unavailable(command))
+                return
+            if isinstance(result, Future):
+                chain(result, response)
+            else:
+                response.set_result(result)
+
+        self._executor.submit(run)
+        return response
+
+    def close(self) -> None:
+        self._connections.close_all()
+
+
+# resposta de uma requisição que não pôde ser entregue a uma partição: TRY_OTHER_SERVER_OR_LATER para cada chave
+def unavailable(command: Message) -> Message:
+    if command.type in ('MPUT', 'MGET'):
+        return Message(command.type + '_OK', items=[Message.try_other(item.key) for item in command.items])
+    return Message.try_other(command.key)
+
+
+# abre o socket de escuta de um worker. Na porta pública, SO_REUSEPORT deixa todos os workers escutarem na mesma
+# porta, cada um com a sua fila de conexões; a porta 0 escolhe uma porta interna livre
+def listen_socket(ip: str, port: int, backlog: int, reuse_port: bool = False) -> socket:
+    sock = socket(AF_INET, SOCK_STREAM)
+    sock.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(SOL_SOCKET, SO_REUSEPORT, 1)
+    sock.bind((ip, port))
+    sock.listen(backlog)
+    return sock
+
+
+# pergunta ao líder os endereços internos dos seus workers, na ordem das partições
+def leader_workers(ip_leader: str, port_leader: int) -> List[Tuple[str, int]]:
+    sock = helpers.open_server_connection(ip_leader, port_leader)
+    if sock is None:
+        raise ConnectionRefusedError(f'Não foi possível conectar em {ip_leader}:{port_leader}')
+    try:
+        response = helpers.send_request(sock, workers_command_factory())
+    finally:
+        helpers.close_server_connection(sock)
+    if response is None or response.type != 'WORKERS_OK' or not response.value:
+        raise ValueError(f'O líder {ip_leader}:{port_leader} não está no modo multiprocesso')
+    return [(ip, int(port)) for ip, port in (address.split(':') for address in response.value.split(','))]
+
+
+# Sobe `workers` processos para o servidor de um nó e aguarda o término deles. O processo principal abre as portas
+# internas (fixas a partir de `worker_base_port`, ou livres com 0) antes de criar os workers, para que cada um já
+# nasça com os endereços dos demais; num follower, ele também descobre os workers do líder, e o worker i segue o
+# worker i do líder. Os limites de memória e de chaves são divididos entre as partições e cada worker grava os seus
+# dados em um subdiretório próprio de `data_dir`
+def run_workers(server_class, ip: str, port: int, ip_leader: str, port_leader: int, workers: int,
+                worker_base_port: int = 0, **options) -> None:
+    backlog = options.get('backlog', 128)
+    internal_sockets = [listen_socket(ip, worker_base_port + i if worker_base_port else 0, backlog)
+                        for i in range(workers)]
+    addresses = [(ip, sock.getsockname()[1]) for sock in internal_sockets]
+    if (ip, port) == (ip_leader, port_leader):
+        leaders = addresses
+    else:
+        leaders = leader_workers(ip_leader, port_leader)
+        if len(leaders) != workers:
+            raise ValueError(f'O líder tem {len(leaders)} workers e este nó {workers}: as partições não coincidem')
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=run_worker, name=f'worker-{i}',
+                                 args=(server_class, i, internal_sockets, addresses, leaders[i], port, options))
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+    for sock in internal_sockets:
+        sock.close()
+    # um SIGTERM no processo principal encerra também os workers, que senão continuariam na porta pública
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    logger.info('%s workers na porta %s, portas internas %s', workers, port,
+                ', '.join(str(internal_port) for _, internal_port in addresses))
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        logger.info('Saindo...')
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
+
+
+# corpo de um worker: um Server escutando na sua porta interna e, com SO_REUSEPORT, na porta pública do nó
+def run_worker(server_class, index: int, internal_sockets: List[socket], addresses: List[Tuple[str, int]],
+               leader: Tuple[str, int], public_port: int, options: Dict) -> None:
+    for i, sock in enumerate(internal_sockets):
+        if i != index:
+            sock.close()
+    workers = len(addresses)
+    options = dict(options)
+    options['max_memory'] = -(-options.get('max_memory', 0) // workers)
+    options['max_keys'] = -(-options.get('max_keys', 0) // workers)
+    if options.get('data_dir') is not None:
+        options['data_dir'] = os.path.join(options['data_dir'], f'worker-{index}')
+    ip, port = addresses[index]
+    server = server_class(ip, port, leader[0], leader[1], server_socket=internal_sockets[index], **options)
+    try:
+        server.set_workers(index, addresses, listen_socket(ip, public_port, options.get('backlog', 128),
+                                                           reuse_port=True))
+        server.setup()
+        server.listen()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()